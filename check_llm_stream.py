@@ -0,0 +1,62 @@
+"""
+Checagem do streaming do cliente LLM contra um servidor falso local.
+
+Sobe um servidor HTTP numa porta livre que responde ``/chat/completions`` em
+SSE com ``Content-Type: text/event-stream`` *sem* charset (como a Groq e
+outros provedores fazem; um servidor Flask de teste acrescentaria
+``charset=utf-8`` e esconderia o problema) e texto em português, aponta
+``LLM_BASE_URL`` para ele e confere que ``_stream_chat_completion`` devolve o
+texto intacto.
+
+Falha (exit 1) se o texto chegar diferente (ex.: "VocÃª" em vez de "Você").
+
+Execute: python check_llm_stream.py
+"""
+
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHUNKS = ["Você está", " no crédito", " este mês: ", "R$ 1.234,56 de saldo", " após a fatura."]
+
+
+class _FakeSSEHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        events = [f"data: {json.dumps({'choices': [{'delta': {'content': c}}]}, ensure_ascii=False)}\n\n" for c in CHUNKS]
+        body = ("".join(events) + "data: [DONE]\n\n").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def check_llm_stream() -> tuple[str, str]:
+    """Retorna ``(esperado, recebido)``."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeSSEHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ["LLM_API_KEY"] = "check"
+    try:
+        from modulos.App_financeiro.llm_client import _stream_chat_completion
+
+        received = "".join(_stream_chat_completion([{"role": "user", "content": "saldo?"}], timeout=5))
+    finally:
+        server.shutdown()
+    return "".join(CHUNKS), received
+
+
+if __name__ == "__main__":
+    expected, received = check_llm_stream()
+    if received != expected:
+        print(f"✗ Streaming com texto diferente:\n  esperado: {expected!r}\n  recebido: {received!r}")
+        sys.exit(1)
+    print("✓ Streaming SSE sem charset decodificado como UTF-8")
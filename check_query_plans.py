@@ -0,0 +1,228 @@
+"""
+Checagem dos planos de execução das queries principais do financeiro.
+
+Popula um conjunto de dados de teste dentro de uma transação, roda EXPLAIN
+nas queries do dashboard (listagem, resumo anual, saldo anterior, previsão de
+caixa, finance-ai, ocorrências de recorrência, sincronização incremental,
+histórico por estabelecimento, meses fechados, chaves de idempotência, anexos,
+membros e auditoria de login) e desfaz tudo no fim.
+Falha (exit 1) se alguma delas cair em varredura sequencial da tabela.
+
+No PostgreSQL usa ``SET LOCAL enable_seqscan = off``: com isso o planner só
+escolhe Seq Scan quando não existe índice que sirva à query. No SQLite usa
+``EXPLAIN QUERY PLAN`` e procura ``SCAN <tabela>``.
+
+Execute depois de ``flask db upgrade``: python check_query_plans.py
+"""
+
+import re
+import sys
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, select, text
+
+from extensions import db
+from models import (
+    Category,
+    FinanceConfig,
+    IdempotencyKey,
+    LoginAudit,
+    MonthlyClosure,
+    MonthlyFixedExpense,
+    RecurringTransaction,
+    Transaction,
+    TransactionAttachment,
+    User,
+    Workspace,
+    WorkspaceMember,
+)
+from run import app
+
+SEED_WORKSPACES = 20
+SEED_TX_PER_WORKSPACE = 500
+
+
+def _insert(conn, model, rows):
+    """Insere linhas e devolve os ids gerados (na ordem)."""
+    ids = []
+    for row in rows:
+        result = conn.execute(model.__table__.insert().values(**row))
+        ids.append(result.inserted_primary_key[0])
+    return ids
+
+
+def _seed(conn):
+    """Popula usuários, workspaces, transações, anexos e auditoria. Devolve ids de referência."""
+    now = datetime.utcnow()
+    user_ids = _insert(conn, User, [
+        {"email": f"plan-check-{i}@example.invalid", "password_hash": "x", "created_at": now}
+        for i in range(SEED_WORKSPACES)
+    ])
+    config_ids = _insert(conn, FinanceConfig, [
+        {"user_id": uid, "created_at": now, "updated_at": now} for uid in user_ids
+    ])
+    category_ids = _insert(conn, Category, [
+        {"config_id": cid, "name": "Geral", "type": "expense", "created_at": now} for cid in config_ids
+    ])
+    workspace_ids = _insert(conn, Workspace, [
+        {"owner_id": uid, "name": f"Plan check {uid}", "created_at": now} for uid in user_ids
+    ])
+    conn.execute(WorkspaceMember.__table__.insert(), [
+        {"workspace_id": workspace_ids[i], "user_id": user_ids[(i + 1) % len(user_ids)], "role": "editor",
+         "joined_at": now, "onboarding_completed": True}
+        for i in range(len(workspace_ids))
+    ])
+    rule_ids = _insert(conn, RecurringTransaction, [
+        {"user_id": uid, "workspace_id": wid, "category_id": cat, "description": "Aluguel", "amount": 100,
+         "type": "expense", "frequency": "monthly", "day_of_month": 5, "start_date": date(2020, 1, 5),
+         "is_active": True, "created_at": now, "updated_at": now}
+        for uid, wid, cat in zip(user_ids, workspace_ids, category_ids)
+    ])
+
+    tx_rows = []
+    for uid, wid, cat, rid in zip(user_ids, workspace_ids, category_ids, rule_ids):
+        for n in range(SEED_TX_PER_WORKSPACE):
+            tx_rows.append({
+                "user_id": uid, "workspace_id": wid, "category_id": cat,
+                "description": f"Compra {n}", "merchant_key": "compra", "amount": 10 + n % 90,
+                "type": "income" if n % 7 == 0 else "expense",
+                "transaction_date": date(2022, 1, 1) + timedelta(days=n * 3 % 1400),
+                "is_paid": bool(n % 2), "frequency": "once",
+                "recurring_transaction_id": rid if n % 25 == 0 else None,
+                "occurrence_month": date(2022 + n // 300, (n // 25) % 12 + 1, 1) if n % 25 == 0 else None,
+                "created_at": now, "updated_at": now,
+            })
+    conn.execute(Transaction.__table__.insert(), tx_rows)
+
+    first_tx_id = conn.execute(select(func.min(Transaction.id)).where(Transaction.workspace_id == workspace_ids[0])).scalar()
+    conn.execute(TransactionAttachment.__table__.insert(), [
+        {"transaction_id": first_tx_id + n, "user_id": user_ids[0], "file_name": f"c{n}.pdf",
+         "file_path": f"/tmp/c{n}.pdf", "file_size": 1024, "uploaded_at": now}
+        for n in range(200)
+    ])
+    conn.execute(LoginAudit.__table__.insert(), [
+        {"user_id": user_ids[n % len(user_ids)], "email": f"plan-check-{n % len(user_ids)}@example.invalid",
+         "succeeded": bool(n % 3), "created_at": now - timedelta(minutes=n)}
+        for n in range(2000)
+    ])
+    conn.execute(MonthlyClosure.__table__.insert(), [
+        {"user_id": uid, "workspace_id": wid, "year": y, "month": m, "status": "open",
+         "total_income": 0, "total_expense": 0, "balance": 0, "created_at": now, "updated_at": now}
+        for uid, wid in zip(user_ids, workspace_ids) for y in (2022, 2023, 2024, 2025) for m in range(1, 13)
+    ])
+    return {
+        "user_id": user_ids[3],
+        "workspace_id": workspace_ids[3],
+        "rule_id": rule_ids[3],
+        "tx_id": first_tx_id,
+        "email": "plan-check-3@example.invalid",
+    }
+
+
+def _dashboard_queries(ref):
+    """(nome, tabela que não pode ser varrida, statement) das queries quentes."""
+    start, end = date(2024, 3, 1), date(2024, 4, 1)
+    tx = Transaction
+    return [
+        ("listagem do mês", "transactions",
+         select(tx.id, tx.amount, tx.type, tx.transaction_date)
+         .where(tx.workspace_id == ref["workspace_id"], tx.transaction_date >= start, tx.transaction_date < end)
+         .order_by(tx.transaction_date.desc())),
+        ("finance-ai por categoria", "transactions",
+         select(tx.category_id, func.sum(tx.amount))
+         .where(tx.workspace_id == ref["workspace_id"], tx.type == "expense",
+                tx.transaction_date >= start, tx.transaction_date < end)
+         .group_by(tx.category_id)),
+        ("resumo anual", "transactions",
+         select(func.extract("month", tx.transaction_date), tx.type, tx.category_id, tx.is_paid, func.sum(tx.amount))
+         .where(tx.workspace_id == ref["workspace_id"],
+                tx.transaction_date >= date(2024, 1, 1), tx.transaction_date < date(2025, 1, 1))
+         .group_by(func.extract("month", tx.transaction_date), tx.type, tx.category_id, tx.is_paid)),
+        ("previsão de caixa", "transactions",
+         select(tx.transaction_date, tx.credit_card_id, tx.is_paid, func.sum(tx.amount))
+         .where(tx.workspace_id == ref["workspace_id"], tx.transaction_date <= date(2025, 6, 30),
+                (tx.transaction_date > date(2024, 12, 31))
+                | (tx.credit_card_id.isnot(None) & tx.is_paid.is_(False) & (tx.transaction_date >= date(2024, 9, 1))))
+         .group_by(tx.transaction_date, tx.credit_card_id, tx.is_paid)),
+        ("livro pessoal", "transactions",
+         select(tx.id).where(tx.user_id == ref["user_id"], tx.workspace_id.is_(None),
+                             tx.transaction_date >= start, tx.transaction_date < end)),
+        ("ocorrência de recorrência", "transactions",
+         select(tx.id).where(tx.recurring_transaction_id == ref["rule_id"], tx.occurrence_month == start)),
+        ("sincronização incremental", "transactions",
+         select(tx.id, tx.updated_at)
+         .where(tx.workspace_id == ref["workspace_id"], tx.updated_at >= datetime.utcnow() - timedelta(days=1))
+         .order_by(tx.updated_at.asc(), tx.id.asc())),
+        ("histórico por estabelecimento", "transactions",
+         select(tx.category_id).where(tx.user_id == ref["user_id"], tx.merchant_key == "compra")
+         .order_by(tx.id.desc()).limit(1)),
+        ("saldo anterior (rollups)", "monthly_closures",
+         select(func.sum(MonthlyClosure.balance))
+         .where(MonthlyClosure.workspace_id == ref["workspace_id"], MonthlyClosure.year <= 2024)),
+        ("mês fechado", "monthly_closures",
+         select(MonthlyClosure.id)
+         .where(MonthlyClosure.workspace_id == ref["workspace_id"], MonthlyClosure.year == 2024,
+                MonthlyClosure.month == 3, MonthlyClosure.status == "closed")),
+        ("despesas fixas do fechamento", "monthly_fixed_expenses",
+         select(MonthlyFixedExpense.id).where(MonthlyFixedExpense.monthly_closure_id == 1)),
+        ("chave de idempotência", "finance_idempotency_keys",
+         select(IdempotencyKey.id).where(IdempotencyKey.user_id == ref["user_id"], IdempotencyKey.key == "k")),
+        ("anexos da transação", "transaction_attachments",
+         select(TransactionAttachment.id).where(TransactionAttachment.transaction_id == ref["tx_id"])),
+        ("workspaces do usuário", "workspace_members",
+         select(WorkspaceMember.workspace_id, WorkspaceMember.role).where(WorkspaceMember.user_id == ref["user_id"])),
+        ("auditoria de login", "login_audit",
+         select(LoginAudit.id, LoginAudit.succeeded)
+         .where(LoginAudit.email == ref["email"], LoginAudit.created_at >= datetime.utcnow() - timedelta(hours=1))
+         .order_by(LoginAudit.created_at.desc()).limit(20)),
+    ]
+
+
+def _explain(conn, stmt):
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "postgresql":
+        return [row[0] for row in conn.execute(text("EXPLAIN " + sql))]
+    return [row[-1] for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql))]
+
+
+def _is_seq_scan(dialect_name, table, plan_lines):
+    if dialect_name == "postgresql":
+        pattern = re.compile(rf"Seq Scan on {table}\b")
+    else:
+        pattern = re.compile(rf"^SCAN {table}\b(?! USING (COVERING )?INDEX)")
+    return any(pattern.search(line.strip()) for line in plan_lines)
+
+
+def check_query_plans():
+    """Retorna a lista de queries que caíram em varredura sequencial."""
+    failures = []
+    with app.app_context():
+        with db.engine.connect() as conn:
+            trans = conn.begin()
+            try:
+                ref = _seed(conn)
+                if conn.dialect.name == "postgresql":
+                    conn.execute(text("ANALYZE"))
+                    conn.execute(text("SET LOCAL enable_seqscan = off"))
+                else:
+                    conn.execute(text("ANALYZE"))
+
+                for name, table, stmt in _dashboard_queries(ref):
+                    plan = _explain(conn, stmt)
+                    bad = _is_seq_scan(conn.dialect.name, table, plan)
+                    print(f"{'✗' if bad else '✓'} {name}")
+                    for line in plan:
+                        print(f"    {line}")
+                    if bad:
+                        failures.append(name)
+            finally:
+                trans.rollback()
+    return failures
+
+
+if __name__ == "__main__":
+    failed = check_query_plans()
+    if failed:
+        print(f"✗ {len(failed)} queries com varredura sequencial: {', '.join(failed)}")
+        sys.exit(1)
+    print("✓ Todas as queries usam índice")
@@ -0,0 +1,408 @@
+"""baseline: schema anterior à série de migrations
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-16 09:00:00
+
+Congela as tabelas como estavam quando o schema ainda era criado direto pelos
+modelos (db.create_all), antes da 0002. Em bancos que já existem as tabelas
+presentes são mantidas e só as que faltarem são criadas; as revisões
+seguintes partem desse schema e criam seus objetos sem checar o banco.
+Os índices opcionais do antigo add_transaction_indexes.py não fazem parte do
+baseline (a 0003 remove os que ela substitui, se existirem).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_baseline'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _create_table(name, *elements):
+    if not sa.inspect(op.get_bind()).has_table(name):
+        op.create_table(name, *elements)
+
+
+def upgrade():
+    _create_table(
+        'admin_users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=150), nullable=False),
+        sa.Column('email', sa.String(length=255), nullable=True),
+        sa.Column('password_hash', sa.String(length=255), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+        sa.UniqueConstraint('username'),
+    )
+    _create_table(
+        'blog_posts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=255), nullable=False),
+        sa.Column('subtitle', sa.String(length=255), nullable=True),
+        sa.Column('slug', sa.String(length=255), nullable=False),
+        sa.Column('category', sa.String(length=100), nullable=True),
+        sa.Column('section', sa.String(length=100), nullable=True),
+        sa.Column('tags', sa.Text(), nullable=True),
+        sa.Column('cover', sa.Text(), nullable=True),
+        sa.Column('cta_text', sa.String(length=255), nullable=True),
+        sa.Column('cta_link', sa.String(length=255), nullable=True),
+        sa.Column('summary', sa.Text(), nullable=True),
+        sa.Column('content', sa.Text(), nullable=True),
+        sa.Column('priority', sa.String(length=20), nullable=True),
+        sa.Column('active', sa.Boolean(), nullable=False),
+        sa.Column('views', sa.Integer(), nullable=False),
+        sa.Column('reading_time', sa.String(length=50), nullable=True),
+        sa.Column('meta_description', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('slug'),
+    )
+    _create_table(
+        'email_verifications',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('email', sa.String(length=255), nullable=False),
+        sa.Column('code', sa.String(length=6), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('is_used', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'menu_items',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nome', sa.String(length=255), nullable=False),
+        sa.Column('nivel', sa.Integer(), nullable=False),
+        sa.Column('ordem', sa.Integer(), nullable=False),
+        sa.Column('ativo', sa.Boolean(), nullable=False),
+        sa.Column('icone', sa.String(length=100), nullable=True),
+        sa.Column('parent_id', sa.Integer(), nullable=True),
+        sa.Column('url', sa.String(length=255), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'newsletter_subscribers',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('email', sa.String(length=255), nullable=False),
+        sa.Column('source', sa.String(length=100), nullable=True),
+        sa.Column('active', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+    )
+    _create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('email', sa.String(length=255), nullable=False),
+        sa.Column('password_hash', sa.String(length=255), nullable=False),
+        sa.Column('is_email_verified', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+    )
+    _create_table(
+        'blog_comments',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.Column('author_name', sa.String(length=120), nullable=False),
+        sa.Column('author_email', sa.String(length=255), nullable=True),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('approved', sa.Boolean(), nullable=False),
+        sa.Column('ip_address', sa.String(length=64), nullable=True),
+        sa.Column('user_agent', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['post_id'], ['blog_posts.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'finance_configs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('management_type', sa.String(length=20), nullable=False),
+        sa.Column('family_name', sa.String(length=255), nullable=True),
+        sa.Column('responsible_name', sa.String(length=255), nullable=True),
+        sa.Column('setup_completed', sa.Boolean(), nullable=False),
+        sa.Column('setup_step', sa.Integer(), nullable=False),
+        sa.Column('currency', sa.String(length=10), nullable=False),
+        sa.Column('timezone', sa.String(length=50), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id'),
+    )
+    _create_table(
+        'login_audit',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('email', sa.String(length=255), nullable=False),
+        sa.Column('ip_address', sa.String(length=64), nullable=True),
+        sa.Column('user_agent', sa.String(length=255), nullable=True),
+        sa.Column('succeeded', sa.Boolean(), nullable=False),
+        sa.Column('message', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'monthly_closures',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('total_income', sa.Numeric(precision=15, scale=2), nullable=False),
+        sa.Column('total_expense', sa.Numeric(precision=15, scale=2), nullable=False),
+        sa.Column('balance', sa.Numeric(precision=15, scale=2), nullable=False),
+        sa.Column('closed_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'password_resets',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('token', sa.String(length=100), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('is_used', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('token'),
+    )
+    _create_table(
+        'system_shares',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('shared_user_id', sa.Integer(), nullable=True),
+        sa.Column('shared_email', sa.String(length=255), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('share_type', sa.String(length=20), nullable=False),
+        sa.Column('family_role', sa.String(length=50), nullable=True),
+        sa.Column('access_level', sa.String(length=20), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('accepted_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['shared_user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'workspaces',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('description', sa.String(length=255), nullable=True),
+        sa.Column('color', sa.String(length=7), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'categories',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('config_id', sa.Integer(), nullable=False),
+        sa.Column('workspace_id', sa.Integer(), nullable=True),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('type', sa.String(length=20), nullable=False),
+        sa.Column('icon', sa.String(length=100), nullable=True),
+        sa.Column('color', sa.String(length=20), nullable=True),
+        sa.Column('is_default', sa.Boolean(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['config_id'], ['finance_configs.id']),
+        sa.ForeignKeyConstraint(['workspace_id'], ['workspaces.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'credit_cards',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('workspace_id', sa.Integer(), nullable=True),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('last_digits', sa.String(length=4), nullable=True),
+        sa.Column('brand', sa.String(length=50), nullable=True),
+        sa.Column('limit', sa.Numeric(precision=15, scale=2), nullable=True),
+        sa.Column('closing_day', sa.Integer(), nullable=True),
+        sa.Column('due_day', sa.Integer(), nullable=True),
+        sa.Column('color', sa.String(length=7), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['workspace_id'], ['workspaces.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'family_members',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('config_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('role', sa.String(length=100), nullable=True),
+        sa.Column('birth_date', sa.Date(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['config_id'], ['finance_configs.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'workspace_invites',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('workspace_id', sa.Integer(), nullable=False),
+        sa.Column('invited_by_id', sa.Integer(), nullable=False),
+        sa.Column('invited_email', sa.String(length=255), nullable=False),
+        sa.Column('invited_user_id', sa.Integer(), nullable=True),
+        sa.Column('role', sa.String(length=20), nullable=True),
+        sa.Column('token', sa.String(length=100), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('responded_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['invited_by_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['invited_user_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['workspace_id'], ['workspaces.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('token'),
+    )
+    _create_table(
+        'workspace_members',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('workspace_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('role', sa.String(length=20), nullable=True),
+        sa.Column('joined_at', sa.DateTime(), nullable=False),
+        sa.Column('onboarding_completed', sa.Boolean(), nullable=False),
+        sa.Column('share_preferences', sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['workspace_id'], ['workspaces.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'subcategories',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('config_id', sa.Integer(), nullable=False),
+        sa.Column('workspace_id', sa.Integer(), nullable=True),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('icon', sa.String(length=100), nullable=True),
+        sa.Column('color', sa.String(length=20), nullable=True),
+        sa.Column('is_default', sa.Boolean(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id']),
+        sa.ForeignKeyConstraint(['config_id'], ['finance_configs.id']),
+        sa.ForeignKeyConstraint(['workspace_id'], ['workspaces.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'recurring_transactions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('subcategory_id', sa.Integer(), nullable=True),
+        sa.Column('subcategory_text', sa.String(length=255), nullable=True),
+        sa.Column('description', sa.String(length=255), nullable=False),
+        sa.Column('amount', sa.Numeric(precision=15, scale=2), nullable=False),
+        sa.Column('type', sa.String(length=20), nullable=False),
+        sa.Column('frequency', sa.String(length=20), nullable=False),
+        sa.Column('day_of_month', sa.Integer(), nullable=True),
+        sa.Column('day_of_week', sa.Integer(), nullable=True),
+        sa.Column('start_date', sa.Date(), nullable=False),
+        sa.Column('end_date', sa.Date(), nullable=True),
+        sa.Column('payment_method', sa.String(length=50), nullable=True),
+        sa.Column('credit_card_id', sa.Integer(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('notes', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id']),
+        sa.ForeignKeyConstraint(['credit_card_id'], ['credit_cards.id']),
+        sa.ForeignKeyConstraint(['subcategory_id'], ['subcategories.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'transactions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('subcategory_id', sa.Integer(), nullable=True),
+        sa.Column('subcategory_text', sa.String(length=255), nullable=True),
+        sa.Column('family_member_id', sa.Integer(), nullable=True),
+        sa.Column('description', sa.String(length=255), nullable=False),
+        sa.Column('amount', sa.Numeric(precision=15, scale=2), nullable=False),
+        sa.Column('type', sa.String(length=20), nullable=False),
+        sa.Column('transaction_date', sa.Date(), nullable=False),
+        sa.Column('is_paid', sa.Boolean(), nullable=False),
+        sa.Column('paid_date', sa.Date(), nullable=True),
+        sa.Column('payment_method', sa.String(length=50), nullable=True),
+        sa.Column('credit_card_id', sa.Integer(), nullable=True),
+        sa.Column('notes', sa.Text(), nullable=True),
+        sa.Column('frequency', sa.String(length=20), nullable=False),
+        sa.Column('is_recurring', sa.Boolean(), nullable=False),
+        sa.Column('is_fixed', sa.Boolean(), nullable=False),
+        sa.Column('recurring_transaction_id', sa.Integer(), nullable=True),
+        sa.Column('monthly_closure_id', sa.Integer(), nullable=True),
+        sa.Column('is_auto_loaded', sa.Boolean(), nullable=False),
+        sa.Column('workspace_id', sa.Integer(), nullable=True),
+        sa.Column('is_closed', sa.Boolean(), nullable=False),
+        sa.Column('proof_document_url', sa.String(length=500), nullable=True),
+        sa.Column('proof_document_data', sa.LargeBinary(), nullable=True),
+        sa.Column('proof_document_name', sa.String(length=255), nullable=True),
+        sa.Column('proof_document_storage_name', sa.String(length=255), nullable=True),
+        sa.Column('proof_document_mime', sa.String(length=255), nullable=True),
+        sa.Column('proof_document_size', sa.Integer(), nullable=True),
+        sa.Column('closed_date', sa.Date(), nullable=True),
+        sa.Column('closed_by_user_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id']),
+        sa.ForeignKeyConstraint(['closed_by_user_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['credit_card_id'], ['credit_cards.id']),
+        sa.ForeignKeyConstraint(['family_member_id'], ['family_members.id']),
+        sa.ForeignKeyConstraint(['monthly_closure_id'], ['monthly_closures.id']),
+        sa.ForeignKeyConstraint(['recurring_transaction_id'], ['recurring_transactions.id']),
+        sa.ForeignKeyConstraint(['subcategory_id'], ['subcategories.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['workspace_id'], ['workspaces.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'monthly_fixed_expenses',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('monthly_closure_id', sa.Integer(), nullable=False),
+        sa.Column('original_transaction_id', sa.Integer(), nullable=True),
+        sa.Column('description', sa.String(length=255), nullable=False),
+        sa.Column('amount', sa.Numeric(precision=15, scale=2), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id']),
+        sa.ForeignKeyConstraint(['monthly_closure_id'], ['monthly_closures.id']),
+        sa.ForeignKeyConstraint(['original_transaction_id'], ['transactions.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'transaction_attachments',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('transaction_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('file_name', sa.String(length=255), nullable=False),
+        sa.Column('file_path', sa.String(length=500), nullable=False),
+        sa.Column('file_size', sa.Integer(), nullable=False),
+        sa.Column('mime_type', sa.String(length=100), nullable=True),
+        sa.Column('uploaded_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['transaction_id'], ['transactions.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+def downgrade():
+    # Não removemos o schema base.
+    pass
@@ -0,0 +1,48 @@
+"""finanças: watermark de recorrências e rollups mensais
+
+Revision ID: 0002_finance_watermark_rollups
+Revises: 0001_baseline
+Create Date: 2026-10-16 09:10:00
+
+- recurring_transactions.workspace_id / generated_through (materialização por watermark)
+- workspaces.rollups_built_at / finance_configs.rollups_built_at
+- monthly_closures.workspace_id (rollup por workspace; NULL = livro pessoal)
+
+Depois do upgrade: ``flask finance-migrate-recurring`` e
+``flask finance-rollups rebuild``.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_finance_watermark_rollups'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+
+def _add_column(table, column):
+    with op.batch_alter_table(table) as batch_op:
+        batch_op.add_column(column)
+
+
+def _drop_column(table, column):
+    with op.batch_alter_table(table) as batch_op:
+        batch_op.drop_column(column)
+
+
+def upgrade():
+    _add_column('recurring_transactions', sa.Column('workspace_id', sa.Integer(), sa.ForeignKey('workspaces.id', name='fk_recurring_transactions_workspace_id'), nullable=True))
+    _add_column('recurring_transactions', sa.Column('generated_through', sa.Date(), nullable=True))
+    _add_column('workspaces', sa.Column('rollups_built_at', sa.DateTime(), nullable=True))
+    _add_column('finance_configs', sa.Column('rollups_built_at', sa.DateTime(), nullable=True))
+    _add_column('monthly_closures', sa.Column('workspace_id', sa.Integer(), sa.ForeignKey('workspaces.id', name='fk_monthly_closures_workspace_id'), nullable=True))
+
+
+def downgrade():
+    _drop_column('monthly_closures', 'workspace_id')
+    _drop_column('finance_configs', 'rollups_built_at')
+    _drop_column('workspaces', 'rollups_built_at')
+    _drop_column('recurring_transactions', 'generated_through')
+    _drop_column('recurring_transactions', 'workspace_id')
@@ -0,0 +1,63 @@
+"""índices compostos por workspace (substitui add_transaction_indexes.py)
+
+Revision ID: 0003_workspace_indexes
+Revises: 0002_finance_watermark_rollups
+Create Date: 2026-10-16 09:20:00
+
+Os índices antigos começavam por user_id, mas as queries quentes (listagem,
+saldo anterior, finance-ai) filtram por workspace_id + transaction_date
+(+ type). Os índices aqui seguem esses caminhos de acesso; a checagem
+``python check_query_plans.py`` confirma que o planner usa cada um deles.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_workspace_indexes'
+down_revision = '0002_finance_watermark_rollups'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_transactions_workspace_date_type', 'transactions', ['workspace_id', 'transaction_date', 'type']),
+    ('ix_transactions_user_date', 'transactions', ['user_id', 'transaction_date']),
+    ('ix_transactions_recurring_date', 'transactions', ['recurring_transaction_id', 'transaction_date']),
+    ('ix_recurring_transactions_workspace_active', 'recurring_transactions', ['workspace_id', 'is_active']),
+    ('ix_recurring_transactions_user_active', 'recurring_transactions', ['user_id', 'is_active']),
+    ('ix_monthly_closures_scope_period', 'monthly_closures', ['workspace_id', 'user_id', 'year', 'month']),
+    ('ix_transaction_attachments_transaction_id', 'transaction_attachments', ['transaction_id']),
+    ('ix_workspace_members_user_id', 'workspace_members', ['user_id']),
+    ('ix_workspace_members_workspace_user', 'workspace_members', ['workspace_id', 'user_id']),
+    ('ix_login_audit_email_created_at', 'login_audit', ['email', 'created_at']),
+]
+
+# Criados pelo antigo add_transaction_indexes.py e cobertos pelos índices acima
+# (idx_transactions_category continua, serve aos relatórios por categoria).
+LEGACY_INDEXES = [
+    ('idx_transactions_dashboard', 'transactions', ['user_id', 'transaction_date', 'type', 'is_paid']),
+    ('idx_transactions_recurring', 'transactions', ['user_id', 'recurring_transaction_id', 'transaction_date']),
+]
+
+
+def _index_names(table):
+    return {ix["name"] for ix in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+    # Os índices legados só existem onde o script antigo foi executado
+    for name, table, _columns in LEGACY_INDEXES:
+        if name in _index_names(table):
+            op.drop_index(name, table_name=table)
+
+
+def downgrade():
+    for name, table, columns in LEGACY_INDEXES:
+        op.create_index(name, table, columns)
+
+    for name, table, _columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,81 @@
+"""transactions.occurrence_month + índice único da ocorrência recorrente
+
+Revision ID: 0004_occurrence_key
+Revises: 0003_workspace_indexes
+Create Date: 2026-10-16 10:00:00
+
+Chave da ocorrência: (recurring_transaction_id, occurrence_month,
+coalesce(workspace_id, 0)). O backfill preenche occurrence_month das
+transações vinculadas a uma regra; se já houver duplicatas do mesmo mês,
+só a mais antiga recebe a chave (as demais ficam como estão, sem apagar dados).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_occurrence_key'
+down_revision = '0003_workspace_indexes'
+branch_labels = None
+depends_on = None
+
+INDEX_NAME = 'ux_transactions_occurrence'
+BATCH_SIZE = 1000
+
+
+def _backfill_occurrence_months(conn):
+    tx = sa.table(
+        'transactions',
+        sa.column('id', sa.Integer),
+        sa.column('recurring_transaction_id', sa.Integer),
+        sa.column('workspace_id', sa.Integer),
+        sa.column('transaction_date', sa.Date),
+        sa.column('occurrence_month', sa.Date),
+    )
+    rows = conn.execute(
+        sa.select(tx.c.id, tx.c.recurring_transaction_id, tx.c.workspace_id, tx.c.transaction_date)
+        .where(tx.c.recurring_transaction_id.isnot(None), tx.c.occurrence_month.is_(None))
+        .order_by(tx.c.id.asc())
+    ).all()
+
+    taken = {
+        (rid, month, wid or 0)
+        for rid, month, wid in conn.execute(
+            sa.select(tx.c.recurring_transaction_id, tx.c.occurrence_month, tx.c.workspace_id)
+            .where(tx.c.occurrence_month.isnot(None))
+        )
+    }
+    updates = []
+    for tx_id, rid, wid, tx_date in rows:
+        if not tx_date:
+            continue
+        month = tx_date.replace(day=1)
+        key = (rid, month, wid or 0)
+        if key in taken:
+            continue
+        taken.add(key)
+        updates.append({"tx_id": tx_id, "month": month})
+
+    stmt = tx.update().where(tx.c.id == sa.bindparam('tx_id')).values(occurrence_month=sa.bindparam('month'))
+    for i in range(0, len(updates), BATCH_SIZE):
+        conn.execute(stmt, updates[i:i + BATCH_SIZE])
+
+
+def upgrade():
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.add_column(sa.Column('occurrence_month', sa.Date(), nullable=True))
+
+    _backfill_occurrence_months(op.get_bind())
+
+    op.create_index(
+        INDEX_NAME,
+        'transactions',
+        ['recurring_transaction_id', 'occurrence_month', sa.text('coalesce(workspace_id, 0)')],
+        unique=True,
+    )
+
+
+def downgrade():
+    op.drop_index(INDEX_NAME, table_name='transactions')
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.drop_column('occurrence_month')
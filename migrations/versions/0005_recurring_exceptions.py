@@ -0,0 +1,25 @@
+"""recurring_transactions.exception_dates (meses excluídos da série)
+
+Revision ID: 0005_recurring_exceptions
+Revises: 0004_occurrence_key
+Create Date: 2026-10-16 10:30:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_recurring_exceptions'
+down_revision = '0004_occurrence_key'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('recurring_transactions') as batch_op:
+        batch_op.add_column(sa.Column('exception_dates', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('recurring_transactions') as batch_op:
+        batch_op.drop_column('exception_dates')
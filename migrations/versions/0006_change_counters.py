@@ -0,0 +1,28 @@
+"""finance_change_counters: contadores de mudança por escopo (ETag)
+
+Revision ID: 0006_change_counters
+Revises: 0005_recurring_exceptions
+Create Date: 2026-10-16 11:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_change_counters'
+down_revision = '0005_recurring_exceptions'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'finance_change_counters',
+        sa.Column('scope', sa.String(length=64), primary_key=True),
+        sa.Column('version', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table('finance_change_counters')
@@ -0,0 +1,58 @@
+"""categories.updated_at + finance_tombstones (sincronização incremental)
+
+Revision ID: 0007_sync_tombstones
+Revises: 0006_change_counters
+Create Date: 2026-10-16 11:30:00
+
+``/api/sync`` devolve o que mudou desde um instante: precisa de
+``updated_at`` em todas as entidades sincronizadas (categorias ainda não
+tinham; o backfill usa ``created_at``), de índices por (escopo, updated_at)
+nas transações e da tabela de tombstones para as exclusões.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_sync_tombstones'
+down_revision = '0006_change_counters'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_transactions_workspace_updated', 'transactions', ['workspace_id', 'updated_at']),
+    ('ix_transactions_user_updated', 'transactions', ['user_id', 'updated_at']),
+]
+
+
+def upgrade():
+    with op.batch_alter_table('categories') as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE categories SET updated_at = created_at WHERE updated_at IS NULL")
+    with op.batch_alter_table('categories') as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+    op.create_table(
+        'finance_tombstones',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('entity', sa.String(length=32), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('workspace_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_finance_tombstones_workspace_deleted', 'finance_tombstones', ['workspace_id', 'deleted_at'])
+    op.create_index('ix_finance_tombstones_user_deleted', 'finance_tombstones', ['user_id', 'deleted_at'])
+
+
+def downgrade():
+    op.drop_table('finance_tombstones')
+
+    for name, table, _columns in INDEXES:
+        op.drop_index(name, table_name=table)
+
+    with op.batch_alter_table('categories') as batch_op:
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,90 @@
+"""transactions.merchant_key + índice (user_id, merchant_key)
+
+Revision ID: 0008_merchant_key
+Revises: 0007_sync_tombstones
+Create Date: 2026-10-16 12:00:00
+
+Chave normalizada do estabelecimento (``_merchant_key``: sem acentos,
+dígitos, pontuação e sufixo de parcela) para buscas por igualdade/prefixo na
+sugestão de categoria, detecção de duplicatas e autocomplete. O backfill
+percorre as transações em lotes por id, com uma cópia do normalizador de
+``helpers.py`` como estava nesta revisão (a migration não importa o app).
+"""
+import re
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008_merchant_key'
+down_revision = '0007_sync_tombstones'
+branch_labels = None
+depends_on = None
+
+INDEX_NAME = 'ix_transactions_user_merchant'
+OCCURRENCE_INDEX_NAME = 'ux_transactions_occurrence'
+BATCH_SIZE = 1000
+MERCHANT_KEY_MAX = 120
+
+
+def _merchant_key(desc):
+    s = re.sub(r"\s*\(\s*\d+\s*/\s*\d+\s*\)\s*$", "", str(desc or "").strip()).strip().lower()
+    s = "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+    s = " ".join(re.findall(r"[a-z]+", s))[:MERCHANT_KEY_MAX].strip()
+    return s or None
+
+
+def _backfill_merchant_keys(conn):
+    tx = sa.table(
+        'transactions',
+        sa.column('id', sa.Integer),
+        sa.column('description', sa.String),
+        sa.column('merchant_key', sa.String),
+    )
+    stmt = tx.update().where(tx.c.id == sa.bindparam('tx_id')).values(merchant_key=sa.bindparam('key'))
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(tx.c.id, tx.c.description)
+            .where(tx.c.id > last_id, tx.c.merchant_key.is_(None))
+            .order_by(tx.c.id.asc())
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = [{"tx_id": tx_id, "key": _merchant_key(desc)} for tx_id, desc in rows]
+        updates = [u for u in updates if u["key"]]
+        if updates:
+            conn.execute(stmt, updates)
+
+
+def upgrade():
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.add_column(sa.Column('merchant_key', sa.String(length=120), nullable=True))
+
+    _backfill_merchant_keys(op.get_bind())
+
+    op.create_index(
+        INDEX_NAME,
+        'transactions',
+        ['user_id', 'merchant_key'],
+        postgresql_ops={'merchant_key': 'varchar_pattern_ops'},
+    )
+
+
+def downgrade():
+    op.drop_index(INDEX_NAME, table_name='transactions')
+    # No SQLite o drop_column recria a tabela a partir da reflexão, que não
+    # enxerga índices de expressão: o índice único da 0004 é refeito depois
+    op.drop_index(OCCURRENCE_INDEX_NAME, table_name='transactions')
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.drop_column('merchant_key')
+    op.create_index(
+        OCCURRENCE_INDEX_NAME,
+        'transactions',
+        ['recurring_transaction_id', 'occurrence_month', sa.text('coalesce(workspace_id, 0)')],
+        unique=True,
+    )
@@ -0,0 +1,47 @@
+"""stored_blobs + transaction_attachments.blob_id (comprovantes por hash)
+
+Revision ID: 0009_stored_blobs
+Revises: 0008_merchant_key
+Create Date: 2026-10-16 12:30:00
+
+Comprovantes passam a apontar para um conteúdo armazenado uma vez por
+SHA-256 (``stored_blobs``), com contagem de referências. Anexos antigos
+ficam com ``blob_id`` NULL e continuam servidos pelo ``file_path``.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009_stored_blobs'
+down_revision = '0008_merchant_key'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'stored_blobs',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('sha256', sa.String(length=64), nullable=False, unique=True),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('mime_type', sa.String(length=100), nullable=True),
+        sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('released_at', sa.DateTime(), nullable=True),
+    )
+
+    with op.batch_alter_table('transaction_attachments') as batch_op:
+        batch_op.add_column(sa.Column('blob_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            'fk_transaction_attachments_blob_id', 'stored_blobs', ['blob_id'], ['id']
+        )
+    op.create_index('ix_transaction_attachments_blob_id', 'transaction_attachments', ['blob_id'])
+
+
+def downgrade():
+    op.drop_index('ix_transaction_attachments_blob_id', table_name='transaction_attachments')
+    with op.batch_alter_table('transaction_attachments') as batch_op:
+        batch_op.drop_constraint('fk_transaction_attachments_blob_id', type_='foreignkey')
+        batch_op.drop_column('blob_id')
+    op.drop_table('stored_blobs')
@@ -0,0 +1,46 @@
+"""credit_card_invoices + índice (credit_card_id, transaction_date)
+
+Revision ID: 0010_credit_card_invoices
+Revises: 0009_stored_blobs
+Create Date: 2026-10-16 13:00:00
+
+Totais por ciclo de fatura de cada cartão, mantidos a cada escrita nas
+transações do cartão; o índice permite recalcular um ciclo sem varrer o
+histórico. Depois do upgrade: ``flask finance-invoices rebuild``.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010_credit_card_invoices'
+down_revision = '0009_stored_blobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_transactions_card_date', 'transactions', ['credit_card_id', 'transaction_date'])
+
+    op.create_table(
+        'credit_card_invoices',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column(
+            'credit_card_id', sa.Integer(),
+            sa.ForeignKey('credit_cards.id', ondelete='CASCADE'), nullable=False,
+        ),
+        sa.Column('reference_month', sa.Date(), nullable=False),
+        sa.Column('period_start', sa.Date(), nullable=False),
+        sa.Column('period_end', sa.Date(), nullable=False),
+        sa.Column('due_date', sa.Date(), nullable=True),
+        sa.Column('total', sa.Numeric(15, 2), nullable=False, server_default='0'),
+        sa.Column('paid_total', sa.Numeric(15, 2), nullable=False, server_default='0'),
+        sa.Column('transaction_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.UniqueConstraint('credit_card_id', 'reference_month', name='ux_credit_card_invoices_card_month'),
+    )
+
+
+def downgrade():
+    op.drop_table('credit_card_invoices')
+    op.drop_index('ix_transactions_card_date', table_name='transactions')
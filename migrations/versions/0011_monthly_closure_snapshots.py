@@ -0,0 +1,33 @@
+"""monthly_closures.category_totals + índice em monthly_fixed_expenses
+
+Revision ID: 0011_monthly_closure_snapshots
+Revises: 0010_credit_card_invoices
+Create Date: 2026-10-16 13:30:00
+
+Snapshot por categoria gravado ao fechar o mês (``flask finance-months
+close``); as despesas fixas do mês fechado são lidas pelo id do fechamento.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0011_monthly_closure_snapshots'
+down_revision = '0010_credit_card_invoices'
+branch_labels = None
+depends_on = None
+
+INDEX_NAME = 'ix_monthly_fixed_expenses_closure'
+
+
+def upgrade():
+    with op.batch_alter_table('monthly_closures') as batch_op:
+        batch_op.add_column(sa.Column('category_totals', sa.JSON(), nullable=True))
+
+    op.create_index(INDEX_NAME, 'monthly_fixed_expenses', ['monthly_closure_id'])
+
+
+def downgrade():
+    op.drop_index(INDEX_NAME, table_name='monthly_fixed_expenses')
+    with op.batch_alter_table('monthly_closures') as batch_op:
+        batch_op.drop_column('category_totals')
@@ -0,0 +1,28 @@
+"""recurring_transactions.interval
+
+Revision ID: 0012_recurring_interval
+Revises: 0011_monthly_closure_snapshots
+Create Date: 2026-10-16 15:00:00
+
+Regras "a cada N" dias/semanas/meses/anos: o passo da série é a frequência
+vezes ``interval`` (1 nas regras existentes).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0012_recurring_interval'
+down_revision = '0011_monthly_closure_snapshots'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('recurring_transactions') as batch_op:
+        batch_op.add_column(sa.Column('interval', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('recurring_transactions') as batch_op:
+        batch_op.drop_column('interval')
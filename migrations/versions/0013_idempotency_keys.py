@@ -0,0 +1,42 @@
+"""finance_idempotency_keys (respostas de POST com Idempotency-Key)
+
+Revision ID: 0013_idempotency_keys
+Revises: 0012_recurring_interval
+Create Date: 2026-10-16 16:00:00
+
+Criação de transação, importação de extrato e upload de comprovante
+repetidos com a mesma ``Idempotency-Key`` devolvem a resposta gravada em vez
+de executar de novo. As linhas expiram (``flask finance-idempotency-purge``).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0013_idempotency_keys'
+down_revision = '0012_recurring_interval'
+branch_labels = None
+depends_on = None
+
+TABLE = 'finance_idempotency_keys'
+
+
+def upgrade():
+    op.create_table(
+        TABLE,
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(length=128), nullable=False),
+        sa.Column('fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('status_code', sa.Integer(), nullable=True),
+        sa.Column('response_body', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.UniqueConstraint('user_id', 'key', name='ux_finance_idempotency_user_key'),
+    )
+    op.create_index('ix_finance_idempotency_expires', TABLE, ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_finance_idempotency_expires', table_name=TABLE)
+    op.drop_table(TABLE)
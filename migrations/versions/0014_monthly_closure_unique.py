@@ -0,0 +1,101 @@
+"""índice único do rollup mensal por (workspace, usuário, mês)
+
+Revision ID: 0014_monthly_closure_unique
+Revises: 0013_idempotency_keys
+Create Date: 2026-10-16 17:00:00
+
+Chave: (coalesce(workspace_id, 0), user_id, year, month). O recálculo dos
+rollups cria a linha com ON CONFLICT DO NOTHING e a trava antes de somar.
+Duplicatas que já existirem são unidas antes do índice: fica a linha fechada
+(ou a mais antiga), as despesas fixas do snapshot passam para ela e, se
+estiver aberta, os totais são recalculados das transações.
+"""
+from collections import defaultdict
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0014_monthly_closure_unique'
+down_revision = '0013_idempotency_keys'
+branch_labels = None
+depends_on = None
+
+INDEX_NAME = 'ux_monthly_closures_scope_period'
+
+
+def _merge_duplicates(conn):
+    mc = sa.table(
+        'monthly_closures',
+        sa.column('id', sa.Integer),
+        sa.column('workspace_id', sa.Integer),
+        sa.column('user_id', sa.Integer),
+        sa.column('year', sa.Integer),
+        sa.column('month', sa.Integer),
+        sa.column('status', sa.String),
+        sa.column('total_income', sa.Numeric),
+        sa.column('total_expense', sa.Numeric),
+        sa.column('balance', sa.Numeric),
+    )
+    fixed = sa.table('monthly_fixed_expenses', sa.column('monthly_closure_id', sa.Integer))
+    tx = sa.table(
+        'transactions',
+        sa.column('workspace_id', sa.Integer),
+        sa.column('user_id', sa.Integer),
+        sa.column('transaction_date', sa.Date),
+        sa.column('type', sa.String),
+        sa.column('amount', sa.Numeric),
+    )
+
+    groups = defaultdict(list)
+    for row_id, wid, uid, year, month, status in conn.execute(
+        sa.select(mc.c.id, mc.c.workspace_id, mc.c.user_id, mc.c.year, mc.c.month, mc.c.status)
+        .order_by(mc.c.id.asc())
+    ):
+        groups[(wid or 0, uid, year, month)].append((row_id, status))
+
+    for (wid, uid, year, month), rows in groups.items():
+        if len(rows) < 2:
+            continue
+        keep_id, keep_status = next((r for r in rows if r[1] == 'closed'), rows[0])
+        drop_ids = [row_id for row_id, _status in rows if row_id != keep_id]
+        conn.execute(
+            fixed.update().where(fixed.c.monthly_closure_id.in_(drop_ids)).values(monthly_closure_id=keep_id)
+        )
+        conn.execute(mc.delete().where(mc.c.id.in_(drop_ids)))
+        if keep_status == 'closed':
+            continue
+        start = date(year, month, 1)
+        end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+        income, expense = conn.execute(
+            sa.select(
+                sa.func.coalesce(sa.func.sum(sa.case((tx.c.type == 'income', tx.c.amount), else_=0)), 0),
+                sa.func.coalesce(sa.func.sum(sa.case((tx.c.type == 'expense', tx.c.amount), else_=0)), 0),
+            ).where(
+                tx.c.workspace_id.is_(None) if not wid else tx.c.workspace_id == wid,
+                tx.c.user_id == uid,
+                tx.c.transaction_date >= start,
+                tx.c.transaction_date < end,
+            )
+        ).one()
+        conn.execute(
+            mc.update().where(mc.c.id == keep_id).values(
+                total_income=income, total_expense=expense, balance=income - expense
+            )
+        )
+
+
+def upgrade():
+    _merge_duplicates(op.get_bind())
+    op.create_index(
+        INDEX_NAME,
+        'monthly_closures',
+        [sa.text('coalesce(workspace_id, 0)'), 'user_id', 'year', 'month'],
+        unique=True,
+    )
+
+
+def downgrade():
+    op.drop_index(INDEX_NAME, table_name='monthly_closures')
@@ -72,6 +72,10 @@ class Workspace(db.Model):
     color = db.Column(db.String(7), default="#3b82f6")  # Cor hex
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
+    # Quando os rollups mensais (monthly_closures) do workspace foram construídos
+    # (workspace novo: desde a criação, os rollups acompanham cada transação)
+    rollups_built_at = db.Column(db.DateTime, default=datetime.utcnow)
+
     owner = db.relationship("User", backref="workspaces")
     members = db.relationship("WorkspaceMember", backref="workspace", cascade="all, delete-orphan")
     transactions = db.relationship("Transaction", backref="workspace", foreign_keys="Transaction.workspace_id", cascade="all, delete-orphan")
@@ -83,6 +87,10 @@ class Workspace(db.Model):
 class WorkspaceMember(db.Model):
     """Membros de um workspace"""
     __tablename__ = "workspace_members"
+    __table_args__ = (
+        db.Index("ix_workspace_members_user_id", "user_id"),
+        db.Index("ix_workspace_members_workspace_user", "workspace_id", "user_id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     workspace_id = db.Column(db.Integer, db.ForeignKey("workspaces.id"), nullable=False)
@@ -147,6 +155,10 @@ class FinanceConfig(db.Model):
     # Configurações gerais
     currency = db.Column(db.String(10), default="BRL", nullable=False)
     timezone = db.Column(db.String(50), default="America/Sao_Paulo")
+
+    # Quando os rollups mensais do livro pessoal (sem workspace) foram construídos
+    # (configuração nova: desde a criação)
+    rollups_built_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -201,6 +213,7 @@ class Category(db.Model):
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
     # Relacionamentos
     transactions = db.relationship("Transaction", backref="category", lazy="dynamic")
@@ -259,9 +272,53 @@ class CreditCard(db.Model):
         return f"<CreditCard {self.name}>"
 
 
+class CreditCardInvoice(db.Model):
+    """Fatura de um ciclo do cartão: totais mantidos a cada escrita nas transações do cartão"""
+    __tablename__ = "credit_card_invoices"
+    __table_args__ = (
+        db.UniqueConstraint("credit_card_id", "reference_month", name="ux_credit_card_invoices_card_month"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    credit_card_id = db.Column(db.Integer, db.ForeignKey("credit_cards.id", ondelete="CASCADE"), nullable=False)
+    # Mês de fechamento da fatura (primeiro dia) e período de compras [period_start, period_end]
+    reference_month = db.Column(db.Date, nullable=False)
+    period_start = db.Column(db.Date, nullable=False)
+    period_end = db.Column(db.Date, nullable=False)
+    due_date = db.Column(db.Date)
+
+    total = db.Column(db.Numeric(15, 2), default=0, nullable=False)  # despesas - estornos
+    paid_total = db.Column(db.Numeric(15, 2), default=0, nullable=False)
+    transaction_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<CreditCardInvoice card={self.credit_card_id} {self.reference_month}>"
+
+
 class Transaction(db.Model):
     """Transações financeiras (receitas e despesas)"""
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Listagem, saldo e IA: filtram por workspace + período (+ tipo)
+        db.Index("ix_transactions_workspace_date_type", "workspace_id", "transaction_date", "type"),
+        # Livro pessoal (workspace_id NULL) e rollups por usuário
+        db.Index("ix_transactions_user_date", "user_id", "transaction_date"),
+        # Ocorrências de uma regra recorrente em um mês
+        db.Index("ix_transactions_recurring_date", "recurring_transaction_id", "transaction_date"),
+        # Faturas: transações de um cartão dentro de um ciclo
+        db.Index("ix_transactions_card_date", "credit_card_id", "transaction_date"),
+        # Sincronização incremental (/api/sync): alterações desde um instante
+        db.Index("ix_transactions_workspace_updated", "workspace_id", "updated_at"),
+        db.Index("ix_transactions_user_updated", "user_id", "updated_at"),
+        # Sugestão de categoria, duplicatas e autocomplete: igualdade/prefixo na chave do estabelecimento
+        db.Index(
+            "ix_transactions_user_merchant",
+            "user_id",
+            "merchant_key",
+            postgresql_ops={"merchant_key": "varchar_pattern_ops"},
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
@@ -272,6 +329,8 @@ class Transaction(db.Model):
     
     # Dados da transação
     description = db.Column(db.String(255), nullable=False)
+    # Descrição normalizada (_merchant_key): sem acentos, dígitos e sufixo de parcela
+    merchant_key = db.Column(db.String(120))
     amount = db.Column(db.Numeric(15, 2), nullable=False)
     type = db.Column(db.String(20), nullable=False)  # income ou expense
     
@@ -294,6 +353,9 @@ class Transaction(db.Model):
     
     # Recorrência (se veio de uma transação recorrente)
     recurring_transaction_id = db.Column(db.Integer, db.ForeignKey("recurring_transactions.id"))
+    # Chave da ocorrência: primeiro dia do mês (regras mensais/anuais) ou a própria data
+    # (diárias/semanais); com a regra e o workspace forma a chave única da ocorrência
+    occurrence_month = db.Column(db.Date)
     
     # Fechamento mensal
     monthly_closure_id = db.Column(db.Integer, db.ForeignKey("monthly_closures.id"))  # Qual mês pertence
@@ -305,7 +367,9 @@ class Transaction(db.Model):
     # Fechamento de despesa
     is_closed = db.Column(db.Boolean, default=False, nullable=False)
     proof_document_url = db.Column(db.String(500))
-    proof_document_data = db.Column(db.LargeBinary)
+    # Legado: blobs vão para o armazenamento de anexos (flask finance-migrate-proof-blobs);
+    # adiado para listagens e agregações nunca carregarem o conteúdo
+    proof_document_data = db.deferred(db.Column(db.LargeBinary))
     proof_document_name = db.Column(db.String(255))
     proof_document_storage_name = db.Column(db.String(255))
     proof_document_mime = db.Column(db.String(255))
@@ -324,9 +388,23 @@ class Transaction(db.Model):
         return f"<Transaction {self.description} R$ {self.amount}>"
 
 
+# Uma ocorrência por (regra, mês, workspace); livro pessoal (workspace NULL) conta como 0
+db.Index(
+    "ux_transactions_occurrence",
+    Transaction.recurring_transaction_id,
+    Transaction.occurrence_month,
+    db.func.coalesce(Transaction.workspace_id, 0),
+    unique=True,
+)
+
+
 class RecurringTransaction(db.Model):
     """Transações recorrentes (salário, aluguel, etc.)"""
     __tablename__ = "recurring_transactions"
+    __table_args__ = (
+        db.Index("ix_recurring_transactions_workspace_active", "workspace_id", "is_active"),
+        db.Index("ix_recurring_transactions_user_active", "user_id", "is_active"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
@@ -340,13 +418,23 @@ class RecurringTransaction(db.Model):
     type = db.Column(db.String(20), nullable=False)  # income ou expense
     
     # Configuração de recorrência
-    frequency = db.Column(db.String(20), nullable=False)  # monthly, weekly, yearly
+    frequency = db.Column(db.String(20), nullable=False)  # daily, weekly, biweekly, monthly, yearly
+    interval = db.Column(db.Integer, default=1, nullable=False, server_default="1")  # A cada N períodos
     day_of_month = db.Column(db.Integer)  # Dia do mês (1-31)
     day_of_week = db.Column(db.Integer)  # Dia da semana (0-6, segunda=0)
     
     # Período de validade
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date)  # Null = sem fim
+
+    # Workspace onde as ocorrências são geradas
+    workspace_id = db.Column(db.Integer, db.ForeignKey("workspaces.id"), nullable=True)
+
+    # Watermark: chave da última ocorrência já materializada em transactions
+    generated_through = db.Column(db.Date)
+
+    # Exceções: ocorrências excluídas da série (lista de chaves ISO)
+    exception_dates = db.Column(db.JSON)
     
     # Pagamento
     payment_method = db.Column(db.String(50))
@@ -373,11 +461,15 @@ class RecurringTransaction(db.Model):
 
 
 class MonthlyClosure(db.Model):
-    """Fechamento mensal - rastreia cada mês encerrado"""
+    """Fechamento mensal - totais do mês por (workspace, usuário); também serve de rollup do saldo"""
     __tablename__ = "monthly_closures"
+    __table_args__ = (
+        db.Index("ix_monthly_closures_scope_period", "workspace_id", "user_id", "year", "month"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    workspace_id = db.Column(db.Integer, db.ForeignKey("workspaces.id"), nullable=True)  # Null = livro pessoal
     
     # Período
     year = db.Column(db.Integer, nullable=False)
@@ -390,6 +482,9 @@ class MonthlyClosure(db.Model):
     total_income = db.Column(db.Numeric(15, 2), default=0, nullable=False)
     total_expense = db.Column(db.Numeric(15, 2), default=0, nullable=False)
     balance = db.Column(db.Numeric(15, 2), default=0, nullable=False)
+
+    # Snapshot do fechamento: [{"type", "category_id", "name", "total", "count"}, ...]
+    category_totals = db.Column(db.JSON)
     
     # Timestamps
     closed_at = db.Column(db.DateTime)  # Quando foi fechado
@@ -403,9 +498,23 @@ class MonthlyClosure(db.Model):
         return f"<MonthlyClosure {self.year}-{self.month:02d} ({self.status})>"
 
 
+# Uma linha de rollup por (workspace, usuário, mês); livro pessoal (workspace NULL) conta como 0
+db.Index(
+    "ux_monthly_closures_scope_period",
+    db.func.coalesce(MonthlyClosure.workspace_id, 0),
+    MonthlyClosure.user_id,
+    MonthlyClosure.year,
+    MonthlyClosure.month,
+    unique=True,
+)
+
+
 class MonthlyFixedExpense(db.Model):
     """Snapshot de despesas fixas copiadas para o próximo mês"""
     __tablename__ = "monthly_fixed_expenses"
+    __table_args__ = (
+        db.Index("ix_monthly_fixed_expenses_closure", "monthly_closure_id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     monthly_closure_id = db.Column(db.Integer, db.ForeignKey("monthly_closures.id"), nullable=False)
@@ -425,6 +534,60 @@ class MonthlyFixedExpense(db.Model):
         return f"<MonthlyFixedExpense {self.description} R$ {self.amount}>"
 
 
+class FinanceChangeCounter(db.Model):
+    """Contador de mudanças por escopo (transações de um workspace, categorias de um usuário...) - base dos ETags"""
+    __tablename__ = "finance_change_counters"
+
+    scope = db.Column(db.String(64), primary_key=True)  # ex.: "tx:w12", "tx:u5", "cat:u5", "card:w12", "ws:12"
+    version = db.Column(db.BigInteger, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<FinanceChangeCounter {self.scope} v{self.version}>"
+
+
+class FinanceTombstone(db.Model):
+    """Registro de exclusão (transação, categoria, cartão, recorrência) para a sincronização incremental"""
+    __tablename__ = "finance_tombstones"
+    __table_args__ = (
+        db.Index("ix_finance_tombstones_workspace_deleted", "workspace_id", "deleted_at"),
+        db.Index("ix_finance_tombstones_user_deleted", "user_id", "deleted_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(32), nullable=False)  # transaction, category, credit_card, recurring
+    entity_id = db.Column(db.Integer, nullable=False)
+    # Sem FK: o registro sobrevive à exclusão do workspace/usuário
+    workspace_id = db.Column(db.Integer, nullable=True)
+    user_id = db.Column(db.Integer, nullable=True)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<FinanceTombstone {self.entity} {self.entity_id}>"
+
+
+class IdempotencyKey(db.Model):
+    """Resposta de um POST com ``Idempotency-Key``: repetições do mesmo pedido recebem a resposta gravada"""
+    __tablename__ = "finance_idempotency_keys"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "key", name="ux_finance_idempotency_user_key"),
+        db.Index("ix_finance_idempotency_expires", "expires_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Sem FK: registro temporário, apagado pela retenção
+    user_id = db.Column(db.Integer, nullable=False)
+    key = db.Column(db.String(128), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)  # SHA-256 de método, rota e corpo
+    status_code = db.Column(db.Integer)  # Null = requisição em andamento
+    response_body = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<IdempotencyKey {self.user_id}:{self.key}>"
+
+
 class SystemShare(db.Model):
     """Compartilhamento do sistema entre usuários"""
     __tablename__ = "system_shares"
@@ -462,6 +625,9 @@ class SystemShare(db.Model):
 
 class LoginAudit(db.Model):
     __tablename__ = "login_audit"
+    __table_args__ = (
+        db.Index("ix_login_audit_email_created_at", "email", "created_at"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
@@ -613,9 +779,30 @@ class NewsletterSubscriber(db.Model):
         return f"<NewsletterSubscriber {self.email} active={self.active}>"
 
 
+class StoredBlob(db.Model):
+    """Conteúdo de comprovante armazenado uma vez por SHA-256, com contagem de referências"""
+    __tablename__ = "stored_blobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    size = db.Column(db.Integer, nullable=False)  # em bytes
+    mime_type = db.Column(db.String(100))
+    # Comprovantes que apontam para o conteúdo; em 0 o arquivo é apagado por finance-attachments-gc
+    ref_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    released_at = db.Column(db.DateTime)
+
+    def __repr__(self) -> str:
+        return f"<StoredBlob {self.sha256[:12]} refs={self.ref_count}>"
+
+
 class TransactionAttachment(db.Model):
     """Comprovantes anexados às transações (múltiplos por transação)"""
     __tablename__ = "transaction_attachments"
+    __table_args__ = (
+        db.Index("ix_transaction_attachments_transaction_id", "transaction_id"),
+        db.Index("ix_transaction_attachments_blob_id", "blob_id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     transaction_id = db.Column(db.Integer, db.ForeignKey("transactions.id"), nullable=False)
@@ -626,6 +813,8 @@ class TransactionAttachment(db.Model):
     file_path = db.Column(db.String(500), nullable=False)
     file_size = db.Column(db.Integer, nullable=False)  # em bytes
     mime_type = db.Column(db.String(100))
+    # Conteúdo no armazenamento endereçado por hash (NULL em anexos antigos, só com file_path)
+    blob_id = db.Column(db.Integer, db.ForeignKey("stored_blobs.id"), nullable=True)
     
     # Timestamps
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -633,6 +822,7 @@ class TransactionAttachment(db.Model):
     # Relationships
     transaction = db.relationship("Transaction", backref="attachments", lazy=True)
     user = db.relationship("User", backref="transaction_attachments", lazy=True)
+    blob = db.relationship("StoredBlob", lazy=True)
 
     def __repr__(self) -> str:
         return f"<TransactionAttachment {self.file_name} for Transaction {self.transaction_id}>"
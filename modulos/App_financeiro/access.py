@@ -0,0 +1,239 @@
+"""
+Acesso a Workspaces - Papéis do usuário por request e em cache
+==============================================================
+
+Uma request de finanças pergunta várias vezes "o usuário X acessa o
+workspace Y e com qual papel?" (workspace ativo, preferências de
+compartilhamento, permissão de edição, listagem de membros...). Este módulo
+resolve isso uma vez:
+
+- ``_user_workspace_roles(user_id)`` carrega todos os workspaces do usuário
+  (dono ou membro) com uma única query (Workspace LEFT JOIN WorkspaceMember);
+- o resultado fica memorizado em ``flask.g`` durante a request e num cache de
+  processo com TTL curto (``FINANCE_ACCESS_TTL``, padrão 30s);
+- mudanças em ``Workspace`` (dono/remoção), ``WorkspaceMember`` e
+  ``WorkspaceInvite`` invalidam o cache no commit da sessão (no worker que
+  fez o commit);
+- nos demais workers, cada entrada guarda as versões dos contadores de
+  mudança de que depende (``wsu:<usuário>`` e ``ws:<workspace>``, ver
+  ``change_counters``) e é descartada quando alguma mudou (uma query por PK
+  na primeira consulta da request): membro removido perde o acesso na hora
+  em todos os processos.
+"""
+
+import os
+import threading
+import time
+
+from flask import g, has_app_context
+from sqlalchemy import and_, event, or_
+from sqlalchemy.orm import Session, attributes
+
+from extensions import db
+from models import Workspace, WorkspaceInvite, WorkspaceMember
+
+from .change_counters import _scope_versions, _user_workspaces_scope, _workspace_scope
+from .helpers import _dbg, _history_values, _keep_previous_value
+
+_ACCESS_TTL = float(os.getenv("FINANCE_ACCESS_TTL", "30"))
+_SESSION_KEY = "finance_access_changes"
+_G_KEY = "_finance_access"
+
+_lock = threading.Lock()
+_user_cache: dict = {}       # user_id -> (expira_em, versões, {workspace_id: papel})
+_members_cache: dict = {}    # workspace_id -> (expira_em, versões, [user_ids])
+
+
+# ---------------------------------------------------------------------------
+# Memo por request + cache de processo
+# ---------------------------------------------------------------------------
+
+def _request_memo() -> dict | None:
+    if not has_app_context():
+        return None
+    memo = g.get(_G_KEY)
+    if memo is None:
+        memo = {"users": {}, "members": {}}
+        setattr(g, _G_KEY, memo)
+    return memo
+
+
+def _cached(cache: dict, key):
+    """Valor do cache se não expirou e os contadores de mudança não andaram."""
+    with _lock:
+        entry = cache.get(key)
+    if not entry:
+        return None
+    expires_at, versions, value = entry
+    if expires_at > time.monotonic() and _scope_versions(versions) == versions:
+        return value
+    with _lock:
+        if cache.get(key) is entry:
+            cache.pop(key, None)
+    return None
+
+
+def _store(cache: dict, key, value, versions: dict) -> None:
+    """Guarda ``value`` com as versões lidas *antes* de carregá-lo (mudança no meio invalida)."""
+    if _ACCESS_TTL <= 0:
+        return
+    with _lock:
+        cache[key] = (time.monotonic() + _ACCESS_TTL, versions, value)
+
+
+def _load_user_roles(user_id: int) -> dict:
+    rows = (
+        db.session.query(Workspace.id, Workspace.owner_id, WorkspaceMember.role)
+        .outerjoin(
+            WorkspaceMember,
+            and_(WorkspaceMember.workspace_id == Workspace.id, WorkspaceMember.user_id == user_id),
+        )
+        .filter(or_(Workspace.owner_id == user_id, WorkspaceMember.user_id == user_id))
+        .order_by(Workspace.id.asc())
+        .all()
+    )
+    roles = {}
+    for workspace_id, owner_id, role in rows:
+        if int(owner_id) == int(user_id):
+            roles[int(workspace_id)] = "owner"
+        else:
+            roles[int(workspace_id)] = (role or "viewer").strip().lower()
+    return roles
+
+
+def _user_workspace_roles(user_id: int) -> dict:
+    """Retorna ``{workspace_id: papel}`` ("owner", "editor", "viewer") do usuário."""
+    if not user_id:
+        return {}
+    user_id = int(user_id)
+    memo = _request_memo()
+    if memo is not None and user_id in memo["users"]:
+        return memo["users"][user_id]
+
+    roles = _cached(_user_cache, user_id)
+    if roles is None:
+        versions = _scope_versions([_user_workspaces_scope(user_id)])
+        roles = _load_user_roles(user_id)
+        # Workspace removido/alterado também invalida (ws:<id> de cada um)
+        versions.update(_scope_versions([_workspace_scope(wid) for wid in roles]))
+        _store(_user_cache, user_id, roles, versions)
+
+    if memo is not None:
+        memo["users"][user_id] = roles
+    return roles
+
+
+def _workspace_role(user_id: int, workspace_id: int):
+    """Papel do usuário no workspace, ou None se não tiver acesso."""
+    if not user_id or not workspace_id:
+        return None
+    try:
+        return _user_workspace_roles(int(user_id)).get(int(workspace_id))
+    except (TypeError, ValueError):
+        return None
+
+
+def _has_workspace_access(user_id: int, workspace_id: int) -> bool:
+    return _workspace_role(user_id, workspace_id) is not None
+
+
+def _user_workspace_ids(user_id: int) -> list:
+    """Workspaces do usuário (dono ou membro), em ordem de id."""
+    return list(_user_workspace_roles(user_id).keys())
+
+
+def _default_workspace_id(user_id: int):
+    """Primeiro workspace (por id) onde o usuário é dono; senão, o primeiro onde é membro."""
+    roles = _user_workspace_roles(user_id)
+    owned = [wid for wid, role in roles.items() if role == "owner"]
+    return (owned or list(roles) or [None])[0]
+
+
+def _workspace_user_ids(workspace_id: int) -> list:
+    """Usuários com acesso ao workspace (dono + membros)."""
+    if not workspace_id:
+        return []
+    workspace_id = int(workspace_id)
+    memo = _request_memo()
+    if memo is not None and workspace_id in memo["members"]:
+        return memo["members"][workspace_id]
+
+    user_ids = _cached(_members_cache, workspace_id)
+    if user_ids is None:
+        versions = _scope_versions([_workspace_scope(workspace_id)])
+        owner_id = db.session.query(Workspace.owner_id).filter(Workspace.id == workspace_id).scalar()
+        user_ids = []
+        if owner_id:
+            user_ids.append(int(owner_id))
+        for (uid,) in db.session.query(WorkspaceMember.user_id).filter(WorkspaceMember.workspace_id == workspace_id).all():
+            if uid and int(uid) not in user_ids:
+                user_ids.append(int(uid))
+        _store(_members_cache, workspace_id, user_ids, versions)
+
+    if memo is not None:
+        memo["members"][workspace_id] = user_ids
+    return user_ids
+
+
+# ---------------------------------------------------------------------------
+# Invalidação
+# ---------------------------------------------------------------------------
+
+def _invalidate_access(user_ids=(), workspace_ids=()) -> None:
+    """Remove do cache (processo e request atual) usuários e workspaces afetados."""
+    user_ids = {int(u) for u in user_ids if u}
+    workspace_ids = {int(w) for w in workspace_ids if w}
+    if not user_ids and not workspace_ids:
+        return
+
+    with _lock:
+        for uid, (_, _versions, roles) in list(_user_cache.items()):
+            if uid in user_ids or workspace_ids.intersection(roles):
+                _user_cache.pop(uid, None)
+        for wid, (_, _versions, members) in list(_members_cache.items()):
+            if wid in workspace_ids or user_ids.intersection(members):
+                _members_cache.pop(wid, None)
+
+    if has_app_context() and g.get(_G_KEY) is not None:
+        setattr(g, _G_KEY, None)
+    _dbg(f"[ACCESS] Cache invalidado users={sorted(user_ids)} workspaces={sorted(workspace_ids)}")
+
+
+# Garante o valor antigo no histórico mesmo com o atributo expirado (ex.: troca
+# de dono: o dono anterior também precisa sair do cache).
+for _attr in (Workspace.owner_id, WorkspaceMember.user_id, WorkspaceMember.workspace_id):
+    event.listen(_attr, "set", _keep_previous_value, active_history=True, retval=True)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_access_changes(session, flush_context):
+    user_ids, workspace_ids = set(), set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Workspace):
+            if obj in session.dirty and not attributes.get_history(obj, "owner_id").has_changes():
+                continue
+            workspace_ids.add(obj.id)
+            user_ids.update(filter(None, _history_values(obj, "owner_id")))
+        elif isinstance(obj, WorkspaceMember):
+            workspace_ids.update(filter(None, _history_values(obj, "workspace_id")))
+            user_ids.update(filter(None, _history_values(obj, "user_id")))
+        elif isinstance(obj, WorkspaceInvite):
+            workspace_ids.update(filter(None, _history_values(obj, "workspace_id")))
+            user_ids.update(filter(None, _history_values(obj, "invited_user_id")))
+
+    if user_ids or workspace_ids:
+        pending = session.info.setdefault(_SESSION_KEY, (set(), set()))
+        pending[0].update(user_ids)
+        pending[1].update(workspace_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_access_changes(session):
+    pending = session.info.pop(_SESSION_KEY, None)
+    if pending:
+        _invalidate_access(*pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_access_changes(session):
+    session.info.pop(_SESSION_KEY, None)
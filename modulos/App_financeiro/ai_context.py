@@ -0,0 +1,254 @@
+"""
+Contexto do Workspace para a IA - Agregação em uma passada + cache
+==================================================================
+
+``/api/finance-ai`` manda à IA um resumo do workspace: totais do mês e dos
+últimos 90 dias, gastos no cartão (transações com ``credit_card_id``) e a
+fatura atual de cada cartão, top categorias, despesas por método de
+pagamento, indícios de empréstimo e as últimas transações.
+
+Em vez de uma query por indicador, ``_aggregate_context`` faz um único scan
+agrupado na janela [hoje - 90 dias, fim do mês] com flags por linha (no mês,
+até hoje, texto de empréstimo) e monta todos os totais em Python; as últimas
+transações (e os exemplos de empréstimo, se houver) vêm de leituras curtas
+pelo índice de data.
+
+O resultado fica em cache de processo por (workspace, escopo de
+compartilhamento, dia), validado pelas versões dos contadores de mudança
+(transações, cartões e workspace, categorias dos membros): qualquer escrita no
+workspace invalida, e turnos seguidos do chat não reagregam nada.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, func, or_
+
+from extensions import db
+from models import Category, CreditCard, CreditCardInvoice, Transaction, Workspace
+
+from .access import _workspace_user_ids
+from .change_counters import _card_scopes, _category_scope, _scope_versions, _tx_scope, _workspace_scope
+from .helpers import _dbg
+from .invoices import _invoice_month, _invoice_payload
+
+_CACHE_SIZE = int(os.getenv("FINANCE_AI_CONTEXT_CACHE", "256"))
+_LOAN_KEYWORDS = ("emprest", "emprést", "financ", "parcela", "consign", "juros")
+
+_lock = threading.Lock()
+_cache: OrderedDict = OrderedDict()  # (workspace_id, user_id|None, dia) -> (versões, contexto)
+
+
+def _loan_text_filter():
+    text_or = []
+    for k in _LOAN_KEYWORDS:
+        text_or.append(func.lower(func.coalesce(Transaction.description, "")).like(f"%{k}%"))
+        text_or.append(func.lower(func.coalesce(Transaction.notes, "")).like(f"%{k}%"))
+        text_or.append(func.lower(func.coalesce(Category.name, "")).like(f"%{k}%"))
+    return or_(*text_or)
+
+
+def _scope_filters(workspace_id: int, user_id) -> list:
+    filters = [Transaction.workspace_id == int(workspace_id)]
+    if user_id:
+        filters.append(Transaction.user_id == int(user_id))
+    return filters
+
+
+def _aggregate_context(workspace_id: int, user_id, today: date) -> dict:
+    """Calcula o resumo do workspace (``user_id`` só quando as transações não são compartilhadas)."""
+    month_start = date(today.year, today.month, 1)
+    month_end = date(today.year + 1, 1, 1) if today.month == 12 else date(today.year, today.month + 1, 1)
+    start_90d = today - timedelta(days=90)
+    start_30d = today - timedelta(days=30)
+    scope = _scope_filters(workspace_id, user_id)
+    loan_text = _loan_text_filter()
+
+    # Um scan: cada linha da janela vira (tipo, categoria, método, no mês?, até hoje?, empréstimo?, cartão?)
+    flagged = (
+        db.session.query(
+            Transaction.type.label("tx_type"),
+            func.coalesce(Category.name, "Sem categoria").label("category"),
+            func.lower(func.coalesce(Transaction.payment_method, "")).label("payment_method"),
+            case((Transaction.transaction_date >= month_start, 1), else_=0).label("in_month"),
+            case((Transaction.transaction_date <= today, 1), else_=0).label("in_90d"),
+            case((loan_text, 1), else_=0).label("is_loan"),
+            case((Transaction.credit_card_id.isnot(None), 1), else_=0).label("on_card"),
+            Transaction.amount.label("amount"),
+        )
+        .outerjoin(Category, Category.id == Transaction.category_id)
+        .filter(*scope, Transaction.transaction_date >= start_90d, Transaction.transaction_date < month_end)
+        .subquery()
+    )
+    groups = db.session.query(
+        flagged.c.tx_type,
+        flagged.c.category,
+        flagged.c.payment_method,
+        flagged.c.in_month,
+        flagged.c.in_90d,
+        flagged.c.is_loan,
+        flagged.c.on_card,
+        func.count(),
+        func.coalesce(func.sum(flagged.c.amount), 0),
+    ).group_by(
+        flagged.c.tx_type,
+        flagged.c.category,
+        flagged.c.payment_method,
+        flagged.c.in_month,
+        flagged.c.in_90d,
+        flagged.c.is_loan,
+        flagged.c.on_card,
+    ).all()
+
+    income_month = expense_month = income_90d = expense_90d = credit_card_month = 0.0
+    by_category, by_payment_method = {}, {}
+    loan_count, loan_total = 0, 0.0
+    for tx_type, category, payment_method, in_month, in_90d, is_loan, on_card, count, total in groups:
+        total = float(total or 0)
+        is_expense = tx_type == "expense"
+        if in_month:
+            if tx_type == "income":
+                income_month += total
+            elif is_expense:
+                expense_month += total
+                by_category[category] = by_category.get(category, 0.0) + total
+                by_payment_method[payment_method] = by_payment_method.get(payment_method, 0.0) + total
+                if on_card:
+                    credit_card_month += total
+        if in_90d:
+            if tx_type == "income":
+                income_90d += total
+            elif is_expense:
+                expense_90d += total
+                if is_loan:
+                    loan_count += int(count or 0)
+                    loan_total += total
+
+    top_categories = [
+        {"category": str(name), "spent": spent}
+        for name, spent in sorted(by_category.items(), key=lambda item: item[1], reverse=True)[:7]
+    ]
+    expense_by_payment_method = [
+        {"payment_method": (pm or "").strip() or None, "spent": spent}
+        for pm, spent in sorted(by_payment_method.items(), key=lambda item: item[1], reverse=True)[:10]
+    ]
+
+    recent_rows = (
+        db.session.query(
+            Transaction.transaction_date, Transaction.type, Transaction.amount, Transaction.description,
+            Category.name, Transaction.payment_method, Transaction.is_paid,
+        )
+        .outerjoin(Category, Category.id == Transaction.category_id)
+        .filter(*scope, Transaction.transaction_date >= start_30d, Transaction.transaction_date <= today)
+        .order_by(Transaction.transaction_date.desc(), Transaction.created_at.desc())
+        .limit(25)
+        .all()
+    )
+    recent_transactions = [
+        {
+            "date": d.isoformat() if d else None,
+            "type": tx_type,
+            "amount": float(amount or 0),
+            "description": description,
+            "category": category,
+            "payment_method": payment_method,
+            "is_paid": bool(is_paid),
+        }
+        for d, tx_type, amount, description, category, payment_method, is_paid in recent_rows
+    ]
+
+    loan_examples = []
+    if loan_count:
+        loan_rows = (
+            db.session.query(Transaction.transaction_date, Transaction.amount, Transaction.description, Category.name)
+            .outerjoin(Category, Category.id == Transaction.category_id)
+            .filter(
+                *scope,
+                Transaction.type == "expense",
+                Transaction.transaction_date >= start_90d,
+                Transaction.transaction_date <= today,
+                loan_text,
+            )
+            .order_by(Transaction.transaction_date.desc(), Transaction.created_at.desc())
+            .limit(8)
+            .all()
+        )
+        loan_examples = [
+            {"date": d.isoformat() if d else None, "amount": float(amount or 0), "description": description, "category": category}
+            for d, amount, description, category in loan_rows
+        ]
+
+    workspace_name = db.session.query(Workspace.name).filter(Workspace.id == int(workspace_id)).scalar()
+    return {
+        "workspace_id": int(workspace_id),
+        "workspace_name": workspace_name,
+        "month": f"{today.year:04d}-{today.month:02d}",
+        "income_month": income_month,
+        "expense_month": expense_month,
+        "balance_month": income_month - expense_month,
+        "income_90d": income_90d,
+        "expense_90d": expense_90d,
+        "expense_90d_monthly_avg_estimate": (expense_90d / 3.0) if expense_90d else 0.0,
+        "credit_card_expense_month": credit_card_month,
+        "credit_card_invoices": _current_invoices(workspace_id, today),
+        "expense_by_payment_method_month": expense_by_payment_method,
+        "top_expense_categories_month": top_categories,
+        "recent_transactions_30d": recent_transactions,
+        "loan_hints_90d": {"count": loan_count, "total": loan_total, "examples": loan_examples},
+    }
+
+
+def _current_invoices(workspace_id: int, today: date) -> list:
+    """Fatura do ciclo atual de cada cartão ativo do workspace (linhas de ``credit_card_invoices``)."""
+    cards = CreditCard.query.filter(CreditCard.workspace_id == int(workspace_id), CreditCard.is_active == True).all()
+    if not cards:
+        return []
+    current = {c.id: _invoice_month(c.closing_day, today) for c in cards}
+    rows = {
+        (r.credit_card_id, r.reference_month): r
+        for r in CreditCardInvoice.query.filter(
+            CreditCardInvoice.credit_card_id.in_(list(current)),
+            CreditCardInvoice.reference_month.in_(set(current.values())),
+        ).all()
+    }
+    items = []
+    for card in cards:
+        row = rows.get((card.id, current[card.id]))
+        invoice = _invoice_payload(card, current[card.id], today, row) if row else None
+        items.append({
+            "card": card.name,
+            "limit": float(card.limit or 0),
+            "closing_day": card.closing_day,
+            "due_day": card.due_day,
+            "current_invoice_total": invoice["total"] if invoice else 0.0,
+            "current_invoice_due_date": invoice["due_date"] if invoice else None,
+        })
+    return items
+
+
+def _workspace_ai_context(workspace_id: int, user_id: int, share_transactions: bool, today: date | None = None) -> dict:
+    """Resumo do workspace para a IA, do cache quando nada mudou no escopo desde o cálculo."""
+    today = today or datetime.utcnow().date()
+    scope_user = None if share_transactions else int(user_id)
+    key = (int(workspace_id), scope_user, today.isoformat())
+    scopes = [_tx_scope(workspace_id, None), _workspace_scope(workspace_id)] + _card_scopes(workspace_id, None)
+    scopes += [_category_scope(uid) for uid in _workspace_user_ids(workspace_id)]
+    versions = _scope_versions(scopes)
+
+    with _lock:
+        entry = _cache.get(key)
+        if entry and entry[0] == versions:
+            _cache.move_to_end(key)
+            _dbg(f"[AI_CONTEXT] Cache hit workspace={workspace_id}")
+            return entry[1]
+
+    context = _aggregate_context(int(workspace_id), scope_user, today)
+    with _lock:
+        _cache[key] = (versions, context)
+        _cache.move_to_end(key)
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    _dbg(f"[AI_CONTEXT] Contexto recalculado workspace={workspace_id}")
+    return context
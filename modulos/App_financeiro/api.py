@@ -5,80 +5,88 @@ API REST para Aplicativo Mobile (Flutter) - Gerenciamento Financeiro
 Endpoints JSON para autenticação e operações financeiras via app mobile.
 """
 
-from flask import Blueprint, request, jsonify, session, current_app
-from sqlalchemy import func, case, or_
+from flask import Blueprint, request, jsonify, session, current_app, stream_with_context
+from sqlalchemy import func, case, and_, or_, tuple_
 from werkzeug.security import check_password_hash, generate_password_hash
 from datetime import datetime, timedelta, date
+from decimal import Decimal
+import base64
 import math
 import random
 import os
 import json
-import requests
 import calendar
 import re
 import secrets
 
 from extensions import db
-from models import User, Workspace, WorkspaceMember, WorkspaceInvite, EmailVerification, LoginAudit, Transaction, Category, FinanceConfig, RecurringTransaction, TransactionAttachment, CreditCard
+from models import User, Workspace, WorkspaceMember, WorkspaceInvite, EmailVerification, LoginAudit, Transaction, Category, FinanceConfig, RecurringTransaction, TransactionAttachment, CreditCard, FinanceTombstone
 from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.utils import secure_filename
 from email_service import send_workspace_invitation
 
+from .helpers import (
+    _dbg,
+    _last_day_of_month,
+    _normalize_str,
+    _shift_month_simple,
+    _strip_installment_suffix,
+)
+from .ai_context import _workspace_ai_context
+from .access import (
+    _default_workspace_id,
+    _has_workspace_access,
+    _user_workspace_ids,
+    _user_workspace_roles,
+    _workspace_role,
+    _workspace_user_ids,
+)
+from .change_counters import _card_scopes, _category_scope, _scopes_etag, _tx_scope, _workspace_scope
+from .rollups import ClosedMonthError, _mark_rollups_for_query, _opening_balance
+from .closures import _close_month, _month_summary, _reopen_month
+from .batch import BatchRequestError, _batch_specs, _run_batch
+from .summary import _year_summary
+from .forecast import _MAX_MONTHS as _FORECAST_MAX_MONTHS, _cash_forecast
+from .idempotency import _idempotent
+from .invoices import _card_invoice_summary, _cycle_bounds
+from .recurrence import (
+    _FREQUENCIES,
+    _FREQUENCY_DAYS,
+    _FREQUENCY_MONTHS,
+    _is_day_based,
+    _occurrence_key,
+    _occurrence_seq,
+    _rule_interval,
+    _series_length,
+)
+from .recurring import (
+    _is_skipped_occurrence,
+    _materialize_occurrence,
+    _materialize_recurring,
+    _project_recurring,
+    _rule_occurrence,
+    _skip_occurrence,
+    _skip_transaction_occurrence,
+)
+from .classifier import _CLASSIFIER_THRESHOLD, _suggest_category_local
+from .llm_client import LLMError, _chat_completion, _llm_configured, _stream_chat_completion
+from .merchants import _autocomplete_merchants, _find_duplicate_transaction, _history_category
+from .statement_import import _import_statement, _statement_format
+from .export import _export_columns, _iter_csv, _iter_xlsx, _stream_rows
+from .sync import (
+    _decode_sync_token,
+    _encode_sync_token,
+    _record_tombstones_for_query,
+    _sync_window_start,
+    _token_expired,
+)
+
 # Blueprint da API
 api_financeiro_bp = Blueprint(
     "api_financeiro",
     __name__,
 )
 
-_DEBUG = True
-
-
-import unicodedata
-
-def _normalize_str(s: str) -> str:
-    """Remove acentos e converte para minúsculas para comparação."""
-    if not s:
-        return ""
-    s = str(s).strip().lower()
-    # Remove acentos
-    s = "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
-    return s
-
-
-def _dbg(msg: str):
-    if _DEBUG:
-        print(f"[DEBUG] {msg}")
-
-
-def _strip_installment_suffix(desc: str | None) -> str:
-    try:
-        s = str(desc or "").strip()
-        if not s:
-            return ""
-        return re.sub(r"\s*\(\s*\d+\s*/\s*\d+\s*\)\s*$", "", s).strip()
-    except Exception:
-        return str(desc or "").strip()
-
-
-def _shift_month_simple(y: int, m: int, delta: int) -> tuple[int, int]:
-    total = (int(y) * 12) + (int(m) - 1) + int(delta)
-    ny = total // 12
-    nm = (total % 12) + 1
-    return int(ny), int(nm)
-
-
-def _month_index(y: int, m: int) -> int:
-    return (int(y) * 12) + (int(m) - 1)
-
-
-def _months_diff(y1: int, m1: int, y2: int, m2: int) -> int:
-    return _month_index(y2, m2) - _month_index(y1, m1)
-
-
-def _last_day_of_month(y: int, m: int) -> date:
-    last = calendar.monthrange(int(y), int(m))[1]
-    return date(int(y), int(m), int(last))
-
 
 def _cors_preflight(origin: str, methods: str):
     resp = jsonify({"ok": True})
@@ -93,18 +101,7 @@ def _cors_preflight(origin: str, methods: str):
 
 
 def _get_workspace_role(user_id: int, workspace_id: int):
-    w = Workspace.query.get(workspace_id)
-    if not w:
-        return None
-    if int(w.owner_id) == int(user_id):
-        return "owner"
-    member = WorkspaceMember.query.filter_by(workspace_id=workspace_id, user_id=user_id).first()
-    if not member:
-        return None
-    try:
-        return (member.role or "viewer").strip().lower()
-    except Exception:
-        return "viewer"
+    return _workspace_role(user_id, workspace_id)
 
 
 def _can_edit_workspace(user_id: int, workspace_id: int) -> bool:
@@ -131,12 +128,9 @@ def _require_active_workspace_or_400(user_id_int: int):
         except Exception:
             pass
 
-    if not workspace_id_hint:
-        owned_ids = [w.id for w in Workspace.query.filter_by(owner_id=user_id_int).all()]
-        member_ids = [m.workspace_id for m in WorkspaceMember.query.filter_by(user_id=user_id_int).all()]
-        if len(set(owned_ids + member_ids)) > 1:
-            resp = jsonify({"success": False, "message": "workspace_id obrigatório"})
-            return None, (_cors_wrap(resp, origin), 400)
+    if not workspace_id_hint and len(_user_workspace_ids(user_id_int)) > 1:
+        resp = jsonify({"success": False, "message": "workspace_id obrigatório"})
+        return None, (_cors_wrap(resp, origin), 400)
 
     active_workspace_id = _get_active_workspace_for_user(user_id_int, workspace_id_hint)
     if not active_workspace_id:
@@ -163,6 +157,36 @@ def _cors_wrap(resp, origin: str):
     return resp
 
 
+def _closed_month_response(error: ClosedMonthError, origin: str):
+    """409 para escrita em mês fechado (desfaz o que a request já tinha feito na sessão)."""
+    db.session.rollback()
+    resp = jsonify({"success": False, "message": str(error), "closed_months": error.months})
+    return _cors_wrap(resp, origin), 409
+
+
+@api_financeiro_bp.errorhandler(ClosedMonthError)
+def _handle_closed_month(error):
+    return _closed_month_response(error, request.headers.get("Origin", "*"))
+
+
+def _etag_not_modified(etag: str, origin: str):
+    """Resposta 304 se o cliente já tem essa versão (If-None-Match); senão None."""
+    sent = request.headers.get("If-None-Match") or ""
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for tag in sent.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == wanted:
+            resp = current_app.response_class(status=304)
+            resp.headers["ETag"] = etag
+            return _cors_wrap(resp, origin), 304
+    return None
+
+
+def _with_etag(resp, etag: str):
+    resp.headers["ETag"] = etag
+    return resp
+
+
 def _get_user_id_from_request():
     session_user_id = session.get("finance_user_id")
     request_user_id = request.args.get("user_id")
@@ -190,17 +214,9 @@ def _get_active_workspace_for_user(user_id: int, workspace_id_hint: int = None):
     Para evitar vazamento/mistura de dados entre workspaces, não tenta
     "adivinhar" um workspace quando há múltiplas opções.
     """
-    # 1. Se workspace_id foi fornecido no request, verificar se usuário tem acesso
-    if workspace_id_hint:
-        workspace = Workspace.query.get(workspace_id_hint)
-        if workspace:
-            # Verificar se usuário tem acesso (owner ou membro)
-            is_owner = workspace.owner_id == user_id
-            is_member = WorkspaceMember.query.filter_by(
-                workspace_id=workspace_id_hint, user_id=user_id
-            ).first()
-            if is_owner or is_member:
-                return workspace_id_hint
+    # 1. Se workspace_id foi fornecido no request, verificar se usuário tem acesso (owner ou membro)
+    if workspace_id_hint and _has_workspace_access(user_id, workspace_id_hint):
+        return workspace_id_hint
 
     # 2. Se há workspace ativo na sessão, respeitar (se usuário tem acesso)
     active_from_session = session.get(f"active_workspace_{user_id}")
@@ -210,23 +226,11 @@ def _get_active_workspace_for_user(user_id: int, workspace_id_hint: int = None):
         except Exception:
             active_from_session = None
 
-    if active_from_session:
-        w = Workspace.query.get(active_from_session)
-        if w:
-            is_owner = w.owner_id == user_id
-            is_member = WorkspaceMember.query.filter_by(
-                workspace_id=active_from_session, user_id=user_id
-            ).first()
-            if is_owner or is_member:
-                return active_from_session
+    if active_from_session and _has_workspace_access(user_id, active_from_session):
+        return active_from_session
     
-    # 3. Buscar workspaces do usuário (owner + membro)
-    owned_workspaces = Workspace.query.filter_by(owner_id=user_id).all()
-    member_links = WorkspaceMember.query.filter_by(user_id=user_id).all()
-    
-    # Se tem apenas um workspace (owner ou membro), usar esse
-    all_workspace_ids = [w.id for w in owned_workspaces] + [m.workspace_id for m in member_links]
-    unique_workspace_ids = list(set(all_workspace_ids))
+    # 3. Workspaces do usuário (owner + membro); se tem apenas um, usar esse
+    unique_workspace_ids = _user_workspace_ids(user_id)
     
     if len(unique_workspace_ids) == 1:
         return unique_workspace_ids[0]
@@ -241,22 +245,10 @@ def _check_user_share_preferences(user_id: int, workspace_id: int):
     Verifica as preferências de compartilhamento do usuário.
     Retorna dict com permissões ou None se usuário é owner.
     """
-    workspace = Workspace.query.get(workspace_id)
-    if not workspace:
-        return None
-    
-    # Acesso total para owner e membros (sem granularidade)
-    if workspace.owner_id == user_id:
-        return {'share_transactions': True, 'share_categories': True}
-    
-    member = WorkspaceMember.query.filter_by(
-        workspace_id=workspace_id, user_id=user_id
-    ).first()
-    
-    if not member:
+    if not _has_workspace_access(user_id, workspace_id):
         return None
 
-    # Compartilhamento sempre total para membros
+    # Compartilhamento sempre total para owner e membros (sem granularidade)
     return {
         'share_transactions': True,
         'share_categories': True,
@@ -269,23 +261,12 @@ def api_sync_workspace_context(workspace_id: int, requesting_user_id: int):
     Define o mesmo workspace ativo para todos os usuários do workspace.
     """
     try:
-        workspace = Workspace.query.get(workspace_id)
-        if not workspace:
-            return False
-        
         # Verificar se usuário solicitante tem acesso
-        is_owner = workspace.owner_id == requesting_user_id
-        is_member = WorkspaceMember.query.filter_by(
-            workspace_id=workspace_id, user_id=requesting_user_id
-        ).first()
-        
-        if not (is_owner or is_member):
+        if not _has_workspace_access(requesting_user_id, workspace_id):
             return False
         
-        # Buscar todos os membros do workspace
-        all_member_ids = [workspace.owner_id]
-        members = WorkspaceMember.query.filter_by(workspace_id=workspace_id).all()
-        all_member_ids.extend([m.user_id for m in members])
+        # Todos os membros do workspace (owner incluso)
+        all_member_ids = _workspace_user_ids(workspace_id)
         
         # Atualizar sessão para todos os membros (simulação - em produção seria via WebSocket/Redis)
         # Por enquanto, apenas loggar a ação
@@ -297,334 +278,6 @@ def api_sync_workspace_context(workspace_id: int, requesting_user_id: int):
         return False
 
 
-def _migrate_legacy_recurring_transactions(user_id: int):
-    """
-    Migra recorrências antigas criadas diretamente na tabela transactions
-    (is_recurring=True, recurring_transaction_id=None) para a tabela
-    recurring_transactions.
-
-    Isso permite que ao trocar o mês no dashboard o sistema consiga gerar
-    automaticamente as recorrentes futuras.
-    """
-    legacy = Transaction.query.filter(
-        Transaction.user_id == user_id,
-        Transaction.is_recurring.is_(True),
-        Transaction.recurring_transaction_id.is_(None),
-    ).all()
-
-    _dbg(f"[MIGRATE_RECURRING] Encontradas {len(legacy)} transações recorrentes antigas para migrar")
-
-    if not legacy:
-        return
-
-    cache: dict[tuple, RecurringTransaction] = {}
-
-    for tx in legacy:
-        if not tx.transaction_date:
-            continue
-        
-        # Buscar transações antigas não vinculadas que correspondem a esta recorrente
-        unlinked_txs = Transaction.query.filter(
-            Transaction.user_id == user_id,
-            Transaction.is_recurring.is_(True),
-            Transaction.recurring_transaction_id.is_(None),
-            Transaction.description == tx.description,
-            Transaction.type == tx.type,
-            Transaction.amount == tx.amount
-        ).all()
-        
-        if unlinked_txs:
-            _dbg(f"[MIGRATE_RECURRING] {tx.description}: encontradas {len(unlinked_txs)} transações não vinculadas")
-            for utx in unlinked_txs:
-                _dbg(f"[MIGRATE_RECURRING]   - Vinculando {utx.description} de {utx.transaction_date}")
-                utx.recurring_transaction_id = tx.id
-                utx.frequency = "monthly"
-            try:
-                db.session.commit()
-            except Exception:
-                db.session.rollback()
-        
-        # Buscar TODAS as transações vinculadas para debug
-        all_txs = Transaction.query.filter_by(
-            user_id=user_id,
-            recurring_transaction_id=tx.id
-        ).order_by(Transaction.transaction_date.asc(), Transaction.id.asc()).all()
-        
-        _dbg(f"[MIGRATE_RECURRING] {tx.description}: {len(all_txs)} transações vinculadas, start_date atual: {tx.start_date}")
-        for atx in all_txs:
-            _dbg(f"[MIGRATE_RECURRING]   - {atx.description} em {atx.transaction_date}")
-        
-        # Buscar a primeira transação vinculada a esta recorrente
-        first_tx = all_txs[0] if all_txs else None
-        
-        if first_tx and first_tx.transaction_date:
-            old_start = tx.start_date
-            # Usar o mês da primeira transação como referência
-            new_start = date(first_tx.transaction_date.year, first_tx.transaction_date.month, 1)
-            
-            _dbg(f"[MIGRATE_RECURRING] {tx.description}: comparando start_date {old_start} com primeira transação {first_tx.transaction_date} -> novo start_date seria {new_start}")
-            
-            # Corrigir se o start_date for diferente do mês da primeira transação
-            if old_start != new_start:
-                tx.start_date = new_start
-                _dbg(f"[MIGRATE_RECURRING] ✅ Corrigindo {tx.description}: {old_start} -> {new_start}")
-            else:
-                _dbg(f"[MIGRATE_RECURRING] ✓ {tx.description}: start_date já está correto ({old_start})")
-        else:
-            _dbg(f"[MIGRATE_RECURRING] ⚠️ {tx.description}: sem transações vinculadas, mantendo start_date {tx.start_date}")
-    
-    if cache:
-        try:
-            db.session.commit()
-            _dbg(f"[MIGRATE_RECURRING] {len(cache)} RecurringTransaction criadas")
-        except Exception as e:
-            _dbg(f"[MIGRATE_RECURRING] Erro ao criar: {e}")
-            db.session.rollback()
-
-
-def _fix_recurring_start_dates(user_id: int):
-    """
-    Corrige start_date de RecurringTransaction que não estão no primeiro dia do mês.
-    Usa a primeira transação vinculada como referência para o mês correto.
-    Também vincula transações antigas não vinculadas.
-    """
-    recurring_txs = RecurringTransaction.query.filter_by(
-        user_id=user_id,
-        is_active=True,
-        frequency="monthly"
-    ).all()
-    
-    fixed_count = 0
-    for rec_tx in recurring_txs:
-        if not rec_tx.start_date:
-            continue
-        
-        # Buscar transações antigas não vinculadas que correspondem a esta recorrente
-        unlinked_txs = Transaction.query.filter(
-            Transaction.user_id == user_id,
-            Transaction.is_recurring.is_(True),
-            Transaction.recurring_transaction_id.is_(None),
-            Transaction.description == rec_tx.description,
-            Transaction.type == rec_tx.type,
-            Transaction.amount == rec_tx.amount
-        ).all()
-        
-        if unlinked_txs:
-            _dbg(f"[FIX_START_DATE] {rec_tx.description}: encontradas {len(unlinked_txs)} transações não vinculadas")
-            for tx in unlinked_txs:
-                _dbg(f"[FIX_START_DATE]   - Vinculando {tx.description} de {tx.transaction_date}")
-                tx.recurring_transaction_id = rec_tx.id
-                tx.frequency = "monthly"
-            try:
-                db.session.commit()
-            except Exception:
-                db.session.rollback()
-        
-        # Buscar TODAS as transações vinculadas para debug
-        all_txs = Transaction.query.filter_by(
-            user_id=user_id,
-            recurring_transaction_id=rec_tx.id
-        ).order_by(Transaction.transaction_date.asc(), Transaction.id.asc()).all()
-        
-        _dbg(f"[FIX_START_DATE] {rec_tx.description}: {len(all_txs)} transações vinculadas, start_date atual: {rec_tx.start_date}")
-        for tx in all_txs:
-            _dbg(f"[FIX_START_DATE]   - {tx.description} em {tx.transaction_date}")
-        
-        # Buscar a primeira transação vinculada a esta recorrente
-        first_tx = all_txs[0] if all_txs else None
-        
-        if first_tx and first_tx.transaction_date:
-            old_start = rec_tx.start_date
-            # Usar o mês da primeira transação como referência
-            new_start = date(first_tx.transaction_date.year, first_tx.transaction_date.month, 1)
-            
-            _dbg(f"[FIX_START_DATE] {rec_tx.description}: comparando start_date {old_start} com primeira transação {first_tx.transaction_date} -> novo start_date seria {new_start}")
-            
-            # Corrigir se o start_date for diferente do mês da primeira transação
-            if old_start != new_start:
-                rec_tx.start_date = new_start
-                _dbg(f"[FIX_START_DATE] ✅ Corrigindo {rec_tx.description}: {old_start} -> {new_start}")
-                fixed_count += 1
-            else:
-                _dbg(f"[FIX_START_DATE] ✓ {rec_tx.description}: start_date já está correto ({old_start})")
-        else:
-            _dbg(f"[FIX_START_DATE] ⚠️ {rec_tx.description}: sem transações vinculadas, mantendo start_date {rec_tx.start_date}")
-    
-    if fixed_count > 0:
-        try:
-            db.session.commit()
-            _dbg(f"[FIX_START_DATE] {fixed_count} RecurringTransaction corrigidas")
-        except Exception as e:
-            _dbg(f"[FIX_START_DATE] Erro ao corrigir: {e}")
-            db.session.rollback()
-
-
-def _fix_legacy_auto_loaded_income_paid(user_id: int):
-    txs = Transaction.query.filter(
-        Transaction.user_id == int(user_id),
-        Transaction.type == "income",
-        Transaction.is_paid == False,
-        Transaction.is_auto_loaded == True,
-        Transaction.recurring_transaction_id.isnot(None),
-    ).all()
-
-    if not txs:
-        return
-
-    for tx in txs:
-        try:
-            tx.is_paid = True
-            tx.paid_date = tx.transaction_date
-
-            if getattr(tx, "workspace_id", None) is None and getattr(tx, "recurring_transaction_id", None):
-                base_tx = (
-                    Transaction.query.filter(
-                        Transaction.user_id == int(user_id),
-                        Transaction.recurring_transaction_id == int(tx.recurring_transaction_id),
-                        Transaction.workspace_id.isnot(None),
-                    )
-                    .order_by(Transaction.transaction_date.asc(), Transaction.id.asc())
-                    .first()
-                )
-                if base_tx:
-                    tx.workspace_id = base_tx.workspace_id
-        except Exception:
-            pass
-
-    try:
-        db.session.commit()
-    except Exception:
-        db.session.rollback()
-
-
-def _generate_recurring_for_month(user_id: int, year: int, month: int, workspace_id_fallback: int | None = None):
-    """
-    Gera automaticamente as transações recorrentes do mês se ainda não existirem.
-    """
-    _dbg(f"[GENERATE_RECURRING] Iniciando geração para {month}/{year}")
-    
-    # Corrigir start_date de recorrentes existentes (uma única vez)
-    _fix_recurring_start_dates(user_id)
-    
-    # Migra recorrências antigas para a tabela recorrente (uma única vez/por demanda)
-    _migrate_legacy_recurring_transactions(user_id)
-
-    _fix_legacy_auto_loaded_income_paid(user_id)
-
-    # Buscar todas as RecurringTransaction ativas do usuário
-    recurring_txs = RecurringTransaction.query.filter_by(
-        user_id=user_id,
-        is_active=True,
-        frequency="monthly"
-    ).all()
-    
-    _dbg(f"[GENERATE_RECURRING] Encontradas {len(recurring_txs)} RecurringTransaction ativas")
-
-    for rec_tx in recurring_txs:
-        # Verificar se está dentro do período de validade
-        target_date = date(year, month, 1)
-        
-        _dbg(f"[GENERATE_RECURRING] Processando: {rec_tx.description} (dia {rec_tx.day_of_month})")
-        _dbg(f"[GENERATE_RECURRING] start_date: {rec_tx.start_date}, end_date: {rec_tx.end_date}, target: {target_date}")
-        
-        # Se tem start_date e o mês é anterior ao início, pular
-        if rec_tx.start_date:
-            start_month = date(rec_tx.start_date.year, rec_tx.start_date.month, 1)
-            if target_date < start_month:
-                _dbg(f"[GENERATE_RECURRING] Pulando {rec_tx.description}: mês anterior ao início ({target_date} < {start_month})")
-                continue
-        
-        # Se tem end_date e o mês é posterior ao fim, pular
-        if rec_tx.end_date:
-            end_month = date(rec_tx.end_date.year, rec_tx.end_date.month, 1)
-            if target_date > end_month:
-                _dbg(f"[GENERATE_RECURRING] Pulando {rec_tx.description}: mês posterior ao fim ({target_date} > {end_month})")
-                continue
-        
-        # Calcular a data da transação usando o dia do mês
-        day_of_month = rec_tx.day_of_month or 1
-        last_day = calendar.monthrange(year, month)[1]
-        day = min(day_of_month, last_day)
-        transaction_date = date(year, month, day)
-
-        inherited_workspace_id = None
-        try:
-            base_tx = (
-                Transaction.query.filter(
-                    Transaction.user_id == int(user_id),
-                    Transaction.recurring_transaction_id == rec_tx.id,
-                    Transaction.workspace_id.isnot(None),
-                )
-                .order_by(Transaction.transaction_date.asc(), Transaction.id.asc())
-                .first()
-            )
-            if base_tx:
-                inherited_workspace_id = base_tx.workspace_id
-        except Exception:
-            inherited_workspace_id = None
-
-        target_workspace_id = inherited_workspace_id if inherited_workspace_id is not None else workspace_id_fallback
-        
-        # Verificar se já existe uma transação deste recurring_transaction neste mês
-        existing_query = Transaction.query.filter(
-            Transaction.user_id == user_id,
-            Transaction.recurring_transaction_id == rec_tx.id,
-            func.extract('year', Transaction.transaction_date) == year,
-            func.extract('month', Transaction.transaction_date) == month,
-        )
-
-        if target_workspace_id is None:
-            existing_query = existing_query.filter(Transaction.workspace_id.is_(None))
-        else:
-            existing_query = existing_query.filter(Transaction.workspace_id == target_workspace_id)
-
-        existing = existing_query.first()
-        
-        if existing:
-            _dbg(f"[GENERATE_RECURRING] Já existe transação para {rec_tx.description} em {month}/{year}")
-            continue  # Já existe, não criar novamente
-
-        gen_desc = getattr(rec_tx, "description", "") or ""
-        if rec_tx.type == "expense" and getattr(rec_tx, "start_date", None) and getattr(rec_tx, "end_date", None):
-            try:
-                total_inst = _months_diff(rec_tx.start_date.year, rec_tx.start_date.month, rec_tx.end_date.year, rec_tx.end_date.month) + 1
-                idx_inst = _months_diff(rec_tx.start_date.year, rec_tx.start_date.month, int(year), int(month)) + 1
-                if total_inst and total_inst > 1:
-                    gen_desc = f"{_strip_installment_suffix(gen_desc)} ({idx_inst}/{total_inst})"
-                else:
-                    gen_desc = _strip_installment_suffix(gen_desc)
-            except Exception:
-                gen_desc = getattr(rec_tx, "description", "") or ""
-
-        # Criar a transação do mês
-        _dbg(f"[GENERATE_RECURRING] Criando transação para {rec_tx.description} em {transaction_date}")
-        new_tx = Transaction(
-            user_id=user_id,
-            category_id=rec_tx.category_id,
-            subcategory_id=rec_tx.subcategory_id,
-            subcategory_text=rec_tx.subcategory_text,
-            description=gen_desc,
-            amount=rec_tx.amount,
-            type=rec_tx.type,
-            transaction_date=transaction_date,
-            is_paid=True if rec_tx.type == "income" else False,  # Despesas recorrentes iniciam como não pagas
-            paid_date=transaction_date if rec_tx.type == "income" else None,
-            workspace_id=target_workspace_id,
-            payment_method=rec_tx.payment_method,
-            notes=rec_tx.notes,
-            is_recurring=True,
-            frequency="monthly",
-            recurring_transaction_id=rec_tx.id,
-            is_auto_loaded=True,
-        )
-        db.session.add(new_tx)
-    
-    try:
-        db.session.commit()
-    except Exception:
-        db.session.rollback()
-
-
 def _ensure_finance_config_and_categories(user_id: int):
     cfg = FinanceConfig.query.filter_by(user_id=user_id).first()
     if not cfg:
@@ -794,72 +447,20 @@ def api_transaction_remove(tx_id: int):
             return
 
         if scope_value == "single":
-            # Se apenas deletarmos, a transação volta no próximo refresh por causa da geração automática
-            # (_generate_recurring_for_month). Para remover só este mês e manter os próximos,
-            # quebramos a recorrência em duas: até o mês anterior, e a partir do mês seguinte.
-            rec_tx = RecurringTransaction.query.filter_by(
-                id=int(rec_id),
-                user_id=int(user_id_int),
-            ).first()
-
-            if not rec_tx or not target_tx.transaction_date:
-                db.session.delete(target_tx)
-                return
-
-            original_end_date = rec_tx.end_date
-
-            # Encerrar recorrência antiga no mês anterior
-            rec_tx.end_date = _prev_month_last_day(target_tx.transaction_date)
-
-            # Criar uma nova recorrência a partir do mês seguinte (se ainda houver futuro)
-            ny, nm = _shift_month_simple(target_tx.transaction_date.year, target_tx.transaction_date.month, 1)
-            next_month_first_day = date(ny, nm, 1)
-
-            should_create_new = True
-            if original_end_date is not None and original_end_date < next_month_first_day:
-                should_create_new = False
-
-            new_rec_tx = None
-            if should_create_new:
-                new_rec_tx = RecurringTransaction(
-                    user_id=rec_tx.user_id,
-                    category_id=rec_tx.category_id,
-                    subcategory_id=rec_tx.subcategory_id,
-                    subcategory_text=rec_tx.subcategory_text,
-                    description=rec_tx.description,
-                    amount=rec_tx.amount,
-                    type=rec_tx.type,
-                    frequency=rec_tx.frequency,
-                    day_of_month=rec_tx.day_of_month,
-                    day_of_week=rec_tx.day_of_week,
-                    start_date=next_month_first_day,
-                    end_date=original_end_date,
-                    is_active=rec_tx.is_active,
-                    payment_method=rec_tx.payment_method,
-                    notes=rec_tx.notes,
-                )
-                db.session.add(new_rec_tx)
-                db.session.flush()
-
-                # Migrar transações futuras já geradas para a nova recorrência
-                db.session.query(Transaction).filter(
-                    Transaction.user_id == int(user_id_int),
-                    Transaction.recurring_transaction_id == int(rec_id),
-                    Transaction.transaction_date >= next_month_first_day,
-                ).update(
-                    {Transaction.recurring_transaction_id: int(new_rec_tx.id)},
-                    synchronize_session=False,
-                )
-
+            # Só este mês: vira exceção na regra, para a materialização/projeção não recriá-lo
+            _skip_transaction_occurrence(target_tx)
             db.session.delete(target_tx)
             return
 
         if scope_value == "future":
-            db.session.query(Transaction).filter(
+            bulk_q = db.session.query(Transaction).filter(
                 Transaction.user_id == int(user_id_int),
                 Transaction.recurring_transaction_id == int(rec_id),
                 Transaction.transaction_date >= target_tx.transaction_date,
-            ).delete(synchronize_session=False)
+            )
+            _mark_rollups_for_query(bulk_q)
+            _record_tombstones_for_query(bulk_q)
+            bulk_q.delete(synchronize_session=False)
 
             rec_tx = RecurringTransaction.query.filter_by(
                 id=int(rec_id),
@@ -870,10 +471,13 @@ def api_transaction_remove(tx_id: int):
             return
 
         if scope_value == "all":
-            db.session.query(Transaction).filter(
+            bulk_q = db.session.query(Transaction).filter(
                 Transaction.user_id == int(user_id_int),
                 Transaction.recurring_transaction_id == int(rec_id),
-            ).delete(synchronize_session=False)
+            )
+            _mark_rollups_for_query(bulk_q)
+            _record_tombstones_for_query(bulk_q)
+            bulk_q.delete(synchronize_session=False)
 
             rec_tx = RecurringTransaction.query.filter_by(
                 id=int(rec_id),
@@ -891,6 +495,8 @@ def api_transaction_remove(tx_id: int):
         _dbg(f"[TX_REMOVE] Transação {tx_id} excluída com sucesso")
         resp = jsonify({"success": True})
         return _cors_wrap(resp, origin), 200
+    except ClosedMonthError as e:
+        return _closed_month_response(e, origin)
     except Exception as e:
         db.session.rollback()
         _dbg(f"[TX_REMOVE] Erro ao excluir: {e}")
@@ -949,6 +555,14 @@ def api_credit_cards():
     
     if request.method == "GET":
         try:
+            if workspace_id:
+                etag = _scopes_etag(_card_scopes(workspace_id, None), "cards", workspace_id)
+            else:
+                etag = _scopes_etag(_card_scopes(None, user_id_int), "cards", user_id_int)
+            not_modified = _etag_not_modified(etag, origin)
+            if not_modified:
+                return not_modified
+
             query = CreditCard.query.filter(CreditCard.is_active == True)
             if workspace_id:
                 query = query.filter(CreditCard.workspace_id == int(workspace_id))
@@ -956,7 +570,7 @@ def api_credit_cards():
                 query = query.filter(CreditCard.user_id == user_id_int)
             
             cards = query.all()
-            return _cors_wrap(jsonify({
+            return _cors_wrap(_with_etag(jsonify({
                 "success": True,
                 "cards": [{
                     "id": c.id,
@@ -968,7 +582,7 @@ def api_credit_cards():
                     "due_day": c.due_day,
                     "color": c.color
                 } for c in cards]
-            }), origin), 200
+            }), etag), origin), 200
         except Exception as e:
             return _cors_wrap(jsonify({"success": False, "message": str(e)}), origin), 500
 
@@ -1033,6 +647,84 @@ def api_delete_credit_card(card_id):
         return _cors_wrap(jsonify({"success": False, "message": str(e)}), origin), 500
 
 
+@api_financeiro_bp.route("/api/credit-cards/<int:card_id>/invoice", methods=["GET", "OPTIONS"])
+def api_credit_card_invoice(card_id):
+    """
+    Fatura do cartão: totais do ciclo, histórico recente e utilização do limite.
+
+    Query: year, month (mês de referência da fatura; padrão: a do ciclo de hoje),
+    history (faturas anteriores, máx. 24), include=transactions para listar as
+    compras do ciclo. Os totais vêm de ``credit_card_invoices``.
+    """
+    origin = request.headers.get("Origin", "*")
+    if request.method == "OPTIONS":
+        return _cors_preflight(origin, "GET, OPTIONS")
+
+    user_id_int = _get_user_id_from_request()
+    if not user_id_int:
+        resp = jsonify({"success": False, "message": "Não autenticado"})
+        return _cors_wrap(resp, origin), 401
+
+    card = CreditCard.query.filter_by(id=card_id).first()
+    if not card:
+        return _cors_wrap(jsonify({"success": False, "message": "Cartão não encontrado"}), origin), 404
+    if card.user_id != user_id_int and not (card.workspace_id and _has_workspace_access(user_id_int, card.workspace_id)):
+        return _cors_wrap(jsonify({"success": False, "message": "Sem permissão"}), origin), 403
+
+    reference_month = None
+    try:
+        if request.args.get("year") and request.args.get("month"):
+            reference_month = date(int(request.args["year"]), int(request.args["month"]), 1)
+        history = max(0, min(int(request.args.get("history") or 12), 24))
+    except Exception:
+        resp = jsonify({"success": False, "message": "Período inválido"})
+        return _cors_wrap(resp, origin), 400
+
+    summary = _card_invoice_summary(card, reference_month, history)
+
+    if "transactions" in (request.args.get("include") or ""):
+        ref = date.fromisoformat(summary["invoice"]["reference_month"] + "-01")
+        start, end = _cycle_bounds(card.closing_day, ref)
+        rows = (
+            db.session.query(
+                Transaction.id, Transaction.transaction_date, Transaction.description,
+                Transaction.amount, Transaction.type, Transaction.is_paid, Transaction.category_id,
+            )
+            .filter(
+                Transaction.credit_card_id == card.id,
+                Transaction.transaction_date >= start,
+                Transaction.transaction_date < end,
+            )
+            .order_by(Transaction.transaction_date.asc(), Transaction.id.asc())
+            .all()
+        )
+        summary["invoice"]["transactions"] = [
+            {
+                "id": tx_id,
+                "date": d.isoformat() if d else None,
+                "description": description,
+                "amount": float(amount or 0),
+                "type": tx_type,
+                "is_paid": bool(is_paid),
+                "category_id": category_id,
+            }
+            for tx_id, d, description, amount, tx_type, is_paid, category_id in rows
+        ]
+
+    resp = jsonify({
+        "success": True,
+        "card": {
+            "id": card.id,
+            "name": card.name,
+            "limit": float(card.limit or 0),
+            "closing_day": card.closing_day,
+            "due_day": card.due_day,
+        },
+        **summary,
+    })
+    return _cors_wrap(resp, origin), 200
+
+
 @api_financeiro_bp.route("/api/categories", methods=["GET", "OPTIONS"])
 def api_categories():
     origin = request.headers.get("Origin", "*")
@@ -1067,17 +759,15 @@ def api_categories():
     cfg = _ensure_finance_config_and_categories(user_id_int)
     cat_type = (request.args.get("type") or "").strip().lower() or None
 
-    if active_workspace_id and share_prefs and share_prefs.get("share_categories", True):
-        w = Workspace.query.get(active_workspace_id)
-        member_ids = []
-        if w:
-            member_ids.append(int(w.owner_id))
-        for m in WorkspaceMember.query.filter_by(workspace_id=active_workspace_id).all():
-            try:
-                member_ids.append(int(m.user_id))
-            except Exception:
-                pass
-        member_ids = list(set(member_ids))
+    shared_categories = bool(active_workspace_id and share_prefs and share_prefs.get("share_categories", True))
+    scope_user_ids = _workspace_user_ids(active_workspace_id) if shared_categories else [user_id_int]
+    etag = _scopes_etag([_category_scope(uid) for uid in scope_user_ids], user_id_int, active_workspace_id, cat_type)
+    not_modified = _etag_not_modified(etag, origin)
+    if not_modified:
+        return not_modified
+
+    if shared_categories:
+        member_ids = scope_user_ids
 
         cfg_ids = []
         for uid in member_ids:
@@ -1107,7 +797,7 @@ def api_categories():
             for c in cats
         ],
     })
-    return _cors_wrap(resp, origin), 200
+    return _cors_wrap(_with_etag(resp, etag), origin), 200
 
 
 @api_financeiro_bp.route("/api/test", methods=["GET", "OPTIONS"])
@@ -1123,6 +813,7 @@ def api_test():
 
 
 @api_financeiro_bp.route("/api/transactions", methods=["POST", "OPTIONS"])
+@_idempotent
 def api_create_transaction():
     origin = request.headers.get("Origin", "*")
     if request.method == "OPTIONS":
@@ -1162,12 +853,9 @@ def api_create_transaction():
             except Exception:
                 workspace_id_hint = None
 
-        if not workspace_id_hint:
-            owned_ids = [w.id for w in Workspace.query.filter_by(owner_id=user_id_int).all()]
-            member_ids = [m.workspace_id for m in WorkspaceMember.query.filter_by(user_id=user_id_int).all()]
-            if len(set(owned_ids + member_ids)) > 1:
-                resp = jsonify({"success": False, "message": "workspace_id obrigatório"})
-                return _cors_wrap(resp, origin), 400
+        if not workspace_id_hint and len(_user_workspace_ids(user_id_int)) > 1:
+            resp = jsonify({"success": False, "message": "workspace_id obrigatório"})
+            return _cors_wrap(resp, origin), 400
         
         # Usar nova lógica consistente para determinar workspace ativo
         active_workspace_id = _get_active_workspace_for_user(user_id_int, workspace_id_hint)
@@ -1191,6 +879,9 @@ def api_create_transaction():
         recurring_end_date_raw = str(data.get("recurring_end_date", "")).strip() or None
         recurring_installments_raw = data.get("recurring_installments")
         recurring_installments_start = str(data.get("recurring_installments_start") or "").strip().lower() or None
+        # daily, weekly, biweekly, monthly (padrão) ou yearly; a cada recurring_interval períodos
+        recurring_frequency = str(data.get("recurring_frequency") or "monthly").strip().lower()
+        recurring_interval_raw = data.get("recurring_interval")
 
         if ttype not in ("income", "expense"):
             resp = jsonify({"success": False, "message": "Tipo inválido (income/expense)."})
@@ -1219,8 +910,19 @@ def api_create_transaction():
             tdate = datetime.utcnow().date()
 
         # Se for recorrente, usar apenas o dia do vencimento e ignorar a data enviada
+        # (regras diárias/semanais/quinzenais começam na própria data)
         recurring_day_int = None
+        recurring_interval = 1
         if is_recurring:
+            try:
+                recurring_interval = int(recurring_interval_raw or 1)
+            except (TypeError, ValueError):
+                recurring_interval = 0
+            if recurring_frequency not in _FREQUENCIES or not 1 <= recurring_interval <= 366:
+                resp = jsonify({"success": False, "message": "Frequência de recorrência inválida."})
+                return _cors_wrap(resp, origin), 400
+
+        if is_recurring and not _is_day_based(recurring_frequency):
             try:
                 recurring_day_int = int(recurring_day)
             except Exception:
@@ -1344,8 +1046,9 @@ def api_create_transaction():
             if recurring_installments_start not in ("current_month", "due_date"):
                 recurring_installments_start = "current_month"
 
-            start_for_installments = date(tdate.year, tdate.month, 1)
-            if installments_int is not None and recurring_installments_start == "due_date":
+            by_day = _is_day_based(recurring_frequency)
+            start_for_installments = tdate if by_day else date(tdate.year, tdate.month, 1)
+            if installments_int is not None and recurring_installments_start == "due_date" and not by_day:
                 try:
                     today = datetime.utcnow().date()
                     if tdate < today:
@@ -1354,9 +1057,14 @@ def api_create_transaction():
                 except Exception:
                     start_for_installments = date(tdate.year, tdate.month, 1)
 
-            if installments_int is not None:
+            if installments_int is not None and by_day:
+                unlimited_bool = False
+                step_days = _FREQUENCY_DAYS[recurring_frequency] * recurring_interval
+                end_date = start_for_installments + timedelta(days=step_days * (installments_int - 1))
+            elif installments_int is not None:
                 unlimited_bool = False
-                end_y, end_m = _shift_month_simple(start_for_installments.year, start_for_installments.month, installments_int - 1)
+                step_months = _FREQUENCY_MONTHS[recurring_frequency] * recurring_interval
+                end_y, end_m = _shift_month_simple(start_for_installments.year, start_for_installments.month, step_months * (installments_int - 1))
                 end_date = _last_day_of_month(end_y, end_m)
             elif not unlimited_bool and recurring_end_date_raw:
                 try:
@@ -1372,14 +1080,17 @@ def api_create_transaction():
                 description=_strip_installment_suffix(description),
                 amount=amount,
                 type=ttype,
-                frequency="monthly",
+                frequency=recurring_frequency,
+                interval=recurring_interval,
                 day_of_month=recurring_day_int,
+                day_of_week=tdate.weekday() if recurring_frequency in ("weekly", "biweekly") else None,
                 start_date=start_for_installments,
                 end_date=end_date,
                 is_active=True,
                 payment_method=payment_method,
                 credit_card_id=credit_card_id,
                 notes=notes,
+                workspace_id=workspace_id,
             )
             db.session.add(recurring_tx)
             db.session.flush()
@@ -1388,13 +1099,13 @@ def api_create_transaction():
         tx_date_final = tdate
         if is_recurring and ttype == "expense" and recurring_tx and getattr(recurring_tx, "start_date", None) and getattr(recurring_tx, "end_date", None):
             try:
-                total_inst = _months_diff(recurring_tx.start_date.year, recurring_tx.start_date.month, recurring_tx.end_date.year, recurring_tx.end_date.month) + 1
+                total_inst = _series_length(recurring_tx)
                 if total_inst and total_inst > 1:
                     tx_desc = f"{_strip_installment_suffix(description)} (1/{total_inst})"
                 else:
                     tx_desc = _strip_installment_suffix(description)
 
-                if recurring_tx.start_date:
+                if recurring_tx.start_date and not _is_day_based(recurring_tx.frequency):
                     last_day = calendar.monthrange(recurring_tx.start_date.year, recurring_tx.start_date.month)[1]
                     tx_date_final = date(recurring_tx.start_date.year, recurring_tx.start_date.month, min(recurring_day_int or 1, last_day))
             except Exception:
@@ -1415,15 +1126,25 @@ def api_create_transaction():
             notes=notes,
             subcategory_text=subcategory_text,
             is_recurring=is_recurring,
-            frequency="monthly" if is_recurring else "once",
+            frequency=recurring_frequency if is_recurring else "once",
             recurring_transaction_id=recurring_tx.id if recurring_tx else None,
         )
 
+        if recurring_tx:
+            # A primeira ocorrência já é esta transação: watermark na chave dela
+            recurring_tx.generated_through = _occurrence_key(recurring_frequency, tx_date_final)
+
+        # Aviso (não bloqueia): mesmo estabelecimento, valor e data já lançados
+        duplicate_id = None
+        if not recurring_tx:
+            duplicate_id = _find_duplicate_transaction(user_id_int, workspace_id, tx_desc, amount, tx_date_final)
+
         db.session.add(tx)
         db.session.commit()
 
         resp = jsonify({
             "success": True,
+            "possible_duplicate_id": duplicate_id,
             "transaction": {
                 "id": tx.id,
                 "description": tx.description,
@@ -1439,7 +1160,9 @@ def api_create_transaction():
             },
         })
         return _cors_wrap(resp, origin), 201
-        
+
+    except ClosedMonthError as e:
+        return _closed_month_response(e, origin)
     except Exception as e:
         print(f"[CREATE_TX] Erro inesperado: {e}")
         import traceback
@@ -1488,37 +1211,12 @@ def api_sync_workspace():
         return _cors_wrap(resp, origin), 500
 
 
-@api_financeiro_bp.route("/api/transactions", methods=["GET", "OPTIONS"])
-def api_list_transactions():
-    origin = request.headers.get("Origin", "*")
-    if request.method == "OPTIONS":
-        return _cors_preflight(origin, "GET, OPTIONS")
-
-    user_id_int = _get_user_id_from_request()
-    if not user_id_int:
-        resp = jsonify({"success": False, "message": "Não autenticado"})
-        return _cors_wrap(resp, origin), 401
-
-    today = datetime.utcnow().date()
-    try:
-        year = int(request.args.get("year") or today.year)
-        month = int(request.args.get("month") or today.month)
-    except Exception:
-        year = today.year
-        month = today.month
-
-    tx_type = (request.args.get("type") or "").strip().lower()
-    q = (request.args.get("q") or "").strip()
-    
-    print(f"[LIST_TX] Filtros - type: '{tx_type}', q: '{q}'")
-
-    start = date(year, month, 1)
-    if month == 12:
-        end = date(year + 1, 1, 1)
-    else:
-        end = date(year, month + 1, 1)
+def _resolve_listing_scope(user_id_int: int, origin: str):
+    """
+    Workspace ativo e preferências de compartilhamento de uma listagem.
 
-    # Buscar workspace_id do request (se fornecido)
+    Retorna ``(active_workspace_id, share_prefs, None)`` ou ``(None, None, resposta_de_erro)``.
+    """
     workspace_id_hint = None
     try:
         workspace_id_hint = request.args.get("workspace_id")
@@ -1527,90 +1225,81 @@ def api_list_transactions():
     except Exception:
         workspace_id_hint = None
 
-    if not workspace_id_hint:
-        owned_ids = [w.id for w in Workspace.query.filter_by(owner_id=user_id_int).all()]
-        member_ids = [m.workspace_id for m in WorkspaceMember.query.filter_by(user_id=user_id_int).all()]
-        if len(set(owned_ids + member_ids)) > 1:
-            resp = jsonify({"success": False, "message": "workspace_id obrigatório"})
-            return _cors_wrap(resp, origin), 400
-    
+    if not workspace_id_hint and len(_user_workspace_ids(user_id_int)) > 1:
+        resp = jsonify({"success": False, "message": "workspace_id obrigatório"})
+        return None, None, (_cors_wrap(resp, origin), 400)
+
     # Determinar workspace ativo usando nova lógica consistente
     active_workspace_id = _get_active_workspace_for_user(user_id_int, workspace_id_hint)
-    print(f"[LIST_TX] user_id={user_id_int}, active_workspace_id={active_workspace_id}")
-    
+
     # Verificar preferências de compartilhamento do usuário
     share_prefs = None
     if active_workspace_id:
         share_prefs = _check_user_share_preferences(user_id_int, active_workspace_id)
-        print(f"[LIST_TX] share_preferences={share_prefs}")
+    return active_workspace_id, share_prefs, None
 
-    # Gerar recorrências do mês para garantir que parcelas apareçam nos meses futuros.
-    # Se o workspace compartilha transações, gerar para todos os membros do workspace.
+
+def _prepare_listing_month(user_id_int: int, active_workspace_id, share_prefs, year: int, month: int):
+    """
+    Materializa as recorrências até o mês pedido (só trabalha se o mês passar do watermark).
+
+    Meses futuros (após o mês atual) são apenas projetados em memória, sem inserir linhas,
+    a menos que o cliente peça projection=0. Se o workspace compartilha transações,
+    considera as regras de todos os membros.
+
+    Roda antes do ETag (materializar muda os dados). Retorna o que
+    ``_listing_projection`` precisa para projetar o mês, ou None se não há o
+    que projetar: a projeção fica para depois do If-None-Match.
+    """
+    today = datetime.utcnow().date()
+    start = date(int(year), int(month), 1)
+    projection_enabled = (request.args.get("projection") or "1").strip().lower() not in ("0", "false", "no")
+    current_month = date(today.year, today.month, 1)
+    materialize_until = min(start, current_month) if projection_enabled else start
     try:
         if active_workspace_id and share_prefs and share_prefs.get('share_transactions', True):
-            member_ids = []
             try:
-                w = Workspace.query.get(active_workspace_id)
-                if w:
-                    member_ids.append(int(getattr(w, 'owner_id', 0) or 0))
-                for m in WorkspaceMember.query.filter_by(workspace_id=active_workspace_id).all():
-                    try:
-                        member_ids.append(int(getattr(m, 'user_id', 0) or 0))
-                    except Exception:
-                        pass
-                member_ids = [uid for uid in set(member_ids) if uid]
+                rule_user_ids = list(_workspace_user_ids(active_workspace_id))
             except Exception:
-                member_ids = []
-
-            for uid in member_ids:
-                try:
-                    _generate_recurring_for_month(int(uid), int(year), int(month), int(active_workspace_id))
-                except Exception:
-                    pass
+                rule_user_ids = []
+            rule_workspace_id = int(active_workspace_id)
         else:
-            _generate_recurring_for_month(int(user_id_int), int(year), int(month), int(active_workspace_id) if active_workspace_id else None)
+            rule_user_ids = [int(user_id_int)]
+            rule_workspace_id = int(active_workspace_id) if active_workspace_id else None
+
+        _materialize_recurring(rule_user_ids, materialize_until.year, materialize_until.month, rule_workspace_id)
+        if start > materialize_until:
+            return rule_user_ids, int(year), int(month), rule_workspace_id
     except Exception:
-        pass
-    
-    query = (
-        db.session.query(
-            Transaction.id,
-            Transaction.description,
-            Transaction.amount,
-            Transaction.type,
-            Transaction.transaction_date,
-            Transaction.is_paid,
-            Transaction.is_recurring,
-            Category.id,
-            Category.name,
-            Category.color,
-            Category.icon,
-        )
-        .outerjoin(Category, Category.id == Transaction.category_id)
-        .filter(
-            Transaction.transaction_date >= start,
-            Transaction.transaction_date < end,
-        )
-    )
-    
-    # Filtrar por workspace se houver um ativo
+        db.session.rollback()
+    return None
+
+
+def _listing_projection(pending) -> dict:
+    """Projeção (``_project_recurring``) do mês preparado por ``_prepare_listing_month``."""
+    projection = {"items": [], "prev_total": 0.0}
+    if not pending:
+        return projection
+    try:
+        projection = _project_recurring(*pending)
+    except Exception:
+        db.session.rollback()
+    return projection
+
+
+def _filter_listing_scope(query, user_id_int: int, active_workspace_id, share_prefs, tx_type: str = "", q: str = ""):
+    """Aplica à query de transações o escopo (workspace ou livro pessoal) e os filtros de tipo/busca."""
     if active_workspace_id and share_prefs:
-        print(f"[LIST_TX] Filtrando transações por workspace_id={active_workspace_id}")
-        
-        # Verificar se usuário pode ver transações compartilhadas
         if share_prefs.get('share_transactions', True):
             # Mostrar todas as transações do workspace
             query = query.filter(Transaction.workspace_id == active_workspace_id)
-            print(f"[LIST_TX] Mostrando todas as transações do workspace (share_transactions=True)")
         else:
             # Mostrar apenas transações próprias do usuário no workspace
             query = query.filter(
                 Transaction.workspace_id == active_workspace_id,
                 Transaction.user_id == int(user_id_int)
             )
-            print(f"[LIST_TX] Mostrando apenas transações próprias no workspace (share_transactions=False)")
     else:
-        print(f"[LIST_TX] Sem workspace ativo, mostrando transações pessoais do usuário")
         # Sem workspace ativo, mostrar apenas transações pessoais do usuário
         query = query.filter(
             Transaction.user_id == int(user_id_int),
@@ -1619,35 +1308,110 @@ def api_list_transactions():
 
     if tx_type in ("income", "expense"):
         query = query.filter(Transaction.type == tx_type)
-        print(f"[LIST_TX] Aplicado filtro de tipo: {tx_type}")
 
     if q:
         query = query.filter(func.lower(Transaction.description).like(f"%{q.lower()}%"))
-        print(f"[LIST_TX] Aplicado filtro de busca: '{q}'")
-
-    # Calcular saldo acumulado de meses anteriores (TOTAL: Receitas - Despesas de TODO o passado)
-    prev_query = db.session.query(
-        func.sum(case(((Transaction.type == 'income'), Transaction.amount), else_=0)) -
-        func.sum(case(((Transaction.type == 'expense'), Transaction.amount), else_=0))
-    ).filter(
-        Transaction.transaction_date < start
+    return query
+
+
+def _filter_projected_items(items: list, tx_type: str = "", q: str = "") -> list:
+    """Aplica às ocorrências projetadas os mesmos filtros de tipo/busca da listagem."""
+    return [
+        p for p in items
+        if (tx_type not in ("income", "expense") or p["type"] == tx_type)
+        and (not q or q.lower() in (p["description"] or "").lower())
+    ]
+
+
+def _listing_etag(user_id_int: int, active_workspace_id, share_prefs, *extra) -> str:
+    """
+    ETag de uma listagem: contador das transações do escopo + categorias dos membros.
+
+    O mês atual entra no ETag porque decide o que é gravado e o que é só projetado.
+    """
+    if active_workspace_id and share_prefs:
+        scopes = [_tx_scope(active_workspace_id, user_id_int)]
+        scopes += [_category_scope(uid) for uid in _workspace_user_ids(active_workspace_id)]
+    else:
+        scopes = [_tx_scope(None, user_id_int), _category_scope(user_id_int)]
+    today = datetime.utcnow().date()
+    return _scopes_etag(scopes, user_id_int, active_workspace_id, f"{today:%Y-%m}", *extra)
+
+
+@api_financeiro_bp.route("/api/transactions", methods=["GET", "OPTIONS"])
+def api_list_transactions():
+    origin = request.headers.get("Origin", "*")
+    if request.method == "OPTIONS":
+        return _cors_preflight(origin, "GET, OPTIONS")
+
+    user_id_int = _get_user_id_from_request()
+    if not user_id_int:
+        resp = jsonify({"success": False, "message": "Não autenticado"})
+        return _cors_wrap(resp, origin), 401
+
+    today = datetime.utcnow().date()
+    try:
+        year = int(request.args.get("year") or today.year)
+        month = int(request.args.get("month") or today.month)
+    except Exception:
+        year = today.year
+        month = today.month
+
+    tx_type = (request.args.get("type") or "").strip().lower()
+    q = (request.args.get("q") or "").strip()
+    
+    print(f"[LIST_TX] Filtros - type: '{tx_type}', q: '{q}'")
+
+    start = date(year, month, 1)
+    if month == 12:
+        end = date(year + 1, 1, 1)
+    else:
+        end = date(year, month + 1, 1)
+
+    active_workspace_id, share_prefs, error = _resolve_listing_scope(user_id_int, origin)
+    if error:
+        return error
+    print(f"[LIST_TX] user_id={user_id_int}, active_workspace_id={active_workspace_id}, share_preferences={share_prefs}")
+
+    pending_projection = _prepare_listing_month(user_id_int, active_workspace_id, share_prefs, year, month)
+
+    etag = _listing_etag(user_id_int, active_workspace_id, share_prefs, "list", year, month, tx_type, q, request.args.get("projection"))
+    not_modified = _etag_not_modified(etag, origin)
+    if not_modified:
+        return not_modified
+    projection = _listing_projection(pending_projection)
+    
+    query = (
+        db.session.query(
+            Transaction.id,
+            Transaction.description,
+            Transaction.amount,
+            Transaction.type,
+            Transaction.transaction_date,
+            Transaction.is_paid,
+            Transaction.is_recurring,
+            Category.id,
+            Category.name,
+            Category.color,
+            Category.icon,
+        )
+        .outerjoin(Category, Category.id == Transaction.category_id)
+        .filter(
+            Transaction.transaction_date >= start,
+            Transaction.transaction_date < end,
+        )
     )
+    
+    query = _filter_listing_scope(query, user_id_int, active_workspace_id, share_prefs, tx_type, q)
 
+    # Saldo acumulado de meses anteriores, a partir dos rollups mensais (monthly_closures)
     if active_workspace_id and share_prefs:
         if share_prefs.get('share_transactions', True):
-            prev_query = prev_query.filter(Transaction.workspace_id == active_workspace_id)
+            prev_balance = _opening_balance(year, month, workspace_id=int(active_workspace_id))
         else:
-            prev_query = prev_query.filter(
-                Transaction.workspace_id == active_workspace_id,
-                Transaction.user_id == int(user_id_int)
-            )
+            prev_balance = _opening_balance(year, month, workspace_id=int(active_workspace_id), user_id=int(user_id_int))
     else:
-        prev_query = prev_query.filter(
-            Transaction.user_id == int(user_id_int),
-            Transaction.workspace_id.is_(None)
-        )
-
-    prev_balance = float(prev_query.scalar() or 0.0)
+        prev_balance = _opening_balance(year, month, user_id=int(user_id_int))
 
     rows = query.order_by(Transaction.transaction_date.desc(), Transaction.id.desc()).all()
     print(f"[LIST_TX] Encontradas {len(rows)} transações para o período {year}-{month:02d}")
@@ -1671,17 +1435,487 @@ def api_list_transactions():
             "date": tdate.isoformat() if tdate else None,
             "is_paid": bool(is_paid),
             "is_recurring": bool(is_recurring),
+            "is_projected": False,
             "category": category,
         })
 
+    # Ocorrências projetadas (meses futuros): aplicar os mesmos filtros e anexar a categoria
+    projected = _filter_projected_items(projection["items"], tx_type, q)
+    if projected:
+        cat_ids = {p["category_id"] for p in projected if p.get("category_id")}
+        cats_by_id = {c.id: c for c in Category.query.filter(Category.id.in_(cat_ids)).all()} if cat_ids else {}
+        for p in projected:
+            c = cats_by_id.get(p.pop("category_id", None))
+            p["category"] = {"id": int(c.id), "name": c.name, "color": c.color, "icon": c.icon} if c else None
+        items = sorted(items + projected, key=lambda it: it["date"] or "", reverse=True)
+
     resp = jsonify({
         "success": True,
         "year": year,
         "month": month,
         "transactions": items,
         "prev_balance": prev_balance,
+        "projected_prev_balance": prev_balance + float(projection["prev_total"] or 0.0),
+    })
+    return _cors_wrap(_with_etag(resp, etag), origin), 200
+
+
+# Campos aceitos em ``fields=`` da listagem paginada (nome na resposta -> coluna)
+_PAGE_FIELDS = {
+    "id": Transaction.id,
+    "date": Transaction.transaction_date,
+    "description": Transaction.description,
+    "amount": Transaction.amount,
+    "type": Transaction.type,
+    "is_paid": Transaction.is_paid,
+    "paid_date": Transaction.paid_date,
+    "is_recurring": Transaction.is_recurring,
+    "recurring_transaction_id": Transaction.recurring_transaction_id,
+    "category_id": Transaction.category_id,
+    "payment_method": Transaction.payment_method,
+    "credit_card_id": Transaction.credit_card_id,
+    "user_id": Transaction.user_id,
+    "notes": Transaction.notes,
+}
+_PAGE_DEFAULT_FIELDS = ("id", "date", "description", "amount", "type", "is_paid", "is_recurring", "category_id")
+_PAGE_DEFAULT_LIMIT = 50
+_PAGE_MAX_LIMIT = 200
+
+
+def _encode_page_cursor(tx_date: date, tx_id: int) -> str:
+    raw = f"{tx_date.isoformat()}|{int(tx_id)}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_page_cursor(cursor: str):
+    """Decodifica o cursor ``(transaction_date, id)``; None se inválido."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        tx_date, tx_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        return date.fromisoformat(tx_date), int(tx_id)
+    except Exception:
+        return None
+
+
+def _page_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+@api_financeiro_bp.route("/api/transactions/page", methods=["GET", "OPTIONS"])
+def api_list_transactions_page():
+    """
+    Listagem paginada por cursor (keyset) em (transaction_date, id), na mesma ordem de ``/api/transactions``.
+
+    Query: year, month, workspace_id, type, q, limit (máx. 200), cursor (``next_cursor``
+    da página anterior) e fields (ex.: ``fields=id,amount,date``). As categorias das
+    linhas vêm uma vez em ``categories`` ({id: {...}}), e não repetidas por item.
+    Ocorrências projetadas (meses futuros) vêm só na primeira página, em ``projected``.
+    """
+    origin = request.headers.get("Origin", "*")
+    if request.method == "OPTIONS":
+        return _cors_preflight(origin, "GET, OPTIONS")
+
+    user_id_int = _get_user_id_from_request()
+    if not user_id_int:
+        resp = jsonify({"success": False, "message": "Não autenticado"})
+        return _cors_wrap(resp, origin), 401
+
+    today = datetime.utcnow().date()
+    try:
+        year = int(request.args.get("year") or today.year)
+        month = int(request.args.get("month") or today.month)
+        start = date(year, month, 1)
+    except Exception:
+        resp = jsonify({"success": False, "message": "Período inválido"})
+        return _cors_wrap(resp, origin), 400
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+
+    try:
+        limit = int(request.args.get("limit") or _PAGE_DEFAULT_LIMIT)
+    except Exception:
+        limit = _PAGE_DEFAULT_LIMIT
+    limit = max(1, min(limit, _PAGE_MAX_LIMIT))
+
+    fields_raw = (request.args.get("fields") or "").strip()
+    if fields_raw:
+        fields = [f.strip() for f in fields_raw.split(",") if f.strip()]
+        unknown = [f for f in fields if f not in _PAGE_FIELDS]
+        if unknown:
+            resp = jsonify({"success": False, "message": f"Campos inválidos: {', '.join(unknown)}"})
+            return _cors_wrap(resp, origin), 400
+    else:
+        fields = list(_PAGE_DEFAULT_FIELDS)
+
+    cursor_raw = (request.args.get("cursor") or "").strip()
+    cursor = _decode_page_cursor(cursor_raw) if cursor_raw else None
+    if cursor_raw and not cursor:
+        resp = jsonify({"success": False, "message": "Cursor inválido"})
+        return _cors_wrap(resp, origin), 400
+
+    tx_type = (request.args.get("type") or "").strip().lower()
+    q = (request.args.get("q") or "").strip()
+
+    active_workspace_id, share_prefs, error = _resolve_listing_scope(user_id_int, origin)
+    if error:
+        return error
+
+    pending_projection = None
+    if not cursor:
+        pending_projection = _prepare_listing_month(user_id_int, active_workspace_id, share_prefs, year, month)
+
+    etag = _listing_etag(
+        user_id_int, active_workspace_id, share_prefs,
+        "page", year, month, tx_type, q, limit, ",".join(fields), cursor_raw, request.args.get("projection"),
+    )
+    not_modified = _etag_not_modified(etag, origin)
+    if not_modified:
+        return not_modified
+    projection = _listing_projection(pending_projection)
+
+    # id e data sempre entram no SELECT: formam o cursor
+    columns = [Transaction.id, Transaction.transaction_date]
+    columns += [_PAGE_FIELDS[f] for f in fields if f not in ("id", "date")]
+    if "category_id" not in fields:
+        columns.append(Transaction.category_id)
+
+    query = db.session.query(*columns).filter(
+        Transaction.transaction_date >= start,
+        Transaction.transaction_date < end,
+    )
+    query = _filter_listing_scope(query, user_id_int, active_workspace_id, share_prefs, tx_type, q)
+    if cursor:
+        query = query.filter(tuple_(Transaction.transaction_date, Transaction.id) < tuple_(cursor[0], cursor[1]))
+
+    rows = query.order_by(Transaction.transaction_date.desc(), Transaction.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = []
+    category_ids = set()
+    for row in rows:
+        values = row._mapping
+        items.append({f: _page_value(values[_PAGE_FIELDS[f].key]) for f in fields})
+        if values["category_id"]:
+            category_ids.add(int(values["category_id"]))
+
+    projected = []
+    if projection["items"]:
+        projected = _filter_projected_items(projection["items"], tx_type, q)
+        category_ids.update(int(p["category_id"]) for p in projected if p.get("category_id"))
+
+    categories = {}
+    if category_ids:
+        for cid, cname, ccolor, cicon in db.session.query(
+            Category.id, Category.name, Category.color, Category.icon
+        ).filter(Category.id.in_(category_ids)).all():
+            categories[str(cid)] = {"id": int(cid), "name": cname, "color": ccolor, "icon": cicon}
+
+    next_cursor = _encode_page_cursor(rows[-1].transaction_date, rows[-1].id) if has_more else None
+    resp = jsonify({
+        "success": True,
+        "year": year,
+        "month": month,
+        "fields": fields,
+        "transactions": items,
+        "projected": projected,
+        "categories": categories,
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+    })
+    return _cors_wrap(_with_etag(resp, etag), origin), 200
+
+
+_SYNC_TX_COLUMNS = [
+    column.label(name) for name, column in _PAGE_FIELDS.items()
+] + [
+    Transaction.workspace_id.label("workspace_id"),
+    Transaction.occurrence_month.label("occurrence_month"),
+    Transaction.updated_at.label("updated_at"),
+]
+_SYNC_CATEGORY_COLUMNS = [
+    Category.id, Category.name, Category.type, Category.icon, Category.color,
+    Category.is_active, Category.updated_at,
+]
+_SYNC_CARD_COLUMNS = [
+    CreditCard.id, CreditCard.user_id, CreditCard.workspace_id, CreditCard.name, CreditCard.last_digits,
+    CreditCard.brand, CreditCard.limit, CreditCard.closing_day, CreditCard.due_day, CreditCard.color,
+    CreditCard.is_active, CreditCard.updated_at,
+]
+_SYNC_RULE_COLUMNS = [
+    RecurringTransaction.id, RecurringTransaction.user_id, RecurringTransaction.workspace_id,
+    RecurringTransaction.category_id, RecurringTransaction.description, RecurringTransaction.amount,
+    RecurringTransaction.type, RecurringTransaction.frequency, RecurringTransaction.interval,
+    RecurringTransaction.day_of_month, RecurringTransaction.day_of_week, RecurringTransaction.start_date,
+    RecurringTransaction.end_date,
+    RecurringTransaction.exception_dates, RecurringTransaction.payment_method,
+    RecurringTransaction.credit_card_id, RecurringTransaction.is_active, RecurringTransaction.notes,
+    RecurringTransaction.updated_at,
+]
+_SYNC_DEFAULT_LIMIT = 500
+_SYNC_MAX_LIMIT = 2000
+
+
+def _sync_row(row) -> dict:
+    return {key: _page_value(value) for key, value in row._mapping.items()}
+
+
+@api_financeiro_bp.route("/api/sync", methods=["GET", "OPTIONS"])
+def api_sync():
+    """
+    Sincronização incremental do app: o que mudou no escopo desde ``since``.
+
+    Query: since (``next_token`` da chamada anterior; vazio = tudo), workspace_id e
+    limit (transações por página, máx. 2000). Retorna transações, categorias, cartões
+    e regras recorrentes criados/alterados e, em ``deleted``, os ids excluídos por
+    entidade. Com ``has_more`` o app chama de novo com ``next_token`` (só transações);
+    ``reset`` indica token expirado: o app descarta os dados locais e usa a resposta completa.
+    """
+    origin = request.headers.get("Origin", "*")
+    if request.method == "OPTIONS":
+        return _cors_preflight(origin, "GET, OPTIONS")
+
+    user_id_int = _get_user_id_from_request()
+    if not user_id_int:
+        resp = jsonify({"success": False, "message": "Não autenticado"})
+        return _cors_wrap(resp, origin), 401
+
+    token_raw = (request.args.get("since") or "").strip()
+    decoded = _decode_sync_token(token_raw) if token_raw else None
+    if token_raw and not decoded:
+        resp = jsonify({"success": False, "message": "Token de sincronização inválido"})
+        return _cors_wrap(resp, origin), 400
+
+    try:
+        limit = int(request.args.get("limit") or _SYNC_DEFAULT_LIMIT)
+    except Exception:
+        limit = _SYNC_DEFAULT_LIMIT
+    limit = max(1, min(limit, _SYNC_MAX_LIMIT))
+
+    active_workspace_id, share_prefs, error = _resolve_listing_scope(user_id_int, origin)
+    if error:
+        return error
+
+    since, cursor, started_at = decoded or (None, None, None)
+    reset = _token_expired(since)
+    if reset:
+        since, cursor, started_at = None, None, None
+    window = _sync_window_start(since) if since else None
+
+    if not cursor:
+        # Mesmo ponto de partida da listagem: ocorrências recorrentes até o mês atual gravadas
+        today = datetime.utcnow().date()
+        _prepare_listing_month(user_id_int, active_workspace_id, share_prefs, today.year, today.month)
+        started_at = datetime.utcnow()
+
+    tx_query = _filter_listing_scope(db.session.query(*_SYNC_TX_COLUMNS), user_id_int, active_workspace_id, share_prefs)
+    if window:
+        tx_query = tx_query.filter(Transaction.updated_at >= window)
+    if cursor:
+        tx_query = tx_query.filter(tuple_(Transaction.updated_at, Transaction.id) > tuple_(cursor[0], cursor[1]))
+    tx_rows = tx_query.order_by(Transaction.updated_at.asc(), Transaction.id.asc()).limit(limit + 1).all()
+    has_more = len(tx_rows) > limit
+    tx_rows = tx_rows[:limit]
+
+    shared = bool(active_workspace_id and share_prefs)
+    shared_transactions = shared and share_prefs.get("share_transactions", True)
+    categories, cards, rules = [], [], []
+    deleted = {"transaction": [], "category": [], "credit_card": [], "recurring": []}
+    if not cursor:
+        # Categorias, cartões, regras e exclusões vão só na primeira página
+        if shared and share_prefs.get("share_categories", True):
+            category_user_ids = _workspace_user_ids(active_workspace_id)
+        else:
+            category_user_ids = [user_id_int]
+        if not since:
+            _ensure_finance_config_and_categories(user_id_int)
+        cat_query = db.session.query(*_SYNC_CATEGORY_COLUMNS).join(
+            FinanceConfig, FinanceConfig.id == Category.config_id
+        ).filter(FinanceConfig.user_id.in_(category_user_ids))
+        if window:
+            cat_query = cat_query.filter(Category.updated_at >= window)
+        categories = [_sync_row(row) for row in cat_query.order_by(Category.id.asc()).all()]
+
+        card_query = db.session.query(*_SYNC_CARD_COLUMNS)
+        if active_workspace_id:
+            card_query = card_query.filter(CreditCard.workspace_id == int(active_workspace_id))
+        else:
+            card_query = card_query.filter(CreditCard.user_id == user_id_int)
+        if window:
+            card_query = card_query.filter(CreditCard.updated_at >= window)
+        cards = [_sync_row(row) for row in card_query.order_by(CreditCard.id.asc()).all()]
+
+        rule_query = db.session.query(*_SYNC_RULE_COLUMNS)
+        if shared_transactions:
+            rule_query = rule_query.filter(RecurringTransaction.workspace_id == int(active_workspace_id))
+        elif shared:
+            rule_query = rule_query.filter(
+                RecurringTransaction.workspace_id == int(active_workspace_id),
+                RecurringTransaction.user_id == user_id_int,
+            )
+        else:
+            rule_query = rule_query.filter(
+                RecurringTransaction.user_id == user_id_int,
+                RecurringTransaction.workspace_id.is_(None),
+            )
+        if window:
+            rule_query = rule_query.filter(RecurringTransaction.updated_at >= window)
+        rules = [_sync_row(row) for row in rule_query.order_by(RecurringTransaction.id.asc()).all()]
+
+        if window:
+            if shared:
+                ledger_scope = [FinanceTombstone.workspace_id == int(active_workspace_id)]
+                if not shared_transactions:
+                    ledger_scope.append(FinanceTombstone.user_id == user_id_int)
+                card_scope = [FinanceTombstone.workspace_id == int(active_workspace_id)]
+            else:
+                ledger_scope = [FinanceTombstone.user_id == user_id_int, FinanceTombstone.workspace_id.is_(None)]
+                card_scope = [FinanceTombstone.user_id == user_id_int]
+            tombstones = db.session.query(FinanceTombstone.entity, FinanceTombstone.entity_id).filter(
+                FinanceTombstone.deleted_at >= window,
+                or_(
+                    and_(FinanceTombstone.entity.in_(("transaction", "recurring")), *ledger_scope),
+                    and_(FinanceTombstone.entity == "credit_card", *card_scope),
+                    and_(FinanceTombstone.entity == "category", FinanceTombstone.user_id.in_(category_user_ids)),
+                ),
+            ).distinct().all()
+            for entity, entity_id in tombstones:
+                deleted[entity].append(int(entity_id))
+            for ids in deleted.values():
+                ids.sort()
+
+    if has_more:
+        next_token = _encode_sync_token(since, (tx_rows[-1].updated_at, tx_rows[-1].id), started_at)
+    else:
+        next_token = _encode_sync_token(started_at)
+
+    resp = jsonify({
+        "success": True,
+        "full": since is None,
+        "reset": reset,
+        "transactions": [_sync_row(row) for row in tx_rows],
+        "categories": categories,
+        "credit_cards": cards,
+        "recurring": rules,
+        "deleted": deleted,
+        "has_more": has_more,
+        "next_token": next_token,
+    })
+    return _cors_wrap(resp, origin), 200
+
+
+@api_financeiro_bp.route("/api/recurring/<int:rule_id>/occurrences/<int:year>/<int:month>", methods=["POST", "DELETE", "OPTIONS"])
+def api_materialize_occurrence(rule_id: int, year: int, month: int):
+    """
+    Converte uma ocorrência projetada (``projection_key`` da listagem) em transação real.
+
+    Usado pelo app antes de pagar, editar ou anexar comprovante em um mês futuro.
+    Body opcional: {"is_paid": true} para já marcar como paga. Regras diárias,
+    semanais e quinzenais têm várias ocorrências no mês: informar a data da
+    ocorrência em ``?date=YYYY-MM-DD``.
+
+    DELETE exclui a ocorrência da série (exceção na regra), gravada ou só projetada.
+    """
+    origin = request.headers.get("Origin", "*")
+    if request.method == "OPTIONS":
+        return _cors_preflight(origin, "POST, DELETE, OPTIONS")
+
+    user_id_int = _get_user_id_from_request()
+    if not user_id_int:
+        resp = jsonify({"success": False, "message": "Não autenticado"})
+        return _cors_wrap(resp, origin), 401
+
+    rule = RecurringTransaction.query.get(rule_id)
+    if not rule or not rule.is_active:
+        resp = jsonify({"success": False, "message": "Recorrência não encontrada"})
+        return _cors_wrap(resp, origin), 404
+
+    if rule.workspace_id:
+        if not _check_user_share_preferences(int(user_id_int), int(rule.workspace_id)):
+            resp = jsonify({"success": False, "message": "Recorrência não encontrada"})
+            return _cors_wrap(resp, origin), 404
+    elif int(rule.user_id) != int(user_id_int):
+        resp = jsonify({"success": False, "message": "Recorrência não encontrada"})
+        return _cors_wrap(resp, origin), 404
+
+    if month < 1 or month > 12:
+        resp = jsonify({"success": False, "message": "Mês inválido"})
+        return _cors_wrap(resp, origin), 400
+
+    key = date(int(year), int(month), 1)
+    if _is_day_based(rule.frequency):
+        try:
+            key = date.fromisoformat((request.args.get("date") or "").strip())
+        except ValueError:
+            key = None
+        if not key or (key.year, key.month) != (int(year), int(month)):
+            resp = jsonify({"success": False, "message": "Informe a data da ocorrência (date=YYYY-MM-DD) no mês"})
+            return _cors_wrap(resp, origin), 400
+
+    if _rule_occurrence(rule, key) is None:
+        resp = jsonify({"success": False, "message": "Data fora do período da recorrência"})
+        return _cors_wrap(resp, origin), 400
+
+    if request.method == "DELETE":
+        try:
+            _skip_occurrence(rule, key)
+            persisted_q = db.session.query(Transaction).filter(
+                Transaction.recurring_transaction_id == int(rule.id),
+                Transaction.occurrence_month == key,
+            )
+            _mark_rollups_for_query(persisted_q)
+            _record_tombstones_for_query(persisted_q)
+            persisted_q.delete(synchronize_session=False)
+            db.session.commit()
+        except ClosedMonthError as e:
+            return _closed_month_response(e, origin)
+        except Exception as e:
+            db.session.rollback()
+            resp = jsonify({"success": False, "message": f"Falha ao excluir ocorrência: {e}"})
+            return _cors_wrap(resp, origin), 500
+        return _cors_wrap(jsonify({"success": True}), origin), 200
+
+    if _is_skipped_occurrence(rule, key):
+        resp = jsonify({"success": False, "message": "Ocorrência excluída da recorrência"})
+        return _cors_wrap(resp, origin), 404
+
+    data = request.get_json(silent=True) or {}
+    try:
+        tx = _materialize_occurrence(rule, key)
+        if "is_paid" in data:
+            tx.is_paid = bool(data.get("is_paid"))
+            tx.paid_date = datetime.utcnow().date() if tx.is_paid else None
+        db.session.commit()
+    except ClosedMonthError as e:
+        return _closed_month_response(e, origin)
+    except Exception as e:
+        db.session.rollback()
+        resp = jsonify({"success": False, "message": f"Falha ao gravar ocorrência: {e}"})
+        return _cors_wrap(resp, origin), 500
+
+    category = Category.query.get(tx.category_id) if tx.category_id else None
+    resp = jsonify({
+        "success": True,
+        "transaction": {
+            "id": int(tx.id),
+            "description": tx.description,
+            "amount": float(tx.amount or 0),
+            "type": tx.type,
+            "date": tx.transaction_date.isoformat() if tx.transaction_date else None,
+            "is_paid": bool(tx.is_paid),
+            "recurring_transaction_id": int(rule.id),
+            "category": {
+                "id": category.id,
+                "name": category.name,
+                "color": category.color,
+                "icon": category.icon,
+            } if category else None,
+        },
     })
-    return _cors_wrap(resp, origin), 200
+    return _cors_wrap(resp, origin), 201
 
 
 @api_financeiro_bp.route("/api/transactions/<int:tx_id>", methods=["GET", "PUT", "DELETE", "OPTIONS"])
@@ -1726,13 +1960,7 @@ def api_transaction_detail(tx_id: int):
 
     tx_workspace_id = getattr(tx, "workspace_id", None)
     if tx_workspace_id:
-        w = Workspace.query.get(int(tx_workspace_id))
-        is_owner = bool(w and int(getattr(w, "owner_id", 0) or 0) == int(user_id_int))
-        is_member = WorkspaceMember.query.filter_by(
-            workspace_id=int(tx_workspace_id),
-            user_id=int(user_id_int),
-        ).first()
-        if not (is_owner or is_member):
+        if not _has_workspace_access(user_id_int, tx_workspace_id):
             resp = jsonify({"success": False, "message": "Transação não encontrada"})
             return _cors_wrap(resp, origin), 404
 
@@ -1762,15 +1990,19 @@ def api_transaction_detail(tx_id: int):
                     return
 
                 if scope_value == "single":
+                    _skip_transaction_occurrence(target_tx)
                     db.session.delete(target_tx)
                     return
 
                 if scope_value == "future":
-                    db.session.query(Transaction).filter(
+                    bulk_q = db.session.query(Transaction).filter(
                         Transaction.user_id == int(user_id_int),
                         Transaction.recurring_transaction_id == int(rec_id),
                         Transaction.transaction_date >= target_tx.transaction_date,
-                    ).delete(synchronize_session=False)
+                    )
+                    _mark_rollups_for_query(bulk_q)
+                    _record_tombstones_for_query(bulk_q)
+                    bulk_q.delete(synchronize_session=False)
 
                     rec_tx = RecurringTransaction.query.filter_by(
                         id=int(rec_id),
@@ -1781,10 +2013,13 @@ def api_transaction_detail(tx_id: int):
                     return
 
                 if scope_value == "all":
-                    db.session.query(Transaction).filter(
+                    bulk_q = db.session.query(Transaction).filter(
                         Transaction.user_id == int(user_id_int),
                         Transaction.recurring_transaction_id == int(rec_id),
-                    ).delete(synchronize_session=False)
+                    )
+                    _mark_rollups_for_query(bulk_q)
+                    _record_tombstones_for_query(bulk_q)
+                    bulk_q.delete(synchronize_session=False)
 
                     rec_tx = RecurringTransaction.query.filter_by(
                         id=int(rec_id),
@@ -1800,6 +2035,8 @@ def api_transaction_detail(tx_id: int):
             db.session.commit()
             resp = jsonify({"success": True})
             return _cors_wrap(resp, origin), 200
+        except ClosedMonthError as e:
+            return _closed_month_response(e, origin)
         except Exception as e:
             db.session.rollback()
             resp = jsonify({"success": False, "message": f"Falha ao excluir transação: {e}"})
@@ -1831,14 +2068,16 @@ def api_transaction_detail(tx_id: int):
                 "recurring_day": int(rec_tx.day_of_month) if rec_tx and rec_tx.day_of_month else (tx.transaction_date.day if tx.transaction_date else None),
                 "recurring_unlimited": True if (rec_tx and rec_tx.end_date is None) else False,
                 "recurring_end_date": rec_tx.end_date.isoformat() if (rec_tx and rec_tx.end_date) else None,
+                "recurring_frequency": rec_tx.frequency if rec_tx else None,
+                "recurring_interval": int(rec_tx.interval or 1) if rec_tx else None,
                 "recurring_installments": (
-                    (_months_diff(rec_tx.start_date.year, rec_tx.start_date.month, rec_tx.end_date.year, rec_tx.end_date.month) + 1)
+                    _series_length(rec_tx)
                     if (rec_tx and rec_tx.type == "expense" and rec_tx.start_date and rec_tx.end_date)
                     else None
                 ),
                 "recurring_installments_start": None,
                 "recurring_installment_index": (
-                    (_months_diff(rec_tx.start_date.year, rec_tx.start_date.month, tx.transaction_date.year, tx.transaction_date.month) + 1)
+                    _occurrence_seq(rec_tx, tx.transaction_date)
                     if (rec_tx and rec_tx.type == "expense" and rec_tx.start_date and rec_tx.end_date and tx.transaction_date)
                     else None
                 ),
@@ -1867,6 +2106,8 @@ def api_transaction_detail(tx_id: int):
                 },
             })
             return _cors_wrap(resp, origin), 200
+        except ClosedMonthError as e:
+            return _closed_month_response(e, origin)
         except Exception as e:
             db.session.rollback()
             resp = jsonify({"success": False, "message": f"Falha ao atualizar pagamento: {e}"})
@@ -1889,6 +2130,16 @@ def api_transaction_detail(tx_id: int):
     recurring_installments_raw = data.get("recurring_installments")
     recurring_installments_start = str(data.get("recurring_installments_start") or "").strip().lower() or None
 
+    rec_tx = None
+    if is_recurring and tx.recurring_transaction_id:
+        rec_tx = RecurringTransaction.query.filter_by(id=tx.recurring_transaction_id, user_id=int(user_id_int)).first()
+
+    # Sem frequência no corpo vale a da regra existente (ou mensal, como no POST)
+    recurring_frequency = str(
+        data.get("recurring_frequency") or (rec_tx.frequency if rec_tx else None) or "monthly"
+    ).strip().lower()
+    recurring_interval_raw = data.get("recurring_interval") or (rec_tx.interval if rec_tx else None)
+
     if ttype not in ("income", "expense"):
         resp = jsonify({"success": False, "message": "Tipo inválido (income/expense)."})
         return _cors_wrap(resp, origin), 400
@@ -1917,7 +2168,21 @@ def api_transaction_detail(tx_id: int):
         tdate = datetime.utcnow().date()
 
     recurring_day_int = None
+    recurring_interval = 1
     if is_recurring:
+        try:
+            recurring_interval = int(recurring_interval_raw or 1)
+        except (TypeError, ValueError):
+            recurring_interval = 0
+        if recurring_frequency not in _FREQUENCIES or not 1 <= recurring_interval <= 366:
+            resp = jsonify({"success": False, "message": "Frequência de recorrência inválida."})
+            return _cors_wrap(resp, origin), 400
+        # As chaves das ocorrências já geradas dependem da frequência da regra
+        if rec_tx and (recurring_frequency != (rec_tx.frequency or "monthly") or recurring_interval != _rule_interval(rec_tx)):
+            resp = jsonify({"success": False, "message": "A frequência de uma recorrência existente não pode ser alterada."})
+            return _cors_wrap(resp, origin), 400
+
+    if is_recurring and not _is_day_based(recurring_frequency):
         try:
             recurring_day_int = int(recurring_day) if recurring_day is not None else None
         except Exception:
@@ -1958,7 +2223,6 @@ def api_transaction_detail(tx_id: int):
             resp = jsonify({"success": False, "message": "Categoria não encontrada."})
             return _cors_wrap(resp, origin), 400
 
-    rec_tx = None
     if is_recurring:
         unlimited_bool = True
         if recurring_unlimited is not None:
@@ -1980,134 +2244,470 @@ def api_transaction_detail(tx_id: int):
         if recurring_installments_start not in ("current_month", "due_date"):
             recurring_installments_start = "current_month"
 
-        if tx.recurring_transaction_id:
-            rec_tx = RecurringTransaction.query.filter_by(id=tx.recurring_transaction_id, user_id=int(user_id_int)).first()
-
-        base_start_month = date(tdate.year, tdate.month, 1)
+        by_day = _is_day_based(recurring_frequency)
+        base_start_month = tdate if by_day else date(tdate.year, tdate.month, 1)
         if rec_tx and rec_tx.start_date:
             # Não mudar o start_date de uma recorrência já existente ao editar parcelas do meio.
-            base_start_month = date(rec_tx.start_date.year, rec_tx.start_date.month, 1)
-        elif installments_int is not None:
+            base_start_month = rec_tx.start_date if by_day else date(rec_tx.start_date.year, rec_tx.start_date.month, 1)
+        elif installments_int is not None and recurring_installments_start == "due_date" and not by_day:
             # Definir start_date apenas quando estamos criando/ativando a recorrência.
-            base_start_month = date(tdate.year, tdate.month, 1)
-            if recurring_installments_start == "due_date":
-                try:
-                    today = datetime.utcnow().date()
-                    if tdate < today:
-                        ny, nm = _shift_month_simple(tdate.year, tdate.month, 1)
-                        base_start_month = date(ny, nm, 1)
-                except Exception:
-                    base_start_month = date(tdate.year, tdate.month, 1)
+            try:
+                today = datetime.utcnow().date()
+                if tdate < today:
+                    ny, nm = _shift_month_simple(tdate.year, tdate.month, 1)
+                    base_start_month = date(ny, nm, 1)
+            except Exception:
+                base_start_month = date(tdate.year, tdate.month, 1)
+
+        if installments_int is not None and by_day:
+            unlimited_bool = False
+            step_days = _FREQUENCY_DAYS[recurring_frequency] * recurring_interval
+            end_date = base_start_month + timedelta(days=step_days * (installments_int - 1))
+        elif installments_int is not None:
+            unlimited_bool = False
+            step_months = _FREQUENCY_MONTHS[recurring_frequency] * recurring_interval
+            end_y, end_m = _shift_month_simple(base_start_month.year, base_start_month.month, step_months * (installments_int - 1))
+            end_date = _last_day_of_month(end_y, end_m)
+        elif not unlimited_bool and recurring_end_date_raw:
+            try:
+                end_date = date.fromisoformat(recurring_end_date_raw)
+            except Exception:
+                end_date = None
+
+        if not rec_tx:
+            start_date_first_day = base_start_month
+            base_desc = _strip_installment_suffix(description)
+            rec_tx = RecurringTransaction(
+                user_id=int(user_id_int),
+                category_id=category.id,
+                subcategory_id=None,
+                subcategory_text=subcategory_text,
+                description=base_desc,
+                amount=amount,
+                type=ttype,
+                frequency=recurring_frequency,
+                interval=recurring_interval,
+                day_of_month=recurring_day_int,
+                day_of_week=tdate.weekday() if recurring_frequency in ("weekly", "biweekly") else None,
+                start_date=start_date_first_day,
+                end_date=end_date,
+                is_active=True,
+                payment_method=payment_method,
+                notes=notes,
+                workspace_id=tx.workspace_id,
+                generated_through=_occurrence_key(recurring_frequency, tdate),
+            )
+            db.session.add(rec_tx)
+            db.session.flush()
+            tx.recurring_transaction_id = rec_tx.id
+
+        if rec_tx:
+            # Só definir start_date se estiver vazio.
+            if rec_tx.start_date is None:
+                rec_tx.start_date = base_start_month
+            rec_tx.end_date = end_date
+            rec_tx.day_of_month = recurring_day_int
+            rec_tx.category_id = category.id
+            rec_tx.subcategory_text = subcategory_text
+            rec_tx.description = _strip_installment_suffix(description)
+            rec_tx.amount = amount
+            rec_tx.type = ttype
+            rec_tx.payment_method = payment_method
+            rec_tx.notes = notes
+            rec_tx.is_active = True
+
+    if not is_recurring:
+        tx.recurring_transaction_id = None
+
+    tx.type = ttype
+    tx_desc = description
+    if is_recurring and ttype == "expense" and rec_tx and getattr(rec_tx, "end_date", None) and getattr(rec_tx, "start_date", None) and tdate:
+        try:
+            total_inst = _series_length(rec_tx)
+            idx_inst = _occurrence_seq(rec_tx, tdate)
+            if total_inst and total_inst > 1:
+                tx_desc = f"{_strip_installment_suffix(description)} ({idx_inst}/{total_inst})"
+            else:
+                tx_desc = _strip_installment_suffix(description)
+        except Exception:
+            tx_desc = description
+
+    tx.description = tx_desc
+    tx.amount = amount
+    tx.category_id = category.id
+    tx_date_final = tdate
+    if is_recurring and recurring_day_int and tdate:
+        try:
+            last_day = calendar.monthrange(tdate.year, tdate.month)[1]
+            tx_date_final = date(tdate.year, tdate.month, min(recurring_day_int or 1, last_day))
+        except Exception:
+            tx_date_final = tdate
+
+    tx.transaction_date = tx_date_final
+    tx.is_paid = is_paid
+    tx.paid_date = tx_date_final if is_paid else None
+    tx.payment_method = payment_method
+    tx.credit_card_id = credit_card_id
+    tx.notes = notes
+    tx.subcategory_text = subcategory_text
+    tx.is_recurring = is_recurring
+    tx.frequency = (rec_tx.frequency if rec_tx else "monthly") if is_recurring else "once"
+
+    db.session.commit()
+
+    resp = jsonify({
+        "success": True,
+        "transaction": {
+            "id": int(tx.id),
+            "description": tx.description,
+            "amount": float(tx.amount or 0),
+            "type": tx.type,
+            "date": tx.transaction_date.isoformat() if tx.transaction_date else None,
+            "category": {
+                "id": category.id,
+                "name": category.name,
+                "color": category.color,
+                "icon": category.icon,
+            },
+        },
+    })
+    return _cors_wrap(resp, origin), 200
+
+
+@api_financeiro_bp.route("/api/transactions/autocomplete", methods=["GET", "OPTIONS"])
+def api_transactions_autocomplete():
+    """
+    Autocomplete da descrição: estabelecimentos já usados que começam com ``q``.
+
+    Query: q, type, limit (máx. 20). Prefixo em ``merchant_key`` (índice por usuário),
+    então "ube" acha "Uber *Trip (2/10)" e "Uber".
+    """
+    origin = request.headers.get("Origin", "*")
+    if request.method == "OPTIONS":
+        return _cors_preflight(origin, "GET, OPTIONS")
+
+    user_id_int = _get_user_id_from_request()
+    if not user_id_int:
+        resp = jsonify({"success": False, "message": "Não autenticado"})
+        return _cors_wrap(resp, origin), 401
+
+    q = (request.args.get("q") or "").strip()
+    tx_type = (request.args.get("type") or "").strip().lower()
+    try:
+        limit = max(1, min(int(request.args.get("limit") or 10), 20))
+    except Exception:
+        limit = 10
+
+    items = _autocomplete_merchants(user_id_int, q, tx_type, limit) if q else []
+    resp = jsonify({"success": True, "suggestions": items})
+    return _cors_wrap(resp, origin), 200
+
+
+@api_financeiro_bp.route("/api/transactions/import", methods=["POST", "OPTIONS"])
+@_idempotent
+def api_import_transactions():
+    """
+    Importa um extrato bancário (multipart ``file``, CSV ou OFX).
+
+    Campos: user_id, workspace_id, format (csv/ofx; padrão pela extensão),
+    dry_run. O arquivo é lido em streaming e gravado em lotes numa única
+    transação; linhas inválidas vão em ``errors`` sem abortar o resto.
+    """
+    origin = request.headers.get("Origin", "*")
+    if request.method == "OPTIONS":
+        return _cors_preflight(origin, "POST, OPTIONS")
+
+    user_id_int = _get_user_id_from_request()
+    if not user_id_int:
+        try:
+            user_id_int = int(request.form.get("user_id"))
+        except Exception:
+            user_id_int = None
+    if not user_id_int:
+        resp = jsonify({"success": False, "message": "Não autenticado"})
+        return _cors_wrap(resp, origin), 401
+
+    upload = request.files.get("file")
+    if not upload or not upload.filename:
+        resp = jsonify({"success": False, "message": "Arquivo do extrato é obrigatório (campo file)"})
+        return _cors_wrap(resp, origin), 400
+
+    try:
+        workspace_id_hint = int(request.form.get("workspace_id") or request.args.get("workspace_id") or 0) or None
+    except Exception:
+        workspace_id_hint = None
+    if not workspace_id_hint and len(_user_workspace_ids(user_id_int)) > 1:
+        resp = jsonify({"success": False, "message": "workspace_id obrigatório"})
+        return _cors_wrap(resp, origin), 400
+    workspace_id = _get_active_workspace_for_user(user_id_int, workspace_id_hint)
+    if not workspace_id:
+        resp = jsonify({"success": False, "message": "workspace_id obrigatório"})
+        return _cors_wrap(resp, origin), 400
+    if not _can_edit_workspace(user_id_int, workspace_id):
+        resp = jsonify({"success": False, "message": "Sem permissão para editar este workspace"})
+        return _cors_wrap(resp, origin), 403
+
+    fmt = _statement_format(upload.filename, request.form.get("format") or request.args.get("format"))
+    dry_run = str(request.form.get("dry_run") or request.args.get("dry_run") or "").strip().lower() in ("1", "true", "yes")
+
+    try:
+        _ensure_finance_config_and_categories(user_id_int)
+        report = _import_statement(upload.stream, user_id_int, workspace_id, fmt=fmt, dry_run=dry_run)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        _dbg(f"[IMPORT] Erro de banco: {e}")
+        resp = jsonify({"success": False, "message": "Erro ao gravar a importação"})
+        return _cors_wrap(resp, origin), 500
+
+    resp = jsonify({"success": True, "workspace_id": workspace_id, "format": fmt, **report})
+    return _cors_wrap(resp, origin), 200
+
+
+@api_financeiro_bp.route("/api/transactions/export", methods=["GET", "OPTIONS"])
+def api_export_transactions():
+    """
+    Exporta as transações do workspace em CSV ou XLSX, em streaming.
+
+    Query: format (csv/xlsx), start, end (YYYY-MM-DD, inclusivos; sem eles,
+    todo o histórico), workspace_id, type, q. Só linhas gravadas (sem projeção
+    de recorrências), em ordem de data.
+    """
+    origin = request.headers.get("Origin", "*")
+    if request.method == "OPTIONS":
+        return _cors_preflight(origin, "GET, OPTIONS")
+
+    user_id_int = _get_user_id_from_request()
+    if not user_id_int:
+        resp = jsonify({"success": False, "message": "Não autenticado"})
+        return _cors_wrap(resp, origin), 401
+
+    fmt = (request.args.get("format") or "csv").strip().lower()
+    if fmt not in ("csv", "xlsx"):
+        resp = jsonify({"success": False, "message": "Formato inválido (csv/xlsx)"})
+        return _cors_wrap(resp, origin), 400
+    try:
+        start = date.fromisoformat(request.args["start"]) if request.args.get("start") else None
+        end = date.fromisoformat(request.args["end"]) if request.args.get("end") else None
+    except ValueError:
+        resp = jsonify({"success": False, "message": "Período inválido"})
+        return _cors_wrap(resp, origin), 400
+
+    active_workspace_id, share_prefs, error = _resolve_listing_scope(user_id_int, origin)
+    if error:
+        return error
+
+    query = db.session.query(*_export_columns()).outerjoin(Category, Category.id == Transaction.category_id)
+    if start:
+        query = query.filter(Transaction.transaction_date >= start)
+    if end:
+        query = query.filter(Transaction.transaction_date <= end)
+    query = _filter_listing_scope(
+        query, user_id_int, active_workspace_id, share_prefs,
+        (request.args.get("type") or "").strip().lower(), (request.args.get("q") or "").strip(),
+    )
+    rows = _stream_rows(query.order_by(Transaction.transaction_date.asc(), Transaction.id.asc()))
+
+    period = f"{start.isoformat() if start else 'inicio'}_{end.isoformat() if end else 'hoje'}"
+    if fmt == "xlsx":
+        body, mimetype = _iter_xlsx(rows), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        body, mimetype = _iter_csv(rows), "text/csv; charset=utf-8"
+    resp = current_app.response_class(stream_with_context(body), mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f'attachment; filename="transacoes_{period}.{fmt}"'
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return _cors_wrap(resp, origin), 200
+
+
+def _month_scope(user_id_int: int, active_workspace_id, share_prefs) -> tuple:
+    """``(workspace_id, user_id)`` do resumo mensal, seguindo o escopo da listagem."""
+    if active_workspace_id and share_prefs:
+        if share_prefs.get('share_transactions', True):
+            return int(active_workspace_id), None
+        return int(active_workspace_id), int(user_id_int)
+    return None, int(user_id_int)
+
+
+@api_financeiro_bp.route("/api/months/<int:year>/<int:month>", methods=["GET", "OPTIONS"])
+def api_month_summary(year: int, month: int):
+    """
+    Resumo do mês: totais, categorias e despesas fixas.
+
+    Mês fechado vem do snapshot do fechamento (``source: "snapshot"``); mês aberto,
+    das transações.
+    """
+    origin = request.headers.get("Origin", "*")
+    if request.method == "OPTIONS":
+        return _cors_preflight(origin, "GET, OPTIONS")
+
+    user_id_int = _get_user_id_from_request()
+    if not user_id_int:
+        resp = jsonify({"success": False, "message": "Não autenticado"})
+        return _cors_wrap(resp, origin), 401
+    if month < 1 or month > 12:
+        resp = jsonify({"success": False, "message": "Mês inválido"})
+        return _cors_wrap(resp, origin), 400
+
+    active_workspace_id, share_prefs, error = _resolve_listing_scope(user_id_int, origin)
+    if error:
+        return error
+
+    etag = _listing_etag(user_id_int, active_workspace_id, share_prefs, "month", year, month)
+    not_modified = _etag_not_modified(etag, origin)
+    if not_modified:
+        return not_modified
+
+    workspace_id, scope_user_id = _month_scope(user_id_int, active_workspace_id, share_prefs)
+    summary = _month_summary(year, month, workspace_id=workspace_id, user_id=scope_user_id)
+    resp = jsonify({"success": True, "workspace_id": workspace_id, **summary})
+    return _cors_wrap(_with_etag(resp, etag), origin), 200
+
+
+@api_financeiro_bp.route("/api/summary", methods=["GET", "OPTIONS"])
+def api_year_summary():
+    """
+    Resumo do ano para os gráficos: 12 meses (receitas, despesas, saldo, pagas/em
+    aberto, status do fechamento), categorias e formas de pagamento com a série
+    mensal de cada uma. Uma query agrupada, em cache até a próxima escrita no escopo.
+    """
+    origin = request.headers.get("Origin", "*")
+    if request.method == "OPTIONS":
+        return _cors_preflight(origin, "GET, OPTIONS")
+
+    user_id_int = _get_user_id_from_request()
+    if not user_id_int:
+        resp = jsonify({"success": False, "message": "Não autenticado"})
+        return _cors_wrap(resp, origin), 401
+
+    try:
+        year = int(request.args.get("year") or datetime.utcnow().year)
+    except (TypeError, ValueError):
+        resp = jsonify({"success": False, "message": "Ano inválido"})
+        return _cors_wrap(resp, origin), 400
+
+    active_workspace_id, share_prefs, error = _resolve_listing_scope(user_id_int, origin)
+    if error:
+        return error
+
+    etag = _listing_etag(user_id_int, active_workspace_id, share_prefs, "summary", year)
+    not_modified = _etag_not_modified(etag, origin)
+    if not_modified:
+        return not_modified
+
+    workspace_id, scope_user_id = _month_scope(user_id_int, active_workspace_id, share_prefs)
+    summary = _year_summary(year, workspace_id=workspace_id, user_id=scope_user_id)
+    resp = jsonify({"success": True, "workspace_id": workspace_id, **summary})
+    return _cors_wrap(_with_etag(resp, etag), origin), 200
+
+
+@api_financeiro_bp.route("/api/forecast", methods=["GET", "OPTIONS"])
+def api_cash_forecast():
+    """
+    Previsão de saldo dia a dia até o fim dos próximos ``months`` meses (padrão 6):
+    transações já lançadas, ocorrências recorrentes pendentes e faturas de cartão
+    no vencimento. Não grava transações.
+    """
+    origin = request.headers.get("Origin", "*")
+    if request.method == "OPTIONS":
+        return _cors_preflight(origin, "GET, OPTIONS")
+
+    user_id_int = _get_user_id_from_request()
+    if not user_id_int:
+        resp = jsonify({"success": False, "message": "Não autenticado"})
+        return _cors_wrap(resp, origin), 401
 
-        if installments_int is not None:
-            unlimited_bool = False
-            end_y, end_m = _shift_month_simple(base_start_month.year, base_start_month.month, installments_int - 1)
-            end_date = _last_day_of_month(end_y, end_m)
-        elif not unlimited_bool and recurring_end_date_raw:
-            try:
-                end_date = date.fromisoformat(recurring_end_date_raw)
-            except Exception:
-                end_date = None
+    try:
+        months = int(request.args.get("months") or 6)
+    except (TypeError, ValueError):
+        months = 0
+    if not 1 <= months <= _FORECAST_MAX_MONTHS:
+        resp = jsonify({"success": False, "message": f"months deve estar entre 1 e {_FORECAST_MAX_MONTHS}"})
+        return _cors_wrap(resp, origin), 400
 
-        if not rec_tx:
-            start_date_first_day = base_start_month
-            base_desc = _strip_installment_suffix(description)
-            rec_tx = RecurringTransaction(
-                user_id=int(user_id_int),
-                category_id=category.id,
-                subcategory_id=None,
-                subcategory_text=subcategory_text,
-                description=base_desc,
-                amount=amount,
-                type=ttype,
-                frequency="monthly",
-                day_of_month=recurring_day_int,
-                start_date=start_date_first_day,
-                end_date=end_date,
-                is_active=True,
-                payment_method=payment_method,
-                notes=notes,
-            )
-            db.session.add(rec_tx)
-            db.session.flush()
-            tx.recurring_transaction_id = rec_tx.id
+    active_workspace_id, share_prefs, error = _resolve_listing_scope(user_id_int, origin)
+    if error:
+        return error
 
-        if rec_tx:
-            # Só definir start_date se estiver vazio.
-            if rec_tx.start_date is None:
-                rec_tx.start_date = base_start_month
-            rec_tx.end_date = end_date
-            rec_tx.day_of_month = recurring_day_int
-            rec_tx.category_id = category.id
-            rec_tx.subcategory_text = subcategory_text
-            rec_tx.description = _strip_installment_suffix(description)
-            rec_tx.amount = amount
-            rec_tx.type = ttype
-            rec_tx.payment_method = payment_method
-            rec_tx.notes = notes
-            rec_tx.is_active = True
+    workspace_id, scope_user_id = _month_scope(user_id_int, active_workspace_id, share_prefs)
+    if workspace_id and scope_user_id is None:
+        rule_user_ids = list(_workspace_user_ids(workspace_id))
+    else:
+        rule_user_ids = [int(user_id_int)]
 
-    if not is_recurring:
-        tx.recurring_transaction_id = None
+    try:
+        forecast = _cash_forecast(rule_user_ids, workspace_id=workspace_id, user_id=scope_user_id, months=months)
+    except Exception as e:
+        db.session.rollback()
+        _dbg(f"[FORECAST] Erro: {e}")
+        resp = jsonify({"success": False, "message": "Erro ao calcular previsão"})
+        return _cors_wrap(resp, origin), 500
 
-    tx.type = ttype
-    tx_desc = description
-    if is_recurring and ttype == "expense" and rec_tx and getattr(rec_tx, "end_date", None) and getattr(rec_tx, "start_date", None) and tdate:
-        try:
-            total_inst = _months_diff(rec_tx.start_date.year, rec_tx.start_date.month, rec_tx.end_date.year, rec_tx.end_date.month) + 1
-            idx_inst = _months_diff(rec_tx.start_date.year, rec_tx.start_date.month, tdate.year, tdate.month) + 1
-            if total_inst and total_inst > 1:
-                tx_desc = f"{_strip_installment_suffix(description)} ({idx_inst}/{total_inst})"
-            else:
-                tx_desc = _strip_installment_suffix(description)
-        except Exception:
-            tx_desc = description
+    resp = jsonify({"success": True, "workspace_id": workspace_id, "months_ahead": months, **forecast})
+    return _cors_wrap(resp, origin), 200
 
-    tx.description = tx_desc
-    tx.amount = amount
-    tx.category_id = category.id
-    tx_date_final = tdate
-    if is_recurring and recurring_day_int and tdate:
-        try:
-            last_day = calendar.monthrange(tdate.year, tdate.month)[1]
-            tx_date_final = date(tdate.year, tdate.month, min(recurring_day_int or 1, last_day))
-        except Exception:
-            tx_date_final = tdate
 
-    tx.transaction_date = tx_date_final
-    tx.is_paid = is_paid
-    tx.paid_date = tx_date_final if is_paid else None
-    tx.payment_method = payment_method
-    tx.credit_card_id = credit_card_id
-    tx.notes = notes
-    tx.subcategory_text = subcategory_text
-    tx.is_recurring = is_recurring
-    tx.frequency = "monthly" if is_recurring else "once"
+@api_financeiro_bp.route("/api/months/<int:year>/<int:month>/close", methods=["POST", "DELETE", "OPTIONS"])
+def api_close_month(year: int, month: int):
+    """
+    Fecha o mês (POST) ou reabre (DELETE) no workspace ativo ou no livro pessoal.
 
-    db.session.commit()
+    Em workspace só o dono pode fechar/reabrir. Depois de fechado, criar, editar ou
+    excluir transações do mês responde 409.
+    """
+    origin = request.headers.get("Origin", "*")
+    if request.method == "OPTIONS":
+        return _cors_preflight(origin, "POST, DELETE, OPTIONS")
 
-    resp = jsonify({
-        "success": True,
-        "transaction": {
-            "id": int(tx.id),
-            "description": tx.description,
-            "amount": float(tx.amount or 0),
-            "type": tx.type,
-            "date": tx.transaction_date.isoformat() if tx.transaction_date else None,
-            "category": {
-                "id": category.id,
-                "name": category.name,
-                "color": category.color,
-                "icon": category.icon,
-            },
-        },
-    })
+    user_id_int = _get_user_id_from_request()
+    if not user_id_int:
+        resp = jsonify({"success": False, "message": "Não autenticado"})
+        return _cors_wrap(resp, origin), 401
+    if month < 1 or month > 12:
+        resp = jsonify({"success": False, "message": "Mês inválido"})
+        return _cors_wrap(resp, origin), 400
+
+    active_workspace_id, _share_prefs, error = _resolve_listing_scope(user_id_int, origin)
+    if error:
+        return error
+    if active_workspace_id and _get_workspace_role(user_id_int, active_workspace_id) != "owner":
+        resp = jsonify({"success": False, "message": "Apenas o dono do workspace pode fechar o mês"})
+        return _cors_wrap(resp, origin), 403
+
+    workspace_id = int(active_workspace_id) if active_workspace_id else None
+    try:
+        if request.method == "DELETE":
+            result = _reopen_month(year, month, workspace_id=workspace_id, user_id=int(user_id_int))
+        else:
+            result = _close_month(year, month, workspace_id=workspace_id, user_id=int(user_id_int))
+    except ValueError as e:
+        db.session.rollback()
+        resp = jsonify({"success": False, "message": str(e)})
+        return _cors_wrap(resp, origin), 400
+    except Exception as e:
+        db.session.rollback()
+        _dbg(f"[CLOSURE] Erro ao fechar {year}-{month:02d}: {e}")
+        resp = jsonify({"success": False, "message": "Falha ao fechar o mês"})
+        return _cors_wrap(resp, origin), 500
+
+    resp = jsonify({"success": True, "workspace_id": workspace_id, **result})
     return _cors_wrap(resp, origin), 200
 
 
+def _confidence_label(score: float) -> str:
+    if score >= 0.85:
+        return "high"
+    return "medium" if score >= _CLASSIFIER_THRESHOLD else "low"
+
+
 @api_financeiro_bp.route("/api/suggest-category", methods=["POST", "OPTIONS"])
 def api_suggest_category():
-    """Sugere categoria e subcategoria usando Groq AI baseado na descrição."""
+    """
+    Sugere categoria e subcategoria a partir da descrição.
+
+    Primeiro o classificador local do usuário (``source`` "history" ou "classifier",
+    com ``score`` de 0 a 1); só abaixo de ``FINANCE_CLASSIFIER_THRESHOLD`` chama a
+    Groq (``source`` "ai").
+    """
     origin = request.headers.get("Origin", "*")
     if request.method == "OPTIONS":
         return _cors_preflight(origin, "POST, OPTIONS")
@@ -2136,47 +2736,56 @@ def api_suggest_category():
         return _cors_wrap(resp, origin), 400
 
     cfg = _ensure_finance_config_and_categories(int(user_id_int))
-    
-    # PRIMEIRO: Buscar transações similares no histórico do usuário
-    similar_tx = Transaction.query.filter(
-        Transaction.user_id == int(user_id_int),
-        Transaction.type == transaction_type,
-        func.lower(Transaction.description).like(f"%{description.lower()}%")
-    ).order_by(Transaction.created_at.desc()).first()
-    
-    # Se encontrou transação similar, reutilizar categoria e subcategoria
-    if similar_tx and similar_tx.category_id:
-        category = Category.query.get(similar_tx.category_id)
-        if category:
-            resp = jsonify({
-                "success": True,
-                "category": category.name,
-                "category_id": category.id,
-                "subcategory": similar_tx.subcategory_text,
-                "confidence": "high",
-                "source": "history"
-            })
-            return _cors_wrap(resp, origin), 200
-    
-    # Se não encontrou no histórico, usar IA
     categories = Category.query.filter_by(config_id=cfg.id, type=transaction_type, is_active=True).all()
     category_names = [c.name for c in categories]
 
+    # PRIMEIRO: classificador local (histórico exato ou Naive Bayes), sem rede
+    local = None
+    try:
+        local = _suggest_category_local(int(user_id_int), transaction_type, description, [c.id for c in categories])
+    except Exception as e:
+        _dbg(f"[CLASSIFIER] Erro: {e}")
+
+    if not local or local["source"] != "history":
+        # Estabelecimento fora da janela de treino do modelo: igualdade indexada em merchant_key
+        found = _history_category(int(user_id_int), transaction_type, description, [c.id for c in categories])
+        if found:
+            local = {"category_id": found[0], "score": 1.0, "source": "history", "subcategory": found[1]}
+
+    def _local_response():
+        category = next(c for c in categories if c.id == local["category_id"])
+        subcategory = local["subcategory"]
+        if category.name.strip().lower() in ("salário", "salario"):
+            subcategory = ""
+        resp = jsonify({
+            "success": True,
+            "category": category.name,
+            "category_id": category.id,
+            "subcategory": subcategory,
+            "confidence": _confidence_label(local["score"]),
+            "score": local["score"],
+            "source": local["source"],
+        })
+        return _cors_wrap(resp, origin), 200
+
+    if local and local["score"] >= _CLASSIFIER_THRESHOLD:
+        _dbg(f"[CLASSIFIER] {description!r} -> {local}")
+        return _local_response()
+
     def _fallback_category_name() -> str:
         if not category_names:
             return "Outros"
         other = next((n for n in category_names if n.strip().lower() == "outros"), None)
         return other or category_names[0]
 
-    # Chamar Groq API
-    groq_api_key = os.getenv("GROQ_API_KEY", "").strip()
-    key_preview = f"{groq_api_key[:6]}...{groq_api_key[-4:]}" if groq_api_key else "AUSENTE"
-    _dbg(f"[GROQ] API Key: {key_preview}")
+    # Chamar Groq API (cliente compartilhado: pool de conexões, concorrência limitada)
     _dbg(f"[GROQ] Descrição: {description}")
     _dbg(f"[GROQ] Tipo: {transaction_type}")
     
-    if not groq_api_key:
+    if not _llm_configured():
         print("[GROQ] ERRO: GROQ_API_KEY não encontrada no ambiente.")
+        if local:
+            return _local_response()
         resp = jsonify({
             "success": False,
             "message": "IA não configurada (GROQ_API_KEY ausente).",
@@ -2210,26 +2819,13 @@ Retorne APENAS um objeto JSON no formato:
 """
 
         _dbg(f"[GROQ] Enviando prompt para Groq...")
-        response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {groq_api_key}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": "llama-3.3-70b-versatile",
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0,
-                "max_tokens": 150
-            },
-            timeout=10
+        content = _chat_completion(
+            [{"role": "user", "content": prompt}],
+            temperature=0,
+            max_tokens=150,
+            timeout=10,
         )
-
-        _dbg(f"[GROQ] Status da resposta: {response.status_code}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            content = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+        if content:
             _dbg(f"[GROQ] Resposta bruta: {content}")
             
             # Tentar extrair JSON de dentro de blocos de código se a IA os incluiu
@@ -2275,11 +2871,17 @@ Retorne APENAS um objeto JSON no formato:
             except Exception as e:
                 _dbg(f"[GROQ] Erro ao processar JSON: {e}")
         else:
-            _dbg(f"[GROQ] Erro na API: {response.text}")
+            _dbg("[GROQ] Resposta vazia")
 
+    except LLMError as e:
+        _dbg(f"[GROQ] Erro na API: {e}")
     except Exception as e:
         _dbg(f"[GROQ ERROR] Exceção: {e}")
 
+    # IA falhou: a sugestão local, mesmo com confiança baixa, ainda ajuda
+    if local:
+        return _local_response()
+
     # Se falhou, retorna success: False mas com status 200 para o app liberar o modo manual sem erro feio
     resp = jsonify({
         "success": False,
@@ -2318,225 +2920,27 @@ def api_finance_ai():
     if mode not in ("credit_cards", "loans", "calculators"):
         mode = "general"
 
-    groq_api_key = os.getenv("GROQ_API_KEY", "").strip()
-    if not groq_api_key:
+    if not _llm_configured():
         resp = jsonify({
             "success": False,
             "message": "IA não configurada (GROQ_API_KEY ausente).",
         })
         return _cors_wrap(resp, origin), 503
 
+    # Streaming (SSE): {"stream": true} no body ou Accept: text/event-stream
+    wants_stream = bool(data.get("stream")) or "text/event-stream" in (request.headers.get("Accept") or "")
+
     # ------------------------------------------------------------------
-    # Contexto do workspace (baseado nos dados reais)
+    # Contexto do workspace (baseado nos dados reais; agregado em uma passada e em cache)
     # ------------------------------------------------------------------
-    today = datetime.utcnow().date()
-    month_start = date(today.year, today.month, 1)
-    if today.month == 12:
-        month_end = date(today.year + 1, 1, 1)
-    else:
-        month_end = date(today.year, today.month + 1, 1)
-
-    tx_filters_month = [
-        Transaction.workspace_id == int(active_workspace_id),
-        Transaction.transaction_date >= month_start,
-        Transaction.transaction_date < month_end,
-    ]
-    tx_filters_90d = [
-        Transaction.workspace_id == int(active_workspace_id),
-        Transaction.transaction_date >= (today - timedelta(days=90)),
-        Transaction.transaction_date <= today,
-    ]
-
-    if share_prefs.get("share_transactions") is False:
-        tx_filters_month.append(Transaction.user_id == int(user_id_int))
-        tx_filters_90d.append(Transaction.user_id == int(user_id_int))
-
-    income_month = 0.0
-    expense_month = 0.0
-    balance_month = 0.0
-    try:
-        sums = db.session.query(
-            func.coalesce(func.sum(case((Transaction.type == "income", Transaction.amount), else_=0)), 0),
-            func.coalesce(func.sum(case((Transaction.type == "expense", Transaction.amount), else_=0)), 0),
-        ).filter(*tx_filters_month).first()
-        income_month = float(sums[0] or 0)
-        expense_month = float(sums[1] or 0)
-        balance_month = income_month - expense_month
-    except Exception:
-        income_month = 0.0
-        expense_month = 0.0
-        balance_month = 0.0
-
-    income_90d = 0.0
-    expense_90d = 0.0
-    try:
-        sums_90d = db.session.query(
-            func.coalesce(func.sum(case((Transaction.type == "income", Transaction.amount), else_=0)), 0),
-            func.coalesce(func.sum(case((Transaction.type == "expense", Transaction.amount), else_=0)), 0),
-        ).filter(*tx_filters_90d).first()
-        income_90d = float(sums_90d[0] or 0)
-        expense_90d = float(sums_90d[1] or 0)
-    except Exception:
-        income_90d = 0.0
-        expense_90d = 0.0
-
-    # Estimativa de gastos em cartão (heurística por payment_method)
-    credit_card_expense_month = 0.0
-    try:
-        credit_like = or_(
-            func.lower(func.coalesce(Transaction.payment_method, "")).like("%cart%"),
-            func.lower(func.coalesce(Transaction.payment_method, "")).like("%credit%"),
-            func.lower(func.coalesce(Transaction.payment_method, "")).like("%crédito%"),
-            func.lower(func.coalesce(Transaction.payment_method, "")).like("%credito%"),
-        )
-        cc_sum = db.session.query(func.coalesce(func.sum(Transaction.amount), 0)).filter(
-            Transaction.workspace_id == int(active_workspace_id),
-            Transaction.type == "expense",
-            Transaction.transaction_date >= month_start,
-            Transaction.transaction_date < month_end,
-            credit_like,
-            *( [Transaction.user_id == int(user_id_int)] if share_prefs.get("share_transactions") is False else [] ),
-        ).scalar()
-        credit_card_expense_month = float(cc_sum or 0)
-    except Exception:
-        credit_card_expense_month = 0.0
-
-    # Top categorias de despesa no mês
-    top_categories = []
-    try:
-        rows = db.session.query(
-            func.coalesce(Category.name, "Sem categoria").label("cat"),
-            func.coalesce(func.sum(Transaction.amount), 0).label("spent"),
-        ).outerjoin(Category, Category.id == Transaction.category_id).filter(
-            Transaction.workspace_id == int(active_workspace_id),
-            Transaction.type == "expense",
-            Transaction.transaction_date >= month_start,
-            Transaction.transaction_date < month_end,
-            *( [Transaction.user_id == int(user_id_int)] if share_prefs.get("share_transactions") is False else [] ),
-        ).group_by(func.coalesce(Category.name, "Sem categoria")).order_by(func.sum(Transaction.amount).desc()).limit(7).all()
-
-        top_categories = [
-            {"category": str(r[0]), "spent": float(r[1] or 0)}
-            for r in (rows or [])
-        ]
-    except Exception:
-        top_categories = []
-
-    # Breakdown de despesas por método de pagamento (mês)
-    expense_by_payment_method_month = []
-    try:
-        rows = db.session.query(
-            func.lower(func.coalesce(Transaction.payment_method, "")).label("pm"),
-            func.coalesce(func.sum(Transaction.amount), 0).label("spent"),
-        ).filter(
-            Transaction.workspace_id == int(active_workspace_id),
-            Transaction.type == "expense",
-            Transaction.transaction_date >= month_start,
-            Transaction.transaction_date < month_end,
-            *( [Transaction.user_id == int(user_id_int)] if share_prefs.get("share_transactions") is False else [] ),
-        ).group_by(func.lower(func.coalesce(Transaction.payment_method, ""))).order_by(func.sum(Transaction.amount).desc()).limit(10).all()
-
-        expense_by_payment_method_month = [
-            {"payment_method": (r[0] or "").strip() or None, "spent": float(r[1] or 0)}
-            for r in (rows or [])
-        ]
-    except Exception:
-        expense_by_payment_method_month = []
-
-    # Últimas transações (30 dias) para fundamentar respostas
-    recent_transactions_30d = []
-    try:
-        recent_q = Transaction.query.filter(
-            Transaction.workspace_id == int(active_workspace_id),
-            Transaction.transaction_date >= (today - timedelta(days=30)),
-            Transaction.transaction_date <= today,
-        )
-        if share_prefs.get("share_transactions") is False:
-            recent_q = recent_q.filter(Transaction.user_id == int(user_id_int))
-
-        recent = recent_q.order_by(Transaction.transaction_date.desc(), Transaction.created_at.desc()).limit(25).all()
-        for tx in recent or []:
-            recent_transactions_30d.append({
-                "date": tx.transaction_date.isoformat() if tx.transaction_date else None,
-                "type": tx.type,
-                "amount": float(tx.amount or 0),
-                "description": tx.description,
-                "category": tx.category.name if tx.category else None,
-                "payment_method": tx.payment_method,
-                "is_paid": bool(tx.is_paid),
-            })
-    except Exception:
-        recent_transactions_30d = []
-
-    # Indícios de empréstimo/financiamento (heurística por texto/categoria)
-    loan_hints_90d = {"count": 0, "total": 0.0, "examples": []}
-    try:
-        kw = ["emprest", "emprést", "financ", "parcela", "consign", "juros"]
-        text_or = []
-        for k in kw:
-            text_or.append(func.lower(func.coalesce(Transaction.description, "")).like(f"%{k}%"))
-            text_or.append(func.lower(func.coalesce(Transaction.notes, "")).like(f"%{k}%"))
-            text_or.append(func.lower(func.coalesce(Category.name, "")).like(f"%{k}%"))
-
-        q = db.session.query(
-            func.count(Transaction.id),
-            func.coalesce(func.sum(Transaction.amount), 0),
-        ).outerjoin(Category, Category.id == Transaction.category_id).filter(
-            Transaction.workspace_id == int(active_workspace_id),
-            Transaction.type == "expense",
-            Transaction.transaction_date >= (today - timedelta(days=90)),
-            Transaction.transaction_date <= today,
-            or_(*text_or),
-            *( [Transaction.user_id == int(user_id_int)] if share_prefs.get("share_transactions") is False else [] ),
-        ).first()
-        loan_hints_90d["count"] = int(q[0] or 0)
-        loan_hints_90d["total"] = float(q[1] or 0)
-
-        ex = Transaction.query.outerjoin(Category, Category.id == Transaction.category_id).filter(
-            Transaction.workspace_id == int(active_workspace_id),
-            Transaction.type == "expense",
-            Transaction.transaction_date >= (today - timedelta(days=90)),
-            Transaction.transaction_date <= today,
-            or_(*text_or),
-        )
-        if share_prefs.get("share_transactions") is False:
-            ex = ex.filter(Transaction.user_id == int(user_id_int))
-        ex = ex.order_by(Transaction.transaction_date.desc(), Transaction.created_at.desc()).limit(8).all()
-        loan_hints_90d["examples"] = [
-            {
-                "date": t.transaction_date.isoformat() if t.transaction_date else None,
-                "amount": float(t.amount or 0),
-                "description": t.description,
-                "category": t.category.name if t.category else None,
-            }
-            for t in (ex or [])
-        ]
-    except Exception:
-        loan_hints_90d = {"count": 0, "total": 0.0, "examples": []}
-
-    workspace = None
+    share_transactions = share_prefs.get("share_transactions") is not False
     try:
-        workspace = Workspace.query.get(int(active_workspace_id))
-    except Exception:
-        workspace = None
-
-    workspace_context = {
-        "workspace_id": int(active_workspace_id),
-        "workspace_name": workspace.name if workspace else None,
-        "month": f"{today.year:04d}-{today.month:02d}",
-        "income_month": income_month,
-        "expense_month": expense_month,
-        "balance_month": balance_month,
-        "income_90d": income_90d,
-        "expense_90d": expense_90d,
-        "expense_90d_monthly_avg_estimate": (expense_90d / 3.0) if expense_90d else 0.0,
-        "credit_card_expense_month_estimate": credit_card_expense_month,
-        "expense_by_payment_method_month": expense_by_payment_method_month,
-        "top_expense_categories_month": top_categories,
-        "recent_transactions_30d": recent_transactions_30d,
-        "loan_hints_90d": loan_hints_90d,
-        "share_transactions": bool(share_prefs.get("share_transactions", True)),
-    }
+        workspace_context = _workspace_ai_context(int(active_workspace_id), int(user_id_int), share_transactions)
+    except Exception as e:
+        db.session.rollback()
+        _dbg(f"[AI_CONTEXT] Erro ao montar contexto: {e}")
+        workspace_context = {"workspace_id": int(active_workspace_id)}
+    workspace_context = dict(workspace_context, share_transactions=bool(share_prefs.get("share_transactions", True)))
 
     system_prompt = (
         "Você é um assistente financeiro pessoal. "
@@ -2573,39 +2977,20 @@ def api_finance_ai():
         f"Pergunta do usuário: {message}\n\n"
         "Regras:\n"
         "- Baseie a resposta nos dados do 'Resumo do workspace' sempre que fizer sentido.\n"
-        "- Se o usuário pedir algo que exige dados que não existem no resumo (ex.: limite por cartão), peça quais dados faltam e sugira como registrar/organizar.\n"
+        "- Se o usuário pedir algo que exige dados que não existem no resumo (ex.: saldo de investimentos), peça quais dados faltam e sugira como registrar/organizar.\n"
         "- Retorne uma resposta direta com passos práticos."
     )
 
-    try:
-        response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {groq_api_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": "llama-3.3-70b-versatile",
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                "temperature": 0.2,
-                "max_tokens": 250,
-            },
-            timeout=12,
-        )
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
 
-        if response.status_code != 200:
-            resp = jsonify({
-                "success": False,
-                "message": "Falha ao consultar IA.",
-            })
-            return _cors_wrap(resp, origin), 502
+    if wants_stream:
+        return _finance_ai_stream(messages, mode, origin)
 
-        result = response.json() or {}
-        content = (result.get("choices") or [{}])[0].get("message", {}).get("content", "") or ""
-        content = content.strip()
+    try:
+        content = _chat_completion(messages, temperature=0.2, max_tokens=250, timeout=12)
 
         if not content:
             resp = jsonify({
@@ -2621,6 +3006,14 @@ def api_finance_ai():
         })
         return _cors_wrap(resp, origin), 200
 
+    except LLMError as e:
+        _dbg(f"[FINANCE_AI] {e}")
+        resp = jsonify({
+            "success": False,
+            "message": "Falha ao consultar IA.",
+        })
+        return _cors_wrap(resp, origin), 502
+
     except Exception:
         resp = jsonify({
             "success": False,
@@ -2629,6 +3022,47 @@ def api_finance_ai():
         return _cors_wrap(resp, origin), 500
 
 
+def _sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _finance_ai_stream(messages: list, mode: str, origin: str):
+    """
+    Resposta da IA em Server-Sent Events, repassando os pedaços conforme chegam.
+
+    Eventos: ``token`` ({"text": ...}) a cada pedaço, ``done`` ({"success", "mode",
+    "answer"}) no fim, ou ``error`` ({"success": false, "message"}).
+    """
+    def generate():
+        parts = []
+        try:
+            for text in _stream_chat_completion(messages, temperature=0.2, max_tokens=250, timeout=12):
+                parts.append(text)
+                yield _sse_event("token", {"text": text})
+        except LLMError as e:
+            _dbg(f"[FINANCE_AI] {e}")
+            yield _sse_event("error", {"success": False, "message": "Falha ao consultar IA."})
+            return
+        except Exception:
+            yield _sse_event("error", {"success": False, "message": "Erro ao processar IA."})
+            return
+        answer = "".join(parts).strip()
+        if not answer:
+            yield _sse_event("error", {"success": False, "message": "IA retornou resposta vazia."})
+            return
+        yield _sse_event("done", {"success": True, "mode": mode, "answer": answer})
+
+    # O gerador não usa request nem banco: a sessão é encerrada aqui para não
+    # manter a conexão (e a transação das leituras do contexto) durante o stream
+    db.session.commit()
+    db.session.remove()
+
+    resp = current_app.response_class(generate(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # nginx: não bufferizar o stream
+    return _cors_wrap(resp, origin), 200
+
+
 @api_financeiro_bp.route("/api/register", methods=["POST", "OPTIONS"])
 @api_financeiro_bp.route("/api/register/", methods=["POST", "OPTIONS"])
 def api_register():
@@ -2833,6 +3267,49 @@ def api_me():
     return resp, 200
 
 
+
+@api_financeiro_bp.route("/api/batch", methods=["POST", "OPTIONS"])
+def api_batch():
+    """
+    Várias chamadas da API num único round-trip (abertura do app móvel).
+
+    Body: {"user_id"?, "workspace_id"?, "requests": [{"id", "method", "path",
+    "query"?, "body"?, "if_none_match"?}, ...]}, com ``path`` relativo à API
+    (ex.: "/api/categories"). Responde {"success", "responses": [{"id", "status",
+    "etag", "body"}, ...]} na ordem pedida; cada item tem o status da sua rota.
+    """
+    origin = request.headers.get("Origin", "*")
+    if request.method == "OPTIONS":
+        return _cors_preflight(origin, "POST, OPTIONS")
+
+    user_id_int = _get_user_id_from_request()
+    if not user_id_int:
+        resp = jsonify({"success": False, "message": "Não autenticado"})
+        return _cors_wrap(resp, origin), 401
+
+    data = request.get_json(silent=True) or {}
+    try:
+        specs = _batch_specs(data)
+    except BatchRequestError as e:
+        resp = jsonify({"success": False, "message": str(e)})
+        return _cors_wrap(resp, origin), 400
+
+    workspace_id = data.get("workspace_id") or request.args.get("workspace_id")
+    if workspace_id:
+        try:
+            workspace_id = int(workspace_id)
+        except (TypeError, ValueError):
+            resp = jsonify({"success": False, "message": "workspace_id inválido"})
+            return _cors_wrap(resp, origin), 400
+        # Papéis do usuário ficam em flask.g: as sub-requests não consultam de novo
+        if not _has_workspace_access(user_id_int, workspace_id):
+            resp = jsonify({"success": False, "message": "Sem permissão para acessar este workspace"})
+            return _cors_wrap(resp, origin), 403
+
+    responses = _run_batch(specs, int(user_id_int), workspace_id or None)
+    resp = jsonify({"success": True, "responses": responses})
+    return _cors_wrap(resp, origin), 200
+
 # Registrar rotas de comprovantes
 from .attachments_endpoints import register_attachment_routes
 register_attachment_routes(api_financeiro_bp)
@@ -2857,28 +3334,40 @@ def api_get_workspaces():
         if not user_id:
             return _cors_wrap(jsonify({"success": False, "message": "user_id obrigatório"}), origin), 400
         
-        # Buscar workspaces onde usuário é owner ou membro
-        print(f"[WORKSPACE] Buscando workspaces para user_id={user_id}")
-        owned_workspaces = Workspace.query.filter_by(owner_id=user_id).all()
-        member_links = WorkspaceMember.query.filter_by(user_id=user_id).all()
-        workspace_ids = {w.id for w in owned_workspaces} | {m.workspace_id for m in member_links}
-        all_workspaces = Workspace.query.filter(Workspace.id.in_(workspace_ids)).all() if workspace_ids else []
+        # ETag: versão de cada workspace do usuário (dados e membros)
+        user_ws_ids = _user_workspace_ids(user_id)
+        etag = _scopes_etag([_workspace_scope(wid) for wid in user_ws_ids], "workspaces", user_id, user_ws_ids)
+        not_modified = _etag_not_modified(etag, origin)
+        if not_modified:
+            return not_modified
+
+        # Workspaces onde usuário é owner ou membro (resolvedor de acesso)
+        roles = _user_workspace_roles(user_id)
+        all_workspaces = Workspace.query.filter(Workspace.id.in_(user_ws_ids)).order_by(Workspace.id.asc()).all() if user_ws_ids else []
         print(f"[WORKSPACE] Encontrados {len(all_workspaces)} workspaces (owner ou membro)")
         
-        # Mapear status de onboarding
-        member_status = {m.workspace_id: (m.onboarding_completed, m.share_preferences) for m in member_links}
+        # Mapear status de onboarding (só onde é membro)
+        member_ws_ids = [wid for wid in user_ws_ids if roles.get(wid) != "owner"]
+        member_status = {
+            m.workspace_id: (m.onboarding_completed, m.share_preferences)
+            for m in WorkspaceMember.query.filter(
+                WorkspaceMember.user_id == user_id, WorkspaceMember.workspace_id.in_(member_ws_ids)
+            )
+        } if member_ws_ids else {}
+        owner_ids = {w.owner_id for w in all_workspaces if w.owner_id}
+        owners = {u.id: u for u in User.query.filter(User.id.in_(owner_ids))} if owner_ids else {}
         
         workspaces_data = []
         for w in all_workspaces:
-            onboarding_completed, prefs = member_status.get(w.id, (True, None)) if w.owner_id != user_id else (True, None)
-            # Buscar informações do owner
-            owner = User.query.get(w.owner_id) if w.owner_id else None
+            is_owner = roles.get(w.id) == "owner"
+            onboarding_completed, prefs = member_status.get(w.id, (True, None)) if not is_owner else (True, None)
+            owner = owners.get(w.owner_id)
             workspaces_data.append({
                 "id": w.id,
                 "name": w.name,
                 "description": w.description or "",
                 "color": w.color or "#3b82f6",
-                "is_owner": w.owner_id == user_id,
+                "is_owner": is_owner,
                 "created_at": w.created_at.isoformat() if w.created_at else None,
                 "onboarding_completed": onboarding_completed,
                 "share_preferences": prefs or {},
@@ -2888,7 +3377,7 @@ def api_get_workspaces():
         
         print(f"[WORKSPACE] Retornando {len(workspaces_data)} workspaces para user_id={user_id}")
         
-        return _cors_wrap(jsonify({"success": True, "workspaces": workspaces_data}), origin), 200
+        return _cors_wrap(_with_etag(jsonify({"success": True, "workspaces": workspaces_data}), etag), origin), 200
         
     except Exception as e:
         print(f"[WORKSPACE] ERRO no GET /api/workspaces: {e}")
@@ -2921,9 +3410,7 @@ def api_get_active_workspace_legacy():
     if workspace_id_hint:
         hinted = Workspace.query.get(workspace_id_hint)
         if hinted:
-            member = WorkspaceMember.query.filter_by(workspace_id=hinted.id, user_id=user_id).first()
-            has_access = hinted.owner_id == user_id or member
-            if has_access:
+            if _has_workspace_access(user_id, hinted.id):
                 session[f"active_workspace_{user_id}"] = hinted.id
                 owner = User.query.get(hinted.owner_id) if hinted.owner_id else None
                 return _cors_wrap(jsonify({
@@ -2945,9 +3432,7 @@ def api_get_active_workspace_legacy():
     if active_workspace_id:
         workspace = Workspace.query.get(active_workspace_id)
         if workspace:
-            member = WorkspaceMember.query.filter_by(workspace_id=workspace.id, user_id=user_id).first()
-            has_access = workspace.owner_id == user_id or member
-            if has_access:
+            if _has_workspace_access(user_id, workspace.id):
                 # Buscar informações do owner
                 owner = User.query.get(workspace.owner_id) if workspace.owner_id else None
                 return _cors_wrap(jsonify({
@@ -2964,13 +3449,8 @@ def api_get_active_workspace_legacy():
                 }), origin), 200
     
     # Se não tem workspace ativo, pegar o primeiro workspace do usuário (owner ou membro)
-    workspace = Workspace.query.filter_by(owner_id=user_id).first()
-    if not workspace:
-        # Se não é owner, buscar primeiro workspace onde é membro
-        member = WorkspaceMember.query.filter_by(user_id=user_id).first()
-        if member:
-            workspace = Workspace.query.get(member.workspace_id)
-            print(f"[ACTIVE_WS] Membro encontrado - workspace_id={workspace.id if workspace else None}")
+    default_id = _default_workspace_id(user_id)
+    workspace = Workspace.query.get(default_id) if default_id else None
     
     if workspace:
         # SEMPRE definir o workspace ativo na sessão
@@ -3131,9 +3611,7 @@ def api_invite_workspace_member():
             return _cors_wrap(jsonify({"success": False, "message": "Workspace não encontrado"}), origin), 404
 
         # Verificar se usuário solicitante tem acesso
-        is_owner = workspace.owner_id == user_id
-        is_member = WorkspaceMember.query.filter_by(workspace_id=workspace_id, user_id=user_id).first()
-        if not (is_owner or is_member):
+        if not _has_workspace_access(user_id, workspace_id):
             return _cors_wrap(jsonify({"success": False, "message": "Sem permissão"}), origin), 403
 
         inviter = User.query.get(user_id)
@@ -3145,13 +3623,8 @@ def api_invite_workspace_member():
 
         # Verificar se email já é membro
         existing_user = User.query.filter(func.lower(User.email) == recipient_email).first()
-        if existing_user:
-            member_record = WorkspaceMember.query.filter_by(
-                workspace_id=workspace_id,
-                user_id=existing_user.id
-            ).first()
-            if member_record or workspace.owner_id == existing_user.id:
-                return _cors_wrap(jsonify({"success": False, "message": "Usuário já faz parte do workspace"}), origin), 400
+        if existing_user and int(existing_user.id) in _workspace_user_ids(workspace_id):
+            return _cors_wrap(jsonify({"success": False, "message": "Usuário já faz parte do workspace"}), origin), 400
 
         # Verificar convite pendente
         pending_invite = WorkspaceInvite.query.filter_by(
@@ -3217,18 +3690,13 @@ def api_get_user_active_workspace():
         workspace = None
         if active_ws_id:
             ws = Workspace.query.get(active_ws_id)
-            if ws and (ws.owner_id == user_id or WorkspaceMember.query.filter_by(workspace_id=ws.id, user_id=user_id).first()):
+            if ws and _has_workspace_access(user_id, ws.id):
                 workspace = ws
 
-        # 2) Se não houver em sessão, procurar primeiro workspace onde é dono
+        # 2) Se não houver em sessão, primeiro workspace onde é dono; 3) senão, onde é membro
         if not workspace:
-            workspace = Workspace.query.filter_by(owner_id=user_id).order_by(Workspace.id.asc()).first()
-
-        # 3) Se ainda não houver, pegar primeiro onde é membro
-        if not workspace:
-            member = WorkspaceMember.query.filter_by(user_id=user_id).order_by(WorkspaceMember.id.asc()).first()
-            if member:
-                workspace = Workspace.query.get(member.workspace_id)
+            default_id = _default_workspace_id(user_id)
+            workspace = Workspace.query.get(default_id) if default_id else None
 
         if not workspace:
             return _cors_wrap(jsonify({"success": False, "message": "Nenhum workspace encontrado"}), origin), 404
@@ -3264,10 +3732,7 @@ def api_activate_workspace(workspace_id):
         return _cors_wrap(jsonify({"success": False, "message": "Workspace não encontrado"}), origin), 404
     
     # Verificar se usuário tem acesso
-    member = WorkspaceMember.query.filter_by(
-        workspace_id=workspace_id, user_id=user_id
-    ).first()
-    if workspace.owner_id != user_id and not member:
+    if not _has_workspace_access(user_id, workspace_id):
         return _cors_wrap(jsonify({"success": False, "message": "Sem permissão"}), origin), 403
     
     session[f"active_workspace_{user_id}"] = workspace.id
@@ -3300,9 +3765,9 @@ def api_complete_onboarding(workspace_id):
         if not workspace:
             return _cors_wrap(jsonify({"success": False, "message": "Workspace não encontrado"}), origin), 404
         
-        member = WorkspaceMember.query.filter_by(workspace_id=workspace_id, user_id=user_id).first()
-        if not member and workspace.owner_id != user_id:
+        if not _has_workspace_access(user_id, workspace_id):
             return _cors_wrap(jsonify({"success": False, "message": "Sem permissão"}), origin), 403
+        member = WorkspaceMember.query.filter_by(workspace_id=workspace_id, user_id=user_id).first()
         
         data = request.get_json() or {}
         share_preferences = data.get("share_preferences") or {}
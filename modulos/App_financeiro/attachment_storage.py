@@ -0,0 +1,339 @@
+"""
+Armazenamento de Comprovantes - Endereçado por conteúdo
+=======================================================
+
+Os arquivos dos comprovantes ficam fora do banco, em
+``FINANCE_ATTACHMENT_STORAGE`` (padrão ``storage/attachments`` na raiz do
+projeto, fora de ``static/``), com o SHA-256 do conteúdo como nome:
+``ab/cd/abcd...``.
+
+- ``_store_stream`` copia o upload em blocos para um temporário calculando o
+  hash no caminho (sem ``seek`` para medir, sem o arquivo inteiro na
+  memória), trava a linha do conteúdo e só então o move para o nome final
+  com ``os.replace`` (mesmo se já existir: o conteúdo é idêntico);
+- cada conteúdo tem uma linha em ``stored_blobs`` com ``ref_count``
+  (``_acquire_blob``/``_release_blob``); com zero referências o arquivo é
+  apagado por ``flask finance-attachments-gc`` depois de um prazo de
+  carência, e não na hora (um upload simultâneo do mesmo conteúdo o
+  reaproveita). O GC remove o arquivo com a mesma linha travada, então não
+  corre contra um upload do mesmo conteúdo;
+- miniaturas WebP (primeira página no caso de PDF) são geradas em segundo
+  plano num pool de threads e gravadas ao lado do arquivo (``<sha>.thumb.webp``).
+
+``_migrate_proof_blobs`` move os blobs legados de
+``transactions.proof_document_data`` para cá, cada um como um
+``TransactionAttachment`` da própria transação.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import undefer
+
+from extensions import db
+from models import StoredBlob, Transaction, TransactionAttachment
+
+from .helpers import _dbg
+
+_STORAGE_ROOT = os.getenv(
+    "FINANCE_ATTACHMENT_STORAGE",
+    os.path.join(os.path.dirname(__file__), "..", "..", "storage", "attachments"),
+)
+_CHUNK_SIZE = 64 * 1024
+_MIGRATION_BATCH = 50
+_GC_GRACE_HOURS = float(os.getenv("FINANCE_ATTACHMENT_GC_GRACE_HOURS", "24"))
+_THUMBNAIL_SIZE = (320, 320)
+_THUMBNAIL_WORKERS = int(os.getenv("FINANCE_THUMBNAIL_WORKERS", "2"))
+_THUMBNAIL_MIMES = ("image/", "application/pdf")
+
+_thumb_lock = threading.Lock()
+_thumb_pending = set()  # caminhos com miniatura na fila
+_thumb_failed = set()   # caminhos cuja miniatura falhou (não tenta de novo neste processo)
+_thumb_executor = None
+
+
+class AttachmentTooLarge(ValueError):
+    """Upload passou do tamanho máximo durante a cópia."""
+
+
+# ---------------------------------------------------------------------------
+# Conteúdo
+# ---------------------------------------------------------------------------
+
+def _blob_path(digest: str) -> str:
+    return os.path.abspath(os.path.join(_STORAGE_ROOT, digest[:2], digest[2:4], digest))
+
+
+def _thumbnail_path(file_path: str) -> str:
+    return f"{file_path}.thumb.webp"
+
+
+def _spool_stream(stream, max_size: int | None = None) -> tuple[str, int, str]:
+    """
+    Copia o stream em blocos para um temporário, calculando o SHA-256 no caminho.
+
+    Retorna ``(sha256, tamanho, temporário)``. Levanta ``AttachmentTooLarge`` (sem
+    deixar nada no disco) se passar de ``max_size`` bytes.
+    """
+    tmp_dir = os.path.join(os.path.abspath(_STORAGE_ROOT), ".tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    sha = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            while True:
+                chunk = stream.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise AttachmentTooLarge(f"Arquivo maior que {max_size} bytes")
+                sha.update(chunk)
+                fh.write(chunk)
+        return sha.hexdigest(), size, tmp_path
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _store_stream(stream, max_size: int | None = None, mime_type: str | None = None) -> tuple[StoredBlob, int, str]:
+    """
+    Grava o conteúdo do stream e conta uma referência a ele.
+
+    Retorna ``(blob, tamanho, caminho)``. O arquivo só vai para o nome final
+    depois que a linha do blob está travada por esta sessão (``_acquire_blob``),
+    e sempre com ``os.replace`` (o conteúdo é idêntico): se o GC apagou o
+    arquivo antes disso, ele volta; depois disso o GC não toca no blob.
+    """
+    digest, size, tmp_path = _spool_stream(stream, max_size)
+    try:
+        blob = _acquire_blob(digest, size, mime_type)
+        path = _blob_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return blob, size, path
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _store_bytes(data: bytes, mime_type: str | None = None) -> tuple[StoredBlob, int, str]:
+    return _store_stream(io.BytesIO(data), mime_type=mime_type)
+
+
+# ---------------------------------------------------------------------------
+# Referências
+# ---------------------------------------------------------------------------
+
+def _acquire_blob(digest: str, size: int, mime_type: str | None = None) -> StoredBlob:
+    """
+    Linha de ``stored_blobs`` do conteúdo com uma referência a mais (cria se não existir).
+
+    A linha fica travada até o commit (``SELECT ... FOR UPDATE`` e a escrita
+    já enviada ao banco), a mesma trava que o GC pega antes de apagar o arquivo.
+    """
+    blob = StoredBlob.query.filter_by(sha256=digest).with_for_update().first()
+    if blob is None:
+        try:
+            with db.session.begin_nested():
+                blob = StoredBlob(sha256=digest, size=int(size), mime_type=mime_type, ref_count=1)
+                db.session.add(blob)
+            return blob
+        except IntegrityError:
+            # Outro upload do mesmo conteúdo criou a linha primeiro
+            blob = StoredBlob.query.filter_by(sha256=digest).with_for_update().one()
+    blob.ref_count = StoredBlob.ref_count + 1
+    blob.released_at = None
+    db.session.flush()
+    return blob
+
+
+def _release_blob(blob: StoredBlob) -> None:
+    """Uma referência a menos; o arquivo fica até o GC (``_collect_unreferenced_blobs``)."""
+    blob.ref_count = StoredBlob.ref_count - 1
+    blob.released_at = datetime.utcnow()
+
+
+def _is_shared_file(file_path: str, exclude_attachment_id=None) -> bool:
+    """Outro comprovante aponta para o mesmo arquivo (anexos antigos, sem ``blob_id``)."""
+    query = TransactionAttachment.query.filter(TransactionAttachment.file_path == file_path)
+    if exclude_attachment_id:
+        query = query.filter(TransactionAttachment.id != int(exclude_attachment_id))
+    return query.first() is not None
+
+
+def _remove_blob_files(digest: str) -> int:
+    """Apaga conteúdo e miniatura do blob. Retorna os bytes liberados."""
+    freed = 0
+    path = _blob_path(digest)
+    for p in (path, _thumbnail_path(path)):
+        try:
+            if os.path.exists(p):
+                freed += os.path.getsize(p)
+                os.remove(p)
+        except OSError as e:
+            _dbg(f"[ATTACHMENT] Erro ao remover {p}: {e}")
+    return freed
+
+
+def _collect_unreferenced_blobs(grace_hours: float = _GC_GRACE_HOURS) -> dict:
+    """
+    Apaga linha e arquivos (conteúdo + miniatura) dos blobs sem referência há mais de ``grace_hours``.
+
+    Cada blob é apagado numa transação própria, com a linha travada enquanto o
+    arquivo é removido: um upload do mesmo conteúdo (``_store_stream``) espera
+    o commit, não acha mais a linha, cria outra e grava o arquivo de novo.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=float(grace_hours))
+    candidates = (
+        db.session.query(StoredBlob.id, StoredBlob.sha256)
+        .filter(StoredBlob.ref_count <= 0, StoredBlob.released_at < cutoff)
+        .all()
+    )
+    removed, freed = 0, 0
+    for blob_id, digest in candidates:
+        # Confere de novo já com a trava: um upload pode ter voltado a referenciar o conteúdo
+        locked = (
+            db.session.query(StoredBlob.id)
+            .filter(StoredBlob.id == blob_id, StoredBlob.ref_count <= 0, StoredBlob.released_at < cutoff)
+            .with_for_update()
+            .first()
+        )
+        if locked is None:
+            db.session.rollback()
+            continue
+        # DELETE antes de remover o arquivo: no SQLite é ele que segura o banco
+        StoredBlob.query.filter(StoredBlob.id == blob_id).delete(synchronize_session=False)
+        freed += _remove_blob_files(digest)
+        db.session.commit()
+        removed += 1
+    return {"removed": removed, "bytes": freed}
+
+
+# ---------------------------------------------------------------------------
+# Miniaturas
+# ---------------------------------------------------------------------------
+
+def _supports_thumbnail(mime_type: str | None) -> bool:
+    return bool(mime_type) and str(mime_type).lower().startswith(_THUMBNAIL_MIMES)
+
+
+def _generate_thumbnail(file_path: str, mime_type: str) -> None:
+    try:
+        from PIL import Image
+
+        if str(mime_type).lower() == "application/pdf":
+            from pdf2image import convert_from_path
+            pages = convert_from_path(file_path, first_page=1, last_page=1, size=(_THUMBNAIL_SIZE[0] * 2, None))
+            if not pages:
+                raise ValueError("PDF sem páginas")
+            image = pages[0]
+        else:
+            image = Image.open(file_path)
+        image.thumbnail(_THUMBNAIL_SIZE)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.mode else "RGB")
+
+        target = _thumbnail_path(file_path)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".thumb-")
+        with os.fdopen(fd, "wb") as fh:
+            image.save(fh, "WEBP", quality=70, method=4)
+        os.replace(tmp_path, target)
+    except Exception as e:
+        _dbg(f"[ATTACHMENT] Miniatura falhou para {os.path.basename(file_path)}: {e}")
+        with _thumb_lock:
+            _thumb_failed.add(file_path)
+    finally:
+        with _thumb_lock:
+            _thumb_pending.discard(file_path)
+
+
+def _schedule_thumbnail(file_path: str, mime_type: str | None) -> str:
+    """
+    Coloca a geração da miniatura na fila (se ainda não existe nem está na fila).
+
+    Retorna o estado: "ready", "pending", "failed" ou "unsupported".
+    """
+    global _thumb_executor
+    if not _supports_thumbnail(mime_type) or not file_path or not os.path.exists(file_path):
+        return "unsupported"
+    if os.path.exists(_thumbnail_path(file_path)):
+        return "ready"
+    with _thumb_lock:
+        if file_path in _thumb_failed:
+            return "failed"
+        if file_path in _thumb_pending:
+            return "pending"
+        _thumb_pending.add(file_path)
+        if _thumb_executor is None:
+            _thumb_executor = ThreadPoolExecutor(max_workers=_THUMBNAIL_WORKERS, thread_name_prefix="thumbnail")
+    _thumb_executor.submit(_generate_thumbnail, file_path, mime_type)
+    return "pending"
+
+
+# ---------------------------------------------------------------------------
+# Migração dos blobs legados
+# ---------------------------------------------------------------------------
+
+def _migrate_proof_blobs(batch_size: int = _MIGRATION_BATCH) -> dict:
+    """
+    Move ``proof_document_data`` para o armazenamento de comprovantes.
+
+    Cada blob vira um ``TransactionAttachment`` e as colunas ``proof_document_*``
+    da transação são limpas. Processa em lotes (um commit por lote, só
+    ``batch_size`` blobs na memória), então pode ser interrompido e rodado de novo.
+    """
+    moved = skipped = total_bytes = 0
+    last_id = 0
+    while True:
+        ids = [
+            row[0]
+            for row in db.session.query(Transaction.id)
+            .filter(Transaction.id > last_id, Transaction.proof_document_data.isnot(None))
+            .order_by(Transaction.id.asc())
+            .limit(int(batch_size))
+            .all()
+        ]
+        if not ids:
+            break
+        last_id = ids[-1]
+
+        txs = Transaction.query.options(undefer(Transaction.proof_document_data)).filter(Transaction.id.in_(ids)).all()
+        for tx in txs:
+            data = tx.proof_document_data
+            if not data:
+                tx.proof_document_data = None
+                skipped += 1
+                continue
+            blob, size, path = _store_bytes(data, tx.proof_document_mime)
+            db.session.add(TransactionAttachment(
+                transaction_id=tx.id,
+                user_id=tx.user_id,
+                file_name=tx.proof_document_name or tx.proof_document_storage_name or f"comprovante_{tx.id}",
+                file_path=path,
+                file_size=size,
+                mime_type=tx.proof_document_mime,
+                blob=blob,
+            ))
+            tx.proof_document_data = None
+            tx.proof_document_name = None
+            tx.proof_document_storage_name = None
+            tx.proof_document_mime = None
+            tx.proof_document_size = None
+            moved += 1
+            total_bytes += size
+        db.session.commit()
+        # Libera os blobs do lote antes de carregar o próximo
+        db.session.expunge_all()
+        _dbg(f"[ATTACHMENT] Migrados {moved} comprovantes até a transação {last_id}")
+
+    return {"moved": moved, "skipped": skipped, "bytes": total_bytes}
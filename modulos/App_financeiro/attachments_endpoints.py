@@ -1,24 +1,47 @@
 """
 Endpoints para gerenciar comprovantes de transações
 """
+import mimetypes
 import os
 from flask import request, jsonify, send_file
 from werkzeug.utils import secure_filename
-from datetime import datetime
 
 from extensions import db
 from models import Transaction, TransactionAttachment
 
+from .attachment_storage import (
+    AttachmentTooLarge,
+    _is_shared_file,
+    _release_blob,
+    _schedule_thumbnail,
+    _store_stream,
+    _supports_thumbnail,
+    _thumbnail_path,
+)
+from .idempotency import _idempotent
+
 
-UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), '..', '..', 'static', 'uploads', 'attachments')
 MAX_FILE_SIZE = 1 * 1024 * 1024  # 1MB em bytes
 ALLOWED_EXTENSIONS = {'pdf', 'jpg', 'jpeg', 'png', 'gif', 'webp'}
 
 
+CACHE_MAX_AGE = 365 * 24 * 3600  # conteúdo de comprovante é imutável
+
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def _thumbnail_url(tx_id: int, attachment_id: int, user_id: int) -> str:
+    return f"/gerenciamento-financeiro/api/transactions/{tx_id}/attachments/{attachment_id}/thumbnail?user_id={user_id}"
+
+
+def _immutable(resp):
+    # Privado: a URL é por usuário e o conteúdo é dele
+    resp.headers["Cache-Control"] = f"private, max-age={CACHE_MAX_AGE}, immutable"
+    return resp
+
+
 def _cors_wrap(resp, origin: str):
     try:
         resp.headers["Access-Control-Allow-Origin"] = origin
@@ -32,6 +55,7 @@ def _cors_wrap(resp, origin: str):
 def upload_attachment(api_bp):
     """POST /api/transactions/<id>/attachments - Upload de comprovante"""
     @api_bp.route("/api/transactions/<int:tx_id>/attachments", methods=["POST", "OPTIONS"])
+    @_idempotent
     def api_upload_attachment(tx_id):
         origin = request.headers.get("Origin", "*")
         
@@ -40,7 +64,7 @@ def upload_attachment(api_bp):
             resp.headers["Access-Control-Allow-Origin"] = origin
             resp.headers["Vary"] = "Origin"
             resp.headers["Access-Control-Allow-Methods"] = "POST, OPTIONS"
-            resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+            resp.headers["Access-Control-Allow-Headers"] = "Content-Type, Idempotency-Key"
             resp.headers["Access-Control-Max-Age"] = "86400"
             return resp, 200
         
@@ -60,6 +84,10 @@ def upload_attachment(api_bp):
             if not tx.is_paid:
                 return _cors_wrap(jsonify({"success": False, "message": "Apenas transações pagas podem ter comprovantes"}), origin), 400
             
+            # Rejeitar cedo pelo Content-Length (a cópia também confere o tamanho real)
+            if request.content_length and request.content_length > MAX_FILE_SIZE + 64 * 1024:
+                return _cors_wrap(jsonify({"success": False, "message": "Arquivo maior que 1MB"}), origin), 400
+
             # Verificar se há arquivo no request
             if 'file' not in request.files:
                 return _cors_wrap(jsonify({"success": False, "message": "Nenhum arquivo enviado"}), origin), 400
@@ -72,26 +100,18 @@ def upload_attachment(api_bp):
             if not allowed_file(file.filename):
                 return _cors_wrap(jsonify({"success": False, "message": f"Tipo de arquivo não permitido. Use: {', '.join(ALLOWED_EXTENSIONS)}"}), origin), 400
             
-            # Ler arquivo para validar tamanho
-            file.seek(0, os.SEEK_END)
-            file_size = file.tell()
-            file.seek(0)
-            
-            if file_size > MAX_FILE_SIZE:
-                return _cors_wrap(jsonify({"success": False, "message": "Arquivo maior que 1MB"}), origin), 400
-            
-            # Criar diretório se não existir
-            os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-            
-            # Gerar nome único para o arquivo
             filename = secure_filename(file.filename)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            unique_filename = f"{user_id_int}_{tx_id}_{timestamp}_{filename}"
-            file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-            
-            # Salvar arquivo
-            file.save(file_path)
-            
+            mime_type = file.mimetype
+            if not mime_type or mime_type == "application/octet-stream":
+                mime_type = mimetypes.guess_type(filename)[0] or mime_type
+
+            # Copiar em blocos calculando o hash; conteúdo repetido reaproveita o blob existente
+            try:
+                blob, file_size, file_path = _store_stream(file.stream, MAX_FILE_SIZE, mime_type)
+            except AttachmentTooLarge:
+                return _cors_wrap(jsonify({"success": False, "message": "Arquivo maior que 1MB"}), origin), 400
+            digest = blob.sha256
+
             # Criar registro no banco
             attachment = TransactionAttachment(
                 transaction_id=tx_id,
@@ -99,10 +119,12 @@ def upload_attachment(api_bp):
                 file_name=filename,
                 file_path=file_path,
                 file_size=file_size,
-                mime_type=file.content_type
+                mime_type=mime_type,
+                blob=blob,
             )
             db.session.add(attachment)
             db.session.commit()
+            thumbnail_status = _schedule_thumbnail(file_path, mime_type)
             
             return _cors_wrap(jsonify({
                 "success": True,
@@ -110,7 +132,10 @@ def upload_attachment(api_bp):
                     "id": attachment.id,
                     "file_name": attachment.file_name,
                     "file_size": attachment.file_size,
-                    "uploaded_at": attachment.uploaded_at.isoformat()
+                    "uploaded_at": attachment.uploaded_at.isoformat(),
+                    "sha256": digest,
+                    "thumbnail_status": thumbnail_status,
+                    "thumbnail_url": _thumbnail_url(tx_id, attachment.id, user_id_int) if thumbnail_status != "unsupported" else None,
                 }
             }), origin), 201
             
@@ -158,6 +183,7 @@ def list_attachments(api_bp):
                     "mime_type": att.mime_type,
                     "uploaded_at": att.uploaded_at.isoformat(),
                     "view_url": f"/gerenciamento-financeiro/api/transactions/{tx_id}/attachments/{att.id}/file?user_id={user_id_int}",
+                    "thumbnail_url": _thumbnail_url(tx_id, att.id, user_id_int) if _supports_thumbnail(att.mime_type) else None,
                 })
             
             return _cors_wrap(jsonify({
@@ -202,12 +228,16 @@ def delete_attachment(api_bp):
             if not attachment:
                 return _cors_wrap(jsonify({"success": False, "message": "Comprovante não encontrado"}), origin), 404
             
-            # Remover arquivo físico
-            try:
-                if os.path.exists(attachment.file_path):
-                    os.remove(attachment.file_path)
-            except Exception as e:
-                print(f"[ATTACHMENT] Erro ao remover arquivo: {e}")
+            if attachment.blob_id:
+                # Conteúdo por hash: só decrementa a referência (o GC apaga o arquivo)
+                _release_blob(attachment.blob)
+            else:
+                # Anexo antigo: remover arquivo físico (se nenhum outro comprovante usa o mesmo)
+                try:
+                    if os.path.exists(attachment.file_path) and not _is_shared_file(attachment.file_path, attachment.id):
+                        os.remove(attachment.file_path)
+                except Exception as e:
+                    print(f"[ATTACHMENT] Erro ao remover arquivo: {e}")
             
             # Remover registro do banco
             db.session.delete(attachment)
@@ -263,21 +293,81 @@ def view_attachment(api_bp):
             if not attachment.file_path or not os.path.exists(attachment.file_path):
                 return _cors_wrap(jsonify({"success": False, "message": "Arquivo não encontrado no servidor"}), origin), 404
 
+            # Range/If-None-Match tratados pelo send_file (conditional); o conteúdo de um
+            # comprovante nunca muda, então o cache pode ser longo
             resp = send_file(
                 attachment.file_path,
                 mimetype=attachment.mime_type or "application/octet-stream",
                 as_attachment=False,
                 download_name=attachment.file_name,
+                conditional=True,
+                etag=attachment.blob.sha256 if attachment.blob_id else True,
+                max_age=CACHE_MAX_AGE,
             )
-            return _cors_wrap(resp, origin)
+            return _cors_wrap(_immutable(resp), origin)
 
         except Exception as e:
             return _cors_wrap(jsonify({"success": False, "message": f"Erro ao abrir comprovante: {str(e)}"}), origin), 500
 
 
+def view_thumbnail(api_bp):
+    """GET /api/transactions/<id>/attachments/<attachment_id>/thumbnail - Miniatura WebP"""
+    @api_bp.route(
+        "/api/transactions/<int:tx_id>/attachments/<int:attachment_id>/thumbnail",
+        methods=["GET", "OPTIONS"],
+    )
+    def api_view_thumbnail(tx_id, attachment_id):
+        origin = request.headers.get("Origin", "*")
+
+        if request.method == "OPTIONS":
+            resp = jsonify({"ok": True})
+            resp.headers["Access-Control-Allow-Origin"] = origin
+            resp.headers["Vary"] = "Origin"
+            resp.headers["Access-Control-Allow-Methods"] = "GET, OPTIONS"
+            resp.headers["Access-Control-Allow-Headers"] = "Content-Type"
+            resp.headers["Access-Control-Max-Age"] = "86400"
+            return resp, 200
+
+        try:
+            user_id = request.args.get("user_id")
+            if not user_id:
+                return _cors_wrap(jsonify({"success": False, "message": "user_id obrigatório"}), origin), 400
+
+            user_id_int = int(user_id)
+
+            tx = Transaction.query.filter_by(id=tx_id, user_id=user_id_int).first()
+            if not tx:
+                return _cors_wrap(jsonify({"success": False, "message": "Transação não encontrada"}), origin), 404
+
+            attachment = TransactionAttachment.query.filter_by(id=attachment_id, transaction_id=tx_id).first()
+            if not attachment:
+                return _cors_wrap(jsonify({"success": False, "message": "Comprovante não encontrado"}), origin), 404
+
+            # Gera sob demanda se ainda não existe (anexos antigos, processo reiniciado)
+            status = _schedule_thumbnail(attachment.file_path, attachment.mime_type)
+            if status == "pending":
+                resp = _cors_wrap(jsonify({"success": True, "status": "pending"}), origin)
+                resp.headers["Retry-After"] = "2"
+                return resp, 202
+            if status != "ready":
+                return _cors_wrap(jsonify({"success": False, "status": status, "message": "Miniatura indisponível"}), origin), 404
+
+            resp = send_file(
+                _thumbnail_path(attachment.file_path),
+                mimetype="image/webp",
+                conditional=True,
+                max_age=CACHE_MAX_AGE,
+            )
+            return _cors_wrap(_immutable(resp), origin)
+
+        except Exception as e:
+            return _cors_wrap(jsonify({"success": False, "message": f"Erro ao abrir miniatura: {str(e)}"}), origin), 500
+
+
 def register_attachment_routes(api_bp):
     """Registra todas as rotas de comprovantes"""
     upload_attachment(api_bp)
     list_attachments(api_bp)
     delete_attachment(api_bp)
     view_attachment(api_bp)
+    view_thumbnail(api_bp)
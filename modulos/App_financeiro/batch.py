@@ -0,0 +1,144 @@
+"""
+Requisições em Lote - ``POST /api/batch``
+=========================================
+
+Ao abrir, o app móvel faz várias leituras em sequência (/api/me,
+/api/workspaces, /api/user/active-workspace, /api/categories,
+/api/credit-cards, /api/transactions). ``/api/batch`` recebe essa lista e
+devolve todas as respostas juntas, num único round-trip:
+
+- usuário (e workspace, se informado) são resolvidos e validados uma vez no
+  lote; cada sub-request recebe ``user_id``/``workspace_id`` na query string;
+- as sub-requests rodam em ordem, cada uma no seu request context, mas sobre
+  o mesmo app context: compartilham ``flask.g`` (papéis nos workspaces já
+  carregados por ``access``) e a sessão do SQLAlchemy;
+- mudanças na sessão Flask (ex.: workspace ativado) passam para as
+  sub-requests seguintes e voltam no cookie da resposta do lote;
+- cada item traz status, ETag e corpo JSON; ``if_none_match`` por item
+  permite 304 sem payload.
+
+Respostas em streaming (exportação, SSE), rotas fora da API de finanças e o
+próprio ``/api/batch`` não são aceitos dentro do lote.
+"""
+
+import os
+from urllib.parse import parse_qsl, urlsplit
+
+from flask import current_app, request, session
+from werkzeug.datastructures import MultiDict
+
+from extensions import db
+
+from .helpers import _dbg
+
+_BATCH_MAX = int(os.getenv("FINANCE_BATCH_MAX", "20"))
+_BLUEPRINT_NAME = "api_financeiro"
+_BATCH_ENDPOINT = f"{_BLUEPRINT_NAME}.api_batch"
+_METHODS = ("GET", "POST", "PUT", "DELETE")
+# Cabeçalhos da request do lote repassados a cada sub-request
+_FORWARDED_HEADERS = ("Cookie", "Origin", "Authorization", "User-Agent", "Accept-Language")
+
+
+class BatchRequestError(ValueError):
+    """Corpo do lote inválido (lista ausente, grande demais...)."""
+
+
+def _batch_specs(data) -> list:
+    """Valida o corpo ``{"requests": [...]}`` e devolve a lista de sub-requests."""
+    specs = data.get("requests") if isinstance(data, dict) else None
+    if not isinstance(specs, list) or not specs:
+        raise BatchRequestError("Informe requests: lista de sub-requests")
+    if len(specs) > _BATCH_MAX:
+        raise BatchRequestError(f"Máximo de {_BATCH_MAX} sub-requests por lote")
+    if not all(isinstance(s, dict) for s in specs):
+        raise BatchRequestError("Cada sub-request deve ser um objeto")
+    return specs
+
+
+def _item(item_id, status: int, body, etag: str | None = None) -> dict:
+    return {"id": item_id, "status": int(status), "etag": etag, "body": body}
+
+
+def _response_body(resp):
+    if resp.status_code == 304:
+        return None
+    body = resp.get_json(silent=True)
+    if body is None and resp.get_data():
+        return resp.get_data(as_text=True)
+    return body
+
+
+def _run_subrequest(spec: dict, prefix: str, user_id: int, workspace_id, headers: dict, state: dict) -> dict:
+    """
+    Executa uma sub-request e devolve ``{"id", "status", "etag", "body"}``.
+
+    ``state`` é a sessão Flask compartilhada do lote: entra na sub-request e é
+    atualizada com o que ela gravar.
+    """
+    item_id = spec.get("id")
+    method = str(spec.get("method") or "GET").strip().upper()
+    target = urlsplit(str(spec.get("path") or ""))
+    if method not in _METHODS or not target.path.startswith("/api/"):
+        return _item(item_id, 400, {"success": False, "message": "Sub-request inválida"})
+
+    query = MultiDict(parse_qsl(target.query, keep_blank_values=True))
+    for key, value in (spec.get("query") or {}).items():
+        query[str(key)] = "" if value is None else str(value)
+    query["user_id"] = str(user_id)
+    if workspace_id and "workspace_id" not in query:
+        query["workspace_id"] = str(workspace_id)
+
+    sub_headers = dict(headers)
+    if spec.get("if_none_match"):
+        sub_headers["If-None-Match"] = str(spec["if_none_match"])
+
+    with current_app.test_request_context(
+        prefix + target.path,
+        method=method,
+        query_string=query,
+        json=spec.get("body"),
+        headers=sub_headers,
+        environ_base={"REMOTE_ADDR": request.remote_addr},
+    ):
+        if request.blueprint != _BLUEPRINT_NAME or request.endpoint == _BATCH_ENDPOINT:
+            return _item(item_id, 404, {"success": False, "message": "Rota não disponível em lote"})
+
+        if dict(session) != state:
+            session.clear()
+            session.update(state)
+        try:
+            resp = current_app.full_dispatch_request()
+        except Exception as e:
+            db.session.rollback()
+            _dbg(f"[BATCH] Erro em {method} {target.path}: {e}")
+            return _item(item_id, 500, {"success": False, "message": "Erro interno"})
+
+        if session.modified:
+            state.clear()
+            state.update(dict(session))
+
+    if resp.is_streamed:
+        resp.close()
+        return _item(item_id, 400, {"success": False, "message": "Resposta em streaming não suportada em lote"})
+    return _item(item_id, resp.status_code, _response_body(resp), resp.headers.get("ETag"))
+
+
+def _run_batch(specs: list, user_id: int, workspace_id=None) -> list:
+    """
+    Executa as sub-requests em ordem na request atual (mesmo app context e sessão do banco).
+
+    Chamar dentro da request do lote; a sessão Flask dela recebe o estado final.
+    """
+    prefix = request.path[: -len("/api/batch")] if request.path.endswith("/api/batch") else ""
+    headers = {h: request.headers[h] for h in _FORWARDED_HEADERS if h in request.headers}
+    state = dict(session)
+    initial = dict(state)
+
+    results = [_run_subrequest(spec, prefix, user_id, workspace_id, headers, state) for spec in specs]
+
+    if state != initial:
+        session.clear()
+        session.update(state)
+    _dbg(f"[BATCH] user={user_id}: {len(results)} sub-requests")
+    return results
+
@@ -0,0 +1,193 @@
+"""
+Contadores de Mudança - Validadores (ETag) das leituras do financeiro
+=====================================================================
+
+Cada escopo de dados tem um contador em ``finance_change_counters``:
+
+- ``tx:w<id>`` / ``tx:u<id>``: transações e recorrências de um workspace /
+  do livro pessoal de um usuário;
+- ``cat:u<id>``: categorias (da ``FinanceConfig``) de um usuário;
+- ``card:w<id>`` / ``card:u<id>``: cartões de crédito;
+- ``ws:<id>``: dados e membros de um workspace;
+- ``wsu:<id>``: workspaces a que um usuário tem acesso (vira dono ou membro,
+  muda de papel, sai) - valida o cache de acesso (``access``) entre workers.
+
+O contador é incrementado no commit de qualquer sessão que altere o escopo
+(``before_flush`` anota, ``before_commit`` grava). Caminhos em lote que não
+passam pelo ORM chamam ``_mark_scopes_changed``.
+
+Os endpoints de leitura montam o ETag com as versões dos escopos que usam
+(uma query pequena por PK) e respondem 304 sem consultar nem serializar o
+payload quando o cliente manda o mesmo ``If-None-Match``.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import (
+    Category,
+    CreditCard,
+    FinanceChangeCounter,
+    FinanceConfig,
+    RecurringTransaction,
+    Transaction,
+    Workspace,
+    WorkspaceMember,
+)
+
+from .helpers import _dbg, _history_values
+
+_SESSION_KEY = "finance_changed_scopes"
+
+
+# ---------------------------------------------------------------------------
+# Escopos
+# ---------------------------------------------------------------------------
+
+def _tx_scope(workspace_id, user_id) -> str | None:
+    if workspace_id:
+        return f"tx:w{int(workspace_id)}"
+    return f"tx:u{int(user_id)}" if user_id else None
+
+
+def _card_scopes(workspace_id, user_id) -> list:
+    # A listagem sem workspace mostra todos os cartões do usuário
+    scopes = [f"card:u{int(user_id)}"] if user_id else []
+    if workspace_id:
+        scopes.append(f"card:w{int(workspace_id)}")
+    return scopes
+
+
+def _category_scope(user_id) -> str | None:
+    return f"cat:u{int(user_id)}" if user_id else None
+
+
+def _workspace_scope(workspace_id) -> str | None:
+    return f"ws:{int(workspace_id)}" if workspace_id else None
+
+
+def _user_workspaces_scope(user_id) -> str | None:
+    return f"wsu:{int(user_id)}" if user_id else None
+
+
+def _mark_scopes_changed(scopes, session=None) -> None:
+    """Anota escopos alterados para incrementar no próximo commit."""
+    session = session or db.session
+    pending = session.info.setdefault(_SESSION_KEY, set())
+    pending.update(s for s in scopes if s)
+
+
+# ---------------------------------------------------------------------------
+# Coleta (ORM) e incremento no commit
+# ---------------------------------------------------------------------------
+
+def _changed_objects(session):
+    for obj in list(session.new) + list(session.deleted):
+        yield obj
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            yield obj
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_changed_scopes(session, flush_context, instances):
+    scopes = set()
+    config_ids = set()
+    for obj in _changed_objects(session):
+        if isinstance(obj, (Transaction, RecurringTransaction)):
+            for wid in _history_values(obj, "workspace_id"):
+                for uid in _history_values(obj, "user_id"):
+                    scopes.add(_tx_scope(wid, uid))
+        elif isinstance(obj, CreditCard):
+            for wid in _history_values(obj, "workspace_id"):
+                for uid in _history_values(obj, "user_id"):
+                    scopes.update(_card_scopes(wid, uid))
+        elif isinstance(obj, Category):
+            config_ids.update(c for c in _history_values(obj, "config_id") if c)
+        elif isinstance(obj, Workspace):
+            scopes.add(_workspace_scope(obj.id))  # None para workspace novo: não há ETag dele ainda
+            scopes.update(_user_workspaces_scope(u) for u in _history_values(obj, "owner_id"))
+        elif isinstance(obj, WorkspaceMember):
+            scopes.update(_workspace_scope(w) for w in _history_values(obj, "workspace_id"))
+            scopes.update(_user_workspaces_scope(u) for u in _history_values(obj, "user_id"))
+
+    if config_ids:
+        rows = session.execute(
+            select(FinanceConfig.user_id).where(FinanceConfig.id.in_(config_ids))
+        ).all()
+        scopes.update(_category_scope(uid) for (uid,) in rows)
+
+    scopes.discard(None)
+    if scopes:
+        _mark_scopes_changed(scopes, session)
+
+
+def _bump_counters(session, scopes) -> None:
+    table = FinanceChangeCounter.__table__
+    now = datetime.utcnow()
+    rows = [{"scope": s, "version": 1, "updated_at": now} for s in sorted(scopes)]
+    dialect = session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = pg_insert if dialect == "postgresql" else sqlite_insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.scope],
+            set_={"version": table.c.version + 1, "updated_at": stmt.excluded.updated_at},
+        )
+        session.execute(stmt, rows)
+        return
+
+    for row in rows:
+        updated = session.execute(
+            table.update()
+            .where(table.c.scope == row["scope"])
+            .values(version=table.c.version + 1, updated_at=now)
+        )
+        if not updated.rowcount:
+            session.execute(table.insert().values(**row))
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_changed_scopes_before_commit(session):
+    if not session.info.get(_SESSION_KEY) and not session.new and not session.dirty and not session.deleted:
+        return
+    session.flush()
+    scopes = session.info.pop(_SESSION_KEY, None)
+    if scopes:
+        _bump_counters(session, scopes)
+        _dbg(f"[ETAG] Escopos alterados: {sorted(scopes)}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_scopes(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+# ---------------------------------------------------------------------------
+# ETag
+# ---------------------------------------------------------------------------
+
+def _scope_versions(scopes) -> dict:
+    scopes = sorted({s for s in scopes if s})
+    if not scopes:
+        return {}
+    rows = db.session.execute(
+        select(FinanceChangeCounter.scope, FinanceChangeCounter.version)
+        .where(FinanceChangeCounter.scope.in_(scopes))
+    ).all()
+    versions = {s: 0 for s in scopes}
+    versions.update({scope: int(version) for scope, version in rows})
+    return versions
+
+
+def _scopes_etag(scopes, *extra) -> str:
+    """ETag (fraco) das versões dos escopos + parâmetros que mudam o payload."""
+    payload = json.dumps([_scope_versions(scopes), [str(e) for e in extra]], sort_keys=True)
+    return 'W/"' + hashlib.sha1(payload.encode()).hexdigest()[:24] + '"'
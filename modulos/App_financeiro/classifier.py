@@ -0,0 +1,272 @@
+"""
+Classificador Local de Categorias - Naive Bayes por usuário
+===========================================================
+
+Responde ``/api/suggest-category`` sem sair do processo na maioria dos casos:
+
+- cada (usuário, tipo) tem um modelo Naive Bayes multinomial com palavras,
+  pares de palavras e trigramas de caracteres das descrições já
+  categorizadas, normalizadas por ``_merchant_key``;
+- descrições com a mesma chave de uma já vista respondem pelo histórico;
+- os modelos ficam num LRU limitado (``FINANCE_CLASSIFIER_CACHE`` modelos),
+  são montados com uma query das últimas ``FINANCE_CLASSIFIER_TRAIN_LIMIT``
+  transações e atualizados no commit de cada transação criada/alterada/
+  excluída via ORM. Inserts em lote (ocorrências recorrentes) entram na
+  próxima reconstrução (``FINANCE_CLASSIFIER_TTL`` segundos).
+
+O score do Naive Bayes é relativo (posterior entre as categorias
+candidatas): só diz qual categoria é a mais provável, não se a descrição se
+parece com alguma. Por isso o classificador só responde com evidência:
+
+- pelo menos ``FINANCE_CLASSIFIER_MIN_WORD_SHARE`` das palavras da descrição
+  já apareceram no histórico (trigramas de caracteres soltos não contam);
+- pelo menos duas categorias candidatas com ``FINANCE_CLASSIFIER_MIN_DOCS``
+  transações cada.
+
+Sem isso não há sugestão local. A API só chama o LLM quando não há sugestão
+ou a confiança fica abaixo de ``FINANCE_CLASSIFIER_THRESHOLD``.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, attributes
+
+from extensions import db
+from models import Transaction
+
+from .helpers import _dbg, _merchant_key
+
+_CACHE_SIZE = int(os.getenv("FINANCE_CLASSIFIER_CACHE", "512"))
+_MODEL_TTL = float(os.getenv("FINANCE_CLASSIFIER_TTL", "900"))
+_TRAIN_LIMIT = int(os.getenv("FINANCE_CLASSIFIER_TRAIN_LIMIT", "5000"))
+_CLASSIFIER_THRESHOLD = float(os.getenv("FINANCE_CLASSIFIER_THRESHOLD", "0.6"))
+# Evidência mínima para o score do classificador valer (ver docstring)
+_MIN_WORD_SHARE = float(os.getenv("FINANCE_CLASSIFIER_MIN_WORD_SHARE", "0.5"))
+_MIN_CATEGORY_DOCS = int(os.getenv("FINANCE_CLASSIFIER_MIN_DOCS", "2"))
+_SESSION_KEY = "finance_classifier_updates"
+
+_lock = threading.Lock()
+_models: OrderedDict = OrderedDict()  # (user_id, tipo) -> _CategoryModel
+
+
+# ---------------------------------------------------------------------------
+# Texto
+# ---------------------------------------------------------------------------
+
+def _features(description) -> list:
+    words = [w for w in (_merchant_key(description) or "").split() if len(w) > 1]
+    features = [f"w:{w}" for w in words]
+    features += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f"#{w}#"
+        features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return features
+
+
+# ---------------------------------------------------------------------------
+# Modelo
+# ---------------------------------------------------------------------------
+
+class _CategoryModel:
+    """Naive Bayes multinomial com contagens incrementais (aprende e desaprende)."""
+
+    def __init__(self):
+        self.docs = Counter()        # category_id -> nº de transações
+        self.features = {}           # category_id -> Counter(feature)
+        self.totals = Counter()      # category_id -> soma das features
+        self.vocabulary = Counter()  # feature -> ocorrências em todas as categorias
+        self.exact = {}              # merchant_key -> Counter(category_id)
+        self.subcategories = {}      # (merchant_key, category_id) -> Counter(subcategoria)
+        self.built_at = time.monotonic()
+
+    def learn(self, description, category_id, subcategory=None, weight: int = 1) -> None:
+        if not category_id or not description:
+            return
+        category_id = int(category_id)
+        key = _merchant_key(description)
+        features = _features(description)
+
+        _add(self.docs, category_id, weight)
+        counts = self.features.setdefault(category_id, Counter())
+        for f in features:
+            _add(counts, f, weight)
+            _add(self.vocabulary, f, weight)
+        _add(self.totals, category_id, weight * len(features))
+        if key:
+            _add(self.exact.setdefault(key, Counter()), category_id, weight)
+            if subcategory:
+                _add(self.subcategories.setdefault((key, category_id), Counter()), str(subcategory).strip(), weight)
+
+    def predict(self, description, allowed_ids):
+        """
+        Retorna ``(category_id, score, origem, subcategoria)`` ou None.
+
+        None também quando falta evidência para o classificador (poucas
+        palavras conhecidas ou menos de duas categorias treinadas): o score
+        relativo seria alto mesmo para uma descrição que não lembra nenhuma.
+        """
+        allowed = {int(c) for c in allowed_ids}
+        key = _merchant_key(description)
+
+        exact = {c: n for c, n in (self.exact.get(key) or {}).items() if c in allowed}
+        if exact:
+            category_id, hits = max(exact.items(), key=lambda item: item[1])
+            return category_id, hits / sum(exact.values()), "history", self._subcategory(key, category_id)
+
+        candidates = [c for c in allowed if self.docs.get(c, 0) >= _MIN_CATEGORY_DOCS]
+        if len(candidates) < 2:
+            return None
+        all_features = _features(description)
+        words = [f for f in all_features if f.startswith("w:")]
+        if not words or sum(1 for f in words if self.vocabulary.get(f)) / len(words) < _MIN_WORD_SHARE:
+            return None
+        features = [f for f in all_features if self.vocabulary.get(f)]
+
+        total_docs = sum(self.docs[c] for c in candidates)
+        vocab_size = len(self.vocabulary)
+        scores = {}
+        for c in candidates:
+            counts = self.features.get(c) or {}
+            denominator = self.totals[c] + vocab_size
+            score = math.log(self.docs[c] / total_docs)
+            for f in features:
+                score += math.log((counts.get(f, 0) + 1) / denominator)
+            scores[c] = score
+
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(s - scores[best]) for s in scores.values())
+        return best, 1.0 / norm, "classifier", None
+
+    def _subcategory(self, key, category_id):
+        subs = self.subcategories.get((key, category_id))
+        return subs.most_common(1)[0][0] if subs else None
+
+
+def _add(counter: Counter, key, weight: int) -> None:
+    value = counter.get(key, 0) + weight
+    if value > 0:
+        counter[key] = value
+    else:
+        counter.pop(key, None)
+
+
+def _build_model(user_id: int, tx_type: str) -> _CategoryModel:
+    rows = (
+        db.session.query(Transaction.description, Transaction.category_id, Transaction.subcategory_text)
+        .filter(
+            Transaction.user_id == int(user_id),
+            Transaction.type == tx_type,
+            Transaction.category_id.isnot(None),
+        )
+        .order_by(Transaction.id.desc())
+        .limit(_TRAIN_LIMIT)
+        .all()
+    )
+    model = _CategoryModel()
+    for description, category_id, subcategory in rows:
+        model.learn(description, category_id, subcategory)
+    _dbg(f"[CLASSIFIER] Modelo user={user_id} tipo={tx_type}: {len(rows)} transações, {len(model.docs)} categorias")
+    return model
+
+
+def _category_model(user_id: int, tx_type: str) -> _CategoryModel:
+    key = (int(user_id), tx_type)
+    with _lock:
+        model = _models.get(key)
+        if model is not None and time.monotonic() - model.built_at < _MODEL_TTL:
+            _models.move_to_end(key)
+            return model
+
+    model = _build_model(user_id, tx_type)
+    with _lock:
+        _models[key] = model
+        _models.move_to_end(key)
+        while len(_models) > _CACHE_SIZE:
+            _models.popitem(last=False)
+    return model
+
+
+def _suggest_category_local(user_id: int, tx_type: str, description: str, allowed_ids):
+    """
+    Sugestão local: ``{"category_id", "score", "source", "subcategory"}`` ou None.
+
+    ``source`` é "history" (descrição já vista) ou "classifier" (Naive Bayes);
+    ``score`` vai de 0 a 1.
+    """
+    if not allowed_ids:
+        return None
+    model = _category_model(user_id, tx_type)
+    with _lock:
+        prediction = model.predict(description, allowed_ids)
+    if not prediction:
+        return None
+    category_id, score, source, subcategory = prediction
+    return {"category_id": category_id, "score": round(score, 4), "source": source, "subcategory": subcategory}
+
+
+# ---------------------------------------------------------------------------
+# Treino incremental (commit)
+# ---------------------------------------------------------------------------
+
+_TRAINED_ATTRS = ("user_id", "type", "description", "category_id", "subcategory_text")
+
+
+def _old_values(obj) -> dict:
+    """Valores antes da alteração; None quando o antigo não estava carregado (não desaprende)."""
+    values = {}
+    for attr in _TRAINED_ATTRS:
+        hist = attributes.get_history(obj, attr)
+        if hist.deleted:
+            values[attr] = hist.deleted[0]
+        elif hist.added:
+            values[attr] = None
+        else:
+            values[attr] = getattr(obj, attr)
+    return values
+
+
+def _example(values: dict, weight: int):
+    return (values["user_id"], values["type"], values["description"], values["category_id"], values["subcategory_text"], weight)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_training_examples(session, flush_context, instances):
+    examples = []
+    for obj in session.new:
+        if isinstance(obj, Transaction):
+            examples.append(_example({a: getattr(obj, a) for a in _TRAINED_ATTRS}, 1))
+    for obj in session.deleted:
+        if isinstance(obj, Transaction):
+            examples.append(_example({a: getattr(obj, a) for a in _TRAINED_ATTRS}, -1))
+    for obj in session.dirty:
+        if not isinstance(obj, Transaction):
+            continue
+        if not any(attributes.get_history(obj, a).has_changes() for a in _TRAINED_ATTRS):
+            continue
+        examples.append(_example(_old_values(obj), -1))
+        examples.append(_example({a: getattr(obj, a) for a in _TRAINED_ATTRS}, 1))
+
+    if examples:
+        session.info.setdefault(_SESSION_KEY, []).extend(examples)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_training_examples(session):
+    examples = session.info.pop(_SESSION_KEY, None)
+    if not examples:
+        return
+    with _lock:
+        for user_id, tx_type, description, category_id, subcategory, weight in examples:
+            model = _models.get((int(user_id), tx_type)) if user_id else None
+            if model is not None:
+                model.learn(description, category_id, subcategory, weight)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_training_examples(session):
+    session.info.pop(_SESSION_KEY, None)
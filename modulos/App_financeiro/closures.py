@@ -0,0 +1,310 @@
+"""
+Fechamento Mensal - Snapshots imutáveis em ``monthly_closures``
+===============================================================
+
+Fechar um mês (``_close_month``) congela um escopo (workspace inteiro ou livro
+pessoal de um usuário) naquele mês:
+
+- as recorrências do mês são materializadas antes (depois disso o mês não
+  recebe mais ocorrências);
+- cada linha de ``MonthlyClosure`` do mês (uma por usuário) recebe os totais
+  recalculados das transações, ``category_totals`` e status "closed";
+- as despesas fixas (``is_fixed`` ou geradas por recorrência) são copiadas
+  para ``MonthlyFixedExpense``;
+- a partir daí, escrever em transações do mês levanta ``ClosedMonthError``
+  (ver ``rollups._mark_rollups_dirty``).
+
+As leituras de um mês (``_month_summary``) usam o snapshot quando o mês está
+fechado e só agregam ``transactions`` nos meses abertos.
+
+CLI: ``flask finance-months close|reopen``.
+"""
+
+from datetime import date, datetime
+
+from sqlalchemy import and_, func, or_
+
+from extensions import db
+from models import Category, MonthlyClosure, MonthlyFixedExpense, Transaction
+
+from .access import _workspace_user_ids
+from .change_counters import _mark_scopes_changed, _tx_scope
+from .helpers import _dbg
+from .recurring import _materialize_recurring
+from .rollups import _all_scopes, _ensure_scope_rollups, _scope_filter
+
+
+def _month_bounds(year: int, month: int) -> tuple[date, date]:
+    start = date(int(year), int(month), 1)
+    end = date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+    return start, end
+
+
+def _closure_query(year: int, month: int, workspace_id=None, user_id=None):
+    """Linhas de ``MonthlyClosure`` do mês no escopo (``user_id`` filtra dentro do workspace)."""
+    query = MonthlyClosure.query.filter(
+        _scope_filter(MonthlyClosure.workspace_id, workspace_id),
+        MonthlyClosure.year == int(year),
+        MonthlyClosure.month == int(month),
+    )
+    if user_id is not None:
+        query = query.filter(MonthlyClosure.user_id == int(user_id))
+    return query
+
+
+def _transaction_filters(year: int, month: int, workspace_id=None, user_id=None) -> list:
+    start, end = _month_bounds(year, month)
+    filters = [
+        _scope_filter(Transaction.workspace_id, workspace_id),
+        Transaction.transaction_date >= start,
+        Transaction.transaction_date < end,
+    ]
+    if user_id is not None:
+        filters.append(Transaction.user_id == int(user_id))
+    return filters
+
+
+# ---------------------------------------------------------------------------
+# Agregação (meses abertos e snapshot)
+# ---------------------------------------------------------------------------
+
+def _aggregate_month(year: int, month: int, workspace_id=None, user_id=None) -> dict:
+    """
+    Totais do mês por usuário, numa query agrupada por (usuário, tipo, categoria).
+
+    Retorna ``{user_id: {"income", "expense", "categories": [...]}}``.
+    """
+    rows = (
+        db.session.query(
+            Transaction.user_id,
+            Transaction.type,
+            Transaction.category_id,
+            Category.name,
+            func.coalesce(func.sum(Transaction.amount), 0),
+            func.count(Transaction.id),
+        )
+        .outerjoin(Category, Category.id == Transaction.category_id)
+        .filter(*_transaction_filters(year, month, workspace_id, user_id))
+        .group_by(Transaction.user_id, Transaction.type, Transaction.category_id, Category.name)
+        .all()
+    )
+    by_user = {}
+    for uid, tx_type, category_id, name, total, count in rows:
+        entry = by_user.setdefault(int(uid), {"income": 0.0, "expense": 0.0, "categories": []})
+        total = float(total or 0)
+        if tx_type in ("income", "expense"):
+            entry[tx_type] += total
+        entry["categories"].append({
+            "type": tx_type,
+            "category_id": int(category_id) if category_id else None,
+            "name": name or "Sem categoria",
+            "total": total,
+            "count": int(count or 0),
+        })
+    return by_user
+
+
+def _merge_categories(groups) -> list:
+    """Soma listas de ``category_totals`` (uma por usuário), ordenando pelo maior total."""
+    merged = {}
+    for categories in groups:
+        for item in categories or []:
+            key = (item["type"], item["category_id"])
+            if key not in merged:
+                merged[key] = dict(item)
+            else:
+                merged[key]["total"] += item["total"]
+                merged[key]["count"] += item["count"]
+    return sorted(merged.values(), key=lambda c: (c["type"], -c["total"]))
+
+
+def _fixed_expense_query(year: int, month: int, workspace_id=None, user_id=None):
+    return Transaction.query.filter(
+        *_transaction_filters(year, month, workspace_id, user_id),
+        Transaction.type == "expense",
+        or_(Transaction.is_fixed.is_(True), Transaction.recurring_transaction_id.isnot(None)),
+    ).order_by(Transaction.transaction_date.asc(), Transaction.id.asc())
+
+
+def _fixed_expense_payload(description, amount, category_id, transaction_id) -> dict:
+    return {
+        "description": description,
+        "amount": float(amount or 0),
+        "category_id": int(category_id) if category_id else None,
+        "transaction_id": int(transaction_id) if transaction_id else None,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Fechamento
+# ---------------------------------------------------------------------------
+
+def _close_month(year: int, month: int, workspace_id=None, user_id=None, today: date | None = None) -> dict:
+    """
+    Fecha o mês do escopo (workspace, ou livro pessoal de ``user_id``) e faz commit.
+
+    Só meses já encerrados podem ser fechados. ``user_id`` no workspace é quem
+    fecha: garante uma linha de fechamento mesmo se o mês não teve transações.
+    Retorna ``{"month", "status", "rows", "fixed_expenses"}``.
+    """
+    today = today or datetime.utcnow().date()
+    start, _end = _month_bounds(year, month)
+    if start >= date(today.year, today.month, 1):
+        raise ValueError("Só meses encerrados podem ser fechados")
+    label = f"{start.year:04d}-{start.month:02d}"
+    personal = workspace_id is None
+    if personal and not user_id:
+        raise ValueError("user_id obrigatório no livro pessoal")
+
+    if _closure_query(year, month, workspace_id, user_id if personal else None).filter(
+        MonthlyClosure.status == "closed"
+    ).first():
+        return {"month": label, "status": "already_closed", "rows": 0, "fixed_expenses": 0}
+
+    # Ocorrências que ainda faltam no mês entram antes de congelar
+    rule_user_ids = [int(user_id)] if personal else list(_workspace_user_ids(workspace_id))
+    _materialize_recurring(rule_user_ids, start.year, start.month, None if personal else int(workspace_id))
+    _ensure_scope_rollups(workspace_id=workspace_id, user_id=user_id if personal else None)
+
+    aggregated = _aggregate_month(year, month, workspace_id, user_id if personal else None)
+    rows = {r.user_id: r for r in _closure_query(year, month, workspace_id, user_id if personal else None).all()}
+    if not rows and not aggregated and user_id:
+        aggregated[int(user_id)] = {"income": 0.0, "expense": 0.0, "categories": []}
+
+    now = datetime.utcnow()
+    for uid in set(rows) | set(aggregated):
+        totals = aggregated.get(uid, {"income": 0.0, "expense": 0.0, "categories": []})
+        row = rows.get(uid)
+        if row is None:
+            row = MonthlyClosure(
+                workspace_id=None if personal else int(workspace_id),
+                user_id=int(uid),
+                year=start.year,
+                month=start.month,
+            )
+            db.session.add(row)
+            rows[uid] = row
+        row.total_income = totals["income"]
+        row.total_expense = totals["expense"]
+        row.balance = totals["income"] - totals["expense"]
+        row.category_totals = sorted(totals["categories"], key=lambda c: (c["type"], -c["total"]))
+        row.status = "closed"
+        row.closed_at = now
+    db.session.flush()
+
+    # Reabrir e fechar de novo substitui o snapshot anterior
+    MonthlyFixedExpense.query.filter(
+        MonthlyFixedExpense.monthly_closure_id.in_([r.id for r in rows.values()])
+    ).delete(synchronize_session=False)
+    fixed = 0
+    for tx in _fixed_expense_query(year, month, workspace_id, user_id if personal else None):
+        db.session.add(MonthlyFixedExpense(
+            monthly_closure_id=rows[tx.user_id].id,
+            original_transaction_id=tx.id,
+            description=tx.description,
+            amount=tx.amount,
+            category_id=tx.category_id,
+        ))
+        fixed += 1
+
+    # Leituras com ETag passam a mostrar o mês como fechado
+    _mark_scopes_changed({_tx_scope(workspace_id, uid) for uid in rows})
+    db.session.commit()
+    _dbg(f"[CLOSURE] {label} fechado ws={workspace_id} user={user_id}: {len(rows)} linhas, {fixed} despesas fixas")
+    return {"month": label, "status": "closed", "rows": len(rows), "fixed_expenses": fixed}
+
+
+def _reopen_month(year: int, month: int, workspace_id=None, user_id=None) -> dict:
+    """Reabre o mês do escopo: descarta o snapshot e volta a aceitar escritas."""
+    personal = workspace_id is None
+    rows = _closure_query(year, month, workspace_id, user_id if personal else None).filter(
+        MonthlyClosure.status == "closed"
+    ).all()
+    label = f"{int(year):04d}-{int(month):02d}"
+    if not rows:
+        return {"month": label, "status": "open", "rows": 0}
+    MonthlyFixedExpense.query.filter(
+        MonthlyFixedExpense.monthly_closure_id.in_([r.id for r in rows])
+    ).delete(synchronize_session=False)
+    for row in rows:
+        row.status = "open"
+        row.closed_at = None
+        row.category_totals = None
+    _mark_scopes_changed({_tx_scope(workspace_id, r.user_id) for r in rows})
+    db.session.commit()
+    _dbg(f"[CLOSURE] {label} reaberto ws={workspace_id} user={user_id}")
+    return {"month": label, "status": "reopened", "rows": len(rows)}
+
+
+def _close_pending_months(until: date) -> list[dict]:
+    """Fecha, em todos os escopos, os meses com rollup ainda aberto até ``until`` (inclusive)."""
+    results = []
+    for workspace_id, user_id in _all_scopes():
+        _ensure_scope_rollups(workspace_id=workspace_id, user_id=user_id)
+        query = db.session.query(MonthlyClosure.year, MonthlyClosure.month).filter(
+            _scope_filter(MonthlyClosure.workspace_id, workspace_id),
+            MonthlyClosure.status != "closed",
+            or_(
+                MonthlyClosure.year < until.year,
+                and_(MonthlyClosure.year == until.year, MonthlyClosure.month <= until.month),
+            ),
+        )
+        if workspace_id is None:
+            query = query.filter(MonthlyClosure.user_id == int(user_id))
+        for year, month in sorted(set(query.all())):
+            result = _close_month(year, month, workspace_id=workspace_id, user_id=user_id)
+            results.append({"workspace_id": workspace_id, "user_id": user_id, **result})
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Leitura
+# ---------------------------------------------------------------------------
+
+def _month_summary(year: int, month: int, workspace_id=None, user_id=None) -> dict:
+    """
+    Totais, categorias e despesas fixas do mês.
+
+    Mês fechado: lê só o snapshot (linhas de ``monthly_closures`` e
+    ``monthly_fixed_expenses``). Mês aberto: agrega as transações do mês.
+    ``user_id`` restringe a um usuário dentro do workspace (ou indica o livro pessoal).
+    """
+    start, _end = _month_bounds(year, month)
+    rows = _closure_query(year, month, workspace_id, user_id).all()
+    closed = [r for r in rows if r.status == "closed"]
+
+    if closed:
+        income = sum(float(r.total_income or 0) for r in closed)
+        expense = sum(float(r.total_expense or 0) for r in closed)
+        categories = _merge_categories(r.category_totals for r in closed)
+        fixed = [
+            _fixed_expense_payload(f.description, f.amount, f.category_id, f.original_transaction_id)
+            for f in MonthlyFixedExpense.query.filter(
+                MonthlyFixedExpense.monthly_closure_id.in_([r.id for r in closed])
+            ).order_by(MonthlyFixedExpense.id.asc())
+        ]
+        closed_at = max(r.closed_at for r in closed if r.closed_at) if any(r.closed_at for r in closed) else None
+        status, source = "closed", "snapshot"
+    else:
+        aggregated = _aggregate_month(year, month, workspace_id, user_id)
+        income = sum(v["income"] for v in aggregated.values())
+        expense = sum(v["expense"] for v in aggregated.values())
+        categories = _merge_categories(v["categories"] for v in aggregated.values())
+        fixed = [
+            _fixed_expense_payload(tx.description, tx.amount, tx.category_id, tx.id)
+            for tx in _fixed_expense_query(year, month, workspace_id, user_id)
+        ]
+        closed_at = None
+        status, source = "open", "transactions"
+
+    return {
+        "month": f"{start.year:04d}-{start.month:02d}",
+        "status": status,
+        "source": source,
+        "closed_at": closed_at.isoformat() if closed_at else None,
+        "total_income": income,
+        "total_expense": expense,
+        "balance": income - expense,
+        "categories": categories,
+        "fixed_expenses": fixed,
+    }
@@ -0,0 +1,253 @@
+"""
+Exportação de Transações - CSV/XLSX em streaming
+================================================
+
+``GET /api/transactions/export`` escreve as linhas direto na resposta
+(chunked), sem montar o arquivo na memória:
+
+- a query seleciona só as colunas exportadas (nada de ``proof_document_data``)
+  com o nome da categoria no JOIN e é lida com ``yield_per`` (cursor no
+  servidor no PostgreSQL);
+- CSV: separador ``;``, vírgula decimal e BOM UTF-8 (abre direto no Excel
+  em pt-BR; o arquivo volta pela importação de extratos sem ajustes);
+- XLSX: planilha única gravada num ZIP em streaming (``zipfile`` aceita
+  destino sem ``seek``), com textos inline e sem tabela de strings
+  compartilhadas, então a memória não cresce com o número de linhas.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from datetime import date
+from xml.sax.saxutils import escape
+
+from models import Category, Transaction
+
+_FLUSH_ROWS = 500
+_YIELD_PER = 1000
+
+# (cabeçalho, tipo da célula no XLSX)
+_EXPORT_COLUMNS = (
+    ("Data", "date"),
+    ("Descrição", "text"),
+    ("Categoria", "text"),
+    ("Subcategoria", "text"),
+    ("Tipo", "text"),
+    ("Valor", "number"),
+    ("Pago", "text"),
+    ("Data do pagamento", "date"),
+    ("Forma de pagamento", "text"),
+    ("Observações", "text"),
+)
+_TYPE_LABELS = {"income": "receita", "expense": "despesa"}
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_EXCEL_EPOCH = date(1899, 12, 30)
+
+
+def _export_columns() -> list:
+    """Colunas do SELECT da exportação (na ordem de ``_EXPORT_COLUMNS``)."""
+    return [
+        Transaction.transaction_date,
+        Transaction.description,
+        Category.name,
+        Transaction.subcategory_text,
+        Transaction.type,
+        Transaction.amount,
+        Transaction.is_paid,
+        Transaction.paid_date,
+        Transaction.payment_method,
+        Transaction.notes,
+    ]
+
+
+def _stream_rows(query):
+    """Itera a query em blocos de ``_YIELD_PER`` linhas (``stream_results`` no PostgreSQL)."""
+    return query.yield_per(_YIELD_PER)
+
+
+def _row_values(row) -> list:
+    tx_date, description, category, subcategory, tx_type, amount, is_paid, paid_date, payment_method, notes = row
+    return [
+        tx_date,
+        description or "",
+        category or "",
+        subcategory or "",
+        _TYPE_LABELS.get(tx_type, tx_type or ""),
+        amount,
+        "sim" if is_paid else "não",
+        paid_date,
+        payment_method or "",
+        notes or "",
+    ]
+
+
+# ---------------------------------------------------------------------------
+# CSV
+# ---------------------------------------------------------------------------
+
+def _csv_cell(value):
+    if isinstance(value, date):
+        return value.strftime("%d/%m/%Y")
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        return f"{value:.2f}".replace(".", ",")
+    return value
+
+
+def _iter_csv(rows):
+    """Gera o CSV em blocos de bytes (a cada ``_FLUSH_ROWS`` linhas)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";", lineterminator="\r\n")
+    buffer.write("﻿")
+    writer.writerow([name for name, _ in _EXPORT_COLUMNS])
+    pending = 0
+    for row in rows:
+        writer.writerow([_csv_cell(v) for v in _row_values(row)])
+        pending += 1
+        if pending >= _FLUSH_ROWS:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode("utf-8")
+
+
+# ---------------------------------------------------------------------------
+# XLSX
+# ---------------------------------------------------------------------------
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Transações" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+# Estilos: 0 = padrão, 1 = data (dd/mm/aaaa), 2 = número com 2 casas, 3 = cabeçalho em negrito
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="dd/mm/yyyy"/></numFmts>'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '</cellXfs>'
+    '</styleSheet>'
+)
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+class _ChunkSink:
+    """Destino só de escrita para o ``ZipFile``: acumula os bytes até o próximo ``drain``."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _column_letter(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+_LETTERS = [_column_letter(i) for i in range(len(_EXPORT_COLUMNS))]
+
+
+def _xlsx_text(ref: str, text: str, style: int = 0) -> str:
+    style_attr = f' s="{style}"' if style else ""
+    text = escape(_XML_INVALID.sub("", str(text)))
+    return f'<c r="{ref}" t="inlineStr"{style_attr}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(row_number: int, values) -> str:
+    cells = []
+    for letter, (_, kind), value in zip(_LETTERS, _EXPORT_COLUMNS, values):
+        ref = f"{letter}{row_number}"
+        if value is None or value == "":
+            continue
+        if kind == "date" and isinstance(value, date):
+            cells.append(f'<c r="{ref}" s="1"><v>{(value - _EXCEL_EPOCH).days}</v></c>')
+        elif kind == "number":
+            cells.append(f'<c r="{ref}" s="2"><v>{value}</v></c>')
+        else:
+            cells.append(_xlsx_text(ref, value))
+    return f'<row r="{row_number}">{"".join(cells)}</row>'
+
+
+def _iter_xlsx(rows):
+    """Gera o XLSX em blocos de bytes, comprimindo a planilha conforme as linhas chegam."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        zf.writestr("_rels/.rels", _ROOT_RELS)
+        zf.writestr("xl/workbook.xml", _WORKBOOK)
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        zf.writestr("xl/styles.xml", _STYLES)
+        yield sink.drain()
+
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            header = "".join(_xlsx_text(f"{letter}1", name, 3) for letter, (name, _) in zip(_LETTERS, _EXPORT_COLUMNS))
+            sheet.write(f'{_SHEET_HEAD}<row r="1">{header}</row>'.encode("utf-8"))
+            row_number, parts = 1, []
+            for row in rows:
+                row_number += 1
+                parts.append(_xlsx_row(row_number, _row_values(row)))
+                if len(parts) >= _FLUSH_ROWS:
+                    sheet.write("".join(parts).encode("utf-8"))
+                    parts = []
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+            sheet.write(("".join(parts) + _SHEET_TAIL).encode("utf-8"))
+    yield sink.drain()
@@ -0,0 +1,270 @@
+"""
+Previsão de Caixa - Curva de saldo diária com NumPy
+===================================================
+
+``/api/forecast?months=N`` projeta o saldo dia a dia de hoje até o fim do
+N-ésimo mês seguinte, sem gravar nada:
+
+- saldo inicial: saldo contábil até hoje (rollups mensais) sem o que ainda
+  não saiu do caixa: compras no cartão não pagas (o dinheiro só sai no
+  vencimento da fatura) e lançamentos fora do cartão vencidos e não pagos
+  (ou não recebidos) nos últimos 100 dias, que entram como fluxo de hoje -
+  mais antigos que isso contam como quitados;
+- transações já gravadas com data futura entram na própria data;
+- compras no cartão (gravadas ou recorrentes) entram no vencimento da fatura
+  do ciclo delas, calculado com o ``closing_day``/``due_day`` do cartão;
+- ocorrências das regras recorrentes ativas ainda não gravadas (depois do
+  watermark, fora de ``exception_dates`` e respeitando ``end_date`` das
+  parcelas), de qualquer frequência, entram na data da ocorrência.
+
+As ocorrências de todas as regras saem de uma vez em arrays do expansor de
+``recurrence`` (o mesmo da materialização e da projeção), os fluxos
+viram um vetor diário com ``np.bincount`` e o saldo sai de ``np.cumsum``:
+centenas de regras custam alguns milissegundos. Fluxos com data já passada
+(ocorrência atrasada, fatura vencida) contam no dia de hoje.
+"""
+
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import and_, case, func, or_
+
+from extensions import db
+from models import CreditCard, Transaction
+
+from .helpers import _dbg, _last_day_of_month, _shift_month_simple
+from .recurrence import _day_in_months
+from .recurring import _pending_occurrences, _persisted_after_watermark, _scope_rules
+from .rollups import _opening_balance, _scope_filter
+
+_MAX_MONTHS = 24
+# Compras no cartão mais antigas que isso já venceram: entram e saem no mesmo dia
+_CARD_LOOKBACK_DAYS = 100
+# Lançamentos vencidos e não pagos mais antigos que isso contam como quitados
+_UNPAID_LOOKBACK_DAYS = 100
+
+
+def _invoice_due_dates(dates: np.ndarray, closing_days: np.ndarray, due_days: np.ndarray) -> np.ndarray:
+    """
+    Vencimento da fatura de cada compra (mesma regra de ``invoices``, vetorizada).
+
+    Sem ``closing_day`` o ciclo é o mês civil; sem ``due_day`` o pagamento cai no
+    fechamento.
+    """
+    months = dates.astype("datetime64[M]")
+    has_closing = closing_days > 0
+    closing = np.where(has_closing, _day_in_months(months, closing_days), (months + 1).astype("datetime64[D]"))
+    invoice_months = np.where(dates < closing, months, months + 1)
+    due_months = np.where(has_closing & (due_days > closing_days), invoice_months, invoice_months + 1)
+    invoice_closing = np.where(
+        has_closing,
+        _day_in_months(invoice_months, closing_days),
+        (invoice_months + 1).astype("datetime64[D]"),
+    )
+    return np.where(due_days > 0, _day_in_months(due_months, due_days), invoice_closing)
+
+
+def _card_terms(card_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """``(closing_day, due_day)`` por elemento (0 quando não há cartão ou o dia não foi definido)."""
+    closing = np.zeros(len(card_ids), dtype=np.int64)
+    due = np.zeros(len(card_ids), dtype=np.int64)
+    ids = {int(c) for c in np.unique(card_ids) if c > 0}
+    if not ids:
+        return closing, due
+    terms = {
+        int(cid): (int(cd or 0), int(dd or 0))
+        for cid, cd, dd in db.session.query(CreditCard.id, CreditCard.closing_day, CreditCard.due_day)
+        .filter(CreditCard.id.in_(ids))
+    }
+    for cid, (cd, dd) in terms.items():
+        mask = card_ids == cid
+        closing[mask] = cd
+        due[mask] = dd
+    return closing, due
+
+
+# ---------------------------------------------------------------------------
+# Fluxos
+# ---------------------------------------------------------------------------
+
+def _recorded_flows(workspace_id, user_id, today: date, horizon_end: date) -> dict:
+    """
+    Transações gravadas que mexem no caixa a partir de hoje (uma query agrupada).
+
+    - datas futuras (fora do cartão, ou já pagas): fluxo na própria data;
+    - cartão não pago: fluxo no vencimento da fatura; as de até hoje já estão no
+      saldo contábil e são devolvidas em ``card_booked``;
+    - fora do cartão, vencidas e não pagas: fluxo hoje; também já estão no saldo
+      contábil e são devolvidas em ``unpaid_booked``.
+    """
+    signed = case((Transaction.type == "income", Transaction.amount), else_=-Transaction.amount)
+    unpaid_card = and_(Transaction.credit_card_id.isnot(None), Transaction.is_paid.is_(False))
+    unpaid_cash = and_(Transaction.credit_card_id.is_(None), Transaction.is_paid.is_(False))
+    filters = [
+        _scope_filter(Transaction.workspace_id, workspace_id),
+        Transaction.transaction_date <= horizon_end,
+        or_(
+            Transaction.transaction_date > today,
+            and_(unpaid_card, Transaction.transaction_date >= today - timedelta(days=_CARD_LOOKBACK_DAYS)),
+            and_(unpaid_cash, Transaction.transaction_date >= today - timedelta(days=_UNPAID_LOOKBACK_DAYS)),
+        ),
+    ]
+    if user_id is not None:
+        filters.append(Transaction.user_id == int(user_id))
+    rows = (
+        db.session.query(
+            Transaction.transaction_date,
+            func.coalesce(Transaction.credit_card_id, 0),
+            Transaction.is_paid,
+            func.coalesce(func.sum(signed), 0),
+            func.count(Transaction.id),
+        )
+        .filter(*filters)
+        .group_by(Transaction.transaction_date, func.coalesce(Transaction.credit_card_id, 0), Transaction.is_paid)
+        .all()
+    )
+    dates = np.array([r[0] for r in rows], dtype="datetime64[D]")
+    card_ids = np.array([int(r[1]) if not r[2] else 0 for r in rows], dtype=np.int64)
+    amounts = np.array([float(r[3] or 0) for r in rows], dtype=np.float64)
+    count = int(sum(int(r[4] or 0) for r in rows))
+    today64 = np.datetime64(today, "D")
+    return {
+        "dates": dates,
+        "card_ids": card_ids,
+        "amounts": amounts,
+        "count": count,
+        "card_booked": float(amounts[(card_ids > 0) & (dates <= today64)].sum()) if len(rows) else 0.0,
+        # Até hoje só vêm linhas não pagas: fora do cartão, são as vencidas em aberto
+        "unpaid_booked": float(amounts[(card_ids == 0) & (dates <= today64)].sum()) if len(rows) else 0.0,
+        "future_booked_this_month": float(
+            amounts[(dates > today64) & (dates.astype("datetime64[M]") == today64.astype("datetime64[M]"))].sum()
+        ) if len(rows) else 0.0,
+    }
+
+
+def _recurring_flows(user_ids: list, workspace_id, horizon_end: date) -> dict:
+    """Ocorrências ainda não gravadas das regras ativas até ``horizon_end`` (``_expand_occurrences``)."""
+    target = date(horizon_end.year, horizon_end.month, 1)
+    rules = _scope_rules(user_ids, target, workspace_id)
+    if not rules:
+        return {"dates": np.array([], dtype="datetime64[D]"), "card_ids": np.array([], dtype=np.int64),
+                "amounts": np.array([], dtype=np.float64), "rules": 0}
+
+    occurrences = _pending_occurrences(rules, horizon_end, _persisted_after_watermark(rules, horizon_end))
+    signed = np.array([float(r.amount or 0) * (1 if r.type == "income" else -1) for r in rules], dtype=np.float64)
+    cards = np.array([int(r.credit_card_id or 0) for r in rules], dtype=np.int64)
+
+    # _scope_rules pode ter resolvido workspace/watermark de regras antigas
+    # (depois de ler as regras: o commit expira os objetos)
+    try:
+        db.session.commit()
+    except Exception as e:
+        # A previsão não depende da gravação: a materialização refaz os ajustes
+        _dbg(f"[FORECAST] Erro ao gravar workspace/watermark das regras: {e}")
+        db.session.rollback()
+
+    rule_pos = occurrences["rule_pos"]
+    return {
+        "dates": occurrences["dates"],
+        "card_ids": cards[rule_pos],
+        "amounts": signed[rule_pos],
+        "rules": len(rules),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Curva
+# ---------------------------------------------------------------------------
+
+def _cash_forecast(user_ids: list, workspace_id=None, user_id=None, months: int = 6, today: date | None = None) -> dict:
+    """
+    Curva de saldo diária de hoje até o fim do ``months``-ésimo mês seguinte.
+
+    ``user_ids`` são os donos das regras recorrentes do escopo; ``user_id``
+    restringe as transações dentro do workspace (ou indica o livro pessoal).
+    """
+    started = datetime.utcnow()
+    today = today or started.date()
+    months = max(1, min(int(months), _MAX_MONTHS))
+    end_y, end_m = _shift_month_simple(today.year, today.month, months)
+    horizon_end = _last_day_of_month(end_y, end_m)
+    next_y, next_m = _shift_month_simple(today.year, today.month, 1)
+
+    recorded = _recorded_flows(workspace_id, user_id, today, horizon_end)
+    recurring = _recurring_flows(user_ids, workspace_id, horizon_end)
+
+    # Saldo contábil até hoje: rollups até o fim do mês menos o que foi lançado para depois de hoje
+    booked = _opening_balance(next_y, next_m, workspace_id=workspace_id, user_id=user_id)
+    booked -= recorded["future_booked_this_month"]
+    start_balance = booked - recorded["card_booked"] - recorded["unpaid_booked"]
+
+    dates = np.concatenate([recorded["dates"], recurring["dates"]])
+    card_ids = np.concatenate([recorded["card_ids"], recurring["card_ids"]])
+    amounts = np.concatenate([recorded["amounts"], recurring["amounts"]])
+
+    # Compras no cartão saem do caixa no vencimento da fatura
+    on_card = card_ids > 0
+    invoices = []
+    if on_card.any():
+        closing_days, due_days = _card_terms(card_ids[on_card])
+        due = _invoice_due_dates(dates[on_card], closing_days, due_days)
+        dates = dates.copy()
+        dates[on_card] = due
+        keys, inverse = np.unique(np.stack([card_ids[on_card], due.astype(np.int64)]), axis=1, return_inverse=True)
+        totals = np.bincount(inverse.ravel(), weights=amounts[on_card], minlength=keys.shape[1])
+        invoices = [
+            {"credit_card_id": int(cid), "due_date": str(np.datetime64(int(d), "D")), "amount": float(-total)}
+            for (cid, d), total in zip(keys.T, totals)
+            if np.datetime64(int(d), "D") >= np.datetime64(today, "D")
+        ]
+
+    today64 = np.datetime64(today, "D")
+    n_days = int((np.datetime64(horizon_end, "D") - today64).astype(np.int64)) + 1
+    day_offsets = np.maximum((dates - today64).astype(np.int64), 0)
+    in_horizon = day_offsets < n_days
+    day_offsets, amounts = day_offsets[in_horizon], amounts[in_horizon]
+
+    inflow = np.bincount(day_offsets, weights=np.where(amounts > 0, amounts, 0.0), minlength=n_days)
+    outflow = np.bincount(day_offsets, weights=np.where(amounts < 0, -amounts, 0.0), minlength=n_days)
+    balance = start_balance + np.cumsum(inflow - outflow)
+    days = today64 + np.arange(n_days)
+
+    # Agregado por mês: fatias contíguas do vetor diário
+    month_of_day = days.astype("datetime64[M]")
+    month_starts = np.flatnonzero(np.r_[True, month_of_day[1:] != month_of_day[:-1]])
+    month_ends = np.r_[month_starts[1:], n_days] - 1
+    monthly = [
+        {
+            "month": str(month_of_day[s]),
+            "inflow": float(inc),
+            "outflow": float(out),
+            "end_balance": float(balance[e]),
+            "min_balance": float(low),
+        }
+        for s, e, inc, out, low in zip(
+            month_starts,
+            month_ends,
+            np.add.reduceat(inflow, month_starts),
+            np.add.reduceat(outflow, month_starts),
+            np.minimum.reduceat(balance, month_starts),
+        )
+    ]
+
+    low_idx = int(np.argmin(balance))
+    negative = np.flatnonzero(balance < 0)
+    elapsed = (datetime.utcnow() - started).total_seconds() * 1000
+    _dbg(f"[FORECAST] {recurring['rules']} regras, {len(amounts)} fluxos, {n_days} dias em {elapsed:.1f} ms")
+    return {
+        "start_date": today.isoformat(),
+        "end_date": horizon_end.isoformat(),
+        "booked_balance": float(booked),
+        "start_balance": float(start_balance),
+        "end_balance": float(balance[-1]),
+        "min_balance": {"date": str(days[low_idx]), "balance": float(balance[low_idx])},
+        "first_negative_date": str(days[negative[0]]) if len(negative) else None,
+        "dates": [str(d) for d in days],
+        "balance": np.round(balance, 2).tolist(),
+        "months": monthly,
+        "card_invoices": sorted(invoices, key=lambda i: (i["due_date"], i["credit_card_id"])),
+        "sources": {"recurring_rules": recurring["rules"], "scheduled_transactions": recorded["count"]},
+    }
@@ -0,0 +1,97 @@
+"""
+Funções utilitárias compartilhadas do módulo financeiro
+========================================================
+
+Helpers puros (datas, meses, normalização de texto e debug) usados tanto
+pela API quanto pelos serviços auxiliares (recorrências, etc.), e os dois
+helpers de histórico de atributos usados pelos listeners de sessão (rollups,
+faturas, contadores de mudança e cache de acesso).
+"""
+
+import calendar
+import re
+import unicodedata
+from datetime import date
+
+from sqlalchemy.orm import attributes
+
+_DEBUG = True
+
+
+def _normalize_str(s: str) -> str:
+    """Remove acentos e converte para minúsculas para comparação."""
+    if not s:
+        return ""
+    s = str(s).strip().lower()
+    # Remove acentos
+    s = "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+    return s
+
+
+def _dbg(msg: str):
+    if _DEBUG:
+        print(f"[DEBUG] {msg}")
+
+
+def _strip_installment_suffix(desc: str | None) -> str:
+    try:
+        s = str(desc or "").strip()
+        if not s:
+            return ""
+        return re.sub(r"\s*\(\s*\d+\s*/\s*\d+\s*\)\s*$", "", s).strip()
+    except Exception:
+        return str(desc or "").strip()
+
+
+_MERCHANT_KEY_MAX = 120
+
+
+def _merchant_key(desc: str | None) -> str | None:
+    """
+    Chave normalizada do estabelecimento: sem acentos, sem sufixo de parcela,
+    sem dígitos e pontuação, em minúsculas e com espaços simples.
+
+    Ex.: "Uber *Trip 1234 (2/10)" -> "uber trip". None se não sobrar nada.
+    """
+    s = _normalize_str(_strip_installment_suffix(desc))
+    s = " ".join(re.findall(r"[a-z]+", s))[:_MERCHANT_KEY_MAX].strip()
+    return s or None
+
+
+def _shift_month_simple(y: int, m: int, delta: int) -> tuple[int, int]:
+    total = (int(y) * 12) + (int(m) - 1) + int(delta)
+    ny = total // 12
+    nm = (total % 12) + 1
+    return int(ny), int(nm)
+
+
+def _month_index(y: int, m: int) -> int:
+    return (int(y) * 12) + (int(m) - 1)
+
+
+def _months_diff(y1: int, m1: int, y2: int, m2: int) -> int:
+    return _month_index(y2, m2) - _month_index(y1, m1)
+
+
+def _last_day_of_month(y: int, m: int) -> date:
+    last = calendar.monthrange(int(y), int(m))[1]
+    return date(int(y), int(m), int(last))
+
+
+def _first_day_of_month(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _history_values(obj, attr: str) -> list:
+    """Valor atual (carregado se expirado) e o anterior, se o atributo mudou."""
+    values = [getattr(obj, attr)]
+    values.extend(attributes.get_history(obj, attr).deleted or [])
+    return values
+
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+    """
+    Listener ``set`` (com ``active_history=True, retval=True``): carrega o valor
+    antigo mesmo com o atributo expirado (após commit), para ``_history_values``.
+    """
+    return value
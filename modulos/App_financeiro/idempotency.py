@@ -0,0 +1,177 @@
+"""
+Idempotência - ``Idempotency-Key`` nos POSTs que criam transações
+=================================================================
+
+Em conexão instável o app repete o POST de criação, importação de extrato ou
+upload de comprovante. Com o cabeçalho ``Idempotency-Key`` (um UUID gerado
+pelo app por ação do usuário) a repetição devolve a resposta gravada da
+primeira execução, sem passar de novo pelo caminho de criação:
+
+- a chave é por usuário e fica em ``finance_idempotency_keys`` com a
+  impressão digital do pedido (método, rota, query e corpo; no multipart,
+  campos e nome/tamanho dos arquivos) e, ao terminar, status e corpo JSON;
+- a primeira request reserva a chave (linha com ``status_code`` NULL, com
+  commit) antes de executar; uma repetição que chega durante a execução
+  recebe 409 (reservas abandonadas há mais de 10 minutos são liberadas), e a
+  mesma chave com outro pedido recebe 422;
+- só respostas 2xx são gravadas: erro libera a chave para a próxima tentativa;
+- a resposta repetida sai com ``Idempotent-Replayed: true``.
+
+As linhas expiram após ``FINANCE_IDEMPOTENCY_TTL_HOURS`` (padrão 24h): chaves
+expiradas valem como novas e ``flask finance-idempotency-purge`` as apaga.
+"""
+
+import hashlib
+import os
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, jsonify, request, session
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import IdempotencyKey
+
+from .helpers import _dbg
+
+_TTL = timedelta(hours=int(os.getenv("FINANCE_IDEMPOTENCY_TTL_HOURS", "24")))
+_HEADER = "Idempotency-Key"
+_MAX_KEY_LENGTH = 128
+# Reserva sem resposta há mais tempo que isso: a request morreu no meio, a chave é liberada
+_CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def _cors_wrap(resp, origin: str):
+    resp.headers["Access-Control-Allow-Origin"] = origin
+    resp.headers["Vary"] = "Origin"
+    resp.headers["Access-Control-Allow-Credentials"] = "true"
+    return resp
+
+
+def _error(message: str, status: int):
+    resp = jsonify({"success": False, "message": message})
+    return _cors_wrap(resp, request.headers.get("Origin", "*")), status
+
+
+def _request_user_id() -> int | None:
+    """Usuário do pedido (sessão, query, corpo JSON ou formulário), como nas rotas da API."""
+    user_id = session.get("finance_user_id") or request.args.get("user_id")
+    if user_id is None and request.is_json:
+        data = request.get_json(silent=True)
+        user_id = data.get("user_id") if isinstance(data, dict) else None
+    if user_id is None and request.mimetype == "multipart/form-data":
+        user_id = request.form.get("user_id")
+    try:
+        return int(user_id) if user_id is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _request_fingerprint() -> str:
+    """SHA-256 de método, rota, query e corpo (no multipart, campos e nome/tamanho dos arquivos)."""
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.path}?{request.query_string.decode('latin-1')}\n".encode())
+    if request.mimetype == "multipart/form-data":
+        # Não lê o conteúdo dos arquivos: a view consome o stream depois
+        for name, value in sorted(request.form.items(multi=True)):
+            digest.update(f"{name}={value}\n".encode())
+        for name, upload in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+            stream = upload.stream
+            position = stream.tell()
+            size = stream.seek(0, os.SEEK_END)
+            stream.seek(position)
+            digest.update(f"{name}:{upload.filename}:{size}\n".encode())
+    else:
+        digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def _claim_key(user_id: int, key: str, fingerprint: str):
+    """
+    Reserva a chave para este pedido.
+
+    Retorna ``(entry_id, None)`` quando este pedido deve executar, ou
+    ``(None, resposta)`` para repetição (resposta gravada) e conflito (409/422).
+    """
+    now = datetime.utcnow()
+    entry = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+    if entry and (entry.expires_at <= now or (entry.status_code is None and entry.created_at <= now - _CLAIM_TIMEOUT)):
+        db.session.delete(entry)
+        db.session.flush()
+        entry = None
+
+    if entry:
+        if entry.fingerprint != fingerprint:
+            return None, _error("Idempotency-Key já usada em outra requisição", 422)
+        if entry.status_code is None:
+            return None, _error("Requisição com esta Idempotency-Key em andamento", 409)
+        resp = current_app.response_class(entry.response_body, status=entry.status_code, mimetype="application/json")
+        resp.headers["Idempotent-Replayed"] = "true"
+        _dbg(f"[IDEMPOTENCY] Resposta repetida user={user_id} key={key}")
+        return None, _cors_wrap(resp, request.headers.get("Origin", "*"))
+
+    entry = IdempotencyKey(user_id=user_id, key=key, fingerprint=fingerprint, created_at=now, expires_at=now + _TTL)
+    db.session.add(entry)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Outra request com a mesma chave reservou primeiro
+        db.session.rollback()
+        return None, _error("Requisição com esta Idempotency-Key em andamento", 409)
+    return entry.id, None
+
+
+def _finish_key(entry_id: int, resp) -> None:
+    """Grava a resposta 2xx da chave reservada; outras respostas liberam a chave."""
+    query = IdempotencyKey.query.filter_by(id=entry_id)
+    if 200 <= resp.status_code < 300 and not resp.is_streamed:
+        query.update(
+            {"status_code": resp.status_code, "response_body": resp.get_data(as_text=True)},
+            synchronize_session=False,
+        )
+    else:
+        query.delete(synchronize_session=False)
+    db.session.commit()
+
+
+def _idempotent(view):
+    """Decorator das rotas de criação: honra ``Idempotency-Key`` nos POSTs."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.headers.get(_HEADER) or "").strip()
+        if request.method != "POST" or not key:
+            return view(*args, **kwargs)
+        if len(key) > _MAX_KEY_LENGTH:
+            return _error(f"Idempotency-Key maior que {_MAX_KEY_LENGTH} caracteres", 400)
+        user_id = _request_user_id()
+        if not user_id:
+            return view(*args, **kwargs)
+
+        entry_id, replay = _claim_key(user_id, key, _request_fingerprint())
+        if replay is not None:
+            return replay
+
+        try:
+            resp = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            _finish_key(entry_id, current_app.response_class(status=500))
+            raise
+        try:
+            _finish_key(entry_id, resp)
+        except Exception as e:
+            # A resposta já foi produzida: sem gravar, a próxima repetição executa de novo
+            db.session.rollback()
+            _dbg(f"[IDEMPOTENCY] Falha ao gravar resposta user={user_id} key={key}: {e}")
+        return resp
+
+    return wrapper
+
+
+def _purge_idempotency_keys() -> int:
+    """Apaga chaves expiradas. Retorna quantas foram removidas."""
+    removed = IdempotencyKey.query.filter(
+        IdempotencyKey.expires_at < datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return int(removed or 0)
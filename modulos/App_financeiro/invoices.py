@@ -0,0 +1,331 @@
+"""
+Faturas de Cartão - Ciclos e totais em ``credit_card_invoices``
+===============================================================
+
+Cada transação com ``credit_card_id`` pertence a um ciclo de fatura, definido
+pelo ``closing_day`` do cartão: compras até a véspera do fechamento entram na
+fatura daquele mês; a partir do dia do fechamento, na do mês seguinte. Sem
+``closing_day`` o ciclo é o mês civil. O vencimento cai no mesmo mês do
+fechamento quando ``due_day > closing_day``, senão no mês seguinte.
+
+Os totais por ciclo (despesas - estornos, pago, nº de transações) ficam em
+``CreditCardInvoice`` e são mantidos como os rollups mensais:
+
+- ``before_flush`` anota (cartão, data) das transações inseridas/alteradas/
+  excluídas via ORM (valores antigos e novos);
+- caminhos em lote chamam ``_mark_invoices_dirty`` (``_mark_rollups_for_query``
+  já faz isso para UPDATE/DELETE em lote);
+- mudar ``closing_day``/``due_day`` do cartão reconstrói as faturas dele;
+- ``before_commit`` recalcula só os ciclos anotados, cada um pelo índice
+  (credit_card_id, transaction_date), com a linha da fatura travada antes da
+  soma (compras concorrentes no mesmo ciclo não se sobrescrevem).
+
+A utilização do limite soma o saldo em aberto das faturas do cartão (poucas
+linhas), sem varrer o histórico de transações.
+
+Manutenção: ``flask finance-invoices rebuild``.
+"""
+
+import calendar
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, case, event, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, attributes
+
+from extensions import db
+from models import CreditCard, CreditCardInvoice, Transaction
+
+from .helpers import _dbg, _history_values, _keep_previous_value
+
+_SESSION_KEY = "finance_invoice_marks"
+_REBUILD_KEY = "finance_invoice_rebuild"
+
+
+# ---------------------------------------------------------------------------
+# Ciclos
+# ---------------------------------------------------------------------------
+
+def _add_months(d: date, months: int) -> date:
+    idx = d.year * 12 + (d.month - 1) + months
+    return date(idx // 12, idx % 12 + 1, 1)
+
+
+def _day_in_month(year: int, month: int, day: int) -> date:
+    return date(year, month, min(max(int(day), 1), calendar.monthrange(year, month)[1]))
+
+
+def _closing_date(closing_day, reference_month: date) -> date:
+    """Dia em que fecha a fatura do mês (compras a partir dele vão para a próxima)."""
+    if not closing_day:
+        return _add_months(reference_month, 1)
+    return _day_in_month(reference_month.year, reference_month.month, closing_day)
+
+
+def _invoice_month(closing_day, d: date) -> date:
+    """Mês de referência (primeiro dia) da fatura em que cai uma compra na data ``d``."""
+    month = date(d.year, d.month, 1)
+    return month if d < _closing_date(closing_day, month) else _add_months(month, 1)
+
+
+def _cycle_bounds(closing_day, reference_month: date) -> tuple[date, date]:
+    """``(início, fim_exclusivo)`` das compras da fatura do mês."""
+    return _closing_date(closing_day, _add_months(reference_month, -1)), _closing_date(closing_day, reference_month)
+
+
+def _due_date(closing_day, due_day, reference_month: date):
+    if not due_day:
+        return None
+    if closing_day and int(due_day) > int(closing_day):
+        return _day_in_month(reference_month.year, reference_month.month, due_day)
+    nxt = _add_months(reference_month, 1)
+    return _day_in_month(nxt.year, nxt.month, due_day)
+
+
+# ---------------------------------------------------------------------------
+# Coleta dos ciclos afetados
+# ---------------------------------------------------------------------------
+
+def _mark_invoices_dirty(marks, session=None) -> None:
+    """Anota pares (credit_card_id, data da transação) para recálculo no próximo commit."""
+    session = session or db.session
+    marks = {(int(cid), d) for cid, d in marks if cid and d}
+    if marks:
+        session.info.setdefault(_SESSION_KEY, set()).update(marks)
+
+
+# Valor antigo do cartão carregado mesmo com o atributo expirado (ver rollups)
+event.listen(Transaction.credit_card_id, "set", _keep_previous_value, active_history=True, retval=True)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_invoice_marks(session, flush_context, instances):
+    marks = set()
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, Transaction) and obj.credit_card_id:
+            marks.add((obj.credit_card_id, obj.transaction_date))
+
+    for obj in session.dirty:
+        if isinstance(obj, CreditCard):
+            if any(attributes.get_history(obj, a).has_changes() for a in ("closing_day", "due_day")) and obj.id:
+                session.info.setdefault(_REBUILD_KEY, set()).add(int(obj.id))
+            continue
+        if not isinstance(obj, Transaction) or not session.is_modified(obj):
+            continue
+        for cid in _history_values(obj, "credit_card_id"):
+            for d in _history_values(obj, "transaction_date"):
+                marks.add((cid, d))
+
+    if marks:
+        _mark_invoices_dirty(marks, session)
+
+
+@event.listens_for(CreditCard, "before_delete")
+def _delete_card_invoices(mapper, connection, target):
+    # Anotações pendentes do cartão são ignoradas no recálculo (cartão não existe mais)
+    connection.execute(
+        CreditCardInvoice.__table__.delete().where(CreditCardInvoice.__table__.c.credit_card_id == target.id)
+    )
+
+
+@event.listens_for(Session, "before_commit")
+def _refresh_invoices_before_commit(session):
+    if not session.info.get(_SESSION_KEY) and not session.info.get(_REBUILD_KEY) \
+            and not session.new and not session.dirty and not session.deleted:
+        return
+    session.flush()
+    marks = session.info.pop(_SESSION_KEY, None) or set()
+    rebuild = session.info.pop(_REBUILD_KEY, None) or set()
+    if marks or rebuild:
+        _refresh_invoices(session, marks, rebuild)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_invoice_marks(session):
+    session.info.pop(_SESSION_KEY, None)
+    session.info.pop(_REBUILD_KEY, None)
+
+
+# ---------------------------------------------------------------------------
+# Recalculo
+# ---------------------------------------------------------------------------
+
+def _cycle_totals(session, card_id: int, start: date, end: date):
+    """``(total, pago, nº)`` das transações do cartão em [start, end)."""
+    signed = case((Transaction.type == "income", -Transaction.amount), else_=Transaction.amount)
+    return session.execute(
+        select(
+            func.coalesce(func.sum(signed), 0),
+            func.coalesce(func.sum(case((Transaction.is_paid.is_(True), signed), else_=0)), 0),
+            func.count(Transaction.id),
+        ).where(
+            Transaction.credit_card_id == int(card_id),
+            Transaction.transaction_date >= start,
+            Transaction.transaction_date < end,
+        )
+    ).one()
+
+
+def _insert_missing_invoices(session, rows: list) -> None:
+    """Cria (zeradas) as faturas que ainda não existem; conflito em (cartão, mês) é ignorado."""
+    if not rows:
+        return
+    table = CreditCardInvoice.__table__
+    for row in rows:
+        row.update(total=0, paid_total=0, transaction_count=0)
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        session.execute(pg_insert(table).on_conflict_do_nothing(), rows)
+    elif dialect == "sqlite":
+        session.execute(sqlite_insert(table).on_conflict_do_nothing(), rows)
+    else:
+        for row in rows:
+            where = and_(table.c.credit_card_id == row["credit_card_id"], table.c.reference_month == row["reference_month"])
+            if session.execute(select(table.c.id).where(where)).first() is None:
+                session.execute(table.insert().values(**row))
+
+
+def _refresh_invoices(session, marks, rebuild_cards=()) -> int:
+    """Recalcula as faturas dos ciclos anotados (e todas as dos cartões em ``rebuild_cards``)."""
+    table = CreditCardInvoice.__table__
+    card_ids = {cid for cid, _ in marks} | {int(c) for c in rebuild_cards}
+    if not card_ids:
+        return 0
+    cards = {
+        int(cid): (closing_day, due_day)
+        for cid, closing_day, due_day in session.execute(
+            select(CreditCard.id, CreditCard.closing_day, CreditCard.due_day).where(CreditCard.id.in_(card_ids))
+        )
+    }
+
+    keys = set()
+    for cid, d in marks:
+        if cid in cards:
+            keys.add((cid, _invoice_month(cards[cid][0], d)))
+    for cid in rebuild_cards:
+        if cid not in cards:
+            continue
+        session.execute(table.delete().where(table.c.credit_card_id == int(cid)))
+        dates = session.execute(
+            select(Transaction.transaction_date).where(Transaction.credit_card_id == int(cid)).distinct()
+        ).scalars()
+        keys.update((int(cid), _invoice_month(cards[cid][0], d)) for d in dates if d)
+
+    now = datetime.utcnow()
+    # Ordem fixa das travas entre sessões concorrentes (evita deadlock)
+    keys = sorted(keys)
+    cycles = {}
+    for cid, month in keys:
+        closing_day, due_day = cards[cid]
+        start, end = _cycle_bounds(closing_day, month)
+        cycles[(cid, month)] = (start, end, {
+            "period_start": start,
+            "period_end": end - timedelta(days=1),
+            "due_date": _due_date(closing_day, due_day, month),
+        })
+    _insert_missing_invoices(session, [
+        {"credit_card_id": cid, "reference_month": month, "updated_at": now, **cycles[(cid, month)][2]}
+        for cid, month in keys
+    ])
+
+    for cid, month in keys:
+        start, end, values = cycles[(cid, month)]
+        where = and_(table.c.credit_card_id == cid, table.c.reference_month == month)
+        # Trava a fatura antes de somar: outra compra concorrente no ciclo espera
+        # este commit e soma de novo, em vez de sobrescrever o total
+        session.execute(select(table.c.id).where(where).with_for_update()).all()
+        total, paid, count = _cycle_totals(session, cid, start, end)
+        if not count:
+            session.execute(table.delete().where(where))
+            continue
+        session.execute(table.update().where(where).values(
+            total=total or 0,
+            paid_total=paid or 0,
+            transaction_count=int(count),
+            updated_at=now,
+            **values,
+        ))
+
+    _dbg(f"[INVOICES] {len(keys)} faturas recalculadas")
+    return len(keys)
+
+
+def _rebuild_all_invoices() -> dict:
+    card_ids = [int(cid) for (cid,) in db.session.query(CreditCard.id).all()]
+    count = _refresh_invoices(db.session, set(), card_ids)
+    db.session.commit()
+    return {"cards": len(card_ids), "invoices": count}
+
+
+# ---------------------------------------------------------------------------
+# Leitura
+# ---------------------------------------------------------------------------
+
+def _invoice_payload(card: CreditCard, reference_month: date, today: date, row=None) -> dict:
+    """Fatura do mês (da linha gravada ou, se não houver, calculada pelo ciclo)."""
+    start, end = _cycle_bounds(card.closing_day, reference_month)
+    if row is None:
+        total, paid, count = _cycle_totals(db.session, card.id, start, end)
+    else:
+        total, paid, count = row.total, row.paid_total, row.transaction_count
+    total, paid = float(total or 0), float(paid or 0)
+    closing = _closing_date(card.closing_day, reference_month)
+    if today >= closing:
+        status = "closed"
+    elif today >= start:
+        status = "open"
+    else:
+        status = "future"
+    due = _due_date(card.closing_day, card.due_day, reference_month)
+    return {
+        "reference_month": f"{reference_month.year:04d}-{reference_month.month:02d}",
+        "period_start": start.isoformat(),
+        "period_end": (end - timedelta(days=1)).isoformat(),
+        "closing_date": closing.isoformat(),
+        "due_date": due.isoformat() if due else None,
+        "status": status,
+        "total": total,
+        "paid_total": paid,
+        "open_total": total - paid,
+        "transaction_count": int(count or 0),
+    }
+
+
+def _card_utilization(card: CreditCard) -> dict:
+    """Saldo em aberto de todas as faturas do cartão contra o limite."""
+    open_amount = db.session.query(
+        func.coalesce(func.sum(CreditCardInvoice.total - CreditCardInvoice.paid_total), 0)
+    ).filter(
+        CreditCardInvoice.credit_card_id == card.id,
+        CreditCardInvoice.total > CreditCardInvoice.paid_total,
+    ).scalar()
+    used = float(open_amount or 0)
+    limit = float(card.limit or 0)
+    return {
+        "limit": limit,
+        "used": used,
+        "available": limit - used if limit else None,
+        "percent": round(used / limit * 100, 2) if limit else None,
+    }
+
+
+def _card_invoice_summary(card: CreditCard, reference_month: date | None = None, history: int = 12, today: date | None = None) -> dict:
+    """Fatura pedida (padrão: a do ciclo de hoje), histórico recente e utilização do limite."""
+    today = today or datetime.utcnow().date()
+    reference_month = reference_month or _invoice_month(card.closing_day, today)
+    rows = (
+        CreditCardInvoice.query.filter(CreditCardInvoice.credit_card_id == card.id)
+        .order_by(CreditCardInvoice.reference_month.desc())
+        .limit(int(history))
+        .all()
+    )
+    by_month = {r.reference_month: r for r in rows}
+    selected = by_month.get(reference_month) or CreditCardInvoice.query.filter_by(
+        credit_card_id=card.id, reference_month=reference_month
+    ).first()
+    return {
+        "invoice": _invoice_payload(card, reference_month, today, selected),
+        "history": [_invoice_payload(card, r.reference_month, today, r) for r in rows],
+        "utilization": _card_utilization(card),
+    }
@@ -0,0 +1,150 @@
+"""
+Cliente LLM - Conexões reaproveitadas, concorrência limitada e streaming
+========================================================================
+
+Cliente único para a API de chat compatível com OpenAI (Groq por padrão)
+usada por ``/api/suggest-category`` e ``/api/finance-ai``:
+
+- uma ``requests.Session`` por processo com pool de conexões keep-alive
+  (sem novo handshake TLS a cada chamada);
+- no máximo ``LLM_MAX_CONCURRENCY`` chamadas simultâneas por processo; quem
+  não consegue vaga em ``LLM_QUEUE_TIMEOUT`` segundos recebe ``LLMError``
+  em vez de prender o worker;
+- timeouts separados de conexão (``LLM_CONNECT_TIMEOUT``) e de leitura;
+- ``_stream_chat_completion`` lê a resposta em SSE (``stream: true``),
+  sempre como UTF-8, e devolve os pedaços de texto conforme chegam
+  (``python check_llm_stream.py`` confere contra um servidor falso).
+
+``LLM_BASE_URL`` (padrão ``https://api.groq.com/openai/v1``) permite apontar
+para um servidor falso local nos testes; a chave vem de ``LLM_API_KEY`` ou
+``GROQ_API_KEY``.
+"""
+
+import json
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .helpers import _dbg
+
+_DEFAULT_BASE_URL = "https://api.groq.com/openai/v1"
+_DEFAULT_MODEL = "llama-3.3-70b-versatile"
+_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "5"))
+_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "3"))
+
+_slots = threading.BoundedSemaphore(_MAX_CONCURRENCY)
+_session_lock = threading.Lock()
+_session = None
+
+
+class LLMError(Exception):
+    """Falha ao consultar o LLM (não configurado, ocupado, HTTP != 200, resposta inválida)."""
+
+
+def _api_key() -> str:
+    return (os.getenv("LLM_API_KEY") or os.getenv("GROQ_API_KEY") or "").strip()
+
+
+def _llm_configured() -> bool:
+    return bool(_api_key())
+
+
+def _llm_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=_MAX_CONCURRENCY, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _post_completion(payload: dict, read_timeout: float, stream: bool = False):
+    api_key = _api_key()
+    if not api_key:
+        raise LLMError("IA não configurada (GROQ_API_KEY ausente).")
+    base_url = (os.getenv("LLM_BASE_URL") or _DEFAULT_BASE_URL).rstrip("/")
+    payload = dict(payload, model=payload.get("model") or os.getenv("LLM_MODEL") or _DEFAULT_MODEL, stream=stream)
+    try:
+        response = _llm_session().post(
+            f"{base_url}/chat/completions",
+            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+            json=payload,
+            timeout=(_CONNECT_TIMEOUT, read_timeout),
+            stream=stream,
+        )
+    except requests.RequestException as e:
+        raise LLMError(f"Falha de conexão com o LLM: {e}") from e
+    if response.status_code != 200:
+        body = response.text[:500]
+        response.close()
+        raise LLMError(f"LLM respondeu {response.status_code}: {body}")
+    return response
+
+
+def _acquire_slot() -> None:
+    if not _slots.acquire(timeout=_QUEUE_TIMEOUT):
+        raise LLMError("LLM ocupado, tente novamente.")
+
+
+def _chat_completion(messages: list, temperature: float = 0.2, max_tokens: int = 250, timeout: float = 12) -> str:
+    """Completion inteira (sem streaming). Retorna o texto da primeira escolha."""
+    _acquire_slot()
+    try:
+        response = _post_completion(
+            {"messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+            read_timeout=timeout,
+        )
+        try:
+            result = response.json() or {}
+        except ValueError as e:
+            raise LLMError("Resposta do LLM não é JSON") from e
+        return ((result.get("choices") or [{}])[0].get("message", {}).get("content", "") or "").strip()
+    finally:
+        _slots.release()
+
+
+def _stream_chat_completion(messages: list, temperature: float = 0.2, max_tokens: int = 250, timeout: float = 12):
+    """
+    Gera os pedaços de texto da completion conforme chegam (SSE ``data: {...}``).
+
+    ``timeout`` vale entre dois pedaços, não para a resposta inteira. A vaga de
+    concorrência fica presa até o gerador terminar ou ser fechado.
+    """
+    _acquire_slot()
+    response = None
+    try:
+        response = _post_completion(
+            {"messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+            read_timeout=timeout,
+            stream=True,
+        )
+        # SSE é sempre UTF-8; sem charset no Content-Type o requests decodificaria
+        # como ISO-8859-1 ("Você" vira "VocÃª"), então a linha é decodificada aqui
+        for raw in response.iter_lines():
+            line = raw.decode("utf-8", errors="replace")
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except ValueError:
+                _dbg(f"[LLM] Linha SSE inválida: {data[:200]}")
+                continue
+            delta = ((chunk.get("choices") or [{}])[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+    except requests.RequestException as e:
+        raise LLMError(f"Falha no streaming do LLM: {e}") from e
+    finally:
+        if response is not None:
+            response.close()
+        _slots.release()
@@ -0,0 +1,114 @@
+"""
+Chave do Estabelecimento - ``transactions.merchant_key``
+========================================================
+
+``merchant_key`` guarda a descrição normalizada por ``_merchant_key`` (sem
+acentos, dígitos, pontuação e sufixo de parcela). É mantida por evento de
+mapper nas gravações via ORM; os INSERTs em lote (ocorrências recorrentes)
+preenchem a coluna na própria linha.
+
+Com o índice (user_id, merchant_key) as buscas por histórico viram igualdade
+ou prefixo em vez de ``LIKE '%...%'`` sobre a descrição:
+
+- ``_history_category``: última categoria usada para o mesmo estabelecimento;
+- ``_find_duplicate_transaction``: mesma chave, valor e data;
+- ``_autocomplete_merchants``: descrições já usadas que começam com o texto.
+"""
+
+from decimal import Decimal
+
+from sqlalchemy import event, func
+
+from extensions import db
+from models import Transaction
+
+from .helpers import _merchant_key, _strip_installment_suffix
+
+
+@event.listens_for(Transaction, "before_insert")
+@event.listens_for(Transaction, "before_update")
+def _sync_merchant_key(mapper, connection, target):
+    """Recalcula a chave a partir da descrição nas gravações via ORM."""
+    target.merchant_key = _merchant_key(target.description)
+
+
+def _history_category(user_id: int, tx_type: str, description: str, allowed_ids):
+    """``(category_id, subcategory_text)`` da última transação do mesmo estabelecimento, ou None."""
+    key = _merchant_key(description)
+    if not key or not allowed_ids:
+        return None
+    row = (
+        db.session.query(Transaction.category_id, Transaction.subcategory_text)
+        .filter(
+            Transaction.user_id == int(user_id),
+            Transaction.merchant_key == key,
+            Transaction.type == tx_type,
+            Transaction.category_id.in_([int(c) for c in allowed_ids]),
+        )
+        .order_by(Transaction.id.desc())
+        .first()
+    )
+    return (int(row[0]), row[1]) if row else None
+
+
+def _find_duplicate_transaction(user_id: int, workspace_id, description: str, amount, transaction_date, exclude_id=None):
+    """Id de uma transação já gravada com o mesmo estabelecimento, valor e data (ou None)."""
+    key = _merchant_key(description)
+    if not key or amount is None or not transaction_date:
+        return None
+    query = db.session.query(Transaction.id).filter(
+        Transaction.user_id == int(user_id),
+        Transaction.merchant_key == key,
+        Transaction.transaction_date == transaction_date,
+        Transaction.amount == Decimal(str(amount)),
+    )
+    if workspace_id:
+        query = query.filter(Transaction.workspace_id == int(workspace_id))
+    else:
+        query = query.filter(Transaction.workspace_id.is_(None))
+    if exclude_id:
+        query = query.filter(Transaction.id != int(exclude_id))
+    row = query.order_by(Transaction.id.asc()).first()
+    return int(row[0]) if row else None
+
+
+def _autocomplete_merchants(user_id: int, prefix: str, tx_type: str = "", limit: int = 10) -> list:
+    """
+    Estabelecimentos já usados pelo usuário cuja chave começa com ``prefix``.
+
+    Retorna ``[{"merchant_key", "description", "category_id", "count"}]``, mais usados
+    primeiro; descrição e categoria são as da transação mais recente.
+    """
+    key = _merchant_key(prefix)
+    if not key:
+        return []
+    filters = [Transaction.user_id == int(user_id), Transaction.merchant_key.like(f"{key}%")]
+    if tx_type in ("income", "expense"):
+        filters.append(Transaction.type == tx_type)
+
+    groups = (
+        db.session.query(Transaction.merchant_key, func.count(Transaction.id), func.max(Transaction.id))
+        .filter(*filters)
+        .group_by(Transaction.merchant_key)
+        .order_by(func.count(Transaction.id).desc(), Transaction.merchant_key.asc())
+        .limit(int(limit))
+        .all()
+    )
+    if not groups:
+        return []
+    latest = {
+        int(tx_id): (desc, cat_id)
+        for tx_id, desc, cat_id in db.session.query(
+            Transaction.id, Transaction.description, Transaction.category_id
+        ).filter(Transaction.id.in_([int(g[2]) for g in groups])).all()
+    }
+    items = []
+    for key_value, count, last_id in groups:
+        desc, cat_id = latest.get(int(last_id), (None, None))
+        items.append({
+            "merchant_key": key_value,
+            "description": _strip_installment_suffix(desc) if desc else desc,
+            "category_id": cat_id,
+            "count": int(count),
+        })
+    return items
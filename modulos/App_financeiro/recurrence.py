@@ -0,0 +1,203 @@
+"""
+Recorrência - Expansão vetorizada das regras em ocorrências
+===========================================================
+
+Uma regra (``RecurringTransaction``) gera uma progressão aritmética:
+
+- regras por mês (``monthly``, ``yearly``): a cada ``interval`` meses (12 no
+  anual), no ``day_of_month`` (limitado ao último dia do mês), a partir do mês
+  de ``start_date`` e até o mês de ``end_date``;
+- regras por dia (``daily``, ``weekly``, ``biweekly``): a cada ``interval``
+  dias/semanas/quinzenas, a partir de ``start_date`` (semanais e quinzenais
+  ancoradas no ``day_of_week``, se informado) e até ``end_date``.
+
+``_expand_occurrences`` expande todas as regras de uma vez em arrays NumPy:
+conta quantos passos de cada regra caem na janela, faz ``np.repeat`` das
+posições e converte as unidades (mês ou dia desde 1970) em ``datetime64``.
+Exceções (``exception_dates``) e ocorrências a ignorar saem num único
+``np.isin``. Materialização, projeção da listagem e previsão de caixa usam o
+mesmo expansor.
+
+Chave da ocorrência (``Transaction.occurrence_month`` e ``generated_through``):
+o 1º dia do mês nas regras por mês - compatível com as ocorrências mensais já
+gravadas - e a própria data nas regras por dia.
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+
+from .helpers import _first_day_of_month, _month_index
+
+_FREQUENCY_MONTHS = {"monthly": 1, "yearly": 12}
+_FREQUENCY_DAYS = {"daily": 1, "weekly": 7, "biweekly": 14}
+_FREQUENCIES = tuple(_FREQUENCY_MONTHS) + tuple(_FREQUENCY_DAYS)
+
+_EPOCH = date(1970, 1, 1)
+_EPOCH_MONTH = 1970 * 12
+# Sem end_date: limite acima de qualquer janela
+_NO_END = np.iinfo(np.int64).max // 4
+# Combina (posição da regra, chave em dias) num inteiro para o np.isin
+_KEY_SPAN = 1_000_000
+
+
+def _is_day_based(frequency: str | None) -> bool:
+    return (frequency or "monthly") in _FREQUENCY_DAYS
+
+
+def _rule_interval(rule) -> int:
+    try:
+        return max(1, int(getattr(rule, "interval", None) or 1))
+    except (TypeError, ValueError):
+        return 1
+
+
+def _occurrence_key(frequency: str | None, d: date) -> date:
+    """Chave da ocorrência que cai em ``d`` (1º dia do mês ou a própria data)."""
+    return d if _is_day_based(frequency) else _first_day_of_month(d)
+
+
+def _watermark_before(rule, d: date) -> date:
+    """Watermark que deixa pendentes as ocorrências a partir de ``d`` (inclusive)."""
+    if _is_day_based(rule.frequency):
+        return d - timedelta(days=1)
+    return _first_day_of_month(_first_day_of_month(d) - timedelta(days=1))
+
+
+def _month_unit(d: date) -> int:
+    return _month_index(d.year, d.month) - _EPOCH_MONTH
+
+
+def _day_unit(d: date) -> int:
+    return (d - _EPOCH).days
+
+
+def _unit(rule, d: date) -> int:
+    return _day_unit(d) if _is_day_based(rule.frequency) else _month_unit(d)
+
+
+def _rule_step(rule) -> int:
+    """Passo da série, na unidade da regra (dias ou meses)."""
+    return (_FREQUENCY_DAYS.get(rule.frequency) or _FREQUENCY_MONTHS.get(rule.frequency, 1)) * _rule_interval(rule)
+
+
+def _rule_anchor(rule) -> int:
+    """Primeira ocorrência da série, na unidade da regra."""
+    start = rule.start_date
+    if rule.frequency in ("weekly", "biweekly") and rule.day_of_week is not None:
+        start = start + timedelta(days=(int(rule.day_of_week) - start.weekday()) % 7)
+    return _unit(rule, start)
+
+
+def _rule_terms(rules: list) -> dict:
+    """Arrays (uma posição por regra) com âncora, passo, fim e dia do mês."""
+    return {
+        "by_day": np.array([_is_day_based(r.frequency) for r in rules], dtype=bool),
+        "anchor": np.array([_rule_anchor(r) for r in rules], dtype=np.int64),
+        "step": np.array([_rule_step(r) for r in rules], dtype=np.int64),
+        "end": np.array([_unit(r, r.end_date) if r.end_date else _NO_END for r in rules], dtype=np.int64),
+        "day": np.array([int(r.day_of_month or r.start_date.day) for r in rules], dtype=np.int64),
+    }
+
+
+def _day_in_months(months: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """Dia ``days`` de cada mês (``datetime64[M]``), limitado ao último dia, como ``datetime64[D]``."""
+    first = months.astype("datetime64[D]")
+    lengths = ((months + 1).astype("datetime64[D]") - first).astype(np.int64)
+    return first + (np.minimum(np.maximum(days, 1), lengths) - 1)
+
+
+def _exception_keys(rule) -> set[date]:
+    """Ocorrências excluídas da série (``exception_dates``), como chaves."""
+    keys = set()
+    for raw in rule.exception_dates or []:
+        try:
+            d = date.fromisoformat(str(raw)[:10])
+        except ValueError:
+            continue
+        keys.add(_occurrence_key(rule.frequency, d))
+    return keys
+
+
+def _series_length(rule) -> int | None:
+    """Total de ocorrências da série (``None`` sem ``end_date``), para o sufixo de parcela."""
+    if not rule.end_date:
+        return None
+    return max(0, _occurrence_seq(rule, rule.end_date))
+
+
+def _occurrence_seq(rule, d: date) -> int:
+    """Número (a partir de 1) da ocorrência da série que cai em ``d``."""
+    return (_unit(rule, d) - _rule_anchor(rule)) // _rule_step(rule) + 1
+
+
+def _expand_occurrences(rules: list, until: date, after: list | None = None, skip=None,
+                        include_skipped: bool = False) -> dict:
+    """
+    Ocorrências de todas as ``rules`` com data até ``until``, numa passada vetorizada.
+
+    - ``after``: por regra, chave a partir da qual gerar (exclusiva), em geral o
+      watermark; ``None`` (ou ``None`` na posição) gera desde o início;
+    - ``skip``: pares ``(rule_id, chave)`` a ignorar (ex.: já gravados);
+    - ``include_skipped``: mantém as datas de ``exception_dates``.
+
+    Retorna arrays paralelos: ``rule_pos`` (posição em ``rules``), ``dates`` e
+    ``keys`` (``datetime64[D]``), ``seq`` (número da ocorrência na série, a
+    partir de 1) e, por regra, ``totals`` (tamanho da série, 0 sem fim).
+    """
+    empty = {
+        "rule_pos": np.array([], dtype=np.int64),
+        "dates": np.array([], dtype="datetime64[D]"),
+        "keys": np.array([], dtype="datetime64[D]"),
+        "seq": np.array([], dtype=np.int64),
+        "totals": np.zeros(len(rules), dtype=np.int64),
+    }
+    if not rules:
+        return empty
+
+    terms = _rule_terms(rules)
+    by_day, anchor, step, end = terms["by_day"], terms["anchor"], terms["step"], terms["end"]
+    after = after or [None] * len(rules)
+    lower = np.array([
+        _unit(r, a) if a is not None else _rule_anchor(r) - 1 for r, a in zip(rules, after)
+    ], dtype=np.int64)
+    upper = np.minimum(np.where(by_day, _day_unit(until), _month_unit(until)), end)
+
+    # Passos k com lower < anchor + k*step <= upper
+    first = np.maximum(0, np.floor_divide(lower - anchor, step) + 1)
+    last = np.floor_divide(upper - anchor, step)
+    counts = np.clip(last - first + 1, 0, None)
+    totals = np.where(end < _NO_END, np.floor_divide(end - anchor, step) + 1, 0)
+    if not counts.sum():
+        return {**empty, "totals": totals}
+
+    rule_pos = np.repeat(np.arange(len(rules)), counts)
+    k = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    units = anchor[rule_pos] + k * step[rule_pos]
+
+    occ_by_day = by_day[rule_pos]
+    dates = np.empty(len(units), dtype="datetime64[D]")
+    keys = np.empty(len(units), dtype="datetime64[D]")
+    day_units = units[occ_by_day].astype("datetime64[D]")
+    dates[occ_by_day] = keys[occ_by_day] = day_units
+    month_units = units[~occ_by_day].astype("datetime64[M]")
+    dates[~occ_by_day] = _day_in_months(month_units, terms["day"][rule_pos[~occ_by_day]])
+    keys[~occ_by_day] = month_units.astype("datetime64[D]")
+
+    excluded = []
+    positions = {int(r.id): pos for pos, r in enumerate(rules)}
+    if not include_skipped:
+        excluded += [(pos, key) for pos, r in enumerate(rules) for key in _exception_keys(r)]
+    excluded += [(positions[int(rid)], key) for rid, key in (skip or ()) if int(rid) in positions]
+    keep = dates <= np.datetime64(until, "D")
+    if excluded:
+        codes = np.array([pos * _KEY_SPAN + _day_unit(key) for pos, key in excluded], dtype=np.int64)
+        keep &= ~np.isin(rule_pos * _KEY_SPAN + keys.astype(np.int64), codes)
+
+    return {
+        "rule_pos": rule_pos[keep],
+        "dates": dates[keep],
+        "keys": keys[keep],
+        "seq": (k + 1)[keep],
+        "totals": totals,
+    }
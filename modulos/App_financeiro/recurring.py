@@ -0,0 +1,679 @@
+"""
+Recorrências - Materialização de Transações Recorrentes
+=======================================================
+
+Gera em ``transactions`` as ocorrências das ``RecurringTransaction`` (diárias,
+semanais, quinzenais, mensais, anuais, a cada N), expandidas por
+``recurrence._expand_occurrences``.
+
+Cada regra guarda um "watermark" (``generated_through``): a chave da última
+ocorrência já materializada. A listagem só faz trabalho quando o mês pedido
+passa do watermark e, nesse caso, cria todas as ocorrências faltantes de todas
+as regras do escopo em um único INSERT em lote.
+
+Cada ocorrência tem a chave (``recurring_transaction_id``, ``occurrence_month``,
+``workspace_id``), protegida pelo índice único ``ux_transactions_occurrence``;
+``occurrence_month`` é o 1º dia do mês nas regras por mês e a própria data nas
+regras por dia. O INSERT usa ``ON CONFLICT DO NOTHING`` (PostgreSQL e SQLite):
+duas listagens concorrentes do mesmo mês não duplicam ocorrências e não é
+preciso consultar antes de inserir.
+
+Excluir uma única ocorrência da série não divide mais a regra: a chave entra em
+``exception_dates`` e materialização/projeção a ignoram.
+
+As correções de dados legados (``_fix_recurring_start_dates``,
+``_migrate_legacy_recurring_transactions`` e
+``_fix_legacy_auto_loaded_income_paid``) não rodam mais a cada listagem:
+executar uma única vez via ``flask finance-migrate-recurring``.
+"""
+
+from datetime import date
+
+import numpy as np
+from sqlalchemy import event, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+from models import RecurringTransaction, Transaction
+
+from .helpers import (
+    _dbg,
+    _last_day_of_month,
+    _merchant_key,
+    _strip_installment_suffix,
+)
+from .invoices import _mark_invoices_dirty
+from .recurrence import (
+    _FREQUENCIES,
+    _exception_keys,
+    _expand_occurrences,
+    _is_day_based,
+    _occurrence_key,
+    _watermark_before,
+)
+from .rollups import _closed_months, _mark_rollups_dirty, _rollup_key
+
+
+def _migrate_legacy_recurring_transactions(user_id: int):
+    """
+    Migra recorrências antigas criadas diretamente na tabela transactions
+    (is_recurring=True, recurring_transaction_id=None) para a tabela
+    recurring_transactions.
+
+    Isso permite que ao trocar o mês no dashboard o sistema consiga gerar
+    automaticamente as recorrentes futuras.
+    """
+    legacy = Transaction.query.filter(
+        Transaction.user_id == user_id,
+        Transaction.is_recurring.is_(True),
+        Transaction.recurring_transaction_id.is_(None),
+    ).all()
+
+    _dbg(f"[MIGRATE_RECURRING] Encontradas {len(legacy)} transações recorrentes antigas para migrar")
+
+    if not legacy:
+        return
+
+    cache: dict[tuple, RecurringTransaction] = {}
+
+    for tx in legacy:
+        if not tx.transaction_date:
+            continue
+        
+        # Buscar transações antigas não vinculadas que correspondem a esta recorrente
+        unlinked_txs = Transaction.query.filter(
+            Transaction.user_id == user_id,
+            Transaction.is_recurring.is_(True),
+            Transaction.recurring_transaction_id.is_(None),
+            Transaction.description == tx.description,
+            Transaction.type == tx.type,
+            Transaction.amount == tx.amount
+        ).all()
+        
+        if unlinked_txs:
+            _dbg(f"[MIGRATE_RECURRING] {tx.description}: encontradas {len(unlinked_txs)} transações não vinculadas")
+            for utx in unlinked_txs:
+                _dbg(f"[MIGRATE_RECURRING]   - Vinculando {utx.description} de {utx.transaction_date}")
+                utx.recurring_transaction_id = tx.id
+                utx.frequency = "monthly"
+            try:
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+        
+        # Buscar TODAS as transações vinculadas para debug
+        all_txs = Transaction.query.filter_by(
+            user_id=user_id,
+            recurring_transaction_id=tx.id
+        ).order_by(Transaction.transaction_date.asc(), Transaction.id.asc()).all()
+        
+        _dbg(f"[MIGRATE_RECURRING] {tx.description}: {len(all_txs)} transações vinculadas, start_date atual: {tx.start_date}")
+        for atx in all_txs:
+            _dbg(f"[MIGRATE_RECURRING]   - {atx.description} em {atx.transaction_date}")
+        
+        # Buscar a primeira transação vinculada a esta recorrente
+        first_tx = all_txs[0] if all_txs else None
+        
+        if first_tx and first_tx.transaction_date:
+            old_start = tx.start_date
+            # Usar o mês da primeira transação como referência
+            new_start = date(first_tx.transaction_date.year, first_tx.transaction_date.month, 1)
+            
+            _dbg(f"[MIGRATE_RECURRING] {tx.description}: comparando start_date {old_start} com primeira transação {first_tx.transaction_date} -> novo start_date seria {new_start}")
+            
+            # Corrigir se o start_date for diferente do mês da primeira transação
+            if old_start != new_start:
+                tx.start_date = new_start
+                _dbg(f"[MIGRATE_RECURRING] ✅ Corrigindo {tx.description}: {old_start} -> {new_start}")
+            else:
+                _dbg(f"[MIGRATE_RECURRING] ✓ {tx.description}: start_date já está correto ({old_start})")
+        else:
+            _dbg(f"[MIGRATE_RECURRING] ⚠️ {tx.description}: sem transações vinculadas, mantendo start_date {tx.start_date}")
+    
+    if cache:
+        try:
+            db.session.commit()
+            _dbg(f"[MIGRATE_RECURRING] {len(cache)} RecurringTransaction criadas")
+        except Exception as e:
+            _dbg(f"[MIGRATE_RECURRING] Erro ao criar: {e}")
+            db.session.rollback()
+
+
+def _fix_recurring_start_dates(user_id: int):
+    """
+    Corrige start_date de RecurringTransaction que não estão no primeiro dia do mês.
+    Usa a primeira transação vinculada como referência para o mês correto.
+    Também vincula transações antigas não vinculadas.
+    """
+    recurring_txs = RecurringTransaction.query.filter_by(
+        user_id=user_id,
+        is_active=True,
+        frequency="monthly"
+    ).all()
+    
+    fixed_count = 0
+    for rec_tx in recurring_txs:
+        if not rec_tx.start_date:
+            continue
+        
+        # Buscar transações antigas não vinculadas que correspondem a esta recorrente
+        unlinked_txs = Transaction.query.filter(
+            Transaction.user_id == user_id,
+            Transaction.is_recurring.is_(True),
+            Transaction.recurring_transaction_id.is_(None),
+            Transaction.description == rec_tx.description,
+            Transaction.type == rec_tx.type,
+            Transaction.amount == rec_tx.amount
+        ).all()
+        
+        if unlinked_txs:
+            _dbg(f"[FIX_START_DATE] {rec_tx.description}: encontradas {len(unlinked_txs)} transações não vinculadas")
+            for tx in unlinked_txs:
+                _dbg(f"[FIX_START_DATE]   - Vinculando {tx.description} de {tx.transaction_date}")
+                tx.recurring_transaction_id = rec_tx.id
+                tx.frequency = "monthly"
+            try:
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+        
+        # Buscar TODAS as transações vinculadas para debug
+        all_txs = Transaction.query.filter_by(
+            user_id=user_id,
+            recurring_transaction_id=rec_tx.id
+        ).order_by(Transaction.transaction_date.asc(), Transaction.id.asc()).all()
+        
+        _dbg(f"[FIX_START_DATE] {rec_tx.description}: {len(all_txs)} transações vinculadas, start_date atual: {rec_tx.start_date}")
+        for tx in all_txs:
+            _dbg(f"[FIX_START_DATE]   - {tx.description} em {tx.transaction_date}")
+        
+        # Buscar a primeira transação vinculada a esta recorrente
+        first_tx = all_txs[0] if all_txs else None
+        
+        if first_tx and first_tx.transaction_date:
+            old_start = rec_tx.start_date
+            # Usar o mês da primeira transação como referência
+            new_start = date(first_tx.transaction_date.year, first_tx.transaction_date.month, 1)
+            
+            _dbg(f"[FIX_START_DATE] {rec_tx.description}: comparando start_date {old_start} com primeira transação {first_tx.transaction_date} -> novo start_date seria {new_start}")
+            
+            # Corrigir se o start_date for diferente do mês da primeira transação
+            if old_start != new_start:
+                rec_tx.start_date = new_start
+                _dbg(f"[FIX_START_DATE] ✅ Corrigindo {rec_tx.description}: {old_start} -> {new_start}")
+                fixed_count += 1
+            else:
+                _dbg(f"[FIX_START_DATE] ✓ {rec_tx.description}: start_date já está correto ({old_start})")
+        else:
+            _dbg(f"[FIX_START_DATE] ⚠️ {rec_tx.description}: sem transações vinculadas, mantendo start_date {rec_tx.start_date}")
+    
+    if fixed_count > 0:
+        try:
+            db.session.commit()
+            _dbg(f"[FIX_START_DATE] {fixed_count} RecurringTransaction corrigidas")
+        except Exception as e:
+            _dbg(f"[FIX_START_DATE] Erro ao corrigir: {e}")
+            db.session.rollback()
+
+
+def _fix_legacy_auto_loaded_income_paid(user_id: int):
+    txs = Transaction.query.filter(
+        Transaction.user_id == int(user_id),
+        Transaction.type == "income",
+        Transaction.is_paid == False,
+        Transaction.is_auto_loaded == True,
+        Transaction.recurring_transaction_id.isnot(None),
+    ).all()
+
+    if not txs:
+        return
+
+    for tx in txs:
+        try:
+            tx.is_paid = True
+            tx.paid_date = tx.transaction_date
+
+            if getattr(tx, "workspace_id", None) is None and getattr(tx, "recurring_transaction_id", None):
+                base_tx = (
+                    Transaction.query.filter(
+                        Transaction.user_id == int(user_id),
+                        Transaction.recurring_transaction_id == int(tx.recurring_transaction_id),
+                        Transaction.workspace_id.isnot(None),
+                    )
+                    .order_by(Transaction.transaction_date.asc(), Transaction.id.asc())
+                    .first()
+                )
+                if base_tx:
+                    tx.workspace_id = base_tx.workspace_id
+        except Exception:
+            pass
+
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+
+
+def _occurrence_description(rec_tx: RecurringTransaction, seq: int, total: int | None) -> str:
+    """Descrição da ocorrência, com sufixo de parcela (n/total) para despesas parceladas."""
+    gen_desc = getattr(rec_tx, "description", "") or ""
+    if rec_tx.type == "expense" and total:
+        if total > 1:
+            gen_desc = f"{_strip_installment_suffix(gen_desc)} ({int(seq)}/{int(total)})"
+        else:
+            gen_desc = _strip_installment_suffix(gen_desc)
+    return gen_desc
+
+
+def _occurrence_row(rec_tx: RecurringTransaction, transaction_date: date, key: date, seq: int, total: int | None) -> dict:
+    """Linha (dict) pronta para INSERT em ``transactions`` para a ocorrência informada."""
+    description = _occurrence_description(rec_tx, seq, total)
+    is_income = rec_tx.type == "income"
+    return {
+        "user_id": int(rec_tx.user_id),
+        "category_id": rec_tx.category_id,
+        "subcategory_id": rec_tx.subcategory_id,
+        "subcategory_text": rec_tx.subcategory_text,
+        "description": description,
+        "merchant_key": _merchant_key(description),
+        "amount": rec_tx.amount,
+        "type": rec_tx.type,
+        "transaction_date": transaction_date,
+        # Despesas recorrentes iniciam como não pagas
+        "is_paid": True if is_income else False,
+        "paid_date": transaction_date if is_income else None,
+        "workspace_id": rec_tx.workspace_id,
+        "payment_method": rec_tx.payment_method,
+        "credit_card_id": rec_tx.credit_card_id,
+        "notes": rec_tx.notes,
+        "is_recurring": True,
+        "frequency": rec_tx.frequency or "monthly",
+        "recurring_transaction_id": int(rec_tx.id),
+        "occurrence_month": key,
+        "is_auto_loaded": True,
+    }
+
+
+def _occurrence_rows(rules: list[RecurringTransaction], occurrences: dict) -> list[dict]:
+    """Linhas de INSERT das ocorrências expandidas por ``_expand_occurrences``."""
+    totals = occurrences["totals"].tolist()
+    return [
+        _occurrence_row(rules[pos], occ_date, key, seq, totals[pos])
+        for pos, occ_date, key, seq in zip(
+            occurrences["rule_pos"].tolist(),
+            occurrences["dates"].tolist(),
+            occurrences["keys"].tolist(),
+            occurrences["seq"].tolist(),
+        )
+    ]
+
+
+def _insert_occurrences(rows: list[dict]) -> list:
+    """
+    INSERT em lote das ocorrências ignorando as que já existem (chave de ocorrência).
+
+    Retorna ``(workspace_id, user_id, transaction_date)`` das linhas realmente inseridas.
+    """
+    if not rows:
+        return []
+    table = Transaction.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = pg_insert(table).on_conflict_do_nothing()
+    elif dialect == "sqlite":
+        stmt = sqlite_insert(table).on_conflict_do_nothing()
+    else:
+        stmt = table.insert()
+    stmt = stmt.returning(table.c.workspace_id, table.c.user_id, table.c.transaction_date)
+    return db.session.execute(stmt, rows).all()
+
+
+@event.listens_for(Transaction, "before_insert")
+@event.listens_for(Transaction, "before_update")
+def _sync_occurrence_month(mapper, connection, target):
+    """Mantém a chave de ocorrência nas transações gravadas via ORM."""
+    if target.recurring_transaction_id is None:
+        target.occurrence_month = None
+    elif target.occurrence_month is None and target.transaction_date:
+        target.occurrence_month = _occurrence_key(target.frequency, target.transaction_date)
+
+
+def _is_skipped_occurrence(rec_tx: RecurringTransaction, key: date) -> bool:
+    return key in _exception_keys(rec_tx)
+
+
+def _skip_occurrence(rec_tx: RecurringTransaction, key: date) -> None:
+    """Exclui uma ocorrência da série (exceção), sem dividir a regra."""
+    skipped = set(rec_tx.exception_dates or [])
+    skipped.add(_occurrence_key(rec_tx.frequency, key).isoformat())
+    # Nova lista (e não append) para o SQLAlchemy detectar a mudança no JSON
+    rec_tx.exception_dates = sorted(skipped)
+
+
+def _skip_transaction_occurrence(tx: Transaction) -> None:
+    """Registra como exceção, na regra de origem, a ocorrência de uma transação que vai ser excluída."""
+    if not tx.recurring_transaction_id:
+        return
+    rule = RecurringTransaction.query.get(int(tx.recurring_transaction_id))
+    if not rule:
+        return
+    key = tx.occurrence_month or (_occurrence_key(rule.frequency, tx.transaction_date) if tx.transaction_date else None)
+    if key:
+        _skip_occurrence(rule, key)
+
+
+def _resolve_rule_workspaces(rules: list[RecurringTransaction], workspace_id_fallback: int | None) -> None:
+    """
+    Preenche ``workspace_id`` das regras antigas (criadas antes da coluna existir).
+
+    Usa o workspace da primeira transação vinculada (mesmo critério do gerador
+    antigo) e, se não houver, o workspace ativo da listagem.
+    """
+    pending = [r for r in rules if r.workspace_id is None]
+    if not pending:
+        return
+
+    inherited: dict[int, int] = {}
+    rows = (
+        db.session.query(Transaction.recurring_transaction_id, Transaction.workspace_id)
+        .filter(
+            Transaction.recurring_transaction_id.in_([int(r.id) for r in pending]),
+            Transaction.workspace_id.isnot(None),
+        )
+        .order_by(Transaction.transaction_date.asc(), Transaction.id.asc())
+        .all()
+    )
+    for rid, wid in rows:
+        inherited.setdefault(int(rid), int(wid))
+
+    for rule in pending:
+        wid = inherited.get(int(rule.id), workspace_id_fallback)
+        if wid is not None:
+            rule.workspace_id = int(wid)
+
+
+def _resolve_rule_watermarks(rules: list[RecurringTransaction], target: date) -> None:
+    """
+    Preenche ``generated_through`` das regras que ainda não têm watermark.
+
+    O watermark passa a ser a chave da última ocorrência já existente. Sem
+    ocorrências, fica logo antes do mês pedido (só o mês pedido é gerado,
+    como fazia o gerador antigo).
+    """
+    pending = [r for r in rules if r.generated_through is None]
+    if not pending:
+        return
+
+    last_by_rule = dict(
+        db.session.query(Transaction.recurring_transaction_id, func.max(Transaction.transaction_date))
+        .filter(Transaction.recurring_transaction_id.in_([int(r.id) for r in pending]))
+        .group_by(Transaction.recurring_transaction_id)
+        .all()
+    )
+
+    for rule in pending:
+        last = last_by_rule.get(int(rule.id))
+        if last:
+            rule.generated_through = _occurrence_key(rule.frequency, last)
+        else:
+            rule.generated_through = _watermark_before(rule, target)
+
+
+def _window_watermark(rule: RecurringTransaction, target: date) -> date:
+    """Watermark da regra depois de materializada até o fim do mês ``target``."""
+    watermark = _occurrence_key(rule.frequency, _last_day_of_month(target.year, target.month))
+    if rule.end_date:
+        watermark = min(watermark, _occurrence_key(rule.frequency, rule.end_date))
+    return watermark
+
+
+def _needs_materialization(rule: RecurringTransaction, target: date) -> bool:
+    if rule.generated_through is None:
+        return True
+    return rule.generated_through < _window_watermark(rule, target)
+
+
+def _scope_rules(user_ids: list[int], target: date, workspace_id: int | None) -> list[RecurringTransaction]:
+    """
+    Regras ativas do escopo (todas as frequências) que já começaram até o mês ``target``.
+
+    - Escopo workspace: regras dos membros (``user_ids``) do workspace, incluindo
+      regras antigas sem workspace, que são atribuídas a ele.
+    - Escopo pessoal (``workspace_id=None``): regras do usuário sem workspace.
+    """
+    user_ids = [int(u) for u in set(user_ids or []) if u]
+    if not user_ids:
+        return []
+
+    rules = RecurringTransaction.query.filter(
+        RecurringTransaction.user_id.in_(user_ids),
+        RecurringTransaction.is_active.is_(True),
+        RecurringTransaction.frequency.in_(_FREQUENCIES),
+        RecurringTransaction.start_date <= _last_day_of_month(target.year, target.month),
+    )
+    if workspace_id is None:
+        rules = rules.filter(RecurringTransaction.workspace_id.is_(None))
+    else:
+        rules = rules.filter(
+            (RecurringTransaction.workspace_id == int(workspace_id)) | (RecurringTransaction.workspace_id.is_(None))
+        )
+    rules = [r for r in rules.all() if _needs_materialization(r, target)]
+    if not rules:
+        return []
+
+    _resolve_rule_workspaces(rules, workspace_id)
+    if workspace_id is not None:
+        # Regras antigas podem pertencer a outro workspace (herdado das transações)
+        rules = [r for r in rules if r.workspace_id == int(workspace_id)]
+    _resolve_rule_watermarks(rules, target)
+    return [r for r in rules if _needs_materialization(r, target)]
+
+
+def _persisted_after_watermark(rules: list[RecurringTransaction], until: date) -> set[tuple[int, date]]:
+    """
+    Pares (regra, chave da ocorrência) já gravados depois do watermark, até ``until``.
+
+    Acontece quando uma ocorrência projetada é materializada isoladamente
+    (paga/editada/anexo) antes do watermark alcançar a data dela.
+    """
+    if not rules:
+        return set()
+
+    since = min(r.generated_through for r in rules)
+    rows = (
+        db.session.query(Transaction.recurring_transaction_id, Transaction.occurrence_month)
+        .filter(
+            Transaction.recurring_transaction_id.in_([int(r.id) for r in rules]),
+            Transaction.occurrence_month > since,
+            Transaction.occurrence_month <= until,
+        )
+        .all()
+    )
+    return {(int(rid), d) for rid, d in rows if d}
+
+
+def _pending_occurrences(rules: list[RecurringTransaction], until: date, persisted=None) -> dict:
+    """Ocorrências das regras após o watermark de cada uma, até ``until`` (``_expand_occurrences``)."""
+    return _expand_occurrences(rules, until, after=[r.generated_through for r in rules], skip=persisted)
+
+
+def _materialize_recurring(user_ids: list[int], year: int, month: int, workspace_id: int | None = None) -> int:
+    """
+    Garante que as regras ativas do escopo estejam materializadas até o fim de ``year/month``.
+
+    Retorna quantas transações foram criadas. Quando todos os watermarks já
+    cobrem o mês pedido, faz apenas o SELECT das regras e não escreve nada.
+    Ocorrências já gravadas (materializadas isoladamente ou por outra request
+    concorrente) são ignoradas pelo ``ON CONFLICT DO NOTHING``.
+    """
+    target = date(int(year), int(month), 1)
+    rules = _scope_rules(user_ids, target, workspace_id)
+    if not rules:
+        return 0
+
+    rows = _occurrence_rows(rules, _pending_occurrences(rules, _last_day_of_month(target.year, target.month)))
+    for rule in rules:
+        rule.generated_through = _window_watermark(rule, target)
+
+    # Meses fechados não recebem ocorrências novas (o watermark passa por eles)
+    closed = _closed_months({_rollup_key(r["workspace_id"], r["user_id"], r["transaction_date"]) for r in rows})
+    if closed:
+        rows = [r for r in rows if _rollup_key(r["workspace_id"], r["user_id"], r["transaction_date"]) not in closed]
+
+    try:
+        inserted = _insert_occurrences(rows)
+        _mark_rollups_dirty(_rollup_key(wid, uid, d) for wid, uid, d in inserted)
+        _mark_invoices_dirty((r["credit_card_id"], r["transaction_date"]) for r in rows)
+        # Watermarks (e workspace_id resolvido) saem no flush do commit
+        db.session.commit()
+    except Exception as e:
+        _dbg(f"[MATERIALIZE] Erro: {e}")
+        db.session.rollback()
+        return 0
+
+    _dbg(f"[MATERIALIZE] {len(rules)} regras, {len(inserted)}/{len(rows)} ocorrências novas até {target:%Y-%m}")
+    return len(inserted)
+
+
+def _projection_key(rule: RecurringTransaction, key: date) -> str:
+    """``<regra>:YYYY-MM`` nas regras por mês, ``<regra>:YYYY-MM-DD`` nas regras por dia."""
+    label = key.isoformat() if _is_day_based(rule.frequency) else f"{key:%Y-%m}"
+    return f"{int(rule.id)}:{label}"
+
+
+def _project_recurring(user_ids: list[int], year: int, month: int, workspace_id: int | None = None) -> dict:
+    """
+    Projeta em memória as ocorrências recorrentes ainda não gravadas, sem inserir linhas.
+
+    Retorna ``{"items": [...], "prev_total": float}``:
+    - ``items``: ocorrências projetadas do mês pedido (mesmo formato da listagem,
+      com ``id=None``, ``is_projected=True`` e ``projection_key``);
+    - ``prev_total``: saldo (receitas - despesas) das ocorrências projetadas nos
+      meses anteriores ao pedido, para compor o saldo previsto.
+    """
+    target = date(int(year), int(month), 1)
+    rules = _scope_rules(user_ids, target, workspace_id)
+    if not rules:
+        return {"items": [], "prev_total": 0.0}
+
+    until = _last_day_of_month(target.year, target.month)
+    occurrences = _pending_occurrences(rules, until, _persisted_after_watermark(rules, until))
+
+    signed = [float(r.amount or 0) * (1 if r.type == "income" else -1) for r in rules]
+    in_month = occurrences["dates"] >= np.datetime64(target, "D")
+    prev_total = float(sum(signed[pos] for pos in occurrences["rule_pos"][~in_month].tolist()))
+
+    items = []
+    month = {name: occurrences[name][in_month] for name in ("rule_pos", "dates", "keys", "seq")}
+    rows = _occurrence_rows(rules, {**month, "totals": occurrences["totals"]})
+    for pos, row in zip(month["rule_pos"].tolist(), rows):
+        rule = rules[pos]
+        items.append({
+            "id": None,
+            "projection_key": _projection_key(rule, row["occurrence_month"]),
+            "recurring_transaction_id": int(rule.id),
+            "description": row["description"],
+            "amount": float(row["amount"] or 0),
+            "type": row["type"],
+            "date": row["transaction_date"].isoformat(),
+            "is_paid": bool(row["is_paid"]),
+            "is_recurring": True,
+            "is_projected": True,
+            "category_id": int(rule.category_id) if rule.category_id else None,
+        })
+
+    # _scope_rules pode ter resolvido workspace/watermark de regras antigas
+    # (depois de ler as regras: o commit expira os objetos)
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+
+    return {"items": items, "prev_total": prev_total}
+
+
+def _rule_occurrence(rule: RecurringTransaction, key: date) -> dict | None:
+    """Linha da ocorrência de chave ``key`` (``None`` se a série não tem essa ocorrência)."""
+    until = key if _is_day_based(rule.frequency) else _last_day_of_month(key.year, key.month)
+    occurrences = _expand_occurrences([rule], until, after=[_watermark_before(rule, key)], include_skipped=True)
+    for row in _occurrence_rows([rule], occurrences):
+        if row["occurrence_month"] == key:
+            return row
+    return None
+
+
+def _materialize_occurrence(rule: RecurringTransaction, key: date) -> Transaction | None:
+    """
+    Grava uma ocorrência projetada (ao ser paga, editada ou receber anexo).
+
+    Se a ocorrência já existir, devolve a existente; ``None`` se ``key`` não é
+    uma ocorrência da série. Não altera o watermark: as ocorrências
+    intermediárias continuam projetadas.
+    """
+    row = _rule_occurrence(rule, key)
+    if row is None:
+        return None
+    inserted = _insert_occurrences([row])
+    _mark_rollups_dirty(_rollup_key(wid, uid, d) for wid, uid, d in inserted)
+    if inserted:
+        _mark_invoices_dirty([(row["credit_card_id"], row["transaction_date"])])
+
+    workspace_filter = (
+        Transaction.workspace_id.is_(None)
+        if row["workspace_id"] is None
+        else Transaction.workspace_id == int(row["workspace_id"])
+    )
+    return Transaction.query.filter(
+        Transaction.recurring_transaction_id == int(rule.id),
+        Transaction.occurrence_month == row["occurrence_month"],
+        workspace_filter,
+    ).first()
+
+
+def _run_recurring_migration() -> dict:
+    """
+    Migração única das recorrências (``flask finance-migrate-recurring``).
+
+    Executa as correções legadas para todos os usuários e preenche
+    ``workspace_id``/``generated_through`` das regras existentes.
+    """
+    user_ids = {
+        int(uid)
+        for (uid,) in db.session.query(RecurringTransaction.user_id).distinct().all()
+    } | {
+        int(uid)
+        for (uid,) in db.session.query(Transaction.user_id)
+        .filter(Transaction.is_recurring.is_(True))
+        .distinct()
+        .all()
+    }
+
+    for uid in sorted(user_ids):
+        _fix_recurring_start_dates(uid)
+        _migrate_legacy_recurring_transactions(uid)
+        _fix_legacy_auto_loaded_income_paid(uid)
+
+    rules = RecurringTransaction.query.filter(
+        (RecurringTransaction.workspace_id.is_(None)) | (RecurringTransaction.generated_through.is_(None))
+    ).all()
+
+    _resolve_rule_workspaces(rules, None)
+
+    last_by_rule = dict(
+        db.session.query(Transaction.recurring_transaction_id, func.max(Transaction.transaction_date))
+        .filter(Transaction.recurring_transaction_id.isnot(None))
+        .group_by(Transaction.recurring_transaction_id)
+        .all()
+    )
+    for rule in rules:
+        if rule.generated_through is not None:
+            continue
+        last = last_by_rule.get(int(rule.id))
+        if last:
+            rule.generated_through = _occurrence_key(rule.frequency, last)
+        elif rule.start_date:
+            rule.generated_through = _watermark_before(rule, rule.start_date)
+
+    db.session.commit()
+    return {"users": len(user_ids), "rules": len(rules)}
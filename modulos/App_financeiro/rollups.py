@@ -0,0 +1,468 @@
+"""
+Rollups Mensais - Saldos por mês em ``monthly_closures``
+========================================================
+
+Mantém uma linha de ``MonthlyClosure`` por (workspace, usuário, ano, mês) com
+``total_income``, ``total_expense`` e ``balance``. Transações sem workspace
+(livro pessoal) usam ``workspace_id = NULL``.
+
+Como é mantido:
+- ``before_flush`` anota os meses afetados por inserts/updates/deletes de
+  ``Transaction`` feitos via ORM (valores antigos e novos);
+- caminhos em lote (INSERT/DELETE direto na tabela) chamam
+  ``_mark_rollups_dirty`` / ``_mark_rollups_for_query`` (este também anota
+  as faturas de cartão atingidas);
+- ``before_commit`` recalcula só esses meses, a partir das transações, com a
+  linha do mês travada (chave única em (coalesce(workspace_id, 0), user_id,
+  ano, mês)): commits concorrentes no mesmo mês não perdem transações.
+
+Meses com status "closed" (ver ``closures``) são imutáveis: anotar um deles
+levanta ``ClosedMonthError`` antes de a escrita chegar ao banco, e o rebuild
+preserva essas linhas. Só contam as escritas que mudam os totais (inclusão,
+exclusão ou mudança de valor, tipo, data, workspace ou usuário); comprovante,
+pagamento e demais campos continuam editáveis.
+
+Com isso o saldo de abertura de um mês é a soma de no máximo algumas centenas
+de linhas de rollup, em vez de varrer todo o histórico.
+
+Workspaces e configurações novos já nascem com ``rollups_built_at`` (as
+linhas são mantidas desde a primeira transação). Escopos anteriores aos
+rollups são construídos por ``flask finance-rollups rebuild`` (depois da
+migration 0002); até lá as leituras somam direto das transações, e nenhuma
+leitura constrói nem grava rollups.
+
+Manutenção: ``flask finance-rollups rebuild|verify``.
+"""
+
+from datetime import date, datetime
+
+from sqlalchemy import and_, case, event, func, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, attributes
+
+from extensions import db
+from models import FinanceConfig, MonthlyClosure, Transaction, Workspace
+
+from .change_counters import _mark_scopes_changed, _tx_scope
+from .helpers import _dbg, _history_values, _keep_previous_value
+from .invoices import _mark_invoices_dirty
+
+_SESSION_KEY = "finance_rollup_keys"
+# Atributos de Transaction que entram nos totais do mês
+_TOTAL_ATTRS = ("amount", "type", "transaction_date", "workspace_id", "user_id")
+
+
+class ClosedMonthError(ValueError):
+    """Escrita em transações de um mês já fechado."""
+
+    def __init__(self, months):
+        self.months = sorted(months)
+        super().__init__(f"Mês fechado: {', '.join(self.months)}")
+
+
+# ---------------------------------------------------------------------------
+# Coleta dos meses afetados
+# ---------------------------------------------------------------------------
+
+def _rollup_key(workspace_id, user_id, d: date | None):
+    if not user_id or not d:
+        return None
+    return (int(workspace_id) if workspace_id else None, int(user_id), int(d.year), int(d.month))
+
+
+def _closed_months(keys, session=None) -> set:
+    """
+    Subconjunto das chaves (workspace_id, user_id, ano, mês) cujo mês está fechado.
+
+    Em workspace o fechamento vale para o workspace inteiro; no livro pessoal,
+    para o usuário.
+    """
+    session = session or db.session
+    keys = {k for k in keys if k}
+    if not keys:
+        return set()
+    table = MonthlyClosure.__table__
+    workspace_months = {(k[0], k[2], k[3]) for k in keys if k[0] is not None}
+    personal_months = {(k[1], k[2], k[3]) for k in keys if k[0] is None}
+    conditions = []
+    if workspace_months:
+        conditions.append(tuple_(table.c.workspace_id, table.c.year, table.c.month).in_(sorted(workspace_months)))
+    if personal_months:
+        conditions.append(and_(
+            table.c.workspace_id.is_(None),
+            tuple_(table.c.user_id, table.c.year, table.c.month).in_(sorted(personal_months)),
+        ))
+    rows = session.execute(
+        select(table.c.workspace_id, table.c.user_id, table.c.year, table.c.month)
+        .where(table.c.status == "closed", or_(*conditions))
+    ).all()
+    closed = {(wid, y, m) if wid is not None else (None, uid, y, m) for wid, uid, y, m in rows}
+    return {k for k in keys if ((k[0], k[2], k[3]) if k[0] is not None else k) in closed}
+
+
+def _mark_rollups_dirty(keys, session=None) -> None:
+    """
+    Anota chaves (workspace_id, user_id, ano, mês) para recálculo no próximo commit.
+
+    Levanta ``ClosedMonthError`` se alguma delas for de um mês fechado.
+    """
+    session = session or db.session
+    keys = [k for k in keys if k]
+    closed = _closed_months(keys, session)
+    if closed:
+        raise ClosedMonthError({f"{y:04d}-{m:02d}" for _wid, _uid, y, m in closed})
+    session.info.setdefault(_SESSION_KEY, set()).update(keys)
+    # Mesmos caminhos (inclusive os em lote) mudam o contador de ETag do escopo
+    _mark_scopes_changed({_tx_scope(k[0], k[1]) for k in keys}, session)
+
+
+def _mark_rollups_for_query(query) -> None:
+    """Anota os meses atingidos por um UPDATE/DELETE em lote (chamar antes de executá-lo)."""
+    rows = query.with_entities(
+        Transaction.workspace_id,
+        Transaction.user_id,
+        Transaction.transaction_date,
+        Transaction.credit_card_id,
+    ).distinct().all()
+    _mark_rollups_dirty(_rollup_key(wid, uid, d) for wid, uid, d, _cid in rows)
+    # Faturas dos cartões atingidos
+    _mark_invoices_dirty((cid, d) for _wid, _uid, d, cid in rows)
+
+
+# Com ``active_history`` o valor antigo é carregado mesmo se o atributo estiver
+# expirado (após commit) - sem isso mover uma transação de mês não marcaria o
+# mês de origem, e regravar o mesmo valor/tipo contaria como mudança.
+for _attr in _TOTAL_ATTRS:
+    event.listen(getattr(Transaction, _attr), "set", _keep_previous_value, active_history=True, retval=True)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_rollup_keys(session, flush_context, instances):
+    keys = set()
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, Transaction):
+            keys.add(_rollup_key(obj.workspace_id, obj.user_id, obj.transaction_date))
+
+    for obj in session.dirty:
+        if not isinstance(obj, Transaction) or not session.is_modified(obj):
+            continue
+        if not any(attributes.get_history(obj, attr).has_changes() for attr in _TOTAL_ATTRS):
+            continue
+        # Valores atuais e anteriores (mudança de data/workspace/usuário afeta dois meses)
+        for wid in _history_values(obj, "workspace_id"):
+            for uid in _history_values(obj, "user_id"):
+                for d in _history_values(obj, "transaction_date"):
+                    keys.add(_rollup_key(wid, uid, d))
+
+    if keys:
+        _mark_rollups_dirty(keys, session)
+
+
+@event.listens_for(Session, "before_commit")
+def _refresh_rollups_before_commit(session):
+    if not session.info.get(_SESSION_KEY) and not session.new and not session.dirty and not session.deleted:
+        return
+    session.flush()
+    keys = session.info.pop(_SESSION_KEY, None)
+    if keys:
+        _refresh_rollups(session, keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rollup_keys(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+# ---------------------------------------------------------------------------
+# Recalculo
+# ---------------------------------------------------------------------------
+
+def _scope_filter(column_ws, workspace_id):
+    return column_ws.is_(None) if workspace_id is None else column_ws == int(workspace_id)
+
+
+def _insert_missing_rollups(session, keys, now: datetime) -> None:
+    """Cria (zeradas) as linhas de rollup que ainda não existem; conflito na chave única é ignorado."""
+    table = MonthlyClosure.__table__
+    rows = [
+        {
+            "workspace_id": workspace_id,
+            "user_id": user_id,
+            "year": year,
+            "month": month,
+            "status": "open",
+            "total_income": 0,
+            "total_expense": 0,
+            "balance": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for workspace_id, user_id, year, month in keys
+    ]
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        session.execute(pg_insert(table).on_conflict_do_nothing(), rows)
+    elif dialect == "sqlite":
+        session.execute(sqlite_insert(table).on_conflict_do_nothing(), rows)
+    else:
+        for row in rows:
+            where = and_(
+                _scope_filter(table.c.workspace_id, row["workspace_id"]),
+                table.c.user_id == row["user_id"],
+                table.c.year == row["year"],
+                table.c.month == row["month"],
+            )
+            if session.execute(select(table.c.id).where(where)).first() is None:
+                session.execute(table.insert().values(**row))
+
+
+def _refresh_rollups(session, keys) -> None:
+    """
+    Recalcula as linhas de rollup das chaves informadas a partir de ``transactions``.
+
+    Cada linha é travada (``SELECT ... FOR UPDATE``) antes da soma: um commit
+    concorrente no mesmo mês espera este terminar e soma de novo já vendo as
+    transações dele (em READ COMMITTED cada comando enxerga o que já foi
+    commitado), em vez de sobrescrever o total com uma soma antiga.
+    """
+    table = MonthlyClosure.__table__
+    # Ordem fixa das travas entre sessões concorrentes (evita deadlock)
+    keys = sorted(keys, key=lambda k: (k[0] or 0, k[1], k[2], k[3]))
+    now = datetime.utcnow()
+    _insert_missing_rollups(session, keys, now)
+
+    for workspace_id, user_id, year, month in keys:
+        start = date(year, month, 1)
+        end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+        where = and_(
+            _scope_filter(table.c.workspace_id, workspace_id),
+            table.c.user_id == user_id,
+            table.c.year == year,
+            table.c.month == month,
+        )
+        session.execute(select(table.c.id).where(where).with_for_update()).all()
+
+        income, expense = session.execute(
+            select(
+                func.coalesce(func.sum(case((Transaction.type == "income", Transaction.amount), else_=0)), 0),
+                func.coalesce(func.sum(case((Transaction.type == "expense", Transaction.amount), else_=0)), 0),
+            ).where(
+                _scope_filter(Transaction.workspace_id, workspace_id),
+                Transaction.user_id == user_id,
+                Transaction.transaction_date >= start,
+                Transaction.transaction_date < end,
+            )
+        ).one()
+
+        session.execute(table.update().where(where).values(
+            total_income=income or 0,
+            total_expense=expense or 0,
+            balance=(income or 0) - (expense or 0),
+            updated_at=now,
+        ))
+
+    _dbg(f"[ROLLUPS] {len(keys)} meses recalculados")
+
+
+def _raw_monthly_totals(workspace_id=None, user_id=None, personal: bool = False):
+    """Totais por (workspace, usuário, ano, mês) direto de ``transactions`` (uma varredura agrupada)."""
+    y = func.extract("year", Transaction.transaction_date)
+    m = func.extract("month", Transaction.transaction_date)
+    q = db.session.query(
+        Transaction.workspace_id,
+        Transaction.user_id,
+        y,
+        m,
+        func.coalesce(func.sum(case((Transaction.type == "income", Transaction.amount), else_=0)), 0),
+        func.coalesce(func.sum(case((Transaction.type == "expense", Transaction.amount), else_=0)), 0),
+    )
+    if workspace_id is not None:
+        q = q.filter(Transaction.workspace_id == int(workspace_id))
+    if personal:
+        q = q.filter(Transaction.workspace_id.is_(None))
+    if user_id is not None:
+        q = q.filter(Transaction.user_id == int(user_id))
+    q = q.group_by(Transaction.workspace_id, Transaction.user_id, y, m)
+    return {
+        (int(wid) if wid else None, int(uid), int(yy), int(mm)): (inc or 0, exp or 0)
+        for wid, uid, yy, mm, inc, exp in q.all()
+    }
+
+
+def _rebuild_scope(workspace_id=None, user_id=None) -> int:
+    """
+    Reconstrói os rollups de um workspace (ou do livro pessoal de ``user_id``).
+
+    Não faz commit; quem chama decide. Retorna quantas linhas foram gravadas.
+    """
+    personal = workspace_id is None
+    totals = _raw_monthly_totals(workspace_id=workspace_id, user_id=user_id if personal else None, personal=personal)
+
+    stale = MonthlyClosure.query.filter(_scope_filter(MonthlyClosure.workspace_id, workspace_id))
+    if personal:
+        stale = stale.filter(MonthlyClosure.user_id == int(user_id))
+    # Meses fechados ficam como estão (snapshot imutável)
+    closed = {
+        (int(wid) if wid else None, int(uid), int(yy), int(mm))
+        for wid, uid, yy, mm in stale.filter(MonthlyClosure.status == "closed").with_entities(
+            MonthlyClosure.workspace_id, MonthlyClosure.user_id, MonthlyClosure.year, MonthlyClosure.month
+        )
+    }
+    stale.filter(MonthlyClosure.status != "closed").delete(synchronize_session=False)
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "workspace_id": wid,
+            "user_id": uid,
+            "year": yy,
+            "month": mm,
+            "status": "open",
+            "total_income": inc,
+            "total_expense": exp,
+            "balance": inc - exp,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for (wid, uid, yy, mm), (inc, exp) in totals.items()
+        if (wid, uid, yy, mm) not in closed
+    ]
+    if rows:
+        db.session.execute(MonthlyClosure.__table__.insert(), rows)
+
+    if personal:
+        FinanceConfig.query.filter_by(user_id=int(user_id)).update(
+            {FinanceConfig.rollups_built_at: now}, synchronize_session=False
+        )
+    else:
+        Workspace.query.filter_by(id=int(workspace_id)).update(
+            {Workspace.rollups_built_at: now}, synchronize_session=False
+        )
+    return len(rows)
+
+
+def _scope_rollups_built(workspace_id=None, user_id=None) -> bool:
+    if workspace_id is not None:
+        built = db.session.query(Workspace.rollups_built_at).filter(Workspace.id == int(workspace_id)).scalar()
+    else:
+        built = db.session.query(FinanceConfig.rollups_built_at).filter(FinanceConfig.user_id == int(user_id)).scalar()
+    return bool(built)
+
+
+def _ensure_scope_rollups(workspace_id=None, user_id=None) -> None:
+    """
+    Constrói os rollups do escopo se ainda não foram construídos.
+
+    Só para caminhos de escrita e CLI (fechamento de mês); erros sobem para
+    quem chamou. Leituras não constroem: ver ``_opening_balance``.
+    """
+    if _scope_rollups_built(workspace_id=workspace_id, user_id=user_id):
+        return
+    _rebuild_scope(workspace_id=workspace_id, user_id=user_id)
+    db.session.commit()
+
+
+def _raw_opening_balance(year: int, month: int, workspace_id=None, user_id=None) -> float:
+    """Mesmo saldo de ``_opening_balance``, somado direto de ``transactions``."""
+    q = db.session.query(
+        func.coalesce(func.sum(case(
+            (Transaction.type == "income", Transaction.amount),
+            (Transaction.type == "expense", -Transaction.amount),
+            else_=0,
+        )), 0)
+    ).filter(
+        _scope_filter(Transaction.workspace_id, workspace_id),
+        Transaction.transaction_date < date(int(year), int(month), 1),
+    )
+    if user_id is not None:
+        q = q.filter(Transaction.user_id == int(user_id))
+    return float(q.scalar() or 0.0)
+
+
+def _opening_balance(year: int, month: int, workspace_id=None, user_id=None) -> float:
+    """
+    Saldo acumulado (receitas - despesas) de todos os meses anteriores a ``year/month``.
+
+    - ``workspace_id`` informado: soma o workspace inteiro, ou só de ``user_id``
+      quando informado (membro sem compartilhamento de transações);
+    - ``workspace_id=None``: livro pessoal de ``user_id``.
+
+    Escopo com transações anteriores aos rollups e ainda não construído
+    (``flask finance-rollups rebuild``): soma direto das transações, sem
+    escrever nada na leitura.
+    """
+    if not _scope_rollups_built(workspace_id=workspace_id, user_id=user_id):
+        _dbg(f"[ROLLUPS] Escopo ws={workspace_id} user={user_id} sem rollups: saldo direto das transações")
+        return _raw_opening_balance(year, month, workspace_id=workspace_id, user_id=user_id)
+
+    q = db.session.query(func.coalesce(func.sum(MonthlyClosure.balance), 0)).filter(
+        _scope_filter(MonthlyClosure.workspace_id, workspace_id),
+        or_(
+            MonthlyClosure.year < int(year),
+            and_(MonthlyClosure.year == int(year), MonthlyClosure.month < int(month)),
+        ),
+    )
+    if user_id is not None:
+        q = q.filter(MonthlyClosure.user_id == int(user_id))
+    return float(q.scalar() or 0.0)
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def _all_scopes() -> list[tuple]:
+    """(workspace_id, user_id) de todos os escopos com transações."""
+    workspaces = [
+        (int(wid), None)
+        for (wid,) in db.session.query(Transaction.workspace_id).filter(Transaction.workspace_id.isnot(None)).distinct()
+    ]
+    personal = [
+        (None, int(uid))
+        for (uid,) in db.session.query(Transaction.user_id).filter(Transaction.workspace_id.is_(None)).distinct()
+    ]
+    return workspaces + personal
+
+
+def _rebuild_all_rollups() -> dict:
+    scopes = _all_scopes()
+    rows = 0
+    for workspace_id, user_id in scopes:
+        rows += _rebuild_scope(workspace_id=workspace_id, user_id=user_id)
+    # Escopos sem transações não têm o que construir
+    now = datetime.utcnow()
+    Workspace.query.filter(Workspace.rollups_built_at.is_(None)).update(
+        {Workspace.rollups_built_at: now}, synchronize_session=False
+    )
+    FinanceConfig.query.filter(FinanceConfig.rollups_built_at.is_(None)).update(
+        {FinanceConfig.rollups_built_at: now}, synchronize_session=False
+    )
+    db.session.commit()
+    return {"scopes": len(scopes), "rows": rows}
+
+
+def _verify_rollups() -> list[dict]:
+    """Compara rollups com os totais brutos; retorna as divergências encontradas."""
+    raw = _raw_monthly_totals()
+    stored = {
+        (int(r.workspace_id) if r.workspace_id else None, int(r.user_id), int(r.year), int(r.month)): (
+            r.total_income or 0,
+            r.total_expense or 0,
+        )
+        for r in MonthlyClosure.query.all()
+    }
+
+    mismatches = []
+    for key in set(raw) | set(stored):
+        expected = raw.get(key, (0, 0))
+        found = stored.get(key, (0, 0))
+        if round(float(expected[0]), 2) != round(float(found[0]), 2) or round(float(expected[1]), 2) != round(float(found[1]), 2):
+            mismatches.append({
+                "workspace_id": key[0],
+                "user_id": key[1],
+                "month": f"{key[2]:04d}-{key[3]:02d}",
+                "expected": [float(expected[0]), float(expected[1])],
+                "found": [float(found[0]), float(found[1])],
+            })
+    return mismatches
@@ -0,0 +1,341 @@
+"""
+Importação de Extratos - CSV/OFX em streaming e INSERTs em lote
+===============================================================
+
+Lê o arquivo linha a linha (sem carregar tudo na memória), converte cada
+lançamento em transação e grava em lotes de ``FINANCE_IMPORT_BATCH`` linhas
+com INSERT direto na tabela, tudo numa única transação do banco:
+
+- CSV: separador detectado no cabeçalho (``;``, ``,`` ou tab); colunas
+  reconhecidas por nome (data, descrição/histórico, valor, tipo, categoria);
+  valores em formato brasileiro ("1.234,56") ou com ponto decimal;
+- OFX (1.x SGML ou 2.x XML): blocos ``<STMTTRN>`` com DTPOSTED, TRNAMT,
+  NAME/MEMO;
+- categoria: a coluna do arquivo (se bater com uma categoria do usuário),
+  senão o classificador local (histórico/Naive Bayes, sem chamar o LLM),
+  senão "Outros";
+- duplicatas: mesma ``merchant_key``, data e valor de uma transação já
+  gravada (cada linha existente "absorve" uma linha do arquivo; reimportar o
+  mesmo extrato não duplica nada, duas compras iguais no mesmo dia entram);
+- erros por linha não interrompem a importação: vão no relatório.
+
+Usado por ``POST /api/transactions/import`` e ``flask finance-import``.
+"""
+
+import csv
+import os
+import re
+from collections import Counter
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from extensions import db
+from models import Category, FinanceConfig, Transaction
+
+from .classifier import _CLASSIFIER_THRESHOLD, _suggest_category_local
+from .helpers import _dbg, _merchant_key, _normalize_str
+from .rollups import _closed_months, _mark_rollups_dirty, _rollup_key
+
+_BATCH_SIZE = int(os.getenv("FINANCE_IMPORT_BATCH", "1000"))
+_MAX_REPORTED_ERRORS = 200
+
+_CSV_COLUMNS = {
+    "date": ("data", "date", "data lancamento", "data do lancamento", "data movimento", "dt"),
+    "description": ("descricao", "description", "historico", "lancamento", "memo", "estabelecimento", "detalhes"),
+    "amount": ("valor", "amount", "valor r", "value", "quantia"),
+    "type": ("tipo", "type", "natureza"),
+    "category": ("categoria", "category"),
+}
+_EXPENSE_WORDS = {"d", "debito", "despesa", "saida", "expense", "debit"}
+_INCOME_WORDS = {"c", "credito", "receita", "entrada", "income", "credit"}
+_DATE_FORMATS = ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%d/%m/%y", "%d.%m.%Y")
+_OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+
+class StatementRowError(ValueError):
+    """Linha do extrato que não pôde ser convertida (vai para o relatório de erros)."""
+
+
+# ---------------------------------------------------------------------------
+# Leitura
+# ---------------------------------------------------------------------------
+
+def _decode_lines(binary_stream):
+    """Linhas de texto de um stream binário (UTF-8, com fallback para cp1252 por linha)."""
+    first = True
+    for raw in binary_stream:
+        try:
+            line = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            line = raw.decode("cp1252", errors="replace")
+        if first:
+            line = line.lstrip("﻿")
+            first = False
+        yield line
+
+
+def _header_key(name: str) -> str:
+    return " ".join(re.findall(r"[a-z]+", _normalize_str(name)))
+
+
+def _parse_amount(raw) -> Decimal:
+    s = str(raw or "").strip().replace("R$", "").replace(" ", "").replace(" ", "")
+    if not s:
+        raise StatementRowError("valor vazio")
+    negative = s.startswith("-") or s.endswith("-") or (s.startswith("(") and s.endswith(")"))
+    s = s.strip("-+()")
+    if "," in s and "." in s:
+        if s.rfind(",") > s.rfind("."):
+            s = s.replace(".", "").replace(",", ".")
+        else:
+            s = s.replace(",", "")
+    elif "," in s:
+        s = s.replace(",", ".")
+    try:
+        value = Decimal(s)
+    except InvalidOperation:
+        raise StatementRowError(f"valor inválido: {raw}")
+    return -value if negative else value
+
+
+def _parse_date(raw) -> date:
+    s = str(raw or "").strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            continue
+    raise StatementRowError(f"data inválida: {raw}")
+
+
+def _row_type(amount: Decimal, raw_type) -> str:
+    word = _header_key(raw_type or "")
+    if word in _EXPENSE_WORDS:
+        return "expense"
+    if word in _INCOME_WORDS:
+        return "income"
+    return "expense" if amount < 0 else "income"
+
+
+def _iter_csv_records(lines):
+    """Gera ``(nº da linha, registro)``; registro = dict com date/description/amount/type/category."""
+    lines = iter(lines)
+    header_line = next(lines, "")
+    delimiter = max((";", ",", "\t"), key=header_line.count)
+    header = next(csv.reader([header_line], delimiter=delimiter), [])
+
+    positions = {}
+    for idx, name in enumerate(header):
+        key = _header_key(name)
+        for field, aliases in _CSV_COLUMNS.items():
+            if field not in positions and key in aliases:
+                positions[field] = idx
+    missing = [f for f in ("date", "description", "amount") if f not in positions]
+    if missing:
+        raise StatementRowError(f"cabeçalho sem as colunas: {', '.join(missing)}")
+
+    for line_no, values in enumerate(csv.reader(lines, delimiter=delimiter), start=2):
+        if not values or not any(v.strip() for v in values):
+            continue
+        yield line_no, {
+            field: (values[idx].strip() if idx < len(values) else "")
+            for field, idx in positions.items()
+        }
+
+
+def _iter_ofx_records(lines):
+    """Gera ``(nº da linha, registro)`` a partir dos blocos ``<STMTTRN>`` do OFX."""
+    current, start = None, 0
+    for line_no, line in enumerate(lines, start=1):
+        for closing, tag, value in _OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if closing and current is not None:
+                    dt = current.get("DTPOSTED", "")
+                    yield start, {
+                        "date": f"{dt[6:8]}/{dt[4:6]}/{dt[0:4]}" if len(dt) >= 8 else dt,
+                        "description": current.get("MEMO") or current.get("NAME") or "",
+                        "amount": current.get("TRNAMT", ""),
+                        "type": current.get("TRNTYPE") if current.get("TRNTYPE") in ("DEBIT", "CREDIT") else "",
+                    }
+                    current = None
+                elif not closing:
+                    current, start = {}, line_no
+            elif current is not None and not closing:
+                current[tag] = value.strip()
+
+
+def _statement_format(filename: str, explicit: str | None = None) -> str:
+    fmt = (explicit or "").strip().lower()
+    if fmt in ("csv", "ofx"):
+        return fmt
+    return "ofx" if str(filename or "").lower().endswith((".ofx", ".qfx")) else "csv"
+
+
+# ---------------------------------------------------------------------------
+# Importação
+# ---------------------------------------------------------------------------
+
+class _CategoryResolver:
+    """Categoria de cada linha: coluna do arquivo > classificador local > "Outros"."""
+
+    def __init__(self, user_id: int):
+        cfg = FinanceConfig.query.filter_by(user_id=int(user_id)).first()
+        rows = Category.query.filter_by(config_id=cfg.id, is_active=True).all() if cfg else []
+        self.user_id = int(user_id)
+        self.by_type = {"income": [], "expense": []}
+        self.by_name = {}
+        for cat in rows:
+            if cat.type in self.by_type:
+                self.by_type[cat.type].append(cat.id)
+                self.by_name.setdefault((cat.type, _normalize_str(cat.name)), cat.id)
+        self.fallback = {
+            t: self.by_name.get((t, "outros")) or (ids[0] if ids else None)
+            for t, ids in self.by_type.items()
+        }
+
+    def resolve(self, tx_type: str, description: str, category_text: str = ""):
+        if category_text:
+            found = self.by_name.get((tx_type, _normalize_str(category_text)))
+            if found:
+                return found
+        suggestion = _suggest_category_local(self.user_id, tx_type, description, self.by_type[tx_type])
+        if suggestion and suggestion["score"] >= _CLASSIFIER_THRESHOLD:
+            return suggestion["category_id"]
+        return self.fallback[tx_type]
+
+
+def _existing_duplicate_keys(user_id: int, workspace_id, rows: list) -> Counter:
+    """Quantas transações já gravadas existem para cada (merchant_key, data, valor) do lote."""
+    keys = {(r["merchant_key"], r["transaction_date"], r["amount"]) for r in rows if r["merchant_key"]}
+    if not keys:
+        return Counter()
+    query = db.session.query(Transaction.merchant_key, Transaction.transaction_date, Transaction.amount).filter(
+        Transaction.user_id == int(user_id),
+        Transaction.merchant_key.in_({k[0] for k in keys}),
+        Transaction.transaction_date >= min(k[1] for k in keys),
+        Transaction.transaction_date <= max(k[1] for k in keys),
+    )
+    if workspace_id:
+        query = query.filter(Transaction.workspace_id == int(workspace_id))
+    else:
+        query = query.filter(Transaction.workspace_id.is_(None))
+    found = Counter()
+    for key, tx_date, amount in query.all():
+        found[(key, tx_date, Decimal(str(amount)))] += 1
+    return found
+
+
+def _flush_batch(user_id: int, workspace_id, batch: list, report: dict, inserted: Counter, dry_run: bool, on_error) -> None:
+    """
+    Descarta as duplicatas do lote e grava o resto com um único INSERT (executemany).
+
+    ``batch`` traz pares ``(linha, valores)``; linhas de meses fechados vão para ``on_error``.
+    """
+    closed = _closed_months({_rollup_key(workspace_id, user_id, row["transaction_date"]) for _, row in batch})
+    candidates = []
+    for line_no, row in batch:
+        if _rollup_key(workspace_id, user_id, row["transaction_date"]) in closed:
+            on_error(line_no, f"mês {row['transaction_date']:%Y-%m} está fechado")
+            continue
+        candidates.append(row)
+
+    existing = _existing_duplicate_keys(user_id, workspace_id, candidates)
+    # Linhas gravadas pelos lotes anteriores desta mesma importação não contam como "já existentes"
+    existing.subtract(inserted)
+    rows = []
+    for row in candidates:
+        key = (row["merchant_key"], row["transaction_date"], row["amount"])
+        if existing.get(key, 0) > 0:
+            existing[key] -= 1
+            report["duplicates"] += 1
+            continue
+        rows.append(row)
+    if rows and not dry_run:
+        db.session.execute(Transaction.__table__.insert(), rows)
+        _mark_rollups_dirty({_rollup_key(workspace_id, user_id, r["transaction_date"]) for r in rows})
+        inserted.update((r["merchant_key"], r["transaction_date"], r["amount"]) for r in rows if r["merchant_key"])
+    report["imported"] += len(rows)
+
+
+def _import_statement(binary_stream, user_id: int, workspace_id=None, fmt: str = "csv", dry_run: bool = False) -> dict:
+    """
+    Importa um extrato (stream binário) para o usuário/workspace.
+
+    Retorna ``{"total", "imported", "duplicates", "error_count", "errors", "dry_run"}``;
+    ``errors`` traz até 200 itens ``{"line", "error"}``. Com ``dry_run`` nada é gravado.
+    A sessão é confirmada (ou desfeita, no dry run / em erro inesperado) ao final.
+    """
+    report = {"total": 0, "imported": 0, "duplicates": 0, "error_count": 0, "errors": [], "dry_run": bool(dry_run)}
+
+    def _row_error(line_no, message):
+        report["error_count"] += 1
+        if len(report["errors"]) < _MAX_REPORTED_ERRORS:
+            report["errors"].append({"line": line_no, "error": message})
+
+    lines = _decode_lines(binary_stream)
+    records = _iter_ofx_records(lines) if fmt == "ofx" else _iter_csv_records(lines)
+    resolver = _CategoryResolver(user_id)
+    now = datetime.utcnow()
+    batch, inserted = [], Counter()
+    try:
+        for line_no, record in records:
+            report["total"] += 1
+            try:
+                description = str(record.get("description") or "").strip()[:255]
+                if not description:
+                    raise StatementRowError("descrição vazia")
+                tx_date = _parse_date(record.get("date"))
+                amount = _parse_amount(record.get("amount"))
+                if amount == 0:
+                    raise StatementRowError("valor zero")
+                tx_type = _row_type(amount, record.get("type"))
+                category_id = resolver.resolve(tx_type, description, record.get("category") or "")
+                if not category_id:
+                    raise StatementRowError(f"nenhuma categoria de {'despesa' if tx_type == 'expense' else 'receita'} cadastrada")
+            except StatementRowError as e:
+                _row_error(line_no, str(e))
+                continue
+
+            batch.append((line_no, {
+                "user_id": int(user_id),
+                "workspace_id": int(workspace_id) if workspace_id else None,
+                "category_id": int(category_id),
+                "description": description,
+                "merchant_key": _merchant_key(description),
+                "amount": abs(amount).quantize(Decimal("0.01")),
+                "type": tx_type,
+                "transaction_date": tx_date,
+                # Lançamento de extrato já foi liquidado
+                "is_paid": True,
+                "paid_date": tx_date,
+                "frequency": "once",
+                "is_recurring": False,
+                "is_fixed": False,
+                "is_auto_loaded": False,
+                "is_closed": False,
+                "created_at": now,
+                "updated_at": now,
+            }))
+            if len(batch) >= _BATCH_SIZE:
+                _flush_batch(user_id, workspace_id, batch, report, inserted, dry_run, _row_error)
+                batch = []
+        if batch:
+            _flush_batch(user_id, workspace_id, batch, report, inserted, dry_run, _row_error)
+    except StatementRowError as e:
+        # Erro do arquivo como um todo (ex.: cabeçalho CSV sem as colunas obrigatórias)
+        db.session.rollback()
+        _row_error(1, str(e))
+        report["imported"] = 0
+        return report
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+    _dbg(f"[IMPORT] user={user_id} ws={workspace_id}: {report['imported']} importadas, "
+         f"{report['duplicates']} duplicadas, {report['error_count']} erros")
+    return report
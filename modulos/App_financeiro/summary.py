@@ -0,0 +1,231 @@
+"""
+Resumo Anual - Agregados do ano numa query agrupada + cache
+===========================================================
+
+``/api/summary?year=`` alimenta os gráficos do dashboard: 12 meses de
+receitas/despesas, totais por categoria e por forma de pagamento (com a
+série mensal de cada um) e contagens de pagas/em aberto.
+
+``_aggregate_year`` faz uma query agrupada por (mês, tipo, categoria, forma
+de pagamento, pago) nos meses abertos do ano - pelo índice
+(workspace_id, transaction_date) ou (user_id, transaction_date) no livro
+pessoal - e monta todas as quebras em Python. Nos meses fechados, totais e
+categorias vêm do snapshot em ``monthly_closures`` (``category_totals``); só
+forma de pagamento e pagas/em aberto, que o snapshot não guarda, saem de uma
+query agrupada sem categoria.
+
+O resultado fica em cache de processo por (workspace, escopo de
+compartilhamento, ano), validado pelas versões dos contadores de mudança
+(transações do escopo e categorias dos membros): qualquer escrita, inclusive
+fechar/reabrir um mês, invalida.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from sqlalchemy import func
+
+from extensions import db
+from models import Category, MonthlyClosure, Transaction
+
+from .access import _workspace_user_ids
+from .change_counters import _category_scope, _scope_versions, _tx_scope
+from .helpers import _dbg
+from .rollups import _scope_filter
+
+_CACHE_SIZE = int(os.getenv("FINANCE_SUMMARY_CACHE", "256"))
+
+_lock = threading.Lock()
+_cache: OrderedDict = OrderedDict()  # (workspace_id, user_id|None, ano) -> (versões, resumo)
+
+
+def _empty_series() -> list:
+    return [0.0] * 12
+
+
+def _add_category(categories: dict, tx_type, category_id, idx: int, total: float, count: int) -> None:
+    cat = categories.setdefault((tx_type, category_id), {
+        "type": tx_type,
+        "category_id": int(category_id) if category_id else None,
+        "total": 0.0,
+        "count": 0,
+        "months": _empty_series(),
+    })
+    cat["total"] += total
+    cat["count"] += count
+    cat["months"][idx] += total
+
+
+def _add_payment(entry: dict, payment_methods: dict, tx_type, payment_method, is_paid, idx: int,
+                 total: float, count: int) -> None:
+    if is_paid:
+        entry["paid_count"] += count
+    else:
+        entry["unpaid_count"] += count
+        entry["unpaid_total"] += total
+
+    pm = payment_methods.setdefault((tx_type, payment_method), {
+        "type": tx_type,
+        "payment_method": payment_method or None,
+        "total": 0.0,
+        "count": 0,
+        "months": _empty_series(),
+    })
+    pm["total"] += total
+    pm["count"] += count
+    pm["months"][idx] += total
+
+
+def _closed_snapshots(year: int, workspace_id=None, user_id=None) -> list:
+    """(mês, receitas, despesas, category_totals) das linhas fechadas do ano no escopo."""
+    query = db.session.query(
+        MonthlyClosure.month,
+        MonthlyClosure.total_income,
+        MonthlyClosure.total_expense,
+        MonthlyClosure.category_totals,
+    ).filter(
+        _scope_filter(MonthlyClosure.workspace_id, workspace_id),
+        MonthlyClosure.year == int(year),
+        MonthlyClosure.status == "closed",
+    )
+    if workspace_id is None or user_id is not None:
+        query = query.filter(MonthlyClosure.user_id == int(user_id))
+    return query.all()
+
+
+def _aggregate_year(year: int, workspace_id=None, user_id=None) -> dict:
+    """Calcula o resumo do ano (``user_id`` restringe dentro do workspace ou indica o livro pessoal)."""
+    start, end = date(int(year), 1, 1), date(int(year) + 1, 1, 1)
+    month_col = func.extract("month", Transaction.transaction_date)
+    payment_col = func.lower(func.trim(func.coalesce(Transaction.payment_method, "")))
+    filters = [
+        _scope_filter(Transaction.workspace_id, workspace_id),
+        Transaction.transaction_date >= start,
+        Transaction.transaction_date < end,
+    ]
+    if user_id is not None:
+        filters.append(Transaction.user_id == int(user_id))
+
+    snapshots = _closed_snapshots(year, workspace_id, user_id)
+    closed = sorted({int(month) for month, *_rest in snapshots})
+
+    # Meses abertos: tudo sai da query agrupada
+    groups = (
+        db.session.query(
+            month_col,
+            Transaction.type,
+            Transaction.category_id,
+            payment_col,
+            Transaction.is_paid,
+            func.count(Transaction.id),
+            func.coalesce(func.sum(Transaction.amount), 0),
+        )
+        .filter(*filters, month_col.notin_(closed))
+        .group_by(month_col, Transaction.type, Transaction.category_id, payment_col, Transaction.is_paid)
+        .all()
+    )
+    # Meses fechados: totais e categorias vêm do snapshot; o snapshot não guarda
+    # forma de pagamento nem pagas/em aberto, que saem de uma query sem categoria
+    payment_groups = (
+        db.session.query(
+            month_col,
+            Transaction.type,
+            payment_col,
+            Transaction.is_paid,
+            func.count(Transaction.id),
+            func.coalesce(func.sum(Transaction.amount), 0),
+        )
+        .filter(*filters, month_col.in_(closed))
+        .group_by(month_col, Transaction.type, payment_col, Transaction.is_paid)
+        .all()
+    ) if closed else []
+
+    months = [
+        {"month": m, "income": 0.0, "expense": 0.0, "paid_count": 0, "unpaid_count": 0, "unpaid_total": 0.0}
+        for m in range(1, 13)
+    ]
+    categories, payment_methods = {}, {}
+    for month, tx_type, category_id, payment_method, is_paid, count, total in groups:
+        idx = int(month) - 1
+        count, total = int(count or 0), float(total or 0)
+        if tx_type in ("income", "expense"):
+            months[idx][tx_type] += total
+        _add_category(categories, tx_type, category_id, idx, total, count)
+        _add_payment(months[idx], payment_methods, tx_type, payment_method, is_paid, idx, total, count)
+
+    for month, income, expense, category_totals in snapshots:
+        idx = int(month) - 1
+        months[idx]["income"] += float(income or 0)
+        months[idx]["expense"] += float(expense or 0)
+        for item in category_totals or []:
+            _add_category(
+                categories, item["type"], item["category_id"], idx,
+                float(item["total"] or 0), int(item["count"] or 0),
+            )
+    for month, tx_type, payment_method, is_paid, count, total in payment_groups:
+        idx = int(month) - 1
+        _add_payment(
+            months[idx], payment_methods, tx_type, payment_method, is_paid, idx,
+            float(total or 0), int(count or 0),
+        )
+
+    # Nome/cor/ícone das categorias (poucas linhas, pela PK)
+    cat_ids = {c["category_id"] for c in categories.values() if c["category_id"]}
+    info = {
+        cid: (name, color, icon)
+        for cid, name, color, icon in db.session.query(Category.id, Category.name, Category.color, Category.icon)
+        .filter(Category.id.in_(cat_ids))
+    } if cat_ids else {}
+    for cat in categories.values():
+        name, color, icon = info.get(cat["category_id"], ("Sem categoria", None, None))
+        cat.update({"name": name, "color": color, "icon": icon})
+
+    for entry in months:
+        entry["balance"] = entry["income"] - entry["expense"]
+        entry["status"] = "closed" if entry["month"] in closed else "open"
+
+    income = sum(m["income"] for m in months)
+    expense = sum(m["expense"] for m in months)
+    return {
+        "year": int(year),
+        "months": months,
+        "categories": sorted(categories.values(), key=lambda c: (c["type"], -c["total"])),
+        "payment_methods": sorted(payment_methods.values(), key=lambda p: (p["type"], -p["total"])),
+        "totals": {
+            "income": income,
+            "expense": expense,
+            "balance": income - expense,
+            "paid_count": sum(m["paid_count"] for m in months),
+            "unpaid_count": sum(m["unpaid_count"] for m in months),
+        },
+    }
+
+
+def _summary_scopes(workspace_id=None, user_id=None) -> list:
+    if workspace_id is None:
+        return [_tx_scope(None, user_id), _category_scope(user_id)]
+    return [_tx_scope(workspace_id, user_id)] + [_category_scope(uid) for uid in _workspace_user_ids(workspace_id)]
+
+
+def _year_summary(year: int, workspace_id=None, user_id=None) -> dict:
+    """Resumo do ano, do cache quando nada mudou no escopo desde o cálculo."""
+    key = (int(workspace_id) if workspace_id else None, int(user_id) if user_id else None, int(year))
+    versions = _scope_versions(_summary_scopes(workspace_id, user_id))
+
+    with _lock:
+        entry = _cache.get(key)
+        if entry and entry[0] == versions:
+            _cache.move_to_end(key)
+            _dbg(f"[SUMMARY] Cache hit {key}")
+            return entry[1]
+
+    summary = _aggregate_year(year, workspace_id, user_id)
+    with _lock:
+        _cache[key] = (versions, summary)
+        _cache.move_to_end(key)
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    _dbg(f"[SUMMARY] Resumo recalculado {key}")
+    return summary
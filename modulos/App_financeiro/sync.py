@@ -0,0 +1,157 @@
+"""
+Sincronização Incremental - Tombstones e token de mudanças (``/api/sync``)
+==========================================================================
+
+O app mobile guarda localmente transações, categorias, cartões e regras
+recorrentes e, ao abrir/retomar, pede só o que mudou desde a última vez:
+
+- criações/alterações saem das colunas ``updated_at`` (com uma pequena
+  sobreposição de janela, ``FINANCE_SYNC_OVERLAP`` segundos, para pegar
+  commits que estavam em andamento; o app faz upsert por id);
+- exclusões ficam em ``finance_tombstones``: ``before_flush`` grava um
+  registro para cada ``delete`` via ORM (e para a transação que sai de um
+  workspace); caminhos em lote chamam ``_record_tombstones_for_query``.
+
+O token é opaco para o app (base64 de um JSON com o instante da última
+sincronização e, durante a paginação, o cursor das transações). Tokens mais
+antigos que a retenção dos tombstones (``FINANCE_SYNC_TOMBSTONE_DAYS``)
+forçam uma sincronização completa.
+
+Manutenção: ``flask finance-sync-purge`` apaga tombstones expirados.
+"""
+
+import base64
+import json
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, attributes
+
+from extensions import db
+from models import Category, CreditCard, FinanceConfig, FinanceTombstone, RecurringTransaction, Transaction
+
+from .helpers import _dbg
+
+_SYNC_OVERLAP = timedelta(seconds=int(os.getenv("FINANCE_SYNC_OVERLAP", "60")))
+_TOMBSTONE_DAYS = int(os.getenv("FINANCE_SYNC_TOMBSTONE_DAYS", "90"))
+
+_ENTITY_NAMES = (
+    (Transaction, "transaction"),
+    (RecurringTransaction, "recurring"),
+    (CreditCard, "credit_card"),
+)
+
+
+# ---------------------------------------------------------------------------
+# Token
+# ---------------------------------------------------------------------------
+
+def _encode_sync_token(since: datetime | None, cursor=None, started_at: datetime | None = None) -> str:
+    """Token da próxima chamada; ``since`` None = sincronização completa em andamento."""
+    payload = {"s": since.isoformat() if since else None}
+    if cursor:
+        payload["c"] = [cursor[0].isoformat(), int(cursor[1])]
+        payload["t"] = started_at.isoformat()
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_sync_token(token: str):
+    """Retorna ``(since, cursor, started_at)``; None se o token for inválido."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        since = datetime.fromisoformat(payload["s"]) if payload["s"] else None
+        cursor = None
+        started_at = None
+        if payload.get("c"):
+            cursor = (datetime.fromisoformat(payload["c"][0]), int(payload["c"][1]))
+            started_at = datetime.fromisoformat(payload["t"])
+        return since, cursor, started_at
+    except Exception:
+        return None
+
+
+def _sync_window_start(since: datetime) -> datetime:
+    """Início da janela consultada (com a sobreposição para commits concorrentes)."""
+    return since - _SYNC_OVERLAP
+
+
+def _token_expired(since: datetime | None) -> bool:
+    """Token anterior à retenção dos tombstones: exclusões podem ter se perdido."""
+    return since is not None and since < datetime.utcnow() - timedelta(days=_TOMBSTONE_DAYS)
+
+
+# ---------------------------------------------------------------------------
+# Tombstones
+# ---------------------------------------------------------------------------
+
+def _record_tombstones_for_query(query) -> None:
+    """Grava tombstones das transações de um DELETE em lote (chamar antes de executá-lo)."""
+    rows = query.with_entities(Transaction.id, Transaction.workspace_id, Transaction.user_id).all()
+    if not rows:
+        return
+    now = datetime.utcnow()
+    db.session.execute(
+        FinanceTombstone.__table__.insert(),
+        [
+            {"entity": "transaction", "entity_id": tx_id, "workspace_id": wid, "user_id": uid, "deleted_at": now}
+            for tx_id, wid, uid in rows
+        ],
+    )
+
+
+def _entity_name(obj):
+    for model, name in _ENTITY_NAMES:
+        if isinstance(obj, model):
+            return name
+    return None
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_tombstones(session, flush_context, instances):
+    tombstones = []
+    category_configs = []
+    for obj in session.deleted:
+        if isinstance(obj, FinanceTombstone):
+            continue
+        if isinstance(obj, Category):
+            category_configs.append((obj.id, obj.workspace_id, obj.config_id))
+            continue
+        name = _entity_name(obj)
+        if name and obj.id:
+            tombstones.append((name, obj.id, obj.workspace_id, obj.user_id))
+
+    # Saiu do workspace: para quem sincroniza o workspace antigo é uma exclusão
+    for obj in session.dirty:
+        name = _entity_name(obj)
+        if not name or not obj.id:
+            continue
+        for old_wid in attributes.get_history(obj, "workspace_id").deleted or []:
+            if old_wid and old_wid != obj.workspace_id:
+                tombstones.append((name, obj.id, old_wid, obj.user_id))
+
+    if category_configs:
+        owners = dict(session.execute(
+            select(FinanceConfig.id, FinanceConfig.user_id)
+            .where(FinanceConfig.id.in_({c for _, _, c in category_configs if c}))
+        ).all())
+        for cat_id, wid, config_id in category_configs:
+            if cat_id:
+                tombstones.append(("category", cat_id, wid, owners.get(config_id)))
+
+    if not tombstones:
+        return
+    now = datetime.utcnow()
+    for entity, entity_id, wid, uid in tombstones:
+        session.add(FinanceTombstone(entity=entity, entity_id=entity_id, workspace_id=wid, user_id=uid, deleted_at=now))
+    _dbg(f"[SYNC] {len(tombstones)} tombstones")
+
+
+def _purge_tombstones() -> int:
+    """Apaga tombstones mais antigos que a retenção. Retorna quantos foram removidos."""
+    cutoff = datetime.utcnow() - timedelta(days=_TOMBSTONE_DAYS)
+    removed = FinanceTombstone.query.filter(FinanceTombstone.deleted_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return int(removed or 0)
@@ -219,9 +219,18 @@ def create_app():
         @app.after_request
         def add_no_cache_headers(response):
             """Adicionar headers para desabilitar cache no navegador."""
-            response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
+            if response.cache_control.immutable:
+                # Conteúdo imutável (comprovantes e miniaturas): a rota já definiu o
+                # cache longo; send_file também põe ETag, que não pode rebaixá-lo.
+                pass
+            elif response.headers.get('ETag'):
+                # Leituras com validador (finanças): o cliente guarda a cópia, mas revalida
+                # sempre com If-None-Match (304 quando nada mudou).
+                response.headers['Cache-Control'] = 'private, no-cache'
+            else:
+                response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+                response.headers['Pragma'] = 'no-cache'
+                response.headers['Expires'] = '0'
 
             if request.path.startswith('/gerenciamento-financeiro/api/'):
                 origin = request.headers.get('Origin')
@@ -326,6 +335,147 @@ def create_app():
             except Exception as e:
                 click.echo(f' Erro: {e}')
 
+        @app.cli.command('finance-migrate-recurring')
+        def finance_migrate_recurring_command():
+            """Correções legadas das recorrências + watermarks (executar uma única vez)."""
+            try:
+                from modulos.App_financeiro.recurring import _run_recurring_migration
+                result = _run_recurring_migration()
+                click.echo(f" Recorrências migradas: {result['rules']} regras de {result['users']} usuários")
+            except Exception as e:
+                click.echo(f' Erro: {e}')
+
+        @app.cli.command('finance-rollups')
+        @click.argument('action', type=click.Choice(['rebuild', 'verify']))
+        def finance_rollups_command(action):
+            """Reconstrói ou confere os rollups mensais (monthly_closures) contra as transações."""
+            try:
+                from modulos.App_financeiro.rollups import _rebuild_all_rollups, _verify_rollups
+                if action == 'rebuild':
+                    result = _rebuild_all_rollups()
+                    click.echo(f" Rollups reconstruídos: {result['rows']} meses em {result['scopes']} escopos")
+                    return
+                mismatches = _verify_rollups()
+                for item in mismatches[:50]:
+                    click.echo(f" ❌ ws={item['workspace_id']} user={item['user_id']} {item['month']}: esperado {item['expected']}, gravado {item['found']}")
+                if mismatches:
+                    click.echo(f' {len(mismatches)} divergências. Rode: flask finance-rollups rebuild')
+                    raise SystemExit(1)
+                click.echo(' ✅ Rollups conferem com as transações')
+            except Exception as e:
+                click.echo(f' Erro: {e}')
+
+        @app.cli.command('finance-invoices')
+        @click.argument('action', type=click.Choice(['rebuild']))
+        def finance_invoices_command(action):
+            """Reconstrói as faturas de todos os cartões (credit_card_invoices) a partir das transações."""
+            try:
+                from modulos.App_financeiro.invoices import _rebuild_all_invoices
+                result = _rebuild_all_invoices()
+                click.echo(f" Faturas reconstruídas: {result['invoices']} em {result['cards']} cartões")
+            except Exception as e:
+                click.echo(f' Erro: {e}')
+
+        @app.cli.command('finance-months')
+        @click.argument('action', type=click.Choice(['close', 'reopen']))
+        @click.option('--month', 'month_label', default=None, help='AAAA-MM (padrão: mês anterior)')
+        @click.option('--workspace-id', type=int, default=None)
+        @click.option('--user-id', type=int, default=None, help='Livro pessoal do usuário')
+        def finance_months_command(action, month_label, workspace_id, user_id):
+            """Fecha meses (snapshot imutável) ou reabre um mês. Sem escopo, fecha todos os meses abertos até --month."""
+            try:
+                from datetime import date as _date
+                from modulos.App_financeiro.closures import _close_month, _close_pending_months, _reopen_month
+                if month_label:
+                    year, month = (int(p) for p in month_label.split('-', 1))
+                else:
+                    today = _date.today()
+                    year, month = (today.year - 1, 12) if today.month == 1 else (today.year, today.month - 1)
+                if action == 'reopen' or workspace_id or user_id:
+                    if not workspace_id and not user_id:
+                        click.echo(' Informe --workspace-id ou --user-id')
+                        raise SystemExit(1)
+                    fn = _reopen_month if action == 'reopen' else _close_month
+                    result = fn(year, month, workspace_id=workspace_id, user_id=user_id)
+                    click.echo(f" {result['month']}: {result['status']} ({result['rows']} linhas)")
+                    return
+                results = _close_pending_months(_date(year, month, 1))
+                for item in results:
+                    click.echo(f" ws={item['workspace_id']} user={item['user_id']} {item['month']}: "
+                               f"{item['status']} ({item['fixed_expenses']} despesas fixas)")
+                click.echo(f" Meses fechados: {sum(1 for r in results if r['status'] == 'closed')}")
+            except Exception as e:
+                click.echo(f' Erro: {e}')
+
+        @app.cli.command('finance-sync-purge')
+        def finance_sync_purge_command():
+            """Apaga tombstones da sincronização mais antigos que FINANCE_SYNC_TOMBSTONE_DAYS."""
+            try:
+                from modulos.App_financeiro.sync import _purge_tombstones
+                removed = _purge_tombstones()
+                click.echo(f" Tombstones removidos: {removed}")
+            except Exception as e:
+                click.echo(f' Erro: {e}')
+
+        @app.cli.command('finance-idempotency-purge')
+        def finance_idempotency_purge_command():
+            """Apaga chaves de idempotência expiradas (FINANCE_IDEMPOTENCY_TTL_HOURS)."""
+            try:
+                from modulos.App_financeiro.idempotency import _purge_idempotency_keys
+                removed = _purge_idempotency_keys()
+                click.echo(f" Chaves de idempotência removidas: {removed}")
+            except Exception as e:
+                click.echo(f' Erro: {e}')
+
+        @app.cli.command('finance-migrate-proof-blobs')
+        @click.option('--batch-size', type=int, default=50)
+        def finance_migrate_proof_blobs_command(batch_size):
+            """Move transactions.proof_document_data para o armazenamento de comprovantes."""
+            try:
+                from modulos.App_financeiro.attachment_storage import _migrate_proof_blobs
+                result = _migrate_proof_blobs(batch_size)
+                click.echo(
+                    f" Comprovantes migrados: {result['moved']} ({result['bytes']} bytes), "
+                    f"vazios descartados: {result['skipped']}"
+                )
+            except Exception as e:
+                click.echo(f' Erro: {e}')
+
+        @app.cli.command('finance-attachments-gc')
+        @click.option('--grace-hours', type=float, default=None)
+        def finance_attachments_gc_command(grace_hours):
+            """Apaga do disco os comprovantes sem referência (após o prazo de carência)."""
+            try:
+                from modulos.App_financeiro.attachment_storage import _GC_GRACE_HOURS, _collect_unreferenced_blobs
+                result = _collect_unreferenced_blobs(_GC_GRACE_HOURS if grace_hours is None else grace_hours)
+                click.echo(f" Conteúdos removidos: {result['removed']} ({result['bytes']} bytes)")
+            except Exception as e:
+                click.echo(f' Erro: {e}')
+
+        @app.cli.command('finance-import')
+        @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+        @click.option('--user-id', type=int, required=True)
+        @click.option('--workspace-id', type=int, default=None)
+        @click.option('--format', 'fmt', type=click.Choice(['csv', 'ofx']), default=None)
+        @click.option('--dry-run', is_flag=True, default=False)
+        def finance_import_command(path, user_id, workspace_id, fmt, dry_run):
+            """Importa um extrato CSV/OFX para o usuário (e workspace) informado."""
+            try:
+                from modulos.App_financeiro.api import _ensure_finance_config_and_categories
+                from modulos.App_financeiro.statement_import import _import_statement, _statement_format
+                _ensure_finance_config_and_categories(user_id)
+                with open(path, 'rb') as fh:
+                    report = _import_statement(fh, user_id, workspace_id, fmt=_statement_format(path, fmt), dry_run=dry_run)
+                click.echo(
+                    f" Linhas: {report['total']} | importadas: {report['imported']} | "
+                    f"duplicadas: {report['duplicates']} | erros: {report['error_count']}"
+                    + (" (dry run)" if dry_run else "")
+                )
+                for err in report['errors']:
+                    click.echo(f"  linha {err['line']}: {err['error']}")
+            except Exception as e:
+                click.echo(f' Erro: {e}')
+
         # Health check simples
         @app.route('/health')
         def health():